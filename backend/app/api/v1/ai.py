@@ -1,22 +1,181 @@
 """
 AI相关API
 """
-from fastapi import APIRouter, Depends
+import asyncio
+import json
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from loguru import logger
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_db, AsyncSessionLocal
 from app.schemas.common import DataResponse
-from app.schemas.ai import AIQueryRequest, AIQueryResponse
+from app.schemas.ai import AIQueryRequest, AIQueryResponse, AIRefineResponse
 from app.services.ai import AIService
 from app.services.query import QueryService
 from app.models.query import QueryStatus
 from app.services.rag import RAGService
 from app.services.metadata_search import MetadataSearch
+from app.services.sql_parser import parse_sql
+from app.services.conversation_context import get_conversation_context_store
+from app.services.conversation_summary import get_conversation_summarizer
+from app.services.draft_refiner import DraftResult, RefineStatus, get_draft_registry, get_generated_sql_cache
+from app.services.model_router import invalid_reason
+from app.services.data_source import DataSourceService
+from app.services.preview import run_preview
+from app.models.ai_conversation import MessageRole
 
 router = APIRouter()
 
 
+async def _start_preview(db: AsyncSession, payload: AIQueryRequest, sql: str) -> Optional[asyncio.Task]:
+    """开启预览时先加载数据源，再在后台并发执行受限预览；条件不满足时返回None。"""
+    if not (payload.preview and payload.data_source_id and settings.AI_PREVIEW_ENABLED):
+        return None
+    if invalid_reason(sql) is not None:
+        return None
+    ds_service = DataSourceService(db)
+    try:
+        ds = await ds_service.get(payload.data_source_id)
+    except Exception as e:
+        logger.warning("预览数据源加载失败: {}", e)
+        return None
+    if ds is None:
+        return None
+    try:
+        # 与请求会话解绑，避免后续提交/回滚使其属性过期（预览在线程中读取连接参数）
+        db.expunge(ds)
+    except Exception:
+        pass
+    return asyncio.create_task(run_preview(ds_service, ds, sql))
+
+
+async def _collect_preview(task: Optional[asyncio.Task]) -> Optional[dict]:
+    if task is None:
+        return None
+    try:
+        result = await task
+    except Exception:
+        return None
+    return result.to_query_results() if result is not None else None
+
+
+def _remember_sql(payload: AIQueryRequest, sql: str):
+    """仅单轮、无附加上下文的问题的有效SQL进入已生成SQL缓存（缓存键只有问题文本）。"""
+    if not payload.conversation_id and not payload.context and invalid_reason(sql) is None:
+        get_generated_sql_cache().put(payload.query, sql)
+
+
+def _build_response(
+    payload: AIQueryRequest,
+    generated_sql: str,
+    *,
+    started: float,
+    history=None,
+    message_id: Optional[int] = None,
+    metadata_ctx: Optional[str] = None,
+    rag_context: Optional[str] = None,
+    rag_chunks: Optional[list] = None,
+    reply: str = "SQL已生成",
+    confidence: float = 0.5,
+    query_results: Optional[dict] = None,
+    is_draft: bool = False,
+    draft_source: Optional[str] = None,
+    refine_status: Optional[str] = None,
+) -> AIQueryResponse:
+    # SQL解析（共享缓存），提取表、维度、指标、筛选与排序
+    analysis = parse_sql(generated_sql or "").analysis()
+    # 响应中的 rag_context 合并元数据结构化上下文 + 文档RAG片段，便于前端引用与诊断
+    combined_ctx_for_response = None
+    if metadata_ctx and rag_context:
+        combined_ctx_for_response = metadata_ctx + "\n" + rag_context
+    else:
+        combined_ctx_for_response = metadata_ctx or rag_context
+    return AIQueryResponse(
+        conversation_id=payload.conversation_id,
+        message_id=message_id,
+        reply=reply,
+        generated_sql=generated_sql,
+        query_results=query_results,
+        suggestions=["已为您解析出表、维度、指标、筛选与排序，可调整后执行"],
+        confidence=confidence,
+        processing_time_ms=int((time.perf_counter() - started) * 1000),
+        rag_context=combined_ctx_for_response,
+        rag_chunks=rag_chunks or [],
+        tables=analysis["tables"],
+        selected_table=analysis["selected_table"],
+        dimensions=analysis["dimensions"],
+        metrics=analysis["metrics"],
+        filters=analysis["filters"],
+        sorts=analysis["sorts"],
+        history_id=getattr(history, "id", None),
+        is_draft=is_draft,
+        draft_source=draft_source,
+        refine_status=refine_status,
+    )
+
+
+async def _draft_query(payload: AIQueryRequest, draft: DraftResult, qs: QueryService, started: float) -> Optional[AIQueryResponse]:
+    """草稿模式：立即返回草稿SQL；低置信度草稿登记后台精炼，按查询历史ID交付结果。
+    低置信度且无法记录查询历史（无法作为精炼结果的键）时返回None，由调用方走同步生成。
+    """
+    needs_refine = not draft.confident and bool(settings.OPENAI_API_KEY)
+    try:
+        history = await qs.create_history(
+            user_id=0,
+            natural_language_query=payload.query,
+            generated_sql=draft.sql,
+            status=QueryStatus.SUCCESS,
+            execution_time_ms=0,
+            row_count=0,
+            is_saved=True,
+            tags=["ai_query", "draft"] if needs_refine else ["ai_query"],
+        )
+    except Exception:
+        history = None
+    if needs_refine and getattr(history, "id", None) is None:
+        return None
+
+    refine_status = RefineStatus.SKIPPED
+    if needs_refine:
+        async def _refine() -> str:
+            # 后台任务使用独立会话，避免与已结束的请求会话共享
+            async with AsyncSessionLocal() as rdb:
+                sql = await AIService(rdb).generate_sql(
+                    payload.query,
+                    context=payload.context,
+                    use_rag=payload.use_rag or False,
+                    conversation_id=payload.conversation_id,
+                )
+            _remember_sql(payload, sql)
+            return sql
+
+        get_draft_registry().submit(history.id, draft, _refine)
+        refine_status = RefineStatus.PENDING
+    logger.info(
+        "AI接口草稿返回: source={}, confident={}, refine_status={}, history_id={}",
+        draft.source,
+        draft.confident,
+        refine_status,
+        getattr(history, "id", None),
+    )
+    return _build_response(
+        payload,
+        draft.sql,
+        started=started,
+        history=history,
+        reply="SQL已生成" if draft.confident else "已生成草稿SQL，正在精炼",
+        confidence=0.9 if draft.confident else 0.3,
+        is_draft=needs_refine,
+        draft_source=draft.source,
+        refine_status=refine_status,
+    )
+
+
 @router.post("/query", response_model=DataResponse[AIQueryResponse])
 async def ai_query(
     payload: AIQueryRequest,
@@ -26,26 +185,42 @@ async def ai_query(
     - 若启用 RAG：先检索文档片段并拼接为 `rag_context`
     - 同步构建元数据结构化上下文（表 -> 列），并在响应的 `rag_context` 中合并展示
     - 传入模型的上下文保持文档RAG片段；元数据上下文在服务层注入，避免重复向量查询
+    - 草稿模式（draft=true）：即时返回模板/意图/缓存/规则SQL，低置信度时后台精炼，
+      通过 `/query/{history_id}/refined` 轮询或 `/query/{history_id}/refined/stream` 订阅结果
+    - 预览模式（preview=true 且指定数据源）：并发执行受限预览，结果附在 `query_results` 并缓存供执行复用
     """
+    started = time.perf_counter()
     # 入参日志（避免记录过长文本，做长度与关键标记）
     try:
         logger.info(
-            "AI接口入参: len(query)={}, use_rag={}, has_context={}, conversation_id={}, data_source_id={}",
+            "AI接口入参: len(query)={}, use_rag={}, has_context={}, conversation_id={}, data_source_id={}, draft={}",
             len(payload.query or ""),
             bool(payload.use_rag),
             bool(payload.context),
             payload.conversation_id,
             payload.data_source_id,
+            bool(payload.draft),
         )
     except Exception:
         pass
     ai = AIService(db)
     qs = QueryService(db)
+    # 多轮追问复用会话工作集，无需重新检索文档与元数据
+    follow_ws = await get_conversation_context_store().follow_up_for(payload.conversation_id, payload.query)
+    # 草稿模式：追问与携带额外上下文的请求依赖模型理解，不走草稿
+    if payload.draft and follow_ws is None and not payload.context:
+        draft = ai.draft_sql(payload.query)
+        if draft is not None:
+            resp = await _draft_query(payload, draft, qs, started)
+            if resp is not None:
+                return DataResponse(data=resp, message="AI生成SQL成功")
     # 若启用RAG，先检索片段与拼接上下文，供SQL生成
     rag_chunks = []
     rag_context = None
     metadata_ctx = None
-    if payload.use_rag:
+    if follow_ws is not None:
+        metadata_ctx = follow_ws.schema_context or None
+    elif payload.use_rag:
         try:
             rag = RAGService()
             rag_chunks = rag.query(payload.query, top_k=4)
@@ -64,6 +239,15 @@ async def ai_query(
                 pass
         except Exception:
             metadata_ctx = None
+    # 多轮对话：滚动摘要 + 最近K轮原文，按Token预算截断
+    summarizer = get_conversation_summarizer()
+    history_ctx = None
+    if payload.conversation_id:
+        try:
+            history_ctx = await summarizer.build_history_context(db, payload.conversation_id)
+        except Exception as e:
+            logger.warning("会话历史上下文获取失败: {}", e)
+            history_ctx = None
     # 生成SQL（支持RAG文档上下文）
     generated_sql = await ai.generate_sql(
         payload.query,
@@ -72,7 +256,25 @@ async def ai_query(
         rag_context=rag_context,
         conversation_id=payload.conversation_id,
         rag_chunks=rag_chunks,
+        history_context=history_ctx,
     )
+    # 推测性预览：与消息记录、历史写入及SQL解析并发执行
+    preview_task = await _start_preview(db, payload, generated_sql)
+    # 单轮问题的有效SQL进入已生成SQL缓存，供后续草稿模式直接复用
+    _remember_sql(payload, generated_sql)
+    # 记录本轮消息（计数原子累加），并在后台滚动更新会话摘要
+    assistant_msg = None
+    if payload.conversation_id:
+        try:
+            await ai.add_message(payload.conversation_id, MessageRole.USER, payload.query)
+            assistant_msg = await ai.add_message(payload.conversation_id, MessageRole.ASSISTANT, generated_sql or "")
+            summarizer.schedule_update(payload.conversation_id)
+        except Exception as e:
+            logger.warning("会话消息记录失败: {}", e)
+            try:
+                await db.rollback()
+            except Exception:
+                pass
     # 记录历史（开发模式：若数据库不可用则忽略错误）
     try:
         history = await qs.create_history(
@@ -87,113 +289,16 @@ async def ai_query(
         )
     except Exception:
         history = None
-    # 简单SQL解析，提取表、维度、指标、筛选与排序（启发式）
-    def _analyze_sql(sql: str):
-        import re
-        txt = sql or ""
-        tables: list[str] = []
-        selected_table: str | None = None
-        dimensions: list[str] = []
-        metrics: list[dict] = []
-        filters: list[dict] = []
-        sorts: list[dict] = []
-
-        # 提取FROM后的第一个标识为主表
-        m_from = re.search(r"from\s+([\w\.`]+)", txt, re.IGNORECASE)
-        if m_from:
-            selected_table = m_from.group(1).strip().strip('`')
-            tables.append(selected_table)
-        # JOIN表
-        for jm in re.finditer(r"join\s+([\w\.`]+)", txt, re.IGNORECASE):
-            t = jm.group(1).strip().strip('`')
-            if t not in tables:
-                tables.append(t)
-
-        # 选取SELECT部分
-        m_sel = re.search(r"select\s+(.*?)\s+from\s", txt, re.IGNORECASE | re.DOTALL)
-        if m_sel:
-            select_part = m_sel.group(1)
-            # 按逗号分割，识别聚合
-            for item in [s.strip() for s in select_part.split(',') if s.strip()]:
-                # 提取别名
-                alias_m = re.search(r"\s+as\s+(\w+)$", item, re.IGNORECASE)
-                alias = alias_m.group(1) if alias_m else None
-                # 聚合函数
-                agg_m = re.match(r"(sum|count|avg|min|max)\s*\(\s*([\w\.]+)\s*\)", item, re.IGNORECASE)
-                if agg_m:
-                    func = agg_m.group(1).lower()
-                    col = agg_m.group(2)
-                    metrics.append({"column": col, "aggregation": func, "alias": alias or f"{func}_{col.replace('.', '_')}"})
-                else:
-                    # 普通列作为维度
-                    # 去掉可能的表前缀
-                    col = re.sub(r"^\w+\.", "", item)
-                    # 去掉函数包装
-                    col = re.sub(r"\b(distinct|coalesce|ifnull)\b\s*\((.*?)\)", r"\2", col, flags=re.IGNORECASE)
-                    # 去掉别名
-                    col = re.sub(r"\s+as\s+\w+$", "", col, flags=re.IGNORECASE)
-                    col = col.strip()
-                    if col:
-                        dimensions.append(col)
-
-        # WHERE解析（简单等值与比较）
-        m_where = re.search(r"where\s+(.*?)\s+(group\s+by|order\s+by|limit|$)", txt, re.IGNORECASE | re.DOTALL)
-        if m_where:
-            where_part = m_where.group(1)
-            # 拆分 AND 条件
-            for cond in re.split(r"\band\b", where_part, flags=re.IGNORECASE):
-                cond = cond.strip()
-                cm = re.match(r"([\w\.]+)\s*(=|!=|>=|<=|>|<|like)\s*(.+)$", cond, re.IGNORECASE)
-                if cm:
-                    col = cm.group(1)
-                    op = cm.group(2).upper()
-                    val = cm.group(3).strip().strip("'\"")
-                    filters.append({"column": col, "operator": op, "value": val})
-
-        # ORDER BY
-        m_order = re.search(r"order\s+by\s+(.*?)\s+(limit|$)", txt, re.IGNORECASE | re.DOTALL)
-        if m_order:
-            order_part = m_order.group(1)
-            for seg in [s.strip() for s in order_part.split(',') if s.strip()]:
-                om = re.match(r"([\w\.]+)\s*(asc|desc)?", seg, re.IGNORECASE)
-                if om:
-                    col = om.group(1)
-                    ord = (om.group(2) or 'asc').lower()
-                    sorts.append({"column": col, "order": ord})
-
-        return {
-            "tables": tables,
-            "selected_table": selected_table,
-            "dimensions": dimensions,
-            "metrics": metrics,
-            "filters": filters,
-            "sorts": sorts,
-        }
-
-    analysis = _analyze_sql(generated_sql or "")
-    # 响应中的 rag_context 合并元数据结构化上下文 + 文档RAG片段，便于前端引用与诊断
-    combined_ctx_for_response = None
-    if metadata_ctx and rag_context:
-        combined_ctx_for_response = metadata_ctx + "\n" + rag_context
-    else:
-        combined_ctx_for_response = metadata_ctx or rag_context
-    resp = AIQueryResponse(
-        conversation_id=None,
-        message_id=None,
-        reply="SQL已生成",
-        generated_sql=generated_sql,
-        query_results=None,
-        suggestions=["已为您解析出表、维度、指标、筛选与排序，可调整后执行"],
-        confidence=0.5,
-        processing_time_ms=0,
-        rag_context=combined_ctx_for_response,
+    resp = _build_response(
+        payload,
+        generated_sql,
+        started=started,
+        history=history,
+        message_id=assistant_msg.id if assistant_msg is not None else None,
+        metadata_ctx=metadata_ctx,
+        rag_context=rag_context,
         rag_chunks=rag_chunks,
-        tables=analysis["tables"],
-        selected_table=analysis["selected_table"],
-        dimensions=analysis["dimensions"],
-        metrics=analysis["metrics"],
-        filters=analysis["filters"],
-        sorts=analysis["sorts"],
+        query_results=await _collect_preview(preview_task),
     )
     # 返回值摘要日志
     try:
@@ -209,4 +314,52 @@ async def ai_query(
         )
     except Exception:
         pass
-    return DataResponse(data=resp, message="AI生成SQL成功")
\ No newline at end of file
+    return DataResponse(data=resp, message="AI生成SQL成功")
+
+
+async def _refine_snapshot(history_id: int, db: AsyncSession) -> AIRefineResponse:
+    """读取精炼状态：优先进程内注册表；未登记时回退查询历史（其他实例精炼或已过期）。"""
+    state = get_draft_registry().get(history_id)
+    if state is not None:
+        return AIRefineResponse(**state.to_dict())
+    item = await QueryService(db).get_history(history_id)
+    if item is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="历史记录不存在")
+    tags = item.tags or []
+    if "refined" in tags:
+        return AIRefineResponse(history_id=history_id, status=RefineStatus.DONE, sql=item.generated_sql)
+    if "draft" in tags:
+        # 草稿仍未回写：精炼在其他实例进行中或已失败
+        return AIRefineResponse(history_id=history_id, status="unknown", draft_sql=item.generated_sql)
+    return AIRefineResponse(history_id=history_id, status=RefineStatus.SKIPPED, sql=item.generated_sql)
+
+
+@router.get("/query/{history_id}/refined", response_model=DataResponse[AIRefineResponse])
+async def get_refined_sql(history_id: int, db: AsyncSession = Depends(get_db)):
+    """轮询草稿精炼结果"""
+    return DataResponse(data=await _refine_snapshot(history_id, db))
+
+
+@router.get("/query/{history_id}/refined/stream")
+async def stream_refined_sql(history_id: int, db: AsyncSession = Depends(get_db)):
+    """以SSE推送草稿精炼结果：精炼结束时发送一次 `refined` 事件后关闭，等待期间定期发送心跳注释。"""
+    snapshot = await _refine_snapshot(history_id, db)
+
+    async def _events():
+        registry = get_draft_registry()
+        deadline = time.monotonic() + settings.DRAFT_REFINE_TIMEOUT_SECONDS + settings.DRAFT_SSE_KEEPALIVE_SECONDS
+        data = snapshot
+        while data.status == RefineStatus.PENDING and time.monotonic() < deadline:
+            state = await registry.wait(history_id, timeout=settings.DRAFT_SSE_KEEPALIVE_SECONDS)
+            if state is None:
+                break
+            data = AIRefineResponse(**state.to_dict())
+            if data.status == RefineStatus.PENDING:
+                yield ": keepalive\n\n"
+        yield f"event: refined\ndata: {json.dumps(data.model_dump(), ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
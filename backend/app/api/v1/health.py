@@ -4,11 +4,45 @@
 from fastapi import APIRouter
 
 from app.core.config import settings
+from app.services.circuit_breaker import llm_breaker_snapshots, BreakerState
+from app.services.ai_call_log_buffer import ai_call_log_buffer
+from app.services.llm_pool import get_llm_pool
+from app.services.connection_pool import get_pool_manager
+from app.services.cost_guard import get_cost_guard
+from app.services.query_sampler import get_query_sampler
+from app.services.query_executor import get_query_executor
+from app.services.query_exports import get_query_export_manager
+from app.services.query_jobs import get_query_job_manager
+from app.services.query_scheduler import get_query_scheduler
+from app.services.replica_router import get_replica_router
+from app.services.result_cache import get_result_cache
 
 router = APIRouter()
 
 
+def build_health_payload() -> dict:
+    """汇总健康检查数据（服务状态、大模型端点熔断状态与各组件指标），供 /health 与 /api/v1/health 共用。"""
+    breakers = llm_breaker_snapshots()
+    degraded = any(b.get("state") != BreakerState.CLOSED.value for b in breakers)
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "service": settings.APP_NAME,
+        "llm_breakers": breakers,
+        "llm_pool": get_llm_pool().stats(),
+        "ai_call_log_buffer": ai_call_log_buffer.stats(),
+        "data_source_pools": get_pool_manager().stats(),
+        "data_source_replicas": get_replica_router().stats(),
+        "query_executors": get_query_executor().stats(),
+        "query_schedulers": get_query_scheduler().stats(),
+        "query_cost_guard": get_cost_guard().stats(),
+        "query_sampler": get_query_sampler().stats(),
+        "query_result_cache": get_result_cache().stats(),
+        "query_jobs": get_query_job_manager().stats(),
+        "query_exports": get_query_export_manager().stats(),
+    }
+
+
 @router.get("/health")
 async def health_v1():
-    """提供 /api/v1/health 端点，便于前端统一探活"""
-    return {"status": "healthy", "service": settings.APP_NAME}
\ No newline at end of file
+    """提供 /api/v1/health 端点，便于前端统一探活；附带大模型端点熔断状态与调用日志缓冲指标"""
+    return build_health_payload()
@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from app.services.metadata_index import MetadataIndexer
 from app.services.metadata_search import MetadataSearch
+from app.services.metadata_catalog import get_metadata_catalog
 from loguru import logger
 import os
 import json
@@ -19,6 +20,8 @@ def sync_metadata_index():
     """
     indexer = MetadataIndexer()
     summary = indexer.sync_all()
+    # 同步完成后标记元数据目录缓存过期，下次访问时后台刷新
+    get_metadata_catalog().invalidate()
     return {"status": "ok", "summary": summary}
 
 
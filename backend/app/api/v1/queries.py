@@ -1,10 +1,19 @@
 """
 查询管理API
 """
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_db, AsyncSessionLocal
 from app.schemas.common import DataResponse, PaginatedResponse, PaginationInfo
 from app.schemas.query import (
     QueryTemplateCreate,
@@ -12,12 +21,64 @@ from app.schemas.query import (
     QueryTemplateResponse,
     QueryHistoryResponse,
     QueryExecuteRequest,
+    QueryExplainRequest,
+    QueryExportResponse,
+    QueryExportSubmitRequest,
+    QueryJobResponse,
+    QueryJobSubmitRequest,
+    QueryPageRequest,
+    QueryPageResponse,
+    QueryStreamRequest,
     QueryResponse,
     QuerySaveRequest,
     QueryShareRequest,
 )
 from app.services.query import QueryService
+from app.services.cost_guard import VERDICT_LIMITED, CostGuardRejectedError, CostVerdict, get_cost_guard
 from app.services.data_source import DataSourceService
+from app.services.preview import get_preview_cache
+from app.services.query_cancel import ClientDisconnectedError, ServerSession, await_or_cancel_on_disconnect
+from app.services.query_executor import ExecutorBusyError
+from app.services.query_exports import (
+    EXPORT_MEDIA_TYPES,
+    ExportFormatUnavailableError,
+    ExportJob,
+    RangeNotSatisfiableError,
+    check_format,
+    export_file_path,
+    get_query_export_manager,
+    iter_file,
+    parse_range,
+    read_manifest,
+)
+from app.services.query_jobs import QueryJob, get_query_job_manager
+from app.services.query_sampler import SamplePlan, get_query_sampler, scale_results
+from app.services.query_scheduler import user_key_from_request
+from app.services.result_cache import get_result_cache
+from app.services.result_format import (
+    ARROW_STREAM_MEDIA_TYPE,
+    COLUMNAR_JSON_MEDIA_TYPE,
+    RESULT_FORMAT_ARROW,
+    RESULT_FORMAT_JSON,
+    FormatNotAcceptableError,
+    negotiate_format,
+    to_arrow_ipc,
+    to_columnar_json,
+)
+from app.services.metadata_catalog import get_metadata_catalog
+from app.services.result_pager import (
+    PAGE_MODE_KEYSET,
+    PAGE_MODE_SEGMENT,
+    InvalidCursorError,
+    PageCursor,
+    build_keyset_sql,
+    decode_cursor,
+    detect_sort_keys,
+    encode_cursor,
+    key_values,
+)
+from app.services.result_stream import STREAM_MEDIA_TYPES, StreamStats, stream_query
+from app.services.sql_parser import parse_sql
 # 暂时不做鉴权，移除用户依赖
 from app.models.query import QueryStatus
 
@@ -151,23 +212,88 @@ async def get_history(
 @router.post("/execute", response_model=DataResponse[QueryResponse])
 async def execute_query(
     payload: QueryExecuteRequest,
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ):
+    """执行只读SQL。Accept 为 Arrow IPC 流或紧凑列式 JSON 时按列式格式返回，否则返回逐行字典。"""
+    try:
+        fmt = negotiate_format(request.headers.get("accept"))
+    except FormatNotAcceptableError as e:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=str(e))
     qs = QueryService(db)
     ds_service = DataSourceService(db)
     ds = await ds_service.get(payload.data_source_id)
     if not ds:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="数据源不存在")
-    import time
     start = time.perf_counter()
+    max_rows = payload.max_rows or 1000
+    session = ServerSession()
+    user_key = user_key_from_request(request)
+    exec_sql = payload.sql
+
+    async def _on_disconnect():
+        # 合并执行中还有其他请求在等待同一结果时不中止，仅放弃本请求
+        if get_result_cache().is_shared(ds.id, exec_sql, max_rows):
+            return
+        await session.cancel(ds_service, ds)
+
     try:
-        rows, columns = await ds_service.execute_sql(
-            ds,
-            payload.sql,
-            max_rows=payload.max_rows or 1000,
-            timeout_seconds=payload.timeout_seconds or 30,
+        # 抽样预览：单表查询改写为在样本上执行，结果标记为近似
+        sample = None
+        if payload.sample:
+            sample = await get_query_sampler().plan(
+                ds_service, ds, payload.sql, payload.sample_percent or settings.QUERY_SAMPLE_PERCENT, user_key
+            )
+            exec_sql = sample.sql
+        # 执行前以 EXPLAIN 预估代价：超出数据源阈值时拒绝，或对明细查询收紧返回行数
+        verdict = await get_cost_guard().check(ds_service, ds, exec_sql, max_rows)
+        max_rows = verdict.max_rows
+        if fmt != RESULT_FORMAT_JSON:
+            return await _execute_columnar(qs, ds_service, ds, payload, fmt, start, request, session, verdict, sample)
+        # 命中 /ai/query 推测性预览的缓存结果时免去再次连接与执行（预览为精确结果，抽样时不使用）
+        preview = None
+        if not payload.refresh_cache and not (sample and sample.applied):
+            preview = get_preview_cache().get(ds.id, payload.sql, max_rows)
+
+        async def _execute():
+            if preview is not None:
+                return preview.rows[:max_rows], preview.columns
+            return await ds_service.execute_sql(
+                ds,
+                exec_sql,
+                max_rows=max_rows,
+                timeout_seconds=payload.timeout_seconds or 30,
+                on_connection=session.on_connection,
+                user_key=user_key,
+            )
+
+        # 客户端断开（关闭页面、代理超时）时中止数据源上仍在执行的语句
+        cached = await await_or_cancel_on_disconnect(
+            request,
+            get_result_cache().get_or_execute(
+                ds.id,
+                exec_sql,
+                max_rows,
+                _execute,
+                use_cache=payload.use_cache,
+                refresh=payload.refresh_cache,
+            ),
+            _on_disconnect,
         )
+        rows, columns = cached.rows, cached.columns
+        approximate = bool(sample and sample.applied)
+        if approximate:
+            rows = scale_results(sample, rows, columns)
         exec_ms = int((time.perf_counter() - start) * 1000)
+        tags = ["execute"]
+        if cached.hit:
+            tags.append("result_cache")
+        elif preview is not None:
+            tags.append("preview_cache")
+        if verdict.verdict == VERDICT_LIMITED:
+            tags.append("cost_limited")
+        if approximate:
+            tags.append("sampled")
         item = await qs.create_history(
             user_id=0,
             natural_language_query="",
@@ -177,15 +303,15 @@ async def execute_query(
             row_count=len(rows),
             error_message=None,
             is_saved=True,
-            tags=["execute"],
-            executed_sql=payload.sql,
+            tags=tags,
+            executed_sql=exec_sql,
         )
         # 构造包含数据与列的响应
         resp = QueryResponse(
             query_id=item.id,
             natural_language_query=item.natural_language_query or "",
             generated_sql=item.generated_sql,
-            executed_sql=payload.sql,
+            executed_sql=exec_sql,
             status=QueryStatus.SUCCESS,
             execution_time_ms=exec_ms,
             row_count=len(rows),
@@ -193,8 +319,48 @@ async def execute_query(
             data=rows,
             error_message=None,
             created_at=item.created_at,
+            cache_hit=cached.hit,
+            cache_age_seconds=cached.age_seconds if cached.hit else None,
+            cost_estimate=verdict.to_dict(),
+            approximate=approximate,
+            sample=sample.to_dict() if sample is not None else None,
         )
-        return DataResponse(data=resp, message="执行成功")
+        return DataResponse(data=resp, message="执行成功（抽样近似结果）" if approximate else "执行成功")
+    except CostGuardRejectedError as e:
+        exec_ms = int((time.perf_counter() - start) * 1000)
+        await qs.create_history(
+            user_id=0,
+            natural_language_query="",
+            generated_sql=payload.sql,
+            status=QueryStatus.ERROR,
+            execution_time_ms=exec_ms,
+            row_count=0,
+            error_message=str(e),
+            is_saved=True,
+            tags=["execute", "cost_guard"],
+            executed_sql=exec_sql,
+        )
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"查询预估代价过高，已拒绝执行：{e}")
+    except ExecutorBusyError as e:
+        # 数据源执行队列已满：快速失败，提示客户端稍后重试
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except ClientDisconnectedError:
+        exec_ms = int((time.perf_counter() - start) * 1000)
+        logger.info("客户端断开，查询已取消: data_source_id={}, ms={}", ds.id, exec_ms)
+        await qs.create_history(
+            user_id=0,
+            natural_language_query="",
+            generated_sql=payload.sql,
+            status=QueryStatus.CANCELLED,
+            execution_time_ms=exec_ms,
+            row_count=0,
+            error_message="客户端断开连接，查询已取消",
+            is_saved=True,
+            tags=["execute", "client_disconnect"],
+            executed_sql=exec_sql,
+        )
+        # 499：客户端已关闭请求（响应不会被读取）
+        return Response(status_code=499)
     except Exception as e:
         exec_ms = int((time.perf_counter() - start) * 1000)
         item = await qs.create_history(
@@ -207,11 +373,603 @@ async def execute_query(
             error_message=str(e),
             is_saved=True,
             tags=["execute_error"],
-            executed_sql=payload.sql,
+            executed_sql=exec_sql,
         )
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"执行失败: {e}")
 
 
+async def _execute_columnar(
+    qs: QueryService,
+    ds_service: DataSourceService,
+    ds,
+    payload: QueryExecuteRequest,
+    fmt: str,
+    start: float,
+    request: Request,
+    session: ServerSession,
+    verdict: CostVerdict,
+    sample: Optional[SamplePlan] = None,
+) -> Response:
+    """列式格式执行：直接取游标元组并编码，保留原生类型；不经过结果缓存与预览缓存（二者按行字典存储）。"""
+    exec_sql = sample.sql if sample is not None else payload.sql
+    rows, columns = await await_or_cancel_on_disconnect(
+        request,
+        ds_service.execute_sql(
+            ds,
+            exec_sql,
+            max_rows=verdict.max_rows,
+            timeout_seconds=payload.timeout_seconds or 30,
+            as_tuples=True,
+            on_connection=session.on_connection,
+            user_key=user_key_from_request(request),
+        ),
+        lambda: session.cancel(ds_service, ds),
+    )
+    approximate = bool(sample and sample.applied)
+    if approximate:
+        rows = scale_results(sample, rows, columns)
+    exec_ms = int((time.perf_counter() - start) * 1000)
+    tags = ["execute", fmt]
+    if verdict.verdict == VERDICT_LIMITED:
+        tags.append("cost_limited")
+    if approximate:
+        tags.append("sampled")
+    item = await qs.create_history(
+        user_id=0,
+        natural_language_query="",
+        generated_sql=payload.sql,
+        status=QueryStatus.SUCCESS,
+        execution_time_ms=exec_ms,
+        row_count=len(rows),
+        error_message=None,
+        is_saved=True,
+        tags=tags,
+        executed_sql=exec_sql,
+    )
+    meta = {"query_id": item.id, "row_count": len(rows), "execution_time_ms": exec_ms}
+    headers = {
+        "X-Query-Id": str(item.id),
+        "X-Row-Count": str(len(rows)),
+        "X-Execution-Time-Ms": str(exec_ms),
+        "X-Cost-Verdict": verdict.verdict,
+        "X-Approximate": "true" if approximate else "false",
+    }
+    if approximate:
+        headers["X-Sample-Percent"] = f"{sample.percent:g}"
+    if fmt == RESULT_FORMAT_ARROW:
+        body = await asyncio.to_thread(to_arrow_ipc, columns, rows, meta)
+        return Response(content=body, media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
+    body = await asyncio.to_thread(to_columnar_json, columns, rows, meta)
+    return Response(content=body, media_type=COLUMNAR_JSON_MEDIA_TYPE, headers=headers)
+
+
+@router.post("/explain", response_model=DataResponse[dict])
+async def explain_query(
+    payload: QueryExplainRequest,
+    db: AsyncSession = Depends(get_db),
+):
+    """预估查询代价（EXPLAIN，不实际执行），返回扫描行数、连接扇出、全表扫描的表及按数据源阈值的判定。"""
+    try:
+        parse_sql(payload.sql).validate_read_only()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    ds_service = DataSourceService(db)
+    ds = await ds_service.get(payload.data_source_id)
+    if not ds:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="数据源不存在")
+    verdict = await get_cost_guard().evaluate(ds_service, ds, payload.sql, payload.max_rows or 1000, force=True)
+    return DataResponse(data=verdict.to_dict(), message="代价估算完成")
+
+
+@router.post("/execute/page", response_model=DataResponse[QueryPageResponse])
+async def execute_query_page(
+    payload: QueryPageRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    """分页执行只读SQL：有稳定排序键时按键集分页（每页代价相同），否则从缓存的结果分段中切片；返回不透明游标。"""
+    parsed = parse_sql(payload.sql)
+    try:
+        parsed.validate_read_only()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    qs = QueryService(db)
+    ds_service = DataSourceService(db)
+    ds = await ds_service.get(payload.data_source_id)
+    if not ds:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="数据源不存在")
+    if payload.cursor:
+        try:
+            cursor = decode_cursor(payload.cursor, ds.id, parsed.fingerprint)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    else:
+        keys = payload.sort_keys
+        if not keys:
+            snapshot = await asyncio.to_thread(get_metadata_catalog().get, True)
+            keys = detect_sort_keys(parsed, ds.id, snapshot)
+        cursor = PageCursor(mode=PAGE_MODE_KEYSET if keys else PAGE_MODE_SEGMENT, keys=list(keys or []))
+    page_size = payload.page_size
+    timeout = payload.timeout_seconds or 30
+    user_key = user_key_from_request(request)
+    session = ServerSession()
+    start = time.perf_counter()
+    try:
+        if cursor.mode == PAGE_MODE_KEYSET:
+            sql, params = build_keyset_sql(parsed, cursor.keys, cursor.after, page_size, getattr(ds.type, "value", ds.type))
+            rows, columns = await await_or_cancel_on_disconnect(
+                request,
+                ds_service.execute_sql(
+                    ds,
+                    sql,
+                    max_rows=page_size + 1,
+                    timeout_seconds=timeout,
+                    on_connection=session.on_connection,
+                    user_key=user_key,
+                    params=params,
+                ),
+                lambda: session.cancel(ds_service, ds),
+            )
+            missing = [k for k in cursor.keys if k not in columns]
+            if missing:
+                raise ValueError(f"排序键不在输出列中: {', '.join(missing)}")
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+            truncated = False
+            next_cursor = None
+            if has_more:
+                next_cursor = PageCursor(
+                    mode=PAGE_MODE_KEYSET,
+                    page=cursor.page + 1,
+                    keys=cursor.keys,
+                    after=key_values(rows[-1], cursor.keys),
+                )
+        else:
+            cap = max(page_size, settings.QUERY_PAGE_SEGMENT_MAX_ROWS)
+            # 结果整体写入查询结果缓存，后续页直接切片，不再访问数据源
+            cached = await await_or_cancel_on_disconnect(
+                request,
+                get_result_cache().get_or_execute(
+                    ds.id,
+                    payload.sql,
+                    cap,
+                    lambda: ds_service.execute_sql(
+                        ds,
+                        payload.sql,
+                        max_rows=cap,
+                        timeout_seconds=timeout,
+                        on_connection=session.on_connection,
+                        user_key=user_key,
+                    ),
+                ),
+                lambda: session.cancel(ds_service, ds),
+            )
+            columns = cached.columns
+            rows = cached.rows[cursor.offset: cursor.offset + page_size]
+            has_more = cursor.offset + page_size < len(cached.rows)
+            truncated = len(cached.rows) >= cap
+            next_cursor = None
+            if has_more:
+                next_cursor = PageCursor(mode=PAGE_MODE_SEGMENT, page=cursor.page + 1, offset=cursor.offset + page_size)
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except ClientDisconnectedError:
+        return Response(status_code=499)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"执行失败: {e}")
+    exec_ms = int((time.perf_counter() - start) * 1000)
+    if cursor.page == 1:
+        # 仅首页记录查询历史，翻页不重复记录
+        await qs.create_history(
+            user_id=0,
+            natural_language_query="",
+            generated_sql=payload.sql,
+            status=QueryStatus.SUCCESS,
+            execution_time_ms=exec_ms,
+            row_count=len(rows),
+            error_message=None,
+            is_saved=True,
+            tags=["execute", "page", cursor.mode],
+            executed_sql=payload.sql,
+        )
+    resp = QueryPageResponse(
+        columns=[{"name": c} for c in columns],
+        data=rows,
+        row_count=len(rows),
+        page=cursor.page,
+        has_more=has_more,
+        next_cursor=encode_cursor(next_cursor, ds.id, parsed.fingerprint) if next_cursor else None,
+        pagination_mode=cursor.mode,
+        sort_keys=cursor.keys,
+        truncated=truncated,
+        execution_time_ms=exec_ms,
+    )
+    return DataResponse(data=resp, message="执行成功")
+
+
+@router.post("/execute/stream")
+async def execute_query_stream(
+    payload: QueryStreamRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    """流式执行只读SQL：服务端游标逐批读取，按 NDJSON（每行一个JSON对象）或 CSV 输出，内存占用与结果集大小无关。"""
+    try:
+        parse_sql(payload.sql).validate_read_only()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    ds_service = DataSourceService(db)
+    ds = await ds_service.get(payload.data_source_id)
+    if not ds:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="数据源不存在")
+    cap = settings.QUERY_STREAM_MAX_ROWS
+    max_rows = min(payload.max_rows or cap, cap) if cap > 0 else payload.max_rows
+    stats = StreamStats()
+    user_key = user_key_from_request(request)
+
+    async def _body():
+        async for chunk in stream_query(
+            ds_service,
+            ds,
+            payload.sql,
+            fmt=payload.format,
+            max_rows=max_rows,
+            timeout_seconds=payload.timeout_seconds or 300,
+            stats=stats,
+            user_key=user_key,
+        ):
+            yield chunk
+        # 结束后记录历史（请求会话可能已释放，使用独立会话）
+        try:
+            async with AsyncSessionLocal() as hdb:
+                await QueryService(hdb).create_history(
+                    user_id=0,
+                    natural_language_query="",
+                    generated_sql=payload.sql,
+                    status=QueryStatus.ERROR if stats.error else QueryStatus.SUCCESS,
+                    execution_time_ms=stats.elapsed_ms,
+                    row_count=stats.rows,
+                    error_message=stats.error,
+                    is_saved=True,
+                    tags=["execute_stream"],
+                    executed_sql=payload.sql,
+                )
+        except Exception as e:
+            logger.warning("流式查询历史记录失败: {}", e)
+
+    headers = {"X-Accel-Buffering": "no"}
+    if payload.format == "csv":
+        headers["Content-Disposition"] = f'attachment; filename="query_{ds.id}.csv"'
+    return StreamingResponse(_body(), media_type=STREAM_MEDIA_TYPES[payload.format], headers=headers)
+
+
+def _job_response(job=None, item=None) -> QueryJobResponse:
+    """由进程内任务（优先，进度最新）或查询历史记录构造任务状态。"""
+    if job is not None:
+        return QueryJobResponse(
+            job_id=job.job_id,
+            status=job.status,
+            progress=job.progress,
+            row_count=job.row_count,
+            execution_time_ms=job.execution_time_ms,
+            error_message=job.error,
+            created_at=getattr(item, "created_at", None),
+        )
+    return QueryJobResponse(
+        job_id=item.id,
+        status=item.status,
+        progress=item.progress or 0,
+        row_count=item.row_count,
+        execution_time_ms=item.execution_time_ms,
+        error_message=item.error_message,
+        created_at=item.created_at,
+    )
+
+
+async def _get_job_history(qs: QueryService, job_id: int):
+    item = await qs.get_history(job_id)
+    if not item or "job" not in (item.tags or []):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="查询任务不存在")
+    return item
+
+
+@router.post("/jobs", response_model=DataResponse[QueryJobResponse], status_code=status.HTTP_202_ACCEPTED)
+async def submit_query_job(
+    payload: QueryJobSubmitRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    """提交异步查询任务：立即返回任务ID，查询在后台执行，通过状态/结果接口轮询。"""
+    try:
+        parse_sql(payload.sql).validate_read_only()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    qs = QueryService(db)
+    ds_service = DataSourceService(db)
+    ds = await ds_service.get(payload.data_source_id)
+    if not ds:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="数据源不存在")
+    item = await qs.create_history(
+        user_id=0,
+        natural_language_query="",
+        generated_sql=payload.sql,
+        status=QueryStatus.QUEUED,
+        is_saved=True,
+        tags=["job"],
+        executed_sql=payload.sql,
+    )
+    try:
+        # 与请求会话解绑，任务在线程中读取连接参数
+        db.expunge(ds)
+    except Exception:
+        pass
+    job = get_query_job_manager().submit(
+        ds_service,
+        QueryJob(
+            job_id=item.id,
+            ds=ds,
+            sql=payload.sql,
+            max_rows=payload.max_rows or 1000,
+            timeout_seconds=payload.timeout_seconds or 600,
+            user_key=user_key_from_request(request),
+        ),
+    )
+    return DataResponse(data=_job_response(job, item), message="查询任务已提交")
+
+
+@router.get("/jobs/{job_id}", response_model=DataResponse[QueryJobResponse])
+async def get_query_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+):
+    job = get_query_job_manager().get(job_id)
+    if job is not None:
+        return DataResponse(data=_job_response(job), message="获取任务状态成功")
+    item = await _get_job_history(QueryService(db), job_id)
+    return DataResponse(data=_job_response(item=item), message="获取任务状态成功")
+
+
+@router.get("/jobs/{job_id}/result", response_model=DataResponse[QueryResponse])
+async def get_query_job_result(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+):
+    """获取已完成任务的结果；任务未结束时返回 409，失败或取消时返回 400。"""
+    qs = QueryService(db)
+    item = await _get_job_history(qs, job_id)
+    job = get_query_job_manager().get(job_id)
+    state = job.status if job is not None else item.status
+    if state in (QueryStatus.QUEUED, QueryStatus.RUNNING):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="查询任务尚未完成")
+    if state != QueryStatus.SUCCESS:
+        error = job.error if job is not None else item.error_message
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"查询任务未成功（{state.value}）: {error}")
+    if job is not None:
+        columns, rows = job.columns, job.rows
+        exec_ms, row_count = job.execution_time_ms, job.row_count
+    else:
+        result = item.query_result or {}
+        columns, rows = result.get("columns") or [], result.get("rows") or []
+        exec_ms, row_count = item.execution_time_ms, item.row_count
+    resp = QueryResponse(
+        query_id=item.id,
+        natural_language_query=item.natural_language_query or "",
+        generated_sql=item.generated_sql,
+        executed_sql=item.executed_sql,
+        status=QueryStatus.SUCCESS,
+        execution_time_ms=exec_ms,
+        row_count=row_count,
+        columns=[{"name": c} for c in columns],
+        data=rows,
+        error_message=None,
+        created_at=item.created_at,
+    )
+    return DataResponse(data=resp, message="获取任务结果成功")
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=DataResponse[QueryJobResponse])
+async def cancel_query_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+):
+    """取消任务：排队中的任务不再执行，执行中的任务在数据源上中止当前语句。"""
+    manager = get_query_job_manager()
+    job = manager.get(job_id)
+    if job is None:
+        item = await _get_job_history(QueryService(db), job_id)
+        if item.status in (QueryStatus.QUEUED, QueryStatus.RUNNING):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="查询任务不在本实例执行，无法取消")
+        return DataResponse(data=_job_response(item=item), message="查询任务已结束")
+    if not await manager.cancel(DataSourceService(db), job):
+        return DataResponse(data=_job_response(job), message="查询任务已结束")
+    return DataResponse(data=_job_response(job), message="已请求取消查询任务")
+
+
+def _export_files(request: Request, export_id: int, files) -> list:
+    return [
+        {**f, "url": str(request.url_for("download_query_export_file", export_id=export_id, name=f["name"]))}
+        for f in files or []
+    ]
+
+
+def _export_response(request: Request, job=None, item=None) -> QueryExportResponse:
+    """由进程内导出任务（优先，进度最新）或查询历史记录（清单在 query_result）构造导出状态。"""
+    if job is not None:
+        return QueryExportResponse(
+            export_id=job.export_id,
+            status=job.status,
+            format=job.fmt,
+            progress=job.progress,
+            row_count=job.row_count,
+            bytes=job.bytes_written,
+            columns=job.columns,
+            files=_export_files(request, job.export_id, job.files),
+            expires_at=datetime.fromtimestamp(job.expires_at) if job.expires_at else None,
+            execution_time_ms=job.execution_time_ms,
+            error_message=job.error,
+            created_at=getattr(item, "created_at", None),
+        )
+    manifest = item.query_result or {}
+    error = item.error_message
+    files = manifest.get("files") or []
+    if item.status == QueryStatus.SUCCESS and read_manifest(item.id) is None:
+        error, files = "导出文件已过期或已删除", []
+    return QueryExportResponse(
+        export_id=item.id,
+        status=item.status,
+        format=manifest.get("format") or next((t for t in item.tags or [] if t in EXPORT_MEDIA_TYPES), None),
+        progress=item.progress or 0,
+        row_count=item.row_count,
+        bytes=manifest.get("bytes"),
+        columns=manifest.get("columns") or [],
+        files=_export_files(request, item.id, files),
+        expires_at=datetime.fromtimestamp(manifest["expires_at"]) if manifest.get("expires_at") else None,
+        execution_time_ms=item.execution_time_ms,
+        error_message=error,
+        created_at=item.created_at,
+    )
+
+
+async def _get_export_history(qs: QueryService, export_id: int):
+    item = await qs.get_history(export_id)
+    if not item or "export" not in (item.tags or []):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="导出任务不存在")
+    return item
+
+
+@router.post("/exports", response_model=DataResponse[QueryExportResponse], status_code=status.HTTP_202_ACCEPTED)
+async def submit_query_export(
+    payload: QueryExportSubmitRequest,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    """提交结果导出任务：结果在后台以服务端游标分片写入 Parquet/CSV 文件，完成后按清单下载。"""
+    try:
+        parse_sql(payload.sql).validate_read_only()
+        check_format(payload.format)
+    except (ValueError, ExportFormatUnavailableError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    qs = QueryService(db)
+    ds_service = DataSourceService(db)
+    ds = await ds_service.get(payload.data_source_id)
+    if not ds:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="数据源不存在")
+    max_rows = payload.max_rows
+    if settings.QUERY_EXPORT_MAX_ROWS:
+        max_rows = min(max_rows or settings.QUERY_EXPORT_MAX_ROWS, settings.QUERY_EXPORT_MAX_ROWS)
+    item = await qs.create_history(
+        user_id=0,
+        natural_language_query="",
+        generated_sql=payload.sql,
+        status=QueryStatus.QUEUED,
+        is_saved=True,
+        tags=["export", payload.format],
+        executed_sql=payload.sql,
+    )
+    try:
+        # 与请求会话解绑，任务在线程中读取连接参数
+        db.expunge(ds)
+    except Exception:
+        pass
+    job = get_query_export_manager().submit(
+        ds_service,
+        ExportJob(
+            export_id=item.id,
+            ds=ds,
+            sql=payload.sql,
+            fmt=payload.format,
+            max_rows=max_rows,
+            timeout_seconds=payload.timeout_seconds or 3600,
+            user_key=user_key_from_request(request),
+        ),
+    )
+    return DataResponse(data=_export_response(request, job, item), message="导出任务已提交")
+
+
+@router.get("/exports/{export_id}", response_model=DataResponse[QueryExportResponse])
+async def get_query_export(
+    export_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    job = get_query_export_manager().get(export_id)
+    if job is not None:
+        return DataResponse(data=_export_response(request, job), message="获取导出状态成功")
+    item = await _get_export_history(QueryService(db), export_id)
+    return DataResponse(data=_export_response(request, item=item), message="获取导出状态成功")
+
+
+@router.post("/exports/{export_id}/cancel", response_model=DataResponse[QueryExportResponse])
+async def cancel_query_export(
+    export_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    """取消导出：排队中的导出不再执行，执行中的导出在数据源上中止当前语句并删除已写出的分片。"""
+    manager = get_query_export_manager()
+    job = manager.get(export_id)
+    if job is None:
+        item = await _get_export_history(QueryService(db), export_id)
+        if item.status in (QueryStatus.QUEUED, QueryStatus.RUNNING):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="导出任务不在本实例执行，无法取消")
+        return DataResponse(data=_export_response(request, item=item), message="导出任务已结束")
+    if not await manager.cancel(DataSourceService(db), job):
+        return DataResponse(data=_export_response(request, job), message="导出任务已结束")
+    return DataResponse(data=_export_response(request, job), message="已请求取消导出任务")
+
+
+@router.get("/exports/{export_id}/files/{name}", name="download_query_export_file")
+async def download_query_export_file(
+    export_id: int,
+    name: str,
+    request: Request,
+):
+    """下载导出分片；支持单段 Range（断点续传），If-Range 与 ETag 不一致时返回完整文件。"""
+    manifest = await asyncio.to_thread(read_manifest, export_id)
+    if manifest is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="导出不存在、未完成或已过期")
+    path = export_file_path(manifest, name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="导出文件不存在")
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="导出文件已删除")
+    size = st.st_size
+    etag = f'"{export_id}-{int(st.st_mtime)}-{size}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="export_{export_id}_{name}"',
+    }
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        # 文件已变化：忽略 Range，返回完整文件
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiableError:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="请求的范围超出文件大小",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    media_type = EXPORT_MEDIA_TYPES.get(manifest.get("format"), "application/octet-stream")
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_file(path, 0, size - 1), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file(path, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
 @router.post("/save", response_model=DataResponse[QueryHistoryResponse])
 async def save_query(
     payload: QuerySaveRequest,
@@ -3,7 +3,7 @@
 """
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import os
 
 
@@ -70,12 +70,90 @@ class Settings(BaseSettings):
         description="OpenAI API基础URL"
     )
     AI_MODEL_NAME: str = Field(default="gpt-4", description="AI模型名称")
-    
+    # 模型分级路由：简单问题走快速模型，复杂问题或快速模型生成无效SQL时使用 AI_MODEL_NAME
+    AI_MODEL_FAST_NAME: str = Field(default="", description="快速/低成本模型名称，为空时不启用分级路由")
+    AI_MODEL_ROUTER_THRESHOLD: float = Field(default=2.0, description="复杂度分数阈值，低于该值路由到快速模型")
+
+    # 多端点负载均衡（JSON数组，元素含 base_url/api_key/model/weight/name；为空时使用 OPENAI_BASE_URL）
+    LLM_ENDPOINTS: List[Dict[str, Any]] = Field(default=[], description="大模型端点列表")
+    LLM_HEDGE_ENABLED: bool = Field(default=False, description="是否启用对冲请求（首个请求超过P90未返回时向其他端点补发）")
+    LLM_HEDGE_MIN_DELAY_MS: int = Field(default=1500, description="对冲触发延迟下限（毫秒），P90样本不足时使用")
+    LLM_HEDGE_MAX_RATIO: float = Field(default=0.1, description="对冲请求占总请求的比例上限")
+
+    # 大模型调用熔断配置（按端点独立统计）
+    LLM_BREAKER_WINDOW_SIZE: int = Field(default=20, description="熔断统计滑动窗口大小（调用次数）")
+    LLM_BREAKER_MIN_CALLS: int = Field(default=5, description="窗口内触发熔断判定的最少调用次数")
+    LLM_BREAKER_ERROR_RATE: float = Field(default=0.5, description="触发熔断的错误率阈值")
+    LLM_BREAKER_SLOW_CALL_MS: int = Field(default=8000, description="慢调用判定阈值（毫秒）")
+    LLM_BREAKER_SLOW_CALL_RATE: float = Field(default=0.8, description="触发熔断的慢调用比例阈值")
+    LLM_BREAKER_OPEN_SECONDS: int = Field(default=30, description="熔断持续时间（秒），之后进入半开探测")
+    LLM_BREAKER_HALF_OPEN_PROBES: int = Field(default=1, description="半开状态允许的探测请求数")
+
+    # AI调用日志缓冲写入配置
+    AI_CALL_LOG_BATCH_SIZE: int = Field(default=50, description="AI调用日志批量写入条数阈值")
+    AI_CALL_LOG_FLUSH_INTERVAL_MS: int = Field(default=1000, description="AI调用日志定时刷新间隔（毫秒）")
+    AI_CALL_LOG_MAX_QUEUE: int = Field(default=10000, description="AI调用日志内存队列上限，超出后丢弃")
+
     # 查询配置
     MAX_QUERY_ROWS: int = Field(default=1000, description="查询结果最大行数")
     QUERY_TIMEOUT_SECONDS: int = Field(default=30, description="查询超时时间（秒）")
     ENABLE_QUERY_CACHE: bool = Field(default=True, description="是否启用查询缓存")
     CACHE_EXPIRE_MINUTES: int = Field(default=60, description="缓存过期时间（分钟）")
+    QUERY_CACHE_MAX_BYTES: int = Field(default=2 * 1024 * 1024, description="单条查询结果缓存的最大压缩后字节数，超出不缓存")
+    QUERY_CACHE_LOCK_SECONDS: int = Field(default=30, description="缓存未命中时回源锁的有效期（秒），其他实例在此期间等待结果")
+
+    # 外部数据源连接池（按数据源ID独立维护）
+    DS_POOL_MIN_SIZE: int = Field(default=1, description="每个数据源保留的最少空闲连接数")
+    DS_POOL_MAX_SIZE: int = Field(default=10, description="每个数据源的最大连接数")
+    DS_POOL_IDLE_TIMEOUT_SECONDS: int = Field(default=300, description="空闲连接回收时间（秒）")
+    DS_POOL_PING_INTERVAL_SECONDS: int = Field(default=30, description="借出前探活的空闲间隔（秒），0 表示不探活")
+    DS_POOL_ACQUIRE_TIMEOUT_SECONDS: int = Field(default=10, description="连接池已满时等待连接的超时时间（秒）")
+    # 只读副本路由（数据源配置 replicas 后，只读查询分流到健康且复制延迟在阈值内的副本）
+    REPLICA_ROUTING_ENABLED: bool = Field(default=True, description="是否将只读查询路由到数据源的只读副本")
+    REPLICA_STRATEGY: str = Field(default="round_robin", description="默认的副本选择策略：round_robin 轮询 / least_connections 最少连接 / primary 仅主库")
+    REPLICA_MAX_LAG_SECONDS: int = Field(default=30, description="默认允许的最大复制延迟（秒），超出的副本不参与路由")
+    REPLICA_ALLOW_UNKNOWN_LAG: bool = Field(default=False, description="复制延迟未知（无权限查看复制状态）的副本是否参与路由；默认不参与，以免读到超出延迟阈值的旧数据")
+    REPLICA_HEALTH_CHECK_INTERVAL_SECONDS: int = Field(default=10, description="副本健康与复制延迟检查间隔（秒）")
+    REPLICA_CHECK_TIMEOUT_SECONDS: int = Field(default=3, description="副本检查借连接与查询的超时时间（秒）")
+    # 外部数据源查询执行线程池（同步驱动在线程中执行，不阻塞事件循环）
+    DS_EXECUTOR_MAX_WORKERS: int = Field(default=4, description="每个数据源并发执行查询的线程数（不超过连接池上限）")
+    DS_EXECUTOR_MAX_QUEUE: int = Field(default=32, description="每个数据源排队等待执行的查询数上限，超出后拒绝")
+    # 数据源查询准入与公平调度
+    QUERY_SCHEDULER_ENABLED: bool = Field(default=True, description="是否启用数据源查询准入与按用户公平调度")
+    QUERY_SCHEDULER_MAX_CONCURRENCY: int = Field(default=4, description="每个数据源默认的最大并发查询数")
+    QUERY_SCHEDULER_DS_CONCURRENCY: Dict[str, int] = Field(default={}, description="按数据源ID覆盖最大并发查询数，如 {\"3\": 2}")
+    QUERY_SCHEDULER_USER_WEIGHTS: Dict[str, float] = Field(default={}, description="用户调度权重（默认1），键为 user:<sub> 或 ip:<地址>")
+    QUERY_SCHEDULER_MAX_QUEUE: int = Field(default=64, description="每个数据源排队等待的查询数上限，超出后立即拒绝")
+    QUERY_SCHEDULER_QUEUE_TIMEOUT_SECONDS: float = Field(default=10.0, description="查询排队等待超时（秒），超时立即失败")
+    # 执行前代价守卫（EXPLAIN 预估扫描行数与连接扇出，数据源上的阈值优先）
+    COST_GUARD_ENABLED: bool = Field(default=True, description="是否在执行前以 EXPLAIN 预估查询代价")
+    COST_GUARD_MAX_SCAN_ROWS: int = Field(default=50000000, description="默认的预估扫描行数上限，0 表示不限制")
+    COST_GUARD_MAX_JOIN_FANOUT: int = Field(default=10000000, description="默认的预估连接扇出行数上限，0 表示不限制")
+    COST_GUARD_ACTION: str = Field(default="reject", description="超出阈值时的默认动作：reject 拒绝 / limit 收紧返回行数后执行 / off 不检查")
+    COST_GUARD_LIMIT_ROWS: int = Field(default=100, description="limit 动作下收紧后的最大返回行数")
+    COST_GUARD_CACHE_TTL_SECONDS: int = Field(default=600, description="执行计划估算按SQL指纹缓存的时间（秒）")
+    COST_GUARD_EXPLAIN_TIMEOUT_SECONDS: int = Field(default=5, description="EXPLAIN 超时时间（秒），超时或失败时放行")
+    # 抽样近似执行（探索性预览，仅单表查询）
+    QUERY_SAMPLE_PERCENT: float = Field(default=1.0, description="未指定时的默认抽样比例（%）")
+    QUERY_SAMPLE_PK_RANGES: int = Field(default=16, description="MySQL 主键范围抽样的分段数（分层抽样，降低数据分布随主键变化带来的偏差）")
+    QUERY_SAMPLE_BOUNDS_TTL_SECONDS: int = Field(default=300, description="MySQL 抽样使用的主键最小/最大值缓存时间（秒）")
+    # 流式执行（服务端游标 + 有界队列背压）
+    QUERY_STREAM_BATCH_ROWS: int = Field(default=500, description="流式执行每批读取与输出的行数")
+    QUERY_STREAM_QUEUE_CHUNKS: int = Field(default=8, description="流式执行缓冲的最大批次数，超出后读取线程等待")
+    QUERY_STREAM_MAX_ROWS: int = Field(default=1000000, description="流式执行的最大行数，0 表示不限制")
+    # 结果分页
+    QUERY_PAGE_SEGMENT_MAX_ROWS: int = Field(default=10000, description="无排序键时缓存分段模式一次读取并缓存的最大行数")
+    # 异步查询任务
+    QUERY_JOB_PROGRESS_INTERVAL_SECONDS: float = Field(default=2.0, description="查询任务进度回写查询历史的间隔（秒）")
+    QUERY_JOB_TTL_SECONDS: int = Field(default=3600, description="已结束查询任务在进程内保留的时间（秒），之后从查询历史读取")
+    # 结果导出（大结果集分片写入 UPLOAD_DIR/exports）
+    QUERY_EXPORT_MAX_ROWS: int = Field(default=50000000, description="单次导出的最大行数，0 表示不限制")
+    QUERY_EXPORT_BATCH_ROWS: int = Field(default=5000, description="导出时服务端游标每批读取的行数")
+    QUERY_EXPORT_ROW_GROUP_ROWS: int = Field(default=100000, description="Parquet 行组行数（即写出前在内存中缓冲的最大行数）")
+    QUERY_EXPORT_FILE_MAX_ROWS: int = Field(default=1000000, description="单个分片文件的最大行数，超出后滚动到下一分片")
+    QUERY_EXPORT_TTL_SECONDS: int = Field(default=86400, description="导出文件保留时间（秒），过期后由后台任务删除")
+    QUERY_EXPORT_CLEANUP_INTERVAL_SECONDS: int = Field(default=600, description="过期导出文件的清理间隔（秒）")
+    QUERY_EXPORT_DOWNLOAD_CHUNK_BYTES: int = Field(default=1024 * 1024, description="导出文件下载时每次读取的字节数")
     
     # ChromaDB配置
     CHROMA_PERSIST_DIRECTORY: str = Field(
@@ -92,6 +170,40 @@ class Settings(BaseSettings):
         description="ChromaDB用于元数据语义检索的集合名称"
     )
     
+    # 元数据目录缓存（规则兜底使用）刷新周期
+    METADATA_CATALOG_TTL_SECONDS: int = Field(default=300, description="元数据目录缓存过期时间（秒），过期后后台刷新")
+
+    # 意图语法引擎（常见统计类问题直接生成SQL，跳过模型调用）
+    INTENT_ENGINE_ENABLED: bool = Field(default=True, description="是否启用意图语法引擎")
+    INTENT_ENGINE_MIN_CONFIDENCE: float = Field(default=0.8, description="意图引擎直接返回SQL所需的最低置信度")
+    INTENT_ENGINE_FALLBACK_CONFIDENCE: float = Field(default=0.4, description="规则兜底时采用意图引擎结果的最低置信度")
+
+    # 查询模板快速路径
+    TEMPLATE_MATCH_ENABLED: bool = Field(default=True, description="是否在调用模型前匹配公开查询模板")
+    TEMPLATE_MATCH_MIN_CONFIDENCE: float = Field(default=0.85, description="模板匹配直接返回SQL所需的最低置信度")
+    TEMPLATE_MATCH_USE_EMBEDDING: bool = Field(default=False, description="模板匹配是否叠加向量相似度（需 sentence-transformers）")
+    TEMPLATE_INDEX_TTL_SECONDS: int = Field(default=300, description="模板索引过期时间（秒），过期后后台重建")
+    TEMPLATE_USAGE_FLUSH_INTERVAL_MS: int = Field(default=5000, description="模板使用次数回写间隔（毫秒）")
+
+    # 会话级上下文复用（多轮追问复用上一轮的表、列与SQL）
+    CONVERSATION_CONTEXT_ENABLED: bool = Field(default=True, description="是否复用会话工作集处理追问")
+    CONVERSATION_CONTEXT_LRU_SIZE: int = Field(default=1000, description="进程内会话工作集缓存条数上限")
+    CONVERSATION_CONTEXT_TTL_SECONDS: int = Field(default=1800, description="会话工作集过期时间（秒）")
+    # 多轮对话滚动摘要（最近K轮原文 + 更早消息的摘要，控制提示词长度）
+    CONVERSATION_KEEP_TURNS: int = Field(default=3, description="提示词中原样保留的最近对话轮数")
+    CONVERSATION_PROMPT_TOKEN_BUDGET: int = Field(default=1200, description="提示词中历史对话（摘要+最近轮次）的Token预算")
+
+    # 两阶段回答（草稿SQL即时返回，模型精炼异步交付）
+    DRAFT_REFINE_TIMEOUT_SECONDS: int = Field(default=60, description="后台精炼的最长耗时（秒）")
+    DRAFT_REFINE_TTL_SECONDS: int = Field(default=600, description="精炼结果在内存中的保留时间（秒）")
+    DRAFT_SSE_KEEPALIVE_SECONDS: int = Field(default=15, description="精炼结果SSE推送的心跳间隔（秒）")
+
+    # 生成SQL的推测性预览（请求开启 preview 且指定数据源时生效）
+    AI_PREVIEW_ENABLED: bool = Field(default=True, description="是否允许生成SQL后并发执行预览")
+    AI_PREVIEW_MAX_ROWS: int = Field(default=50, description="预览返回的最大行数")
+    AI_PREVIEW_TIMEOUT_SECONDS: int = Field(default=3, description="预览执行超时时间（秒）")
+    AI_PREVIEW_CACHE_TTL_SECONDS: int = Field(default=120, description="预览结果缓存时间（秒），供随后的执行请求复用")
+
     # 文件上传配置
     MAX_FILE_SIZE: int = Field(default=10 * 1024 * 1024, description="最大文件大小（字节）")
     UPLOAD_DIR: str = Field(default="./uploads", description="文件上传目录")
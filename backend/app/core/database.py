@@ -37,6 +37,13 @@ redis_pool = redis.ConnectionPool.from_url(
     max_connections=100
 )
 
+# 二进制Redis连接池（不解码响应，用于压缩后的查询结果缓存等二进制值）
+redis_binary_pool = redis.ConnectionPool.from_url(
+    settings.REDIS_URL,
+    decode_responses=False,
+    max_connections=50
+)
+
 
 class Base(DeclarativeBase):
     """数据库模型基类"""
@@ -64,6 +71,11 @@ async def get_redis() -> redis.Redis:
     return redis.Redis(connection_pool=redis_pool)
 
 
+async def get_redis_binary() -> redis.Redis:
+    """获取返回原始字节的Redis连接"""
+    return redis.Redis(connection_pool=redis_binary_pool)
+
+
 async def init_db():
     """初始化数据库"""
     try:
@@ -85,4 +97,8 @@ async def close_db():
     try:
         redis_pool.disconnect()
     except Exception as e:
-        logger.warning(f"关闭Redis连接失败: {e}")
\ No newline at end of file
+        logger.warning(f"关闭Redis连接失败: {e}")
+    try:
+        await redis_binary_pool.disconnect()
+    except Exception as e:
+        logger.warning(f"关闭Redis二进制连接池失败: {e}")
\ No newline at end of file
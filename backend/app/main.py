@@ -11,9 +11,19 @@ import time
 from app.core.config import settings
 from app.core.database import init_db, close_db
 from app.api import api_router
+from app.api.v1.health import build_health_payload
 from app.core.logging import setup_logging
 from app.core.middleware import RequestLoggingMiddleware
 from app.services.metadata_index import MetadataIndexer
+from app.services.metadata_catalog import get_metadata_catalog
+from app.services.ai_call_log_buffer import ai_call_log_buffer
+from app.services.template_matcher import template_usage_counter
+from app.services.conversation_summary import get_conversation_summarizer
+from app.services.connection_pool import get_pool_manager
+from app.services.query_executor import get_query_executor
+from app.services.query_exports import get_query_export_manager
+from app.services.query_jobs import get_query_job_manager
+from app.services.replica_router import get_replica_router
 
 # 初始化日志（确保文件日志和控制台日志均生效）
 setup_logging()
@@ -32,6 +42,11 @@ def _metadata_sync_loop(stop_evt: threading.Event):
         logger.info("后台任务: 首次元数据同步完成")
     except Exception as e:
         logger.warning(f"后台任务: 首次元数据同步失败: {e}")
+    # 预热规则兜底使用的元数据目录缓存
+    try:
+        get_metadata_catalog().refresh()
+    except Exception as e:
+        logger.warning(f"后台任务: 元数据目录加载失败: {e}")
     # 循环执行
     while not stop_evt.is_set():
         # 等待一小时或被终止
@@ -42,6 +57,7 @@ def _metadata_sync_loop(stop_evt: threading.Event):
             logger.info("后台任务: 每小时元数据同步开始…")
             indexer.sync_all()
             logger.info("后台任务: 每小时元数据同步完成")
+            get_metadata_catalog().refresh()
         except Exception as e:
             logger.warning(f"后台任务: 每小时元数据同步失败: {e}")
 
@@ -79,8 +95,74 @@ async def lifespan(app: FastAPI):
     t = threading.Thread(target=_metadata_sync_loop, args=(_stop_event,), daemon=True)
     t.start()
 
+    # 启动AI调用日志缓冲写入任务
+    try:
+        await ai_call_log_buffer.start()
+    except Exception as e:
+        logger.warning(f"AI调用日志缓冲启动失败: {e}")
+
+    # 启动查询模板使用次数回写任务
+    try:
+        await template_usage_counter.start()
+    except Exception as e:
+        logger.warning(f"模板使用次数回写任务启动失败: {e}")
+
+    # 启动数据源连接池空闲回收任务
+    try:
+        await get_pool_manager().start()
+    except Exception as e:
+        logger.warning(f"数据源连接池回收任务启动失败: {e}")
+
+    # 启动只读副本健康与复制延迟检查任务
+    try:
+        await get_replica_router().start()
+    except Exception as e:
+        logger.warning(f"只读副本检查任务启动失败: {e}")
+
+    # 启动过期导出文件清理任务
+    try:
+        await get_query_export_manager().start()
+    except Exception as e:
+        logger.warning(f"导出文件清理任务启动失败: {e}")
+
     yield
     
+    # 排空AI调用日志缓冲，避免关闭时丢失
+    try:
+        await ai_call_log_buffer.stop()
+    except Exception as e:
+        logger.error(f"AI调用日志缓冲排空失败: {e}")
+    try:
+        await template_usage_counter.stop()
+    except Exception as e:
+        logger.error(f"模板使用次数回写失败: {e}")
+    # 等待进行中的会话摘要更新写库（需在关闭数据库连接之前）
+    try:
+        await get_conversation_summarizer().drain()
+    except Exception as e:
+        logger.error(f"会话摘要任务排空失败: {e}")
+    # 依次停止查询任务、导出任务、执行线程池、副本检查与连接池；各步骤独立，某步失败不影响后续步骤
+    try:
+        get_query_job_manager().shutdown()
+    except Exception as e:
+        logger.error(f"异步查询任务关闭失败: {e}")
+    try:
+        await get_query_export_manager().stop()
+    except Exception as e:
+        logger.error(f"导出任务管理器关闭失败: {e}")
+    try:
+        get_query_executor().shutdown()
+    except Exception as e:
+        logger.error(f"数据源执行线程池关闭失败: {e}")
+    try:
+        await get_replica_router().stop()
+    except Exception as e:
+        logger.error(f"只读副本检查任务停止失败: {e}")
+    try:
+        await get_pool_manager().stop()
+    except Exception as e:
+        logger.error(f"数据源连接池关闭失败: {e}")
+
     # 停止后台定时任务
     try:
         if _stop_event is not None:
@@ -132,8 +214,8 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
-    return {"status": "healthy", "service": settings.APP_NAME}
+    """健康检查端点（附带大模型端点熔断状态）"""
+    return build_health_payload()
 
 
 if __name__ == "__main__":
@@ -105,6 +105,9 @@ class AICallLog(Base):
     rag_chunks = Column(JSON, comment="检索片段")
     status = Column(Enum(QueryStatus), nullable=False, default=QueryStatus.SUCCESS, comment="调用状态")
     error_message = Column(Text, comment="错误信息")
+    model_tier = Column(String(20), nullable=True, comment="模型档位(fast/strong)")
+    sql_valid = Column(Boolean, nullable=True, comment="生成SQL是否通过校验")
+    escalated = Column(Boolean, default=False, comment="是否由快速模型升级而来")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
 
     # 关系
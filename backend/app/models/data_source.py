@@ -34,6 +34,12 @@ class DataSource(Base):
     password_encrypted = Column(Text, comment="加密密码")
     description = Column(Text, comment="描述")
     is_active = Column(Boolean, default=True, comment="是否激活")
+    max_scan_rows = Column(BigInteger, comment="执行前代价守卫：预估扫描行数上限（为空时取全局默认）")
+    max_join_fanout = Column(BigInteger, comment="执行前代价守卫：预估连接扇出行数上限（为空时取全局默认）")
+    cost_guard_action = Column(String(10), comment="超出代价阈值时的动作：reject/limit/off（为空时取全局默认）")
+    replicas = Column(JSON, comment="只读副本列表 [{host, port, username, password_encrypted}]")
+    replica_strategy = Column(String(20), comment="副本选择策略：round_robin/least_connections/primary（为空时取全局默认）")
+    max_replica_lag_seconds = Column(Integer, comment="允许的最大复制延迟秒数（为空时取全局默认）")
     created_by = Column(BigInteger, ForeignKey("aitt_users.id"), nullable=False, comment="创建人")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
     updated_at = Column(
@@ -17,6 +17,9 @@ class QueryStatus(str, enum.Enum):
     SUCCESS = "success"
     ERROR = "error"
     TIMEOUT = "timeout"
+    QUEUED = "queued"
+    RUNNING = "running"
+    CANCELLED = "cancelled"
 
 
 class QueryHistory(Base):
@@ -33,6 +36,7 @@ class QueryHistory(Base):
     execution_time_ms = Column(Integer, comment="执行时间毫秒")
     row_count = Column(Integer, comment="结果行数")
     status = Column(Enum(QueryStatus), nullable=False, comment="执行状态")
+    progress = Column(Integer, default=0, comment="执行进度(0-100)")
     error_message = Column(Text, comment="错误信息")
     is_saved = Column(Boolean, default=False, comment="是否保存")
     is_shared = Column(Boolean, default=False, comment="是否分享")
@@ -15,6 +15,8 @@ class AIQueryRequest(BaseModel):
     context: Optional[Dict[str, Any]] = Field(None, description="额外上下文")
     use_rag: bool = Field(True, description="是否使用RAG")
     use_agent: bool = Field(True, description="是否使用Agent")
+    draft: bool = Field(False, description="草稿模式：立即返回规则/意图/缓存SQL，低置信度时后台调用模型精炼")
+    preview: bool = Field(False, description="指定数据源时并发执行受限预览，结果附在 query_results")
 
 
 class AIQueryResponse(BaseModel):
@@ -37,6 +39,22 @@ class AIQueryResponse(BaseModel):
     metrics: List[Dict[str, Any]] = Field([], description="指标字段配置，包含聚合等")
     filters: List[Dict[str, Any]] = Field([], description="筛选条件列表")
     sorts: List[Dict[str, Any]] = Field([], description="排序字段列表")
+    # 两阶段回答：草稿标记与精炼状态（按查询历史ID轮询或订阅SSE获取精炼结果）
+    history_id: Optional[int] = Field(None, description="查询历史ID")
+    is_draft: bool = Field(False, description="是否为待精炼的草稿SQL")
+    draft_source: Optional[str] = Field(None, description="草稿来源(template/intent/cache/rule)")
+    refine_status: Optional[str] = Field(None, description="精炼状态(pending/done/failed/skipped)")
+
+
+class AIRefineResponse(BaseModel):
+    """草稿精炼结果响应模型"""
+    history_id: int = Field(..., description="查询历史ID")
+    status: str = Field(..., description="精炼状态(pending/done/failed/skipped/unknown)")
+    draft_sql: Optional[str] = Field(None, description="草稿SQL")
+    draft_source: Optional[str] = Field(None, description="草稿来源")
+    sql: Optional[str] = Field(None, description="精炼后的SQL")
+    error: Optional[str] = Field(None, description="失败原因")
+    elapsed_ms: Optional[int] = Field(None, description="精炼耗时毫秒")
 
 
 class MessageResponse(BaseModel):
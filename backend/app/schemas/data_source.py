@@ -8,6 +8,14 @@ from pydantic import BaseModel, Field, validator
 from app.models.data_source import DataSourceType
 
 
+class DataSourceReplica(BaseModel):
+    """只读副本节点"""
+    host: str = Field(..., min_length=1, max_length=255, description="主机地址")
+    port: int = Field(..., ge=1, le=65535, description="端口")
+    username: Optional[str] = Field(None, max_length=100, description="用户名（为空时沿用主库账号）")
+    password: Optional[str] = Field(None, description="密码（仅写入，不在响应中返回；为空时沿用主库密码）")
+
+
 class DataSourceBase(BaseModel):
     """数据源基础模型"""
     name: str = Field(..., min_length=1, max_length=100, description="数据源名称")
@@ -17,6 +25,12 @@ class DataSourceBase(BaseModel):
     database_name: str = Field(..., min_length=1, max_length=100, description="数据库名")
     username: Optional[str] = Field(None, max_length=100, description="用户名")
     description: Optional[str] = Field(None, description="描述")
+    max_scan_rows: Optional[int] = Field(None, ge=0, description="执行前代价守卫：预估扫描行数上限（为空取全局默认，0 不限制）")
+    max_join_fanout: Optional[int] = Field(None, ge=0, description="执行前代价守卫：预估连接扇出行数上限（为空取全局默认，0 不限制）")
+    cost_guard_action: Optional[str] = Field(None, pattern="^(reject|limit|off)$", description="超出代价阈值时的动作(reject/limit/off)")
+    replicas: Optional[List[DataSourceReplica]] = Field(None, description="只读副本列表，只读查询按策略分流到健康的副本")
+    replica_strategy: Optional[str] = Field(None, pattern="^(round_robin|least_connections|primary)$", description="副本选择策略(round_robin/least_connections/primary)")
+    max_replica_lag_seconds: Optional[int] = Field(None, ge=0, description="允许的最大复制延迟秒数（为空取全局默认，0 不限制）")
 
 
 class DataSourceCreate(DataSourceBase):
@@ -34,6 +48,12 @@ class DataSourceUpdate(BaseModel):
     password: Optional[str] = Field(None, description="密码")
     description: Optional[str] = Field(None, description="描述")
     is_active: Optional[bool] = Field(None, description="是否激活")
+    max_scan_rows: Optional[int] = Field(None, ge=0, description="执行前代价守卫：预估扫描行数上限（为空取全局默认，0 不限制）")
+    max_join_fanout: Optional[int] = Field(None, ge=0, description="执行前代价守卫：预估连接扇出行数上限（为空取全局默认，0 不限制）")
+    cost_guard_action: Optional[str] = Field(None, pattern="^(reject|limit|off)$", description="超出代价阈值时的动作(reject/limit/off)")
+    replicas: Optional[List[DataSourceReplica]] = Field(None, description="只读副本列表，只读查询按策略分流到健康的副本")
+    replica_strategy: Optional[str] = Field(None, pattern="^(round_robin|least_connections|primary)$", description="副本选择策略(round_robin/least_connections/primary)")
+    max_replica_lag_seconds: Optional[int] = Field(None, ge=0, description="允许的最大复制延迟秒数（为空取全局默认，0 不限制）")
 
 
 class DataSourceResponse(DataSourceBase):
@@ -30,6 +30,11 @@ class QueryResponse(BaseModel):
     data: List[Dict[str, Any]] = Field([], description="查询结果数据")
     error_message: Optional[str] = Field(None, description="错误信息")
     created_at: datetime = Field(..., description="创建时间")
+    cache_hit: bool = Field(False, description="是否命中结果缓存")
+    cache_age_seconds: Optional[float] = Field(None, description="缓存结果的年龄（秒）")
+    cost_estimate: Optional[Dict[str, Any]] = Field(None, description="执行前代价估算与判定（pass/limited/skipped）")
+    approximate: bool = Field(False, description="是否为抽样得到的近似结果")
+    sample: Optional[Dict[str, Any]] = Field(None, description="抽样信息（方法、实际比例、放大的列及未抽样原因）")
 
 
 class QueryHistoryResponse(BaseModel):
@@ -95,6 +100,94 @@ class QueryExecuteRequest(BaseModel):
     data_source_id: int = Field(..., description="数据源ID")
     max_rows: Optional[int] = Field(1000, ge=1, le=10000, description="最大返回行数")
     timeout_seconds: Optional[int] = Field(30, ge=1, le=300, description="超时时间秒")
+    use_cache: bool = Field(True, description="是否使用结果缓存（False 时直接执行且不写缓存）")
+    refresh_cache: bool = Field(False, description="是否忽略已有缓存重新执行并刷新缓存")
+    sample: bool = Field(False, description="是否抽样执行（单表查询返回近似结果，用于探索性预览）")
+    sample_percent: Optional[float] = Field(None, gt=0, le=100, description="抽样比例（百分比），缺省取系统配置")
+
+
+class QueryExplainRequest(BaseModel):
+    """查询代价估算请求模型"""
+    sql: str = Field(..., min_length=1, description="SQL语句")
+    data_source_id: int = Field(..., description="数据源ID")
+    max_rows: Optional[int] = Field(1000, ge=1, le=10000, description="最大返回行数")
+
+
+class QueryJobSubmitRequest(BaseModel):
+    """提交异步查询任务请求模型"""
+    sql: str = Field(..., min_length=1, description="SQL语句")
+    data_source_id: int = Field(..., description="数据源ID")
+    max_rows: Optional[int] = Field(1000, ge=1, le=10000, description="最大返回行数")
+    timeout_seconds: Optional[int] = Field(600, ge=1, le=3600, description="超时时间秒")
+
+
+class QueryJobResponse(BaseModel):
+    """异步查询任务状态响应模型"""
+    job_id: int = Field(..., description="任务ID（查询历史ID）")
+    status: QueryStatus = Field(..., description="任务状态")
+    progress: int = Field(0, description="执行进度(0-100)")
+    row_count: Optional[int] = Field(None, description="已读取/结果行数")
+    execution_time_ms: Optional[int] = Field(None, description="执行时间毫秒")
+    error_message: Optional[str] = Field(None, description="错误信息")
+    created_at: Optional[datetime] = Field(None, description="创建时间")
+
+
+class QueryExportSubmitRequest(BaseModel):
+    """提交结果导出任务请求模型"""
+    sql: str = Field(..., min_length=1, description="SQL语句")
+    data_source_id: int = Field(..., description="数据源ID")
+    format: str = Field("parquet", pattern="^(parquet|csv)$", description="导出格式(parquet/csv)")
+    max_rows: Optional[int] = Field(None, ge=1, description="最大导出行数（为空时取服务端上限）")
+    timeout_seconds: Optional[int] = Field(3600, ge=1, le=86400, description="超时时间秒")
+
+
+class QueryExportResponse(BaseModel):
+    """结果导出任务状态响应模型"""
+    export_id: int = Field(..., description="导出ID（查询历史ID）")
+    status: QueryStatus = Field(..., description="导出状态")
+    format: Optional[str] = Field(None, description="导出格式")
+    progress: int = Field(0, description="导出进度(0-100)")
+    row_count: Optional[int] = Field(None, description="已导出/结果行数")
+    bytes: Optional[int] = Field(None, description="已写出的文件字节数")
+    columns: List[str] = Field([], description="列名")
+    files: List[Dict[str, Any]] = Field([], description="分片文件（name/rows/bytes/url）")
+    expires_at: Optional[datetime] = Field(None, description="文件过期时间")
+    execution_time_ms: Optional[int] = Field(None, description="执行时间毫秒")
+    error_message: Optional[str] = Field(None, description="错误信息")
+    created_at: Optional[datetime] = Field(None, description="创建时间")
+
+
+class QueryPageRequest(BaseModel):
+    """分页执行查询请求模型"""
+    sql: str = Field(..., min_length=1, description="SQL语句")
+    data_source_id: int = Field(..., description="数据源ID")
+    page_size: int = Field(100, ge=1, le=1000, description="每页行数")
+    cursor: Optional[str] = Field(None, description="上一页返回的 next_cursor，首页不传")
+    sort_keys: Optional[List[str]] = Field(None, description="排序键输出列名（需唯一且非空），不传时自动识别主键")
+    timeout_seconds: Optional[int] = Field(30, ge=1, le=300, description="超时时间秒")
+
+
+class QueryPageResponse(BaseModel):
+    """分页执行查询响应模型"""
+    columns: List[Dict[str, Any]] = Field([], description="列信息")
+    data: List[Dict[str, Any]] = Field([], description="本页数据")
+    row_count: int = Field(0, description="本页行数")
+    page: int = Field(1, description="页码")
+    has_more: bool = Field(False, description="是否还有下一页")
+    next_cursor: Optional[str] = Field(None, description="下一页游标")
+    pagination_mode: str = Field(..., description="分页方式：keyset 键集分页 / segment 缓存分段")
+    sort_keys: List[str] = Field([], description="键集分页使用的排序键")
+    truncated: bool = Field(False, description="缓存分段模式下结果是否超过分段上限被截断")
+    execution_time_ms: int = Field(0, description="执行时间毫秒")
+
+
+class QueryStreamRequest(BaseModel):
+    """流式执行查询请求模型"""
+    sql: str = Field(..., min_length=1, description="SQL语句")
+    data_source_id: int = Field(..., description="数据源ID")
+    format: str = Field("ndjson", pattern="^(ndjson|csv)$", description="输出格式(ndjson/csv)")
+    max_rows: Optional[int] = Field(None, ge=1, description="最大返回行数，为空时使用服务端上限")
+    timeout_seconds: Optional[int] = Field(300, ge=1, le=3600, description="超时时间秒")
 
 
 class QuerySaveRequest(BaseModel):
@@ -1,5 +1,4 @@
-from typing import Optional
-import re
+from typing import Any, Dict, List, Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -9,13 +8,16 @@ from app.models.ai_conversation import AIConversation, AIMessage, MessageRole, C
 from app.services.rag import RAGService
 from app.services.metadata_search import MetadataSearch
 from app.services.prompt import build_sql_generation_prompt
-
-try:
-    # OpenAI Python SDK (v1.x)
-    from openai import OpenAI
-    OPENAI_SDK_AVAILABLE = True
-except Exception:
-    OPENAI_SDK_AVAILABLE = False
+from app.services.llm_pool import get_llm_pool, LLMUnavailableError, ASYNC_OPENAI_AVAILABLE as OPENAI_SDK_AVAILABLE
+from app.services.ai_call_log_buffer import ai_call_log_buffer, compact_rag_chunks
+from app.services.metadata_catalog import get_metadata_catalog, KEYWORD_SETS, ORDER_KW, DETAIL_KW, PRODUCT_KW
+from app.services.intent_engine import get_intent_engine
+from app.services.template_matcher import get_template_matcher, template_usage_counter
+from app.services.sql_parser import extract_sql_from_text
+from app.services.model_router import ModelTier, route as route_model, invalid_reason
+from app.services.conversation_context import get_conversation_context_store, build_delta_context
+from app.services.conversation_summary import estimate_tokens, increment_conversation_counters
+from app.services.draft_refiner import DraftResult, get_generated_sql_cache
 
 
 class AIService:
@@ -33,145 +35,164 @@ class AIService:
         return conv
 
     async def add_message(self, conversation_id: int, role: MessageRole, content: str, token_count: Optional[int] = None) -> AIMessage:
+        if token_count is None:
+            token_count = estimate_tokens(content)
         msg = AIMessage(conversation_id=conversation_id, role=role, content=content, token_count=token_count)
         self.db.add(msg)
         await self.db.flush()
+        # 会话计数在同一事务内原子累加，避免并发轮次互相覆盖
+        await increment_conversation_counters(self.db, conversation_id, messages=1, tokens=token_count)
         await self.db.refresh(msg)
         await self.db.commit()
         return msg
 
+    def _template_sql(self, nl_query: str) -> Optional[str]:
+        """公开查询模板快速路径：高置信度匹配时返回渲染后的SQL，并异步累计模板使用次数。"""
+        if not settings.TEMPLATE_MATCH_ENABLED:
+            return None
+        try:
+            tm = get_template_matcher().match(nl_query)
+        except Exception as e:
+            logger.warning("查询模板匹配失败: {}", e)
+            return None
+        if tm is None or tm.confidence < settings.TEMPLATE_MATCH_MIN_CONFIDENCE:
+            return None
+        logger.info("命中查询模板: id={}, name={}, method={}, confidence={}", tm.template_id, tm.name, tm.method, tm.confidence)
+        template_usage_counter.bump(tm.template_id)
+        return tm.sql
+
+    def _intent_sql(self, nl_query: str, min_confidence: float) -> Optional[str]:
+        """意图语法引擎：置信度达到阈值时返回SQL，否则返回None。"""
+        if not settings.INTENT_ENGINE_ENABLED:
+            return None
+        try:
+            result = get_intent_engine().match(nl_query, get_metadata_catalog().get())
+        except Exception as e:
+            logger.warning("意图引擎解析失败: {}", e)
+            return None
+        if result is None:
+            return None
+        logger.info(
+            "意图引擎: intent={}, table={}, confidence={}, threshold={}",
+            result.intent,
+            result.table,
+            result.confidence,
+            min_confidence,
+        )
+        return result.sql if result.confidence >= min_confidence else None
+
+    def draft_sql(self, nl_query: str) -> Optional[DraftResult]:
+        """草稿模式：仅使用纯内存来源即时给出SQL，不检索上下文、不调用模型。
+        模板/高置信度意图/已生成SQL缓存视为可信草稿；规则兜底为低置信度草稿，需后台精炼。
+        """
+        sql = self._template_sql(nl_query)
+        if sql:
+            return DraftResult(sql=sql, source="template", confident=True)
+        sql = self._intent_sql(nl_query, settings.INTENT_ENGINE_MIN_CONFIDENCE)
+        if sql:
+            return DraftResult(sql=sql, source="intent", confident=True)
+        sql = get_generated_sql_cache().get(nl_query)
+        if sql:
+            return DraftResult(sql=sql, source="cache", confident=True)
+        sql = self._rule_based_sql(nl_query)
+        if sql:
+            return DraftResult(sql=sql, source="rule", confident=False)
+        return None
+
     def _rule_based_sql(self, nl_query: str) -> Optional[str]:
         """当未配置模型或调用失败时的规则兜底：
-        - 利用元数据结构化匹配识别意图：
+        - 优先使用意图语法引擎（较低置信度阈值）；
+        - 其次以元数据向量检索命中的表为候选（按相关度），无命中时才回退到缓存的元数据目录，识别意图：
           1) 订单统计（近7天订单数与GMV）
           2) 简单详情类查询（查看X的详细信息：主表+常用维度列）
-        - MySQL语法；若无法可靠生成返回None。
+        - 目录中的表按预计算索引选表（订单类表、同时具备日期与金额列的表）与匹配列；MySQL语法；若无法可靠生成返回None。
         """
         try:
-            ms = MetadataSearch()
-            matches = ms.get_structured_matches_for_query(nl_query, top_k=16)
-            if not matches:
-                # 若Chroma不可用或未命中，直接从MySQL元数据表兜底读取
-                try:
-                    from sqlalchemy.engine.url import make_url
-                    import pymysql
-                    from pymysql.cursors import DictCursor
-                    url = make_url(settings.DATABASE_URL)
-                    conn = pymysql.connect(
-                        host=url.host or "localhost",
-                        port=int(url.port or 3306),
-                        user=url.username,
-                        password=url.password or "",
-                        database=url.database,
-                        charset="utf8mb4",
-                        cursorclass=DictCursor,
-                    )
-                    tables_map: dict[str, dict] = {}
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            """
-                            SELECT id, data_source_id, table_name, display_name
-                            FROM aitt_data_tables
-                            ORDER BY id
-                            """
-                        )
-                        tables = cur.fetchall() or []
-                        for t in tables:
-                            tables_map[str(t["table_name"])]= {"display_name": t.get("display_name"), "columns": []}
-                        cur.execute(
-                            """
-                            SELECT tc.table_id, tc.column_name, tc.data_type, tc.is_dimension, tc.is_metric, dt.table_name
-                            FROM aitt_table_columns tc
-                            JOIN aitt_data_tables dt ON dt.id = tc.table_id
-                            ORDER BY tc.id
-                            """
-                        )
-                        cols = cur.fetchall() or []
-                        for c in cols:
-                            tname = str(c.get("table_name") or "")
-                            if tname and tname in tables_map:
-                                tables_map[tname]["columns"].append({
-                                    "name": c.get("column_name"),
-                                    "type": c.get("data_type"),
-                                    "is_dim": bool(c.get("is_dimension")),
-                                    "is_met": bool(c.get("is_metric")),
-                                })
-                    try:
-                        conn.close()
-                    except Exception:
-                        pass
-                    matches = tables_map
-                except Exception as e2:
-                    logger.warning("规则兜底MySQL元数据读取失败: {}", e2)
-                    return None
+            intent_sql = self._intent_sql(nl_query, settings.INTENT_ENGINE_FALLBACK_CONFIDENCE)
+            if intent_sql:
+                return intent_sql
+            snap = get_metadata_catalog().get()
+            try:
+                matches = MetadataSearch().get_structured_matches_for_query(nl_query, top_k=16) or {}
+            except Exception as e:
+                logger.warning("规则兜底: 元数据检索失败，回退到元数据目录: {}", e)
+                matches = {}
+            catalog_tables = snap.tables if snap is not None else {}
+            if matches:
+                # 检索命中的表若已不在目录中（已停用/删除）则剔除；目录不可用时直接使用命中结果
+                candidates = [t for t in matches if not catalog_tables or t in catalog_tables] or list(matches)
+            else:
+                candidates = list(catalog_tables)
+            if not candidates:
+                return None
             q = (nl_query or "").lower()
-            # 关键词集合（包含产品类词汇以支持详情意图）
-            order_kw = ["order", "orders", "交易", "订单"]
-            date_kw = ["date", "dt", "时间", "日期", "created_at", "order_date", "下单"]
-            amt_kw = ["amount", "total_amount", "gmv", "price", "pay", "支付", "金额", "交易额"]
-            product_kw = ["product", "商品", "产品", "sku", "spu", "brand", "category"]
-            detail_kw = ["detail", "详细", "详情", "明细"]
+            mentioned = snap.tables_mentioned_in(q) if snap is not None else []
+
+            def column_for(tname: str, set_name: str) -> Optional[str]:
+                if tname in catalog_tables:
+                    return snap.column_for(tname, set_name)
+                kws = KEYWORD_SETS[set_name]
+                for c in matches.get(tname, {}).get("columns") or []:
+                    cname = str(c.get("name") or "")
+                    if cname and any(k in cname.lower() for k in kws):
+                        return cname
+                return None
+
+            def dim_columns(tname: str) -> List[str]:
+                if tname in catalog_tables:
+                    return [c.name for c in catalog_tables[tname].columns if c.is_dim]
+                return [c.get("name") for c in matches.get(tname, {}).get("columns") or [] if c.get("is_dim") and c.get("name")]
+
+            # 目录中的表直接查预计算索引，仅目录外的检索命中表才逐个匹配关键词
+            order_tables = set(snap.tables_by_keyword.get("order") or []) if snap is not None else set()
+            date_amount_tables = set(snap.tables_with_date_and_amount) if snap is not None else set()
 
             def pick_table() -> Optional[str]:
-                # 优先表名包含订单/交易关键词
-                candidates = list(matches.keys())
+                # 优先查询中显式提及的表，其次候选中表名包含订单/交易关键词的表
+                if mentioned:
+                    return mentioned[0]
                 for t in candidates:
-                    t_low = (t or "").lower()
-                    if any(k in t_low for k in order_kw):
+                    if t in catalog_tables:
+                        if t in order_tables:
+                            return t
+                    elif any(k in t.lower() for k in ORDER_KW):
                         return t
                 # 回退：选择列中存在金额与日期列的表
-                for t, info in matches.items():
-                    cols = info.get("columns") or []
-                    has_date = any(any(k in (c.get("name") or "").lower() for k in date_kw) for c in cols)
-                    has_amt = any(any(k in (c.get("name") or "").lower() for k in amt_kw) for c in cols)
-                    if has_date and has_amt:
+                for t in candidates:
+                    if t in catalog_tables:
+                        if t in date_amount_tables:
+                            return t
+                    elif column_for(t, "date") and column_for(t, "amount"):
                         return t
                 return None
 
-            def pick_col(cols: list[dict], kw_list: list[str]) -> Optional[str]:
-                # 先按名称匹配，再按维度/指标标记
-                for c in cols:
-                    name = (c.get("name") or "").lower()
-                    if any(k in name for k in kw_list):
-                        return c.get("name")
-                # 次选：如果金额列需要指标列
-                for c in cols:
-                    if c.get("is_met") and any(k in (c.get("name") or "").lower() for k in kw_list):
-                        return c.get("name")
-                return None
-
             # 详情意图：当包含产品相关词汇或明确详情关键词时，优先返回主表的常见维度列
             def is_detail_intent() -> bool:
-                return any(k in q for k in detail_kw) or any(k in q for k in product_kw)
+                return any(k in q for k in DETAIL_KW) or any(k in q for k in PRODUCT_KW)
 
             if is_detail_intent():
-                # 从匹配中选择更像“产品”的表
-                candidates = list(matches.keys())
-                chosen = None
-                for t in candidates:
-                    tl = (t or "").lower()
-                    if any(k in tl for k in ["product", "sku", "spu"]):
-                        chosen = t
-                        break
-                if not chosen and candidates:
+                # 从候选中选择更像“产品”的表；检索命中时相关度最高的表作为回退
+                chosen = mentioned[0] if mentioned else None
+                if not chosen:
+                    for t in candidates:
+                        tl = t.lower()
+                        if any(k in tl for k in ["product", "sku", "spu"]):
+                            chosen = t
+                            break
+                if not chosen and matches:
                     chosen = candidates[0]
-                cols = matches.get(chosen, {}).get("columns") or []
-                # 选取常见维度列
-                want_kw = ["id", "name", "category", "brand", "price"]
                 sel = []
-                for w in want_kw:
-                    c = pick_col(cols, [w])
-                    if c and c not in sel:
-                        sel.append(c)
-                # 回退：如果仍然为空，取前5个维度列
-                if not sel:
-                    for c in cols:
-                        if c.get("is_dim"):
-                            sel.append(c.get("name"))
-                            if len(sel) >= 5:
-                                break
+                if chosen:
+                    # 选取常见维度列
+                    for w in ["id", "name", "category", "brand", "price"]:
+                        c = column_for(chosen, w)
+                        if c and c not in sel:
+                            sel.append(c)
+                    # 回退：如果仍然为空，取前5个维度列
+                    if not sel:
+                        sel = dim_columns(chosen)[:5]
                 if chosen and sel:
-                    select_list = ", ".join([f"{x}" for x in sel])
+                    select_list = ", ".join(sel)
                     return f"SELECT {select_list} FROM {chosen}"
                 # 若详情意图无法确定列/表，继续尝试订单统计兜底
 
@@ -179,9 +200,8 @@ class AIService:
             tname = pick_table()
             if not tname:
                 return None
-            cols = matches[tname].get("columns") or []
-            date_col = pick_col(cols, date_kw) or "created_at"
-            amt_col = pick_col(cols, amt_kw) or "amount"
+            date_col = column_for(tname, "date") or "created_at"
+            amt_col = column_for(tname, "amount") or "amount"
             has_7d = any(k in q for k in ["近7天", "最近7天", "past 7", "last 7", "近七天"])
             date_cond = "DATE_SUB(CURDATE(), INTERVAL 7 DAY)" if has_7d else "DATE_SUB(CURDATE(), INTERVAL 30 DAY)"
             return (
@@ -193,21 +213,53 @@ class AIService:
             logger.warning("规则兜底生成失败: {}", e)
             return None
 
-    async def generate_sql(self, nl_query: str, context: Optional[str] = None, use_rag: bool = True, rag_context: Optional[str] = None, conversation_id: Optional[int] = None, rag_chunks: Optional[list] = None) -> str:
-        """生成SQL：支持RAG上下文与真实模型调用（带降级）。"""
+    async def generate_sql(self, nl_query: str, context: Optional[Dict[str, Any]] = None, use_rag: bool = True, rag_context: Optional[str] = None, conversation_id: Optional[int] = None, rag_chunks: Optional[list] = None, history_context: Optional[str] = None) -> str:
+        """生成SQL：支持RAG上下文与真实模型调用（带降级）。
+        history_context 为会话滚动摘要+最近轮次原文，仅注入模型提示词，不影响快速路径判定。
+        """
         logger.info(
             f"AI生成SQL请求: len(query)={len(nl_query or '')}, use_rag={use_rag}, model={settings.AI_MODEL_NAME}, base_url={settings.OPENAI_BASE_URL}"
         )
-        # 1) 元数据上下文（强制）：始终从Chroma元数据集合检索
+        # 会话工作集：追问复用上一轮的表、列与SQL，跳过检索并缩小提示词上下文
+        ctx_store = get_conversation_context_store()
+        follow_ws = await ctx_store.follow_up_for(conversation_id, nl_query)
+        if follow_ws is not None:
+            logger.info("AI生成SQL: 识别为追问，复用会话工作集 conversation_id={}, tables={}", conversation_id, follow_ws.tables)
+            delta_ctx = build_delta_context(nl_query, follow_ws)
+        else:
+            delta_ctx = None
+
+        # 0) 模板/意图引擎快速路径：高置信度命中时无需检索上下文与调用模型（多轮追问依赖上下文，交由模型处理）
+        if not context and delta_ctx is None:
+            fast_sql = self._template_sql(nl_query) or self._intent_sql(nl_query, settings.INTENT_ENGINE_MIN_CONFIDENCE)
+            if fast_sql:
+                await ctx_store.remember(conversation_id, nl_query, fast_sql)
+                return fast_sql
+
+        # 0.1) 熔断快速降级：端点池全部熔断期间不再检索上下文与调用模型，直接走规则兜底
+        pool = get_llm_pool()
+        if settings.OPENAI_API_KEY and OPENAI_SDK_AVAILABLE and not pool.has_available():
+            rb0 = self._rule_based_sql(nl_query)
+            if rb0:
+                logger.warning("LLM端点全部熔断，直接使用规则兜底SQL")
+                return rb0
+            logger.warning("LLM端点全部熔断，规则兜底失败，返回占位SQL")
+            return "SELECT 1 AS placeholder;"
+
+        # 1) 元数据上下文：追问直接使用工作集中的精简表结构，否则从Chroma元数据集合检索
         metadata_ctx: Optional[str] = None
-        try:
-            ms = MetadataSearch()
-            # 优先使用结构化上下文（表/列分组），便于模型解析
-            metadata_ctx = ms.get_grouped_context_for_query(nl_query, top_k=12)
-            logger.info("AI生成SQL: 元数据上下文就绪 len(meta_ctx)={}", len(metadata_ctx or ""))
-        except Exception:
-            metadata_ctx = None
-            logger.warning("AI生成SQL: 元数据上下文获取失败或不可用")
+        if follow_ws is not None and follow_ws.schema_context:
+            metadata_ctx = follow_ws.schema_context
+            use_rag = False
+        else:
+            try:
+                ms = MetadataSearch()
+                # 优先使用结构化上下文（表/列分组），便于模型解析
+                metadata_ctx = ms.get_grouped_context_for_query(nl_query, top_k=12)
+                logger.info("AI生成SQL: 元数据上下文就绪 len(meta_ctx)={}", len(metadata_ctx or ""))
+            except Exception:
+                metadata_ctx = None
+                logger.warning("AI生成SQL: 元数据上下文获取失败或不可用")
 
         # 2) 文档RAG上下文（可选）
         if use_rag and not rag_context:
@@ -231,6 +283,8 @@ class AIService:
             nl_query=nl_query,
             schema_context=combined_ctx,
             user_context=context,
+            history_context=history_context,
+            followup_context=delta_ctx,
         )
         try:
             logger.info("AI生成SQL: Prompt长度={}", len(prompt or ""))
@@ -247,21 +301,26 @@ class AIService:
             logger.warning("AI SDK不可用或未配置API密钥，规则兜底失败，返回占位SQL")
             return "SELECT 1 AS placeholder;"
 
-        # 带重试与超时的调用实现
-        client = OpenAI(base_url=settings.OPENAI_BASE_URL, api_key=settings.OPENAI_API_KEY)
+        # 带重试与超时的调用实现（经端点池路由，重试由本方法统一控制，SDK内置重试已关闭）
         attempt = 0
         last_err: Exception | None = None
         import time as _time
         t0 = _time.perf_counter()
         prompt_tokens = 0
         completion_tokens = 0
-        model_name = settings.AI_MODEL_NAME
+        # 按问题复杂度选择模型档位；快速模型生成无效SQL时升级到强模型
+        decision = route_model(nl_query, metadata_ctx)
+        tier = decision.tier
+        model_name = decision.model
+        escalated = False
+        logger.info("模型路由: tier={}, model={}, score={}, features={}", tier.value, model_name, decision.score, decision.features)
+        endpoint_name = "chat.completions"
         while attempt <= self._max_retries:
             try:
                 # 使用 Chat Completions，要求仅输出SQL
                 _approx_len = max(1, len(prompt or ""))
                 _dyn_max_tokens = max(128, min(512, int(_approx_len / 8)))
-                completion = client.chat.completions.create(
+                completion, ep = await pool.chat_completion(
                     model=model_name,
                     messages=[
                         {"role": "system", "content": "你是资深数据分析助理，只输出合法SQL，不要解释，不要包含代码块标记，不要包含分号。"},
@@ -277,6 +336,7 @@ class AIService:
                     user=str(conversation_id or "anonymous"),
                     timeout=self._timeout_seconds,
                 )
+                endpoint_name = ep.name
                 # 统计tokens（SDK返回如有不一致则回退估算）
                 try:
                     usage = getattr(completion, "usage", None)
@@ -286,21 +346,15 @@ class AIService:
                     prompt_tokens = 0
                     completion_tokens = 0
                 content = completion.choices[0].message.content or ""
-                cleaned = content.strip()
-                cleaned = re.sub(r"^```sql\s*", "", cleaned, flags=re.IGNORECASE)
-                cleaned = re.sub(r"```\s*$", "", cleaned)
-                m = re.search(r"\b(SELECT|WITH|INSERT|UPDATE|DELETE)\b[\s\S]*", cleaned, flags=re.IGNORECASE)
-                sql_text = m.group(0).strip() if m else cleaned
-                sql_text = sql_text or ""
-                sql_text = re.sub(r";\s*$", "", sql_text)
+                sql_text = extract_sql_from_text(content)
                 latency_ms = int((_time.perf_counter() - t0) * 1000)
-                # 异步保存调用日志
+                bad_reason = invalid_reason(sql_text)
+                # 调用日志入队，由后台缓冲批量写入
                 try:
-                    import asyncio as _asyncio
-                    _asyncio.create_task(self._save_ai_call_log(
+                    self._save_ai_call_log(
                         conversation_id=conversation_id,
-                        model_name=model_name,
-                        endpoint="chat.completions",
+                        model_name=model_name or ep.model,
+                        endpoint=endpoint_name,
                         prompt_tokens=prompt_tokens,
                         completion_tokens=completion_tokens,
                         total_tokens=prompt_tokens + completion_tokens,
@@ -311,18 +365,36 @@ class AIService:
                         rag_chunks=rag_chunks,
                         status="success",
                         error_message=None,
-                    ))
+                        model_tier=tier.value,
+                        sql_valid=bad_reason is None,
+                        escalated=escalated,
+                    )
                 except Exception:
                     pass
-                if sql_text:
+                if bad_reason is not None and tier == ModelTier.FAST:
+                    logger.info("快速模型生成SQL无效(reason={})，升级至强模型 {}", bad_reason, settings.AI_MODEL_NAME)
+                    tier = ModelTier.STRONG
+                    model_name = settings.AI_MODEL_NAME
+                    escalated = True
+                    attempt = 0
+                    t0 = _time.perf_counter()
+                    continue
+                if bad_reason is None:
                     logger.info(f"AI生成SQL成功: {sql_text[:500]}")
+                    await ctx_store.remember(conversation_id, nl_query, sql_text, metadata_ctx)
                     return sql_text
+                # 强模型返回空或已知无效的SQL（非只读、括号不配对、引用不存在的表）：不返回该SQL，改走规则兜底
                 rb2 = self._rule_based_sql(nl_query)
                 if rb2:
-                    logger.info("模型返回空，使用规则兜底SQL")
+                    logger.info("模型生成SQL无效(reason={})，使用规则兜底SQL", bad_reason)
                     return rb2
-                logger.warning("AI返回空内容，降级为占位SQL")
+                logger.warning("模型生成SQL无效(reason={})，规则兜底失败，降级为占位SQL", bad_reason)
                 return "SELECT 1 AS placeholder;"
+            except LLMUnavailableError as e:
+                # 端点池中无可用端点（熔断打开），立即停止重试
+                last_err = e
+                logger.warning("LLM端点全部熔断，停止重试")
+                break
             except Exception as e:
                 last_err = e
                 attempt += 1
@@ -339,9 +411,8 @@ class AIService:
                     break
         # 全部失败：记录日志并降级
         try:
-            import asyncio as _asyncio
             latency_ms = int((_time.perf_counter() - t0) * 1000)
-            _asyncio.create_task(self._save_ai_call_log(
+            self._save_ai_call_log(
                 conversation_id=conversation_id,
                 model_name=model_name,
                 endpoint="chat.completions",
@@ -355,7 +426,9 @@ class AIService:
                 rag_chunks=rag_chunks,
                 status="error",
                 error_message=str(last_err) if last_err else None,
-            ))
+                model_tier=tier.value,
+                escalated=escalated,
+            )
         except Exception:
             pass
         rb3 = self._rule_based_sql(nl_query)
@@ -370,7 +443,7 @@ class AIService:
         import asyncio
         await asyncio.sleep(max(0.0, float(seconds)))
 
-    async def _save_ai_call_log(
+    def _save_ai_call_log(
         self,
         conversation_id: Optional[int],
         model_name: Optional[str],
@@ -385,33 +458,33 @@ class AIService:
         rag_chunks: Optional[list],
         status: str,
         error_message: Optional[str],
+        model_tier: Optional[str] = None,
+        sql_valid: Optional[bool] = None,
+        escalated: bool = False,
     ):
-        """保存AI调用日志到数据库"""
+        """将AI调用日志写入内存缓冲，由后台任务批量落库（请求路径无数据库往返）"""
         try:
-            from app.models.ai_conversation import AICallLog
             from app.models.query import QueryStatus
-            from app.core.database import AsyncSessionLocal
-            log = AICallLog(
-                conversation_id=conversation_id,
-                model_name=model_name or settings.AI_MODEL_NAME,
-                endpoint=endpoint or "chat.completions",
-                prompt_tokens=int(prompt_tokens or 0),
-                completion_tokens=int(completion_tokens or 0),
-                total_tokens=int(total_tokens or 0),
-                latency_ms=int(latency_ms or 0),
-                use_rag=bool(use_rag),
-                rag_context_len=int(rag_context_len or 0),
-                metadata_context_len=int(metadata_context_len or 0),
-                rag_chunks=rag_chunks,
-                status=QueryStatus.SUCCESS if status == "success" else QueryStatus.ERROR,
-                error_message=error_message,
-            )
-            async with AsyncSessionLocal() as s:
-                s.add(log)
-                await s.flush()
-                await s.commit()
+            ai_call_log_buffer.enqueue({
+                "conversation_id": conversation_id,
+                "model_name": model_name or settings.AI_MODEL_NAME,
+                "endpoint": endpoint or "chat.completions",
+                "prompt_tokens": int(prompt_tokens or 0),
+                "completion_tokens": int(completion_tokens or 0),
+                "total_tokens": int(total_tokens or 0),
+                "latency_ms": int(latency_ms or 0),
+                "use_rag": bool(use_rag),
+                "rag_context_len": int(rag_context_len or 0),
+                "metadata_context_len": int(metadata_context_len or 0),
+                "rag_chunks": compact_rag_chunks(rag_chunks),
+                "status": QueryStatus.SUCCESS if status == "success" else QueryStatus.ERROR,
+                "error_message": (error_message or None) and str(error_message)[:2000],
+                "model_tier": model_tier,
+                "sql_valid": sql_valid,
+                "escalated": bool(escalated),
+            })
         except Exception as e:
             try:
-                logger.warning("保存AI调用日志失败: {}", e)
+                logger.warning("AI调用日志入队失败: {}", e)
             except Exception:
-                pass
\ No newline at end of file
+                pass
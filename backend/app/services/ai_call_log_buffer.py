@@ -0,0 +1,209 @@
+"""
+AI调用日志缓冲写入：
+- 请求路径只做内存入队，不产生数据库往返；
+- 后台任务按“满 N 条或每 T 毫秒”批量刷新，使用单条多行 INSERT 写入 aitt_ai_call_logs；
+- 应用关闭时在 lifespan 中排空队列，避免日志丢失；
+- 提供队列深度等指标，便于健康检查观察积压情况。
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+def compact_rag_chunks(chunks: Optional[list], max_chunks: int = 8, snippet_chars: int = 200) -> Optional[list]:
+    """压缩检索片段：仅保留来源、原文长度与截断后的文本摘要，避免每条日志写入完整片段。"""
+    if not chunks:
+        return None
+    out: List[Dict[str, Any]] = []
+    for c in chunks[:max_chunks]:
+        if not isinstance(c, dict):
+            continue
+        text = str(c.get("text") or "")
+        out.append({
+            "source": c.get("source"),
+            "len": len(text),
+            "text": text[:snippet_chars],
+        })
+    return out or None
+
+
+class AICallLogBuffer:
+    def __init__(self, batch_size: int = 50, flush_interval_ms: int = 1000, max_queue: int = 10000):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval_ms = max(10, int(flush_interval_ms))
+        self.max_queue = max(self.batch_size, int(max_queue))
+        self._items: Deque[Dict[str, Any]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # 指标
+        self._enqueued_total = 0
+        self._flushed_total = 0
+        self._dropped_total = 0
+        self._flush_batches = 0
+        self._flush_failures = 0
+        self._last_flush_ms = 0
+        self._last_flush_at: Optional[float] = None
+
+    def enqueue(self, record: Dict[str, Any]) -> bool:
+        """非阻塞入队；队列已满时丢弃并计数，保证请求路径不受日志写入影响。"""
+        if len(self._items) >= self.max_queue:
+            self._dropped_total += 1
+            return False
+        self._items.append(record)
+        self._enqueued_total += 1
+        if self._wakeup is not None and len(self._items) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def start(self):
+        """在事件循环中启动后台刷新任务（幂等）。"""
+        if self._task is not None and not self._task.done():
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            "AI调用日志缓冲已启动: batch_size={}, flush_interval_ms={}, max_queue={}",
+            self.batch_size,
+            self.flush_interval_ms,
+            self.max_queue,
+        )
+
+    async def stop(self):
+        """停止后台任务并排空剩余日志。"""
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception as e:
+                logger.warning("AI调用日志缓冲后台任务异常退出: {}", e)
+            self._task = None
+        # 兜底：后台任务异常退出时仍尽量写入剩余数据
+        await self.flush_all()
+        logger.info("AI调用日志缓冲已停止: flushed_total={}, dropped_total={}", self._flushed_total, self._dropped_total)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_ms / 1000.0)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush_all()
+
+    async def flush_all(self):
+        """按批次写入当前队列中的全部日志。"""
+        while self._items:
+            batch: List[Dict[str, Any]] = []
+            while self._items and len(batch) < self.batch_size:
+                batch.append(self._items.popleft())
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        t0 = time.perf_counter()
+        try:
+            await self._insert_orm(batch)
+        except Exception as e:
+            # ORM 路径不可用（缺少 greenlet 等），降级为 PyMySQL 批量写入
+            try:
+                await asyncio.to_thread(self._insert_pymysql, batch)
+            except Exception as e2:
+                self._flush_failures += 1
+                logger.warning("AI调用日志批量写入失败，丢弃 {} 条: orm_err={}, pymysql_err={}", len(batch), e, e2)
+                return
+        self._flushed_total += len(batch)
+        self._flush_batches += 1
+        self._last_flush_ms = int((time.perf_counter() - t0) * 1000)
+        self._last_flush_at = time.time()
+
+    async def _insert_orm(self, batch: List[Dict[str, Any]]):
+        from sqlalchemy import insert
+        from app.models.ai_conversation import AICallLog
+        from app.core.database import AsyncSessionLocal
+
+        async with AsyncSessionLocal() as s:
+            # 多行 VALUES 的单条 INSERT，一次往返写入整批
+            await s.execute(insert(AICallLog).values(batch))
+            await s.commit()
+
+    def _insert_pymysql(self, batch: List[Dict[str, Any]]):
+        import json
+        import pymysql
+        from sqlalchemy.engine.url import make_url
+
+        url = make_url(settings.DATABASE_URL)
+        conn = pymysql.connect(
+            host=url.host or "localhost",
+            port=int(url.port or 3306),
+            user=url.username,
+            password=url.password or "",
+            database=url.database,
+            charset="utf8mb4",
+        )
+        try:
+            with conn.cursor() as cur:
+                # PyMySQL 的 executemany 会将 INSERT ... VALUES 改写为多行插入
+                cur.executemany(
+                    """
+                    INSERT INTO aitt_ai_call_logs (
+                        conversation_id, model_name, endpoint, prompt_tokens, completion_tokens,
+                        total_tokens, latency_ms, use_rag, rag_context_len, metadata_context_len,
+                        rag_chunks, status, error_message, model_tier, sql_valid, escalated
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """,
+                    [
+                        (
+                            r.get("conversation_id"),
+                            r.get("model_name"),
+                            r.get("endpoint"),
+                            r.get("prompt_tokens"),
+                            r.get("completion_tokens"),
+                            r.get("total_tokens"),
+                            r.get("latency_ms"),
+                            r.get("use_rag"),
+                            r.get("rag_context_len"),
+                            r.get("metadata_context_len"),
+                            json.dumps(r.get("rag_chunks"), ensure_ascii=False) if r.get("rag_chunks") is not None else None,
+                            str(getattr(r.get("status"), "value", r.get("status"))),
+                            r.get("error_message"),
+                            r.get("model_tier"),
+                            r.get("sql_valid"),
+                            bool(r.get("escalated")),
+                        )
+                        for r in batch
+                    ],
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓冲区指标快照。"""
+        return {
+            "queue_depth": len(self._items),
+            "max_queue": self.max_queue,
+            "running": self._task is not None and not self._task.done(),
+            "enqueued_total": self._enqueued_total,
+            "flushed_total": self._flushed_total,
+            "dropped_total": self._dropped_total,
+            "flush_batches": self._flush_batches,
+            "flush_failures": self._flush_failures,
+            "last_flush_ms": self._last_flush_ms,
+            "last_flush_at": self._last_flush_at,
+        }
+
+
+# 全局单例：由 lifespan 负责启动与排空
+ai_call_log_buffer = AICallLogBuffer(
+    batch_size=settings.AI_CALL_LOG_BATCH_SIZE,
+    flush_interval_ms=settings.AI_CALL_LOG_FLUSH_INTERVAL_MS,
+    max_queue=settings.AI_CALL_LOG_MAX_QUEUE,
+)
@@ -0,0 +1,188 @@
+"""
+大模型调用熔断器：
+- 按端点（base_url）维护独立状态，互不影响；
+- 基于滑动窗口的错误率与慢调用比例判定是否熔断；
+- 熔断期间直接拒绝调用，由调用方立即走规则/缓存兜底；
+- 冷却期结束后进入半开状态，仅放行少量探测请求，成功则恢复，失败则重新熔断。
+"""
+import enum
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+class BreakerState(str, enum.Enum):
+    """熔断器状态枚举"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window_size: int = 20,
+        min_calls: int = 5,
+        error_rate_threshold: float = 0.5,
+        slow_call_ms: int = 8000,
+        slow_call_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_probes: int = 1,
+    ):
+        self.name = name
+        self.window_size = max(1, int(window_size))
+        self.min_calls = max(1, int(min_calls))
+        self.error_rate_threshold = float(error_rate_threshold)
+        self.slow_call_ms = int(slow_call_ms)
+        self.slow_call_rate_threshold = float(slow_call_rate_threshold)
+        self.open_seconds = float(open_seconds)
+        self.half_open_max_probes = max(1, int(half_open_max_probes))
+        self._lock = threading.Lock()
+        # 窗口内每次调用记为 (是否失败, 是否慢调用)
+        self._window: Deque[tuple[bool, bool]] = deque(maxlen=self.window_size)
+        self._state = BreakerState.CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._last_error: Optional[str] = None
+        self._total_rejected = 0
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        """冷却期结束后由 OPEN 转为 HALF_OPEN（需在持锁状态下调用）。"""
+        if self._state == BreakerState.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = BreakerState.HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+            logger.info("LLM熔断器进入半开状态: endpoint={}", self.name)
+
+    def _trip(self, reason: str):
+        """切换为 OPEN 状态（需在持锁状态下调用）。"""
+        self._state = BreakerState.OPEN
+        self._opened_at = time.monotonic()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        logger.warning("LLM熔断器打开: endpoint={}, reason={}", self.name, reason)
+
+    def allow_request(self) -> bool:
+        """判断当前是否允许发起调用；半开状态下仅放行有限数量的探测请求。"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == BreakerState.CLOSED:
+                return True
+            if self._state == BreakerState.HALF_OPEN and self._probes_in_flight < self.half_open_max_probes:
+                self._probes_in_flight += 1
+                return True
+            self._total_rejected += 1
+            return False
+
+    def record_success(self, latency_ms: int):
+        """记录一次成功调用；慢调用同样计入窗口，超过比例阈值也会触发熔断。"""
+        slow = int(latency_ms) >= self.slow_call_ms
+        with self._lock:
+            if self._state == BreakerState.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if slow:
+                    self._trip(f"半开探测慢调用 latency_ms={latency_ms}")
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_probes:
+                    self._state = BreakerState.CLOSED
+                    self._window.clear()
+                    logger.info("LLM熔断器恢复关闭: endpoint={}", self.name)
+                return
+            self._window.append((False, slow))
+            self._evaluate()
+
+    def record_failure(self, latency_ms: int, error: Optional[BaseException | str] = None):
+        """记录一次失败调用；半开状态下任意失败立即重新熔断。"""
+        with self._lock:
+            self._last_error = str(error)[:500] if error else None
+            if self._state == BreakerState.HALF_OPEN:
+                self._trip(f"半开探测失败 err={self._last_error}")
+                return
+            if self._state == BreakerState.OPEN:
+                return
+            self._window.append((True, int(latency_ms) >= self.slow_call_ms))
+            self._evaluate()
+
+    def record_cancelled(self):
+        """调用被主动取消（如对冲请求中落后的一方）：不计入成功或失败，仅释放半开探测名额。"""
+        with self._lock:
+            if self._state == BreakerState.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _evaluate(self):
+        """依据窗口统计判断是否需要熔断（需在持锁状态下调用）。"""
+        total = len(self._window)
+        if total < self.min_calls:
+            return
+        failures = sum(1 for f, _ in self._window if f)
+        slows = sum(1 for _, s in self._window if s)
+        if failures / total >= self.error_rate_threshold:
+            self._trip(f"错误率 {failures}/{total}")
+        elif slows / total >= self.slow_call_rate_threshold:
+            self._trip(f"慢调用比例 {slows}/{total}")
+
+    def snapshot(self) -> Dict:
+        """返回熔断器状态快照，用于健康检查展示。"""
+        with self._lock:
+            self._maybe_half_open()
+            total = len(self._window)
+            failures = sum(1 for f, _ in self._window if f)
+            slows = sum(1 for _, s in self._window if s)
+            retry_in = 0.0
+            if self._state == BreakerState.OPEN:
+                retry_in = max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+            return {
+                "endpoint": self.name,
+                "state": self._state.value,
+                "window_calls": total,
+                "error_rate": round(failures / total, 3) if total else 0.0,
+                "slow_call_rate": round(slows / total, 3) if total else 0.0,
+                "retry_in_seconds": round(retry_in, 1),
+                "rejected_total": self._total_rejected,
+                "last_error": self._last_error,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_llm_breaker(endpoint: str) -> CircuitBreaker:
+    """按端点获取（或创建）熔断器，参数取自全局配置。"""
+    key = endpoint or "default"
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name=key,
+                window_size=settings.LLM_BREAKER_WINDOW_SIZE,
+                min_calls=settings.LLM_BREAKER_MIN_CALLS,
+                error_rate_threshold=settings.LLM_BREAKER_ERROR_RATE,
+                slow_call_ms=settings.LLM_BREAKER_SLOW_CALL_MS,
+                slow_call_rate_threshold=settings.LLM_BREAKER_SLOW_CALL_RATE,
+                open_seconds=settings.LLM_BREAKER_OPEN_SECONDS,
+                half_open_max_probes=settings.LLM_BREAKER_HALF_OPEN_PROBES,
+            )
+            _breakers[key] = breaker
+        return breaker
+
+
+def llm_breaker_snapshots() -> list[Dict]:
+    """返回所有端点的熔断器状态快照。"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in breakers]
@@ -0,0 +1,420 @@
+"""
+外部数据源连接池：
+- 按数据源ID与节点（主库 / 只读副本 host:port）维护独立连接池（最小/最大连接数、空闲回收、借出前按间隔探活）；
+- 密码在连接池创建时解密一次，会话级设置（字符集、自动提交、语句超时）在每个连接上只下发一次，
+  之后仅当请求的超时与连接当前设置不同时才重新下发；
+- 数据源更新/删除时失效对应连接池；连接参数变化（签名不一致）时自动重建；
+- 连接出现网络/协议类错误时直接丢弃，不归还池中。
+线程安全：连接的借出与归还可在事件循环线程与执行线程中进行。
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+import pymysql
+from loguru import logger
+
+from app.core.config import settings
+from app.models.data_source import DataSource, DataSourceType
+from app.utils.security import decrypt_secret
+
+
+class PoolTimeoutError(Exception):
+    """在等待时间内未能借到连接"""
+
+
+# 这些异常意味着连接本身已不可用，需要丢弃
+_BROKEN_CONN_ERRORS = ("OperationalError", "InterfaceError")
+
+# 主库节点标识；只读副本以 "host:port" 标识
+PRIMARY_NODE = "primary"
+
+
+def replica_node(replica: Dict[str, Any]) -> str:
+    return f"{replica.get('host')}:{replica.get('port')}"
+
+
+def _endpoint(ds: DataSource, replica: Optional[Dict[str, Any]]) -> Tuple[str, int, Optional[str], Optional[str]]:
+    """节点连接参数 (主机, 端口, 用户名, 加密密码)；副本未配置账号时沿用主库账号。"""
+    if replica is None:
+        return ds.host, int(ds.port), ds.username, ds.password_encrypted
+    if replica.get("username"):
+        return replica["host"], int(replica["port"]), replica["username"], replica.get("password_encrypted")
+    return replica["host"], int(replica["port"]), ds.username, replica.get("password_encrypted") or ds.password_encrypted
+
+
+def _signature(ds: DataSource, replica: Optional[Dict[str, Any]] = None) -> str:
+    host, port, username, password_encrypted = _endpoint(ds, replica)
+    raw = "|".join(str(x) for x in (ds.type, host, port, ds.database_name, username, password_encrypted))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _decrypt_password(password_encrypted: Optional[str]) -> str:
+    # 兼容历史纯文本（解密失败则回退为原值）
+    try:
+        return decrypt_secret(password_encrypted) if password_encrypted else ""
+    except Exception:
+        return password_encrypted or ""
+
+
+class PooledConnection:
+    """池化连接包装：记录所属节点、创建/使用时间与已下发的会话超时。"""
+
+    def __init__(self, raw: Any, kind: DataSourceType, node: str = PRIMARY_NODE):
+        self.raw = raw
+        self.kind = kind
+        self.node = node
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.timeout_seconds: Optional[int] = None
+
+    def cursor(self):
+        return self.raw.cursor()
+
+    def set_timeout(self, seconds: int):
+        """按需下发语句超时：仅在与连接当前设置不同时执行一次 SET。"""
+        seconds = int(seconds)
+        if seconds == self.timeout_seconds:
+            return
+        try:
+            with self.raw.cursor() as cur:
+                if self.kind == DataSourceType.MYSQL:
+                    # MySQL 5.7+ 支持 MAX_EXECUTION_TIME，旧版本忽略
+                    cur.execute(f"SET SESSION MAX_EXECUTION_TIME = {seconds * 1000}")
+                else:
+                    cur.execute(f"SET statement_timeout = '{seconds}s'")
+        except Exception:
+            pass
+        self.timeout_seconds = seconds
+
+    def session_id(self) -> Optional[int]:
+        """服务端会话标识：MySQL 连接线程ID / PostgreSQL 后端进程ID。"""
+        try:
+            if self.kind == DataSourceType.MYSQL:
+                return int(self.raw.thread_id())
+            return int(self.raw.info.backend_pid)
+        except Exception:
+            return None
+
+    def ping(self) -> bool:
+        try:
+            if self.kind == DataSourceType.MYSQL:
+                self.raw.ping(reconnect=False)
+            else:
+                self.raw.execute("SELECT 1")
+            self.last_checked = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    def close(self):
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class DataSourcePool:
+    def __init__(
+        self,
+        ds: DataSource,
+        replica: Optional[Dict[str, Any]] = None,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout_seconds: int = 300,
+        ping_interval_seconds: int = 30,
+        acquire_timeout_seconds: int = 10,
+    ):
+        self.ds_id = ds.id
+        self.kind = ds.type
+        self.node = replica_node(replica) if replica is not None else PRIMARY_NODE
+        self.signature = _signature(ds, replica)
+        host, port, username, password_encrypted = _endpoint(ds, replica)
+        self._params = {
+            "host": host,
+            "port": port,
+            "user": username,
+            "password": _decrypt_password(password_encrypted),
+            "database": ds.database_name,
+        }
+        self.min_size = max(0, int(min_size))
+        self.max_size = max(1, int(max_size), self.min_size)
+        self.idle_timeout_seconds = max(1, int(idle_timeout_seconds))
+        self.ping_interval_seconds = max(0, int(ping_interval_seconds))
+        self.acquire_timeout_seconds = max(1, int(acquire_timeout_seconds))
+        self._idle: Deque[PooledConnection] = deque()
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        # 指标
+        self.created_total = 0
+        self.discarded_total = 0
+        self.acquired_total = 0
+        self.wait_total = 0
+        self.timeouts_total = 0
+
+    def _connect(self) -> PooledConnection:
+        p = self._params
+        timeout = int(settings.QUERY_TIMEOUT_SECONDS)
+        if self.kind == DataSourceType.MYSQL:
+            raw = pymysql.connect(
+                host=p["host"],
+                port=p["port"],
+                user=p["user"],
+                password=p["password"],
+                database=p["database"],
+                charset="utf8mb4",
+                cursorclass=pymysql.cursors.DictCursor,
+                connect_timeout=min(timeout, 10),
+                autocommit=True,
+            )
+        elif self.kind == DataSourceType.POSTGRESQL:
+            try:
+                import psycopg  # 延迟导入，避免未安装时阻断服务启动
+            except ImportError:
+                raise ValueError("PostgreSQL驱动未安装，请安装 'psycopg' 以执行查询")
+            raw = psycopg.connect(
+                host=p["host"],
+                port=p["port"],
+                user=p["user"],
+                password=p["password"],
+                dbname=p["database"],
+                connect_timeout=min(timeout, 10),
+                autocommit=True,
+            )
+        else:
+            raise ValueError(f"暂不支持该类型的连接: {self.kind}")
+        conn = PooledConnection(raw, self.kind, self.node)
+        conn.set_timeout(timeout)
+        self.created_total += 1
+        return conn
+
+    def _discard(self, conn: PooledConnection):
+        conn.close()
+        with self._cond:
+            self._size -= 1
+            self.discarded_total += 1
+            self._cond.notify()
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        deadline = time.monotonic() + (timeout or self.acquire_timeout_seconds)
+        while True:
+            conn: Optional[PooledConnection] = None
+            with self._cond:
+                if self._closed:
+                    raise ValueError("连接池已关闭")
+                if self._idle:
+                    # 后进先出：优先复用最近使用的连接，其余连接更易被空闲回收
+                    conn = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts_total += 1
+                        raise PoolTimeoutError(f"数据源{self.ds_id}({self.node})连接池已满，等待连接超时")
+                    self.wait_total += 1
+                    self._cond.wait(remaining)
+                    continue
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif self.ping_interval_seconds and time.monotonic() - conn.last_checked > self.ping_interval_seconds:
+                if not conn.ping():
+                    logger.info("数据源连接探活失败，丢弃重建: data_source_id={}, node={}", self.ds_id, self.node)
+                    self._discard(conn)
+                    continue
+            self.acquired_total += 1
+            return conn
+
+    def release(self, conn: PooledConnection, broken: bool = False):
+        if broken or self._closed:
+            self._discard(conn)
+            return
+        now = time.monotonic()
+        conn.last_used = now
+        conn.last_checked = now
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+        self.evict_idle()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[PooledConnection]:
+        conn = self.acquire(timeout)
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = type(e).__name__ in _BROKEN_CONN_ERRORS
+            raise
+        finally:
+            self.release(conn, broken=broken)
+
+    def evict_idle(self) -> int:
+        """回收超过空闲时间的连接（保留最小连接数）。"""
+        now = time.monotonic()
+        evicted = []
+        with self._cond:
+            # 队首为最久未使用的连接
+            while self._idle and self._size - len(evicted) > self.min_size:
+                if now - self._idle[0].last_used <= self.idle_timeout_seconds:
+                    break
+                evicted.append(self._idle.popleft())
+            self._size -= len(evicted)
+            self.discarded_total += len(evicted)
+        for conn in evicted:
+            conn.close()
+        return len(evicted)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def in_use(self) -> int:
+        with self._cond:
+            return self._size - len(self._idle)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "data_source_id": self.ds_id,
+                "node": self.node,
+                "type": getattr(self.kind, "value", str(self.kind)),
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+                "created_total": self.created_total,
+                "discarded_total": self.discarded_total,
+                "acquired_total": self.acquired_total,
+                "wait_total": self.wait_total,
+                "timeouts_total": self.timeouts_total,
+            }
+
+
+class ConnectionPoolManager:
+    """按 (数据源ID, 节点) 管理连接池；后台任务定期回收空闲连接。"""
+
+    def __init__(self):
+        self._pools: Dict[Tuple[int, str], DataSourcePool] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def get_pool(self, ds: DataSource, replica: Optional[Dict[str, Any]] = None) -> DataSourcePool:
+        """获取数据源主库（replica 为空）或指定只读副本的连接池。"""
+        sig = _signature(ds, replica)
+        key = (ds.id, replica_node(replica) if replica is not None else PRIMARY_NODE)
+        stale = None
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is not None and pool.signature == sig:
+                return pool
+            stale = pool
+            pool = DataSourcePool(
+                ds,
+                replica,
+                min_size=settings.DS_POOL_MIN_SIZE,
+                max_size=settings.DS_POOL_MAX_SIZE,
+                idle_timeout_seconds=settings.DS_POOL_IDLE_TIMEOUT_SECONDS,
+                ping_interval_seconds=settings.DS_POOL_PING_INTERVAL_SECONDS,
+                acquire_timeout_seconds=settings.DS_POOL_ACQUIRE_TIMEOUT_SECONDS,
+            )
+            self._pools[key] = pool
+        if stale is not None:
+            logger.info("数据源连接参数变化，重建连接池: data_source_id={}, node={}", ds.id, key[1])
+            stale.close()
+        return pool
+
+    def peek(self, ds_id: int, node: str) -> Optional[DataSourcePool]:
+        """返回已存在的连接池（不创建）。"""
+        with self._lock:
+            return self._pools.get((ds_id, node))
+
+    @contextmanager
+    def connection(
+        self, ds: DataSource, timeout: Optional[float] = None, replica: Optional[Dict[str, Any]] = None
+    ) -> Iterator[PooledConnection]:
+        with self.get_pool(ds, replica).connection(timeout) as conn:
+            yield conn
+
+    def invalidate(self, ds_id: int):
+        """数据源更新/删除后关闭并移除其全部节点的连接池（借出中的连接归还时关闭）。"""
+        with self._lock:
+            keys = [k for k in self._pools if k[0] == ds_id]
+            pools = [self._pools.pop(k) for k in keys]
+        for pool in pools:
+            pool.close()
+        if pools:
+            logger.info("数据源连接池已失效: data_source_id={}, pools={}", ds_id, len(pools))
+
+    def evict_idle(self) -> int:
+        with self._lock:
+            pools = list(self._pools.values())
+        return sum(p.evict_idle() for p in pools)
+
+    async def start(self):
+        """启动空闲连接回收任务（幂等）。"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        interval = max(5, int(settings.DS_POOL_IDLE_TIMEOUT_SECONDS) // 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                evicted = await asyncio.to_thread(self.evict_idle)
+                if evicted:
+                    logger.debug("数据源连接池空闲回收: evicted={}", evicted)
+            except Exception as e:
+                logger.warning("数据源连接池空闲回收失败: {}", e)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for p in pools:
+            p.close()
+
+    def stats(self):
+        with self._lock:
+            pools = list(self._pools.values())
+        return [p.stats() for p in pools]
+
+
+_manager: Optional[ConnectionPoolManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_pool_manager() -> ConnectionPoolManager:
+    """获取全局数据源连接池管理器单例。"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ConnectionPoolManager()
+    return _manager
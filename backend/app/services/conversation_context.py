@@ -0,0 +1,236 @@
+"""
+会话级上下文复用：
+- 每个会话维护一份“工作集”：上一轮解析出的表、维度/指标列、筛选条件、关联路径、SQL 及精简后的表结构上下文；
+- 存储为进程内 LRU + Redis 两级缓存（Redis 不可用时仅使用本地缓存，并在短时间内不再重试）；
+- 识别“再按城市分组”“只看2024年的呢”等追问，复用上一轮工作集生成增量提示词，
+  跳过向量检索并缩小提示词中的表结构上下文。
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.metadata_catalog import get_metadata_catalog
+from app.services.sql_parser import parse_sql
+
+
+# 追问常见起始词/结尾词
+FOLLOW_UP_PREFIXES = ("再", "那", "那么", "然后", "还有", "另外", "改成", "改为", "换成", "只看", "只要", "仅看", "去掉", "加上", "同样", "同时", "并且", "按照这个", "在此基础上", "基于上面")
+FOLLOW_UP_SUFFIXES = ("呢", "呢？", "呢?")
+FOLLOW_UP_MARKERS = ("上面", "上述", "刚才", "之前的", "这个结果", "该结果", "上一步")
+
+_REDIS_KEY = "aitt:conv_ctx:{}"
+
+
+@dataclass
+class WorkingSet:
+    conversation_id: int
+    nl_query: str
+    sql: str
+    tables: List[str] = field(default_factory=list)
+    dimensions: List[str] = field(default_factory=list)
+    metrics: List[Dict[str, Any]] = field(default_factory=list)
+    filters: List[Dict[str, Any]] = field(default_factory=list)
+    # 表在 FROM/JOIN 中出现的顺序即关联路径
+    join_path: List[str] = field(default_factory=list)
+    schema_context: str = ""
+    turn: int = 1
+    updated_at: float = field(default_factory=time.time)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False, default=str)
+
+    @classmethod
+    def from_json(cls, raw: str) -> Optional["WorkingSet"]:
+        try:
+            data = json.loads(raw)
+            return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+        except Exception:
+            return None
+
+
+def compact_schema_context(tables: List[str], fallback_ctx: Optional[str] = None) -> str:
+    """仅保留工作集涉及表的结构上下文：优先取元数据目录，其次从原上下文中截取对应表块。"""
+    wanted = {t.lower() for t in tables}
+    if not wanted:
+        return ""
+    lines: List[str] = []
+    try:
+        snap = get_metadata_catalog().get()
+    except Exception:
+        snap = None
+    if snap is not None:
+        for tname, t in snap.tables.items():
+            if tname.lower() not in wanted:
+                continue
+            lines.append(f"Table: {tname}" + (f" ({t.display_name})" if t.display_name else ""))
+            for c in t.columns:
+                flags = (" [D]" if c.is_dim else "") + (" [M]" if c.is_met else "")
+                lines.append(f"  - {c.name}: {c.type}{flags}")
+    if lines:
+        return "\n".join(lines)
+    # 目录不可用：按 “Table: xxx” 块过滤原上下文
+    keep = False
+    for line in (fallback_ctx or "").splitlines():
+        m = re.match(r"^Table:\s*([\w.]+)", line)
+        if m:
+            keep = m.group(1).split(".")[-1].lower() in wanted
+        if keep:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def is_follow_up(nl_query: str, ws: Optional[WorkingSet]) -> bool:
+    """判断本轮问题是否为对上一轮结果的追问（需存在工作集，且未显式提及工作集之外的新表）。"""
+    if ws is None or not ws.sql:
+        return False
+    q = (nl_query or "").strip()
+    if not q:
+        return False
+    try:
+        snap = get_metadata_catalog().get()
+        mentioned = snap.tables_mentioned_in(q) if snap is not None else []
+    except Exception:
+        mentioned = []
+    known = {t.lower() for t in ws.tables}
+    if any(t.lower() not in known for t in mentioned):
+        return False
+    if q.startswith(FOLLOW_UP_PREFIXES) or q.endswith(FOLLOW_UP_SUFFIXES) or any(k in q for k in FOLLOW_UP_MARKERS):
+        return True
+    # 短问题且未提及任何表，通常是在上一轮基础上调整维度/筛选
+    return len(q) <= 12 and not mentioned and bool(re.search(r"按|分组|排序|筛选|过滤|只|前\d+|top", q, re.IGNORECASE))
+
+
+def build_delta_context(nl_query: str, ws: WorkingSet) -> str:
+    """增量提示：给出上一轮问题与SQL、已解析的表与列，要求模型在其基础上修改。"""
+    parts = [
+        f"上一轮问题：{ws.nl_query}",
+        f"上一轮SQL：{ws.sql}",
+    ]
+    if ws.join_path:
+        parts.append(f"已确定的表/关联路径：{' -> '.join(ws.join_path)}")
+    if ws.dimensions:
+        parts.append(f"已使用维度：{', '.join(ws.dimensions)}")
+    if ws.metrics:
+        parts.append("已使用指标：" + ", ".join(f"{m.get('aggregation')}({m.get('column')})" for m in ws.metrics))
+    if ws.filters:
+        parts.append("已有筛选：" + "; ".join(f"{f.get('column')} {f.get('operator')} {f.get('value')}" for f in ws.filters))
+    parts.append("本轮为追问：请在上一轮SQL基础上按需求修改，未提及的条件保持不变。")
+    return "\n".join(parts)
+
+
+class ConversationContextStore:
+    def __init__(self, max_entries: int = 1000, ttl_seconds: int = 1800):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self._local: "OrderedDict[int, WorkingSet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_retry_at = 0.0
+
+    def _local_get(self, conversation_id: int) -> Optional[WorkingSet]:
+        with self._lock:
+            ws = self._local.get(conversation_id)
+            if ws is None:
+                return None
+            if time.time() - ws.updated_at > self.ttl_seconds:
+                self._local.pop(conversation_id, None)
+                return None
+            self._local.move_to_end(conversation_id)
+            return ws
+
+    def _local_put(self, ws: WorkingSet):
+        with self._lock:
+            self._local[ws.conversation_id] = ws
+            self._local.move_to_end(ws.conversation_id)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    async def _redis(self):
+        if time.time() < self._redis_retry_at:
+            return None
+        from app.core.database import get_redis
+        return await get_redis()
+
+    def _redis_failed(self, e: Exception):
+        # Redis 不可用时 30 秒内不再尝试，避免每轮请求都等待连接失败
+        self._redis_retry_at = time.time() + 30
+        logger.warning("会话上下文Redis不可用，暂时仅使用本地缓存: {}", e)
+
+    async def get(self, conversation_id: Optional[int]) -> Optional[WorkingSet]:
+        if not conversation_id:
+            return None
+        ws = self._local_get(conversation_id)
+        if ws is None:
+            try:
+                r = await self._redis()
+                raw = await r.get(_REDIS_KEY.format(conversation_id)) if r is not None else None
+                ws = WorkingSet.from_json(raw) if raw else None
+                if ws is not None:
+                    self._local_put(ws)
+            except Exception as e:
+                self._redis_failed(e)
+        return ws
+
+    async def put(self, ws: WorkingSet):
+        self._local_put(ws)
+        try:
+            r = await self._redis()
+            if r is not None:
+                await r.set(_REDIS_KEY.format(ws.conversation_id), ws.to_json(), ex=self.ttl_seconds)
+        except Exception as e:
+            self._redis_failed(e)
+
+    async def remember(self, conversation_id: Optional[int], nl_query: str, sql: str, schema_ctx: Optional[str] = None):
+        """根据本轮生成的SQL更新会话工作集（复用共享的SQL解析缓存）。"""
+        if not conversation_id or not sql or "placeholder" in sql.lower():
+            return
+        try:
+            prev = self._local_get(conversation_id)
+            analysis = parse_sql(sql).analysis()
+            tables = list(analysis.get("tables") or [])
+            ws = WorkingSet(
+                conversation_id=int(conversation_id),
+                nl_query=nl_query,
+                sql=sql,
+                tables=tables,
+                dimensions=list(analysis.get("dimensions") or []),
+                metrics=list(analysis.get("metrics") or []),
+                filters=list(analysis.get("filters") or []),
+                join_path=tables,
+                schema_context=compact_schema_context(tables, schema_ctx) or (prev.schema_context if prev else ""),
+                turn=(prev.turn + 1) if prev else 1,
+            )
+            await self.put(ws)
+            logger.debug("会话工作集更新: conversation_id={}, turn={}, tables={}", conversation_id, ws.turn, tables)
+        except Exception as e:
+            logger.warning("会话工作集更新失败: {}", e)
+
+    async def follow_up_for(self, conversation_id: Optional[int], nl_query: str) -> Optional[WorkingSet]:
+        """若本轮为追问，返回上一轮工作集；否则返回None。"""
+        if not settings.CONVERSATION_CONTEXT_ENABLED:
+            return None
+        ws = await self.get(conversation_id)
+        return ws if is_follow_up(nl_query, ws) else None
+
+
+_store: Optional[ConversationContextStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_context_store() -> ConversationContextStore:
+    """获取全局会话上下文存储单例。"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationContextStore(
+                    max_entries=settings.CONVERSATION_CONTEXT_LRU_SIZE,
+                    ttl_seconds=settings.CONVERSATION_CONTEXT_TTL_SECONDS,
+                )
+    return _store
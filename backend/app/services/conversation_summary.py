@@ -0,0 +1,220 @@
+"""
+多轮对话滚动摘要：
+- 最近 K 轮消息原样保留，更早的消息折叠进会话的滚动摘要（存于 AIConversation.context 的 summary 键，仅按键更新）；
+- 每轮结束后在后台异步更新摘要，同一会话同时只运行一个更新任务；服务关闭时排空进行中的任务；
+- 摘要优先由模型压缩（有快速模型时使用快速模型），模型不可用时退化为抽取式摘要；
+- 拼装给提示词的历史上下文按 Token 预算截断，保证每轮提示词长度有上限。
+"""
+import asyncio
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from loguru import logger
+from sqlalchemy import case, func, select, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.ai_conversation import AIConversation, AIMessage, MessageRole
+
+
+_CJK = re.compile(r"[一-鿿]")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """粗略估算Token数：中文按每字1个，其余按约4个字符1个。"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + max(0, len(text) - cjk) // 4 + 1
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    """从头部截断文本，使估算Token数不超过预算（保留最新内容）。"""
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if estimate_tokens(text[mid:]) <= budget:
+            hi = mid
+        else:
+            lo = mid + 1
+    return "…" + text[lo:]
+
+
+def _load_state(conv: AIConversation) -> Dict[str, Any]:
+    ctx = conv.context if isinstance(conv.context, dict) else {}
+    return {
+        "summary": str(ctx.get("summary") or ""),
+        "summarized_until": int(ctx.get("summarized_until") or 0),
+    }
+
+
+def _format_message(m: AIMessage) -> str:
+    role = "用户" if m.role == MessageRole.USER else ("助手" if m.role == MessageRole.ASSISTANT else "系统")
+    return f"{role}: {(m.content or '').strip()}"
+
+
+async def increment_conversation_counters(db, conversation_id: int, messages: int, tokens: int):
+    """原子累加会话消息数与Token数（单条UPDATE，避免读改写竞争）。"""
+    await db.execute(
+        update(AIConversation)
+        .where(AIConversation.id == conversation_id)
+        .values(
+            total_messages=AIConversation.total_messages + messages,
+            total_tokens=AIConversation.total_tokens + tokens,
+        )
+    )
+
+
+class ConversationSummarizer:
+    def __init__(self, keep_turns: int = 3, token_budget: int = 1200):
+        self.keep_turns = max(1, int(keep_turns))
+        self.token_budget = max(100, int(token_budget))
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def build_history_context(self, db, conversation_id: Optional[int]) -> Optional[str]:
+        """拼装“滚动摘要 + 最近K轮原文”的历史上下文，总长度不超过Token预算。"""
+        if not conversation_id:
+            return None
+        conv = await db.get(AIConversation, conversation_id)
+        if conv is None:
+            return None
+        state = _load_state(conv)
+        res = await db.execute(
+            select(AIMessage)
+            .where(AIMessage.conversation_id == conversation_id, AIMessage.id > state["summarized_until"])
+            .order_by(AIMessage.id.desc())
+            .limit(self.keep_turns * 2)
+        )
+        recent = [_format_message(m) for m in reversed(res.scalars().all())]
+        if not state["summary"] and not recent:
+            return None
+        # 优先保证最近对话原文，剩余预算留给摘要；超出时丢弃最早的原文
+        budget = self.token_budget
+        kept: List[str] = []
+        for line in reversed(recent):
+            cost = estimate_tokens(line)
+            if cost > budget:
+                break
+            kept.insert(0, line)
+            budget -= cost
+        parts = []
+        summary = _truncate_to_tokens(state["summary"], budget)
+        if summary:
+            parts.append(f"对话摘要：{summary}")
+        if kept:
+            parts.append("最近对话：\n" + "\n".join(kept))
+        return "\n".join(parts) or None
+
+    def schedule_update(self, conversation_id: Optional[int]):
+        """每轮结束后调度后台摘要更新；同一会话已有任务在运行时跳过。"""
+        if not conversation_id or conversation_id in self._running or self._stopping:
+            return
+        self._running.add(conversation_id)
+        task = asyncio.create_task(self._update(conversation_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self, timeout: float = 10.0):
+        """关闭时等待进行中的摘要更新完成，超时仍未完成的任务取消（下一轮对话会重新折叠）。"""
+        self._stopping = True
+        tasks = list(self._tasks)
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        logger.info("会话摘要任务已排空: completed={}, cancelled={}", len(done), len(pending))
+
+    async def _update(self, conversation_id: int):
+        try:
+            async with AsyncSessionLocal() as db:
+                conv = await db.get(AIConversation, conversation_id)
+                if conv is None:
+                    return
+                state = _load_state(conv)
+                res = await db.execute(
+                    select(AIMessage)
+                    .where(AIMessage.conversation_id == conversation_id, AIMessage.id > state["summarized_until"])
+                    .order_by(AIMessage.id.asc())
+                )
+                pending = res.scalars().all()
+                overflow = pending[: max(0, len(pending) - self.keep_turns * 2)]
+                if not overflow:
+                    return
+                summary = await self._summarize(state["summary"], [_format_message(m) for m in overflow])
+                # 仅写入 context 中的摘要键（JSON_SET），不覆盖其他并发写入的键；计数列由原子累加维护。
+                # 以 summarized_until 未变作为条件，多实例同时折叠同一会话时只有一方生效
+                ctx_col = AIConversation.context
+                base = case(
+                    (func.json_type(ctx_col) == "OBJECT", ctx_col),
+                    else_=func.json_object(),
+                )
+                res = await db.execute(
+                    update(AIConversation)
+                    .where(
+                        AIConversation.id == conversation_id,
+                        func.coalesce(func.json_extract(ctx_col, "$.summarized_until"), 0) == state["summarized_until"],
+                    )
+                    .values(context=func.json_set(base, "$.summary", summary, "$.summarized_until", overflow[-1].id))
+                    .execution_options(synchronize_session=False)
+                )
+                if not res.rowcount:
+                    await db.rollback()
+                    logger.info("会话摘要已被并发更新，跳过本次写入: conversation_id={}", conversation_id)
+                    return
+                await db.commit()
+                logger.info("会话摘要已更新: conversation_id={}, folded={}, len(summary)={}", conversation_id, len(overflow), len(summary))
+        except Exception as e:
+            logger.warning("会话摘要更新失败: conversation_id={}, err={}", conversation_id, e)
+        finally:
+            self._running.discard(conversation_id)
+
+    async def _summarize(self, previous: str, lines: List[str]) -> str:
+        budget = max(50, self.token_budget // 2)
+        if settings.OPENAI_API_KEY:
+            try:
+                from app.services.llm_pool import get_llm_pool
+                pool = get_llm_pool()
+                if pool.has_available():
+                    prompt = (
+                        "请将以下数据分析对话压缩为简洁的中文摘要，保留涉及的表、字段、筛选条件、时间范围与关键结论，不超过200字。\n"
+                        f"已有摘要：{previous or '无'}\n新增对话：\n" + "\n".join(lines)
+                    )
+                    completion, _ = await pool.chat_completion(
+                        model=settings.AI_MODEL_FAST_NAME or settings.AI_MODEL_NAME,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=0.0,
+                        max_tokens=300,
+                        timeout=15,
+                    )
+                    text = (completion.choices[0].message.content or "").strip()
+                    if text:
+                        return _truncate_to_tokens(text, budget)
+            except Exception as e:
+                logger.warning("模型摘要失败，改用抽取式摘要: {}", e)
+        # 抽取式摘要：每条消息只保留首行要点，整体按预算截断（保留最新内容）
+        extract = [ln.splitlines()[0][:120] for ln in lines if ln.strip()]
+        merged = "；".join(([previous] if previous else []) + extract)
+        return _truncate_to_tokens(merged, budget)
+
+
+_summarizer: Optional[ConversationSummarizer] = None
+
+
+def get_conversation_summarizer() -> ConversationSummarizer:
+    """获取全局会话摘要器单例（仅在事件循环内使用，无需加锁）。"""
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = ConversationSummarizer(
+            keep_turns=settings.CONVERSATION_KEEP_TURNS,
+            token_budget=settings.CONVERSATION_PROMPT_TOKEN_BUDGET,
+        )
+    return _summarizer
@@ -0,0 +1,319 @@
+"""
+执行前代价守卫（EXPLAIN 预检）：
+- 执行前在数据源上获取执行计划（MySQL EXPLAIN FORMAT=JSON / PostgreSQL EXPLAIN (FORMAT JSON)，均不实际执行），
+  估算扫描行数（嵌套循环中内表按外表行数重复扫描）、连接扇出（连接结果行数）与全表扫描的表；
+- 超出阈值（数据源 max_scan_rows / max_join_fanout，为空时取全局默认，0 不限制）时按动作处理：
+  reject 直接拒绝；limit 对明细查询把返回行数收紧到 COST_GUARD_LIMIT_ROWS 后执行（数据库可提前结束扫描），
+  聚合、排序等须读完全部输入的查询收紧行数无效，仍拒绝；off 不检查；
+- 计划估算按 (数据源ID, SQL指纹) 进程内缓存，判定在每次检查时按当前阈值重新计算，调整阈值立即生效；
+- EXPLAIN 失败或超时不阻断执行（放行并记录），守卫只拦截确定超限的查询。
+仅在事件循环内使用。
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+from app.models.data_source import DataSource, DataSourceType
+from app.services.query_executor import get_query_executor
+from app.services.sql_parser import parse_sql
+
+ACTION_REJECT = "reject"
+ACTION_LIMIT = "limit"
+ACTION_OFF = "off"
+
+VERDICT_PASS = "pass"
+VERDICT_LIMITED = "limited"
+VERDICT_REJECTED = "rejected"
+VERDICT_SKIPPED = "skipped"
+
+_JOIN_NODES = ("Nested Loop", "Hash Join", "Merge Join")
+
+
+@dataclass
+class PlanEstimate:
+    rows_scanned: int = 0
+    join_fanout: int = 0
+    full_scans: List[str] = field(default_factory=list)
+    cost: Optional[float] = None
+    created_at: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "rows_scanned": self.rows_scanned,
+            "join_fanout": self.join_fanout,
+            "full_scans": self.full_scans,
+            "cost": self.cost,
+        }
+
+
+@dataclass
+class CostVerdict:
+    verdict: str
+    max_rows: int
+    estimate: Optional[PlanEstimate] = None
+    reason: Optional[str] = None
+    max_scan_rows: int = 0
+    max_join_fanout: int = 0
+    cached: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "verdict": self.verdict,
+            "reason": self.reason,
+            "max_scan_rows": self.max_scan_rows or None,
+            "max_join_fanout": self.max_join_fanout or None,
+            "cached": self.cached,
+        }
+        if self.estimate is not None:
+            data.update(self.estimate.to_dict())
+        return data
+
+
+class CostGuardRejectedError(Exception):
+    """查询的预估代价超出数据源阈值，已拒绝执行"""
+
+    def __init__(self, verdict: CostVerdict):
+        super().__init__(verdict.reason or "查询预估代价过高，已拒绝执行")
+        self.verdict = verdict
+
+
+def _num(value: Any) -> float:
+    # MySQL 计划中的数值多为字符串（如 "cost_info": {"query_cost": "12.50"}）
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# ---------- MySQL EXPLAIN FORMAT=JSON ----------
+def _mysql_join(tables: List[Dict[str, Any]], est: PlanEstimate, acc: Dict[str, float]):
+    # rows_produced_per_join 为连接到当前表为止的累计行数，即下一张表被扫描的次数
+    loops = 1.0
+    for t in tables:
+        acc["scanned"] += _num(t.get("rows_examined_per_scan")) * loops
+        if t.get("access_type") == "ALL":
+            est.full_scans.append(str(t.get("table_name") or "?"))
+        loops = max(1.0, _num(t.get("rows_produced_per_join")))
+    if len(tables) > 1:
+        acc["fanout"] = max(acc["fanout"], loops)
+
+
+def _mysql_walk(node: Any, est: PlanEstimate, acc: Dict[str, float]):
+    if isinstance(node, list):
+        for v in node:
+            _mysql_walk(v, est, acc)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if key == "nested_loop" and isinstance(value, list):
+            tables = [v["table"] for v in value if isinstance(v, dict) and isinstance(v.get("table"), dict)]
+            _mysql_join(tables, est, acc)
+            # 派生表、子查询的计划嵌套在表节点内
+            for t in tables:
+                _mysql_walk(t, est, acc)
+        elif key == "table" and isinstance(value, dict):
+            _mysql_join([value], est, acc)
+            _mysql_walk(value, est, acc)
+        else:
+            _mysql_walk(value, est, acc)
+
+
+def parse_mysql_plan(plan: Any) -> PlanEstimate:
+    est = PlanEstimate(created_at=time.time())
+    acc = {"scanned": 0.0, "fanout": 0.0}
+    _mysql_walk(plan, est, acc)
+    if isinstance(plan, dict):
+        cost = ((plan.get("query_block") or {}).get("cost_info") or {}).get("query_cost")
+        est.cost = _num(cost) if cost is not None else None
+    est.rows_scanned = int(acc["scanned"])
+    est.join_fanout = int(acc["fanout"])
+    return est
+
+
+# ---------- PostgreSQL EXPLAIN (FORMAT JSON) ----------
+def _pg_walk(node: Dict[str, Any], loops: float, est: PlanEstimate, acc: Dict[str, float]):
+    node_type = str(node.get("Node Type") or "")
+    rows = _num(node.get("Plan Rows"))
+    if node.get("Relation Name") and node_type.endswith("Scan"):
+        # Plan Rows 为每次扫描的输出行数（已过滤），嵌套循环内表按外表行数重复扫描
+        acc["scanned"] += rows * loops
+        if node_type == "Seq Scan":
+            est.full_scans.append(str(node["Relation Name"]))
+    if node_type in _JOIN_NODES:
+        acc["fanout"] = max(acc["fanout"], rows * loops)
+    children = [c for c in node.get("Plans") or [] if isinstance(c, dict)]
+    if node_type == "Nested Loop" and len(children) >= 2:
+        outer, inner = children[0], children[1]
+        _pg_walk(outer, loops, est, acc)
+        _pg_walk(inner, loops * max(1.0, _num(outer.get("Plan Rows"))), est, acc)
+        for c in children[2:]:
+            _pg_walk(c, loops, est, acc)
+        return
+    for c in children:
+        _pg_walk(c, loops, est, acc)
+
+
+def parse_postgres_plan(plan: Any) -> PlanEstimate:
+    est = PlanEstimate(created_at=time.time())
+    acc = {"scanned": 0.0, "fanout": 0.0}
+    if isinstance(plan, list) and plan:
+        plan = plan[0]
+    root = plan.get("Plan") if isinstance(plan, dict) else None
+    if isinstance(root, dict):
+        _pg_walk(root, 1.0, est, acc)
+        est.cost = _num(root.get("Total Cost"))
+    est.rows_scanned = int(acc["scanned"])
+    est.join_fanout = int(acc["fanout"])
+    return est
+
+
+def _limit_effective(sql: str) -> bool:
+    """收紧 LIMIT 能否减少扫描：仅无排序的明细查询（聚合、去重、排序须读完全部输入）。"""
+    parsed = parse_sql(sql)
+    if parsed.analysis()["sorts"]:
+        return False
+    return parse_sql(parsed.without_order_limit()).is_plain_select
+
+
+class CostGuard:
+    def __init__(self, max_entries: int = 1000, ttl_seconds: int = 600):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self._items: "OrderedDict[Tuple[int, str], PlanEstimate]" = OrderedDict()
+        # 指标
+        self.checks_total = 0
+        self.cache_hits = 0
+        self.explain_errors = 0
+        self.limited_total = 0
+        self.rejected_total = 0
+
+    @staticmethod
+    def thresholds(ds: DataSource) -> Tuple[str, int, int]:
+        """(动作, 扫描行数上限, 连接扇出上限)：数据源上的设置优先，为空时取全局默认。"""
+        action = (getattr(ds, "cost_guard_action", None) or settings.COST_GUARD_ACTION or ACTION_REJECT).lower()
+        scan = getattr(ds, "max_scan_rows", None)
+        fanout = getattr(ds, "max_join_fanout", None)
+        return (
+            action,
+            int(settings.COST_GUARD_MAX_SCAN_ROWS if scan is None else scan),
+            int(settings.COST_GUARD_MAX_JOIN_FANOUT if fanout is None else fanout),
+        )
+
+    def _get(self, key: Tuple[int, str]) -> Optional[PlanEstimate]:
+        est = self._items.get(key)
+        if est is None:
+            return None
+        if time.time() - est.created_at > self.ttl_seconds:
+            self._items.pop(key, None)
+            return None
+        self._items.move_to_end(key)
+        return est
+
+    def _put(self, key: Tuple[int, str], est: PlanEstimate):
+        self._items[key] = est
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    async def estimate(self, ds_service, ds: DataSource, sql: str) -> Tuple[PlanEstimate, bool]:
+        """返回 (计划估算, 是否命中缓存)；EXPLAIN 失败时抛出异常。"""
+        key = (int(ds.id), parse_sql(sql).fingerprint)
+        est = self._get(key)
+        if est is not None:
+            self.cache_hits += 1
+            return est, True
+        timeout = max(1, int(settings.COST_GUARD_EXPLAIN_TIMEOUT_SECONDS))
+        plan = await asyncio.wait_for(
+            get_query_executor().run(ds.id, ds_service.explain_blocking, ds, sql, timeout),
+            timeout=timeout + 1,
+        )
+        est = parse_mysql_plan(plan) if ds.type == DataSourceType.MYSQL else parse_postgres_plan(plan)
+        self._put(key, est)
+        return est, False
+
+    async def evaluate(self, ds_service, ds: DataSource, sql: str, max_rows: int, force: bool = False) -> CostVerdict:
+        """估算代价并按数据源阈值给出判定（不抛出拒绝）。force=True 时即使守卫关闭也获取估算（供界面预览）。"""
+        action, max_scan, max_fanout = self.thresholds(ds)
+        verdict = CostVerdict(verdict=VERDICT_SKIPPED, max_rows=max_rows, max_scan_rows=max_scan, max_join_fanout=max_fanout)
+        enabled = settings.COST_GUARD_ENABLED and action != ACTION_OFF
+        if not (enabled or force) or ds.type not in (DataSourceType.MYSQL, DataSourceType.POSTGRESQL):
+            return verdict
+        self.checks_total += 1
+        try:
+            verdict.estimate, verdict.cached = await self.estimate(ds_service, ds, sql)
+        except asyncio.TimeoutError:
+            self.explain_errors += 1
+            logger.info("EXPLAIN 超时，跳过代价检查: data_source_id={}", ds.id)
+            verdict.reason = "获取执行计划超时，未检查代价"
+            return verdict
+        except Exception as e:
+            self.explain_errors += 1
+            logger.info("EXPLAIN 失败，跳过代价检查: data_source_id={}, err={}", ds.id, e)
+            verdict.reason = f"获取执行计划失败，未检查代价: {e}"
+            return verdict
+        est = verdict.estimate
+        reasons = []
+        if max_scan and est.rows_scanned > max_scan:
+            reasons.append(f"预估扫描 {est.rows_scanned:,} 行，超过上限 {max_scan:,} 行")
+        if max_fanout and est.join_fanout > max_fanout:
+            reasons.append(f"预估连接结果 {est.join_fanout:,} 行，超过上限 {max_fanout:,} 行")
+        if not reasons:
+            verdict.verdict = VERDICT_PASS
+            return verdict
+        if est.full_scans:
+            reasons.append("全表扫描: " + ", ".join(dict.fromkeys(est.full_scans)))
+        verdict.reason = "；".join(reasons)
+        if not enabled:
+            # 仅预览：给出按当前动作会得到的判定
+            action = action if action != ACTION_OFF else ACTION_REJECT
+        if action == ACTION_LIMIT and _limit_effective(sql):
+            verdict.verdict = VERDICT_LIMITED
+            verdict.max_rows = min(max_rows, max(1, int(settings.COST_GUARD_LIMIT_ROWS)))
+            verdict.reason += f"；已将返回行数限制为 {verdict.max_rows}"
+        else:
+            verdict.verdict = VERDICT_REJECTED
+        return verdict
+
+    async def check(self, ds_service, ds: DataSource, sql: str, max_rows: int) -> CostVerdict:
+        """执行前检查：超限且需拒绝时抛出 CostGuardRejectedError；否则返回判定（含可能被收紧的 max_rows）。"""
+        verdict = await self.evaluate(ds_service, ds, sql, max_rows)
+        if verdict.verdict == VERDICT_REJECTED:
+            self.rejected_total += 1
+            logger.info("查询预估代价超限，已拒绝: data_source_id={}, {}", ds.id, verdict.reason)
+            raise CostGuardRejectedError(verdict)
+        if verdict.verdict == VERDICT_LIMITED:
+            self.limited_total += 1
+            logger.info("查询预估代价超限，已收紧返回行数: data_source_id={}, {}", ds.id, verdict.reason)
+        return verdict
+
+    def invalidate(self, ds_id: int):
+        for key in [k for k in self._items if k[0] == int(ds_id)]:
+            self._items.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.COST_GUARD_ENABLED,
+            "cached_plans": len(self._items),
+            "checks_total": self.checks_total,
+            "cache_hits": self.cache_hits,
+            "explain_errors": self.explain_errors,
+            "limited_total": self.limited_total,
+            "rejected_total": self.rejected_total,
+        }
+
+
+_guard: Optional[CostGuard] = None
+
+
+def get_cost_guard() -> CostGuard:
+    """获取全局代价守卫（仅在事件循环内使用）。"""
+    global _guard
+    if _guard is None:
+        _guard = CostGuard(ttl_seconds=settings.COST_GUARD_CACHE_TTL_SECONDS)
+    return _guard
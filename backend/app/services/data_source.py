@@ -1,12 +1,36 @@
-from typing import List, Optional
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence
 
 import pymysql
 from sqlalchemy import select, update, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.data_source import DataSource, DataSourceType, DataTable, TableColumn
-from app.schemas.data_source import DataSourceCreate, DataSourceUpdate
-from app.utils.security import encrypt_secret, decrypt_secret, InvalidToken
+from app.schemas.data_source import DataSourceCreate, DataSourceReplica, DataSourceUpdate
+from app.utils.security import encrypt_secret
+from app.services.sql_parser import parse_sql
+from app.services.connection_pool import PRIMARY_NODE, PooledConnection, get_pool_manager
+from app.services.cost_guard import get_cost_guard
+from app.services.query_sampler import get_query_sampler
+from app.services.query_executor import get_query_executor
+from app.services.query_scheduler import get_query_scheduler
+from app.services.replica_router import get_replica_router
+from app.services.result_cache import get_result_cache
+
+
+def _replicas_to_store(replicas: Optional[List[DataSourceReplica]]) -> Optional[List[Dict[str, Any]]]:
+    """副本配置入库：密码加密保存。"""
+    if replicas is None:
+        return None
+    return [
+        {
+            "host": r.host,
+            "port": r.port,
+            "username": r.username,
+            "password_encrypted": encrypt_secret(r.password) if r.password else None,
+        }
+        for r in replicas
+    ]
 
 
 class DataSourceService:
@@ -26,6 +50,12 @@ class DataSourceService:
             password_encrypted=enc_pwd,
             description=payload.description,
             is_active=True,
+            max_scan_rows=payload.max_scan_rows,
+            max_join_fanout=payload.max_join_fanout,
+            cost_guard_action=payload.cost_guard_action,
+            replicas=_replicas_to_store(payload.replicas),
+            replica_strategy=payload.replica_strategy,
+            max_replica_lag_seconds=payload.max_replica_lag_seconds,
         )
         self.db.add(ds)
         await self.db.flush()
@@ -48,17 +78,37 @@ class DataSourceService:
                 password_encrypted=enc_pwd,
                 description=payload.description,
                 is_active=payload.is_active,
+                max_scan_rows=payload.max_scan_rows,
+                max_join_fanout=payload.max_join_fanout,
+                cost_guard_action=payload.cost_guard_action,
+                replicas=_replicas_to_store(payload.replicas),
+                replica_strategy=payload.replica_strategy,
+                max_replica_lag_seconds=payload.max_replica_lag_seconds,
             )
             .returning(DataSource)
         )
         res = await self.db.execute(stmt)
         await self.db.commit()
+        # 连接参数可能变化，关闭旧连接池
+        get_pool_manager().invalidate(ds_id)
+        get_query_scheduler().invalidate(ds_id)
+        get_cost_guard().invalidate(ds_id)
+        get_query_sampler().invalidate(ds_id)
+        get_replica_router().invalidate(ds_id)
+        await get_result_cache().invalidate_data_source(ds_id)
         return res.scalar_one_or_none()
 
     async def delete(self, ds_id: int) -> None:
         stmt = delete(DataSource).where(DataSource.id == ds_id)
         await self.db.execute(stmt)
         await self.db.commit()
+        get_pool_manager().invalidate(ds_id)
+        get_query_executor().invalidate(ds_id)
+        get_query_scheduler().invalidate(ds_id)
+        get_cost_guard().invalidate(ds_id)
+        get_query_sampler().invalidate(ds_id)
+        get_replica_router().invalidate(ds_id)
+        await get_result_cache().invalidate_data_source(ds_id)
 
     async def get(self, ds_id: int) -> Optional[DataSource]:
         """获取单个数据源。
@@ -89,7 +139,9 @@ class DataSourceService:
                     cur.execute(
                         """
                         SELECT id, name, type, host, port, database_name, username, password_encrypted,
-                               description, is_active, created_by, created_at, updated_at
+                               description, is_active, max_scan_rows, max_join_fanout, cost_guard_action,
+                               replicas, replica_strategy, max_replica_lag_seconds,
+                               created_by, created_at, updated_at
                         FROM aitt_data_sources
                         WHERE id = %s
                         """,
@@ -117,6 +169,12 @@ class DataSourceService:
                         password_encrypted=r.get("password_encrypted"),
                         description=r.get("description"),
                         is_active=bool(r.get("is_active")),
+                        max_scan_rows=r.get("max_scan_rows"),
+                        max_join_fanout=r.get("max_join_fanout"),
+                        cost_guard_action=r.get("cost_guard_action"),
+                        replicas=json.loads(r["replicas"]) if isinstance(r.get("replicas"), (str, bytes)) else r.get("replicas"),
+                        replica_strategy=r.get("replica_strategy"),
+                        max_replica_lag_seconds=r.get("max_replica_lag_seconds"),
                         created_by=int(r.get("created_by")),
                         created_at=r.get("created_at"),
                         updated_at=r.get("updated_at"),
@@ -156,7 +214,9 @@ class DataSourceService:
                     cur.execute(
                         """
                         SELECT id, name, type, host, port, database_name, username, password_encrypted,
-                               description, is_active, created_by, created_at, updated_at
+                               description, is_active, max_scan_rows, max_join_fanout, cost_guard_action,
+                               replicas, replica_strategy, max_replica_lag_seconds,
+                               created_by, created_at, updated_at
                         FROM aitt_data_sources
                         ORDER BY id
                         LIMIT %s OFFSET %s
@@ -185,6 +245,12 @@ class DataSourceService:
                             password_encrypted=r.get("password_encrypted"),
                             description=r.get("description"),
                             is_active=bool(r.get("is_active")),
+                            max_scan_rows=r.get("max_scan_rows"),
+                            max_join_fanout=r.get("max_join_fanout"),
+                            cost_guard_action=r.get("cost_guard_action"),
+                            replicas=json.loads(r["replicas"]) if isinstance(r.get("replicas"), (str, bytes)) else r.get("replicas"),
+                            replica_strategy=r.get("replica_strategy"),
+                            max_replica_lag_seconds=r.get("max_replica_lag_seconds"),
                             created_by=int(r.get("created_by")),
                             created_at=r.get("created_at"),
                             updated_at=r.get("updated_at"),
@@ -334,194 +400,308 @@ class DataSourceService:
                 conn.close()
             return items
 
+    def _ping_blocking(self, ds: DataSource) -> bool:
+        pool = get_pool_manager().get_pool(ds)
+        conn = pool.acquire()
+        ok = conn.ping()
+        pool.release(conn, broken=not ok)
+        return ok
+
     async def test_connection(self, ds: DataSource) -> tuple[bool, str]:
         try:
-            # 解密密码，兼容历史纯文本（解密失败则回退为原值）
-            pwd = None
-            try:
-                pwd = decrypt_secret(ds.password_encrypted) if ds.password_encrypted else ""
-            except Exception:
-                pwd = ds.password_encrypted or ""
-            if ds.type == DataSourceType.MYSQL:
-                conn = pymysql.connect(
-                    host=ds.host, port=ds.port, user=ds.username, password=pwd, database=ds.database_name,
-                    connect_timeout=5
-                )
-                conn.close()
-                return True, "MySQL连接成功"
-            elif ds.type == DataSourceType.POSTGRESQL:
-                try:
-                    import psycopg  # 延迟导入，避免未安装时阻断服务启动
-                except ImportError:
-                    return False, "PostgreSQL驱动未安装，请安装 'psycopg' 或使用其它数据源类型"
-                with psycopg.connect(
-                    host=ds.host, port=ds.port, user=ds.username, password=pwd, dbname=ds.database_name
-                ) as _:
-                    pass
-                return True, "PostgreSQL连接成功"
-            else:
+            if ds.type not in (DataSourceType.MYSQL, DataSourceType.POSTGRESQL):
                 return False, f"暂不支持该类型的连接测试: {ds.type}"
+            # 经连接池借出连接并探活：成功的连接保留在池中供后续查询复用
+            ok = await get_query_executor().run(ds.id, self._ping_blocking, ds)
+            if not ok:
+                return False, "连接失败: 探活未通过"
+            return True, "MySQL连接成功" if ds.type == DataSourceType.MYSQL else "PostgreSQL连接成功"
+        except ValueError as e:
+            # 驱动未安装等配置问题
+            return False, str(e)
         except Exception as e:
             return False, f"连接失败: {e}"
 
-    async def execute_sql(self, ds: DataSource, sql: str, max_rows: int = 1000, timeout_seconds: int = 30) -> tuple[List[dict], List[str]]:
+    async def execute_sql(
+        self,
+        ds: DataSource,
+        sql: str,
+        max_rows: int = 1000,
+        timeout_seconds: int = 30,
+        as_tuples: bool = False,
+        on_connection: Optional[Callable[[Optional[PooledConnection]], None]] = None,
+        user_key: Optional[str] = None,
+        params: Optional[Sequence[Any]] = None,
+    ) -> tuple[List[Any], List[str]]:
         """在指定数据源上执行只读SQL，返回(结果行, 列名)。仅支持MySQL/PostgreSQL。
-        为安全起见，仅允许以SELECT开头的语句。
+        为安全起见，仅允许单条只读查询（SELECT/WITH），并在最外层注入 LIMIT max_rows。
+        as_tuples=True 时结果行为游标原始元组（供列式输出），否则为字典。
+        on_connection 的含义同 stream_sql_blocking；user_key 为公平调度使用的用户标识。
+        params 为 %s 占位参数（此时SQL中的字面 % 需写作 %%）。
+        """
+        # 先经数据源准入调度（并发上限 + 按用户公平排队），再放入数据源专属的有界线程池执行；名额随线程任务结束归还
+        return await get_query_scheduler().run(
+            ds.id,
+            user_key,
+            self.execute_sql_blocking,
+            ds,
+            sql,
+            max_rows=max_rows,
+            timeout_seconds=timeout_seconds,
+            as_tuples=as_tuples,
+            on_connection=on_connection,
+            params=params,
+        )
+
+    def execute_sql_blocking(
+        self,
+        ds: DataSource,
+        sql: str,
+        max_rows: int = 1000,
+        timeout_seconds: int = 30,
+        as_tuples: bool = False,
+        on_connection: Optional[Callable[[Optional[PooledConnection]], None]] = None,
+        params: Optional[Sequence[Any]] = None,
+    ) -> tuple[List[Any], List[str]]:
+        """execute_sql 的同步实现，可放入线程执行（不访问 self.db）。
+        语句按数据源方言校验后在只读事务中执行：即使校验被绕过，数据库层面也拒绝写入。
         """
-        q = sql.strip().lower()
-        if not q.startswith("select"):
-            raise ValueError("仅允许执行SELECT查询")
-        rows: List[dict] = []
+        parsed = parse_sql(sql, ds.type)
+        parsed.validate_read_only()
+        sql = parsed.with_limit(max_rows)
+        rows: List[Any] = []
         columns: List[str] = []
-        # 解密密码，兼容历史纯文本
-        try:
-            pwd = decrypt_secret(ds.password_encrypted) if ds.password_encrypted else ""
-        except Exception:
-            pwd = ds.password_encrypted or ""
-        if ds.type == DataSourceType.MYSQL:
-            conn = pymysql.connect(
-                host=ds.host,
-                port=ds.port,
-                user=ds.username,
-                password=pwd,
-                database=ds.database_name,
-                cursorclass=pymysql.cursors.DictCursor,
-                connect_timeout=timeout_seconds,
-            )
+        if ds.type not in (DataSourceType.MYSQL, DataSourceType.POSTGRESQL):
+            raise ValueError(f"暂不支持该类型的SQL执行: {ds.type}")
+        # 复用数据源连接池：密码解密与会话设置仅在建立连接时执行一次；配置了只读副本时按策略路由到副本
+        with get_replica_router().connection(ds) as conn:
+            if on_connection is not None:
+                on_connection(conn)
             try:
-                with conn.cursor() as cur:
-                    # 尝试设置语句级超时（MySQL 5.7+ 支持 MAX_EXECUTION_TIME），失败则忽略
-                    try:
-                        cur.execute(f"SET SESSION MAX_EXECUTION_TIME = {int(timeout_seconds * 1000)}")
-                    except Exception:
-                        pass
-                    cur.execute(sql)
-                    res = cur.fetchmany(max_rows)
-                    rows = list(res)
-                    # 通过描述获取列名
-                    if cur.description:
-                        columns = [d[0] for d in cur.description]
+                conn.set_timeout(timeout_seconds)
+                if ds.type == DataSourceType.MYSQL:
+                    # 连接默认使用 DictCursor；列式输出直接取元组，省去逐行构造字典
+                    with conn.raw.cursor(pymysql.cursors.Cursor) if as_tuples else conn.cursor() as cur:
+                        cur.execute("START TRANSACTION READ ONLY")
+                        try:
+                            cur.execute(sql, params)
+                            res = cur.fetchmany(max_rows)
+                            rows = list(res)
+                            # 通过描述获取列名
+                            if cur.description:
+                                columns = [d[0] for d in cur.description]
+                        finally:
+                            conn.raw.rollback()
+                else:
+                    # 连接处于自动提交模式，显式开启只读事务
+                    with conn.raw.transaction():
+                        with conn.cursor() as cur:
+                            cur.execute("SET TRANSACTION READ ONLY")
+                            cur.execute(sql, params)
+                            res = cur.fetchmany(max_rows)
+                            # psycopg返回的是tuple列表，需要转字典
+                            if cur.description:
+                                columns = [c.name for c in cur.description]
+                            if as_tuples:
+                                rows = list(res)
+                            else:
+                                for r in res:
+                                    rows.append({columns[i]: r[i] for i in range(len(columns))})
             finally:
-                conn.close()
-        elif ds.type == DataSourceType.POSTGRESQL:
-            try:
-                import psycopg  # 延迟导入
-            except ImportError:
-                raise ValueError("PostgreSQL驱动未安装，请安装 'psycopg' 以执行查询")
-            with psycopg.connect(
-                host=ds.host,
-                port=ds.port,
-                user=ds.username,
-                password=pwd,
-                dbname=ds.database_name,
-                connect_timeout=timeout_seconds,
-            ) as conn:
-                with conn.cursor() as cur:
-                    # 设置语句超时
-                    try:
-                        cur.execute(f"SET LOCAL statement_timeout = '{int(timeout_seconds)}s'")
-                    except Exception:
-                        pass
-                    cur.execute(sql)
-                    res = cur.fetchmany(max_rows)
-                    # psycopg返回的是tuple列表，需要转字典
-                    if cur.description:
-                        columns = [c.name for c in cur.description]
-                    for r in res:
-                        rows.append({columns[i]: r[i] for i in range(len(columns))})
-        else:
-            raise ValueError(f"暂不支持该类型的SQL执行: {ds.type}")
+                if on_connection is not None:
+                    on_connection(None)
         return rows, columns
 
-    async def sync_tables(self, ds: DataSource) -> tuple[int, int]:
-        """同步外部数据源的表与列元数据。仅实现MySQL与PostgreSQL的基本同步。返回(表数量, 列数量)。"""
-        tables_count = 0
-        columns_count = 0
-        # 解密密码，兼容历史纯文本
+    def stream_sql_blocking(
+        self,
+        ds: DataSource,
+        sql: str,
+        emit: Callable[[List[str], List[tuple]], bool],
+        max_rows: Optional[int] = None,
+        timeout_seconds: int = 300,
+        batch_size: int = 500,
+        on_connection: Optional[Callable[[Optional[PooledConnection]], None]] = None,
+    ) -> int:
+        """以服务端游标（MySQL SSCursor / PostgreSQL 命名游标）逐批读取结果并交给 emit(列名, 行批次)。
+        emit 返回 False 表示消费端已停止，此时丢弃连接而不是读完剩余结果。返回已读取的行数。
+        on_connection 在借到连接后以该连接调用、归还连接前以 None 调用，供调用方定位服务端会话（如取消查询）。
+        与 execute_sql_blocking 相同，在只读事务中执行。
+        """
+        parsed = parse_sql(sql, ds.type)
+        parsed.validate_read_only()
+        if max_rows:
+            sql = parsed.with_limit(max_rows)
+        if ds.type not in (DataSourceType.MYSQL, DataSourceType.POSTGRESQL):
+            raise ValueError(f"暂不支持该类型的SQL执行: {ds.type}")
+        batch_size = max(1, int(batch_size))
+        pool, conn = get_replica_router().acquire(ds)
+        total = 0
+        finished = False
         try:
-            pwd = decrypt_secret(ds.password_encrypted) if ds.password_encrypted else ""
-        except Exception:
-            pwd = ds.password_encrypted or ""
-        if ds.type == DataSourceType.MYSQL:
-            conn = pymysql.connect(
-                host=ds.host, port=ds.port, user=ds.username, password=pwd, database=ds.database_name,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            try:
-                with conn.cursor() as cur:
+            if on_connection is not None:
+                on_connection(conn)
+            conn.set_timeout(timeout_seconds)
+            if ds.type == DataSourceType.MYSQL:
+                cur = conn.raw.cursor(pymysql.cursors.SSCursor)
+                cur.execute("START TRANSACTION READ ONLY")
+                cur.execute(sql)
+                columns = [d[0] for d in cur.description or []]
+                while True:
+                    batch = cur.fetchmany(batch_size)
+                    if not batch:
+                        break
+                    total += len(batch)
+                    if not emit(columns, list(batch)):
+                        return total
+                cur.close()
+                conn.raw.rollback()
+            else:
+                # 命名游标需在事务内使用（连接为自动提交模式）
+                with conn.raw.transaction():
+                    conn.raw.execute("SET TRANSACTION READ ONLY")
+                    with conn.raw.cursor(name=f"aitt_stream_{id(conn)}") as cur:
+                        cur.itersize = batch_size
+                        cur.execute(sql)
+                        columns = [c.name for c in cur.description or []]
+                        while True:
+                            batch = cur.fetchmany(batch_size)
+                            if not batch:
+                                break
+                            total += len(batch)
+                            if not emit(columns, batch):
+                                return total
+            if total == 0:
+                emit(columns, [])
+            finished = True
+            return total
+        finally:
+            if on_connection is not None:
+                on_connection(None)
+            # 未读完的服务端游标会占用连接，提前结束或出错时直接丢弃连接
+            pool.release(conn, broken=not finished)
+
+    def cancel_query_blocking(self, ds: DataSource, session_id: int, node: str = PRIMARY_NODE) -> bool:
+        """在会话所在节点（主库或只读副本）的独立连接上中止其正在执行的语句（MySQL KILL QUERY / PostgreSQL pg_cancel_backend）。"""
+        replica = None
+        if node != PRIMARY_NODE:
+            replica = get_replica_router().find(ds, node)
+            if replica is None:
+                # 副本已从配置中移除，无法定位会话所在节点
+                return False
+        with get_pool_manager().connection(ds, timeout=5, replica=replica) as conn:
+            with conn.raw.cursor() as cur:
+                if ds.type == DataSourceType.MYSQL:
+                    cur.execute(f"KILL QUERY {int(session_id)}")
+                    return True
+                cur.execute("SELECT pg_cancel_backend(%s)", (int(session_id),))
+                row = cur.fetchone()
+                return bool(row and row[0])
+
+    def explain_blocking(self, ds: DataSource, sql: str, timeout_seconds: int = 5) -> Any:
+        """获取只读SQL的JSON格式执行计划（MySQL EXPLAIN FORMAT=JSON / PostgreSQL EXPLAIN (FORMAT JSON)），不实际执行。"""
+        parsed = parse_sql(sql, ds.type)
+        parsed.validate_read_only()
+        if ds.type not in (DataSourceType.MYSQL, DataSourceType.POSTGRESQL):
+            raise ValueError(f"暂不支持该类型的执行计划: {ds.type}")
+        body = parsed.sql[: parsed.main[-1].end] if parsed.main else parsed.sql
+        # 与查询执行使用相同的副本路由，估算反映实际执行节点的统计信息
+        with get_replica_router().connection(ds) as conn:
+            conn.set_timeout(timeout_seconds)
+            if ds.type == DataSourceType.MYSQL:
+                with conn.raw.cursor() as cur:
+                    cur.execute("START TRANSACTION READ ONLY")
+                    try:
+                        cur.execute(f"EXPLAIN FORMAT=JSON {body}")
+                        row = cur.fetchone()
+                    finally:
+                        conn.raw.rollback()
+                plan = next(iter(row.values())) if isinstance(row, dict) else (row[0] if row else None)
+            else:
+                with conn.raw.transaction():
+                    with conn.raw.cursor() as cur:
+                        cur.execute("SET TRANSACTION READ ONLY")
+                        cur.execute(f"EXPLAIN (FORMAT JSON) {body}")
+                        row = cur.fetchone()
+                plan = row[0] if row else None
+        # psycopg 已将 json 列解析为对象，PyMySQL 返回文本
+        if isinstance(plan, (bytes, str)):
+            plan = json.loads(plan)
+        return plan
+
+    def _fetch_schema_blocking(self, ds: DataSource) -> List[tuple]:
+        """读取外部数据源的表与列定义（同步，在执行线程中运行）。
+        返回 [(表名, 行数, [(列名, 类型, 是否可空), ...]), ...]。
+        """
+        schema: List[tuple] = []
+        with get_pool_manager().connection(ds) as conn:
+            with conn.cursor() as cur:
+                if ds.type == DataSourceType.MYSQL:
                     cur.execute("SELECT table_name, table_rows FROM information_schema.tables WHERE table_schema=%s", (ds.database_name,))
-                    tables = cur.fetchall()
-                    for t in tables:
-                        table = DataTable(
-                            data_source_id=ds.id,
-                            table_name=t["table_name"],
-                            description=None,
-                            category=None,
-                            tags=None,
-                            row_count=t.get("table_rows") or 0,
-                            size_mb=None,
-                        )
-                        self.db.add(table)
-                        await self.db.flush()
-                        await self.db.refresh(table)
-                        tables_count += 1
+                    tables = [(t["table_name"], t.get("table_rows") or 0) for t in cur.fetchall()]
+                    for table_name, row_count in tables:
                         cur.execute(
                             "SELECT column_name, data_type, is_nullable FROM information_schema.columns WHERE table_schema=%s AND table_name=%s",
-                            (ds.database_name, t["table_name"]),
+                            (ds.database_name, table_name),
                         )
-                        cols = cur.fetchall()
-                        for c in cols:
-                            col = TableColumn(
-                                table_id=table.id,
-                                column_name=c["column_name"],
-                                data_type=c["data_type"],
-                                is_nullable=True if c["is_nullable"] == "YES" else False,
-                                is_dimension=False,
-                                is_metric=False,
-                                is_primary_key=False,
-                                is_foreign_key=False,
-                            )
-                            self.db.add(col)
-                            columns_count += 1
-                await self.db.commit()
-            finally:
-                conn.close()
-        elif ds.type == DataSourceType.POSTGRESQL:
-            try:
-                import psycopg  # 延迟导入
-            except ImportError:
-                # 其它类型暂不支持
-                return tables_count, columns_count
-            with psycopg.connect(host=ds.host, port=ds.port, user=ds.username, password=pwd, dbname=ds.database_name) as conn:
-                with conn.cursor() as cur:
+                        cols = [(c["column_name"], c["data_type"], c["is_nullable"] == "YES") for c in cur.fetchall()]
+                        schema.append((table_name, row_count, cols))
+                else:
                     cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='public'")
-                    tables = cur.fetchall()
-                    for (table_name,) in tables:
-                        table = DataTable(
-                            data_source_id=ds.id,
-                            table_name=table_name,
-                        )
-                        self.db.add(table)
-                        await self.db.flush()
-                        await self.db.refresh(table)
-                        tables_count += 1
+                    tables = [r[0] for r in cur.fetchall()]
+                    for table_name in tables:
                         cur.execute(
                             "SELECT column_name, data_type, is_nullable FROM information_schema.columns WHERE table_schema='public' AND table_name=%s",
                             (table_name,),
                         )
-                        cols = cur.fetchall()
-                        for column_name, data_type, is_nullable in cols:
-                            col = TableColumn(
-                                table_id=table.id,
-                                column_name=column_name,
-                                data_type=data_type,
-                                is_nullable=True if is_nullable == "YES" else False,
-                            )
-                            self.db.add(col)
-                            columns_count += 1
-                await self.db.commit()
-        else:
+                        cols = [(c[0], c[1], c[2] == "YES") for c in cur.fetchall()]
+                        schema.append((table_name, None, cols))
+        return schema
+
+    async def sync_tables(self, ds: DataSource) -> tuple[int, int]:
+        """同步外部数据源的表与列元数据。仅实现MySQL与PostgreSQL的基本同步。返回(表数量, 列数量)。"""
+        tables_count = 0
+        columns_count = 0
+        if ds.type == DataSourceType.POSTGRESQL:
+            try:
+                import psycopg  # noqa: F401 延迟导入
+            except ImportError:
+                # 其它类型暂不支持
+                return tables_count, columns_count
+        elif ds.type != DataSourceType.MYSQL:
             # 其它类型暂不支持
-            pass
+            return tables_count, columns_count
+        # 外部库读取放入执行线程，写入平台库在事件循环中进行
+        schema = await get_query_executor().run(ds.id, self._fetch_schema_blocking, ds)
+        for table_name, row_count, cols in schema:
+            table = DataTable(
+                data_source_id=ds.id,
+                table_name=table_name,
+                description=None,
+                category=None,
+                tags=None,
+                row_count=row_count or 0,
+                size_mb=None,
+            )
+            self.db.add(table)
+            await self.db.flush()
+            await self.db.refresh(table)
+            tables_count += 1
+            for column_name, data_type, is_nullable in cols:
+                col = TableColumn(
+                    table_id=table.id,
+                    column_name=column_name,
+                    data_type=data_type,
+                    is_nullable=is_nullable,
+                    is_dimension=False,
+                    is_metric=False,
+                    is_primary_key=False,
+                    is_foreign_key=False,
+                )
+                self.db.add(col)
+                columns_count += 1
+        await self.db.commit()
 
+        if tables_count:
+            from app.services.metadata_catalog import get_metadata_catalog
+            get_metadata_catalog().invalidate()
         return tables_count, columns_count
\ No newline at end of file
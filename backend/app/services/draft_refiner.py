@@ -0,0 +1,197 @@
+"""
+两阶段回答：草稿SQL即时返回，模型精炼结果异步交付。
+- 草稿来源：公开模板 / 意图引擎（高置信度）/ 近期相同问题的已生成SQL缓存 / 规则兜底（低置信度）；
+- 高置信度草稿直接作为最终结果，不再调用模型；低置信度草稿在后台调用模型精炼；
+- 精炼状态按查询历史ID登记在进程内注册表，供轮询与SSE读取，完成后回写查询历史。
+"""
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.query import QueryHistory
+
+
+class RefineStatus:
+    """精炼状态常量"""
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+@dataclass
+class DraftResult:
+    sql: str
+    source: str
+    # 高置信度草稿可直接作为最终结果
+    confident: bool
+
+
+@dataclass
+class RefineState:
+    history_id: int
+    draft_sql: str
+    draft_source: str
+    status: str = RefineStatus.PENDING
+    sql: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "history_id": self.history_id,
+            "status": self.status,
+            "draft_sql": self.draft_sql,
+            "draft_source": self.draft_source,
+            "sql": self.sql,
+            "error": self.error,
+            "elapsed_ms": int(((self.finished_at or time.time()) - self.created_at) * 1000),
+        }
+
+
+def normalize_question(nl_query: str) -> str:
+    return re.sub(r"\s+", " ", (nl_query or "").strip().lower())
+
+
+class GeneratedSQLCache:
+    """近期模型生成SQL的进程内LRU缓存（按归一化问题文本），作为草稿来源之一。"""
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: int = 3600):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, nl_query: str) -> Optional[str]:
+        key = normalize_question(nl_query)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            sql, ts = item
+            if time.time() - ts > self.ttl_seconds:
+                self._items.pop(key, None)
+                return None
+            self._items.move_to_end(key)
+            return sql
+
+    def put(self, nl_query: str, sql: str):
+        if not sql or "placeholder" in sql.lower():
+            return
+        key = normalize_question(nl_query)
+        with self._lock:
+            self._items[key] = (sql, time.time())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+class DraftRefineRegistry:
+    def __init__(self, ttl_seconds: int = 600):
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self._states: Dict[int, RefineState] = {}
+        self._tasks: set = set()
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            hid for hid, st in self._states.items()
+            if st.finished_at is not None and now - st.finished_at > self.ttl_seconds
+        ]
+        for hid in expired:
+            self._states.pop(hid, None)
+
+    def get(self, history_id: int) -> Optional[RefineState]:
+        self._prune()
+        return self._states.get(history_id)
+
+    def submit(self, history_id: int, draft: DraftResult, refine: Callable[[], Awaitable[str]]) -> RefineState:
+        """登记草稿并在后台执行精炼协程，完成后回写查询历史。"""
+        self._prune()
+        state = RefineState(history_id=history_id, draft_sql=draft.sql, draft_source=draft.source)
+        self._states[history_id] = state
+        task = asyncio.create_task(self._run(state, refine))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return state
+
+    async def _run(self, state: RefineState, refine: Callable[[], Awaitable[str]]):
+        try:
+            sql = await asyncio.wait_for(refine(), timeout=settings.DRAFT_REFINE_TIMEOUT_SECONDS)
+            if not sql or "placeholder" in sql.lower():
+                state.status = RefineStatus.FAILED
+                state.error = "模型未生成有效SQL，保留草稿"
+            else:
+                state.sql = sql
+                state.status = RefineStatus.DONE
+                await self._persist(state)
+        except asyncio.TimeoutError:
+            state.status = RefineStatus.FAILED
+            state.error = "精炼超时，保留草稿"
+        except Exception as e:
+            state.status = RefineStatus.FAILED
+            state.error = str(e)
+            logger.warning("草稿精炼失败: history_id={}, err={}", state.history_id, e)
+        finally:
+            state.finished_at = time.time()
+            state.done.set()
+            logger.info(
+                "草稿精炼结束: history_id={}, status={}, elapsed_ms={}",
+                state.history_id,
+                state.status,
+                int((state.finished_at - state.created_at) * 1000),
+            )
+
+    async def _persist(self, state: RefineState):
+        """精炼结果回写查询历史，便于其他实例或稍后读取。"""
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(QueryHistory)
+                    .where(QueryHistory.id == state.history_id)
+                    .values(generated_sql=state.sql, tags=["ai_query", "refined"])
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning("精炼SQL回写查询历史失败: history_id={}, err={}", state.history_id, e)
+
+    async def wait(self, history_id: int, timeout: float) -> Optional[RefineState]:
+        state = self.get(history_id)
+        if state is None or state.done.is_set():
+            return state
+        try:
+            await asyncio.wait_for(state.done.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return state
+
+
+_registry: Optional[DraftRefineRegistry] = None
+_sql_cache: Optional[GeneratedSQLCache] = None
+
+
+def get_draft_registry() -> DraftRefineRegistry:
+    """获取全局草稿精炼注册表（仅在事件循环内使用）。"""
+    global _registry
+    if _registry is None:
+        _registry = DraftRefineRegistry(ttl_seconds=settings.DRAFT_REFINE_TTL_SECONDS)
+    return _registry
+
+
+def get_generated_sql_cache() -> GeneratedSQLCache:
+    """获取全局已生成SQL缓存。"""
+    global _sql_cache
+    if _sql_cache is None:
+        _sql_cache = GeneratedSQLCache(ttl_seconds=settings.CACHE_EXPIRE_MINUTES * 60)
+    return _sql_cache
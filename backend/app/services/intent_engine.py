@@ -0,0 +1,624 @@
+"""
+确定性意图引擎：
+- 以预编译的正则规则（可扩展）解析常见分析类问题的槽位：时间范围、时间粒度、Top-N、
+  分组维度、去重计数与聚合指标；
+- 基于元数据目录（aitt_table_columns 的维度/指标标记）选择主表并解析列，纯内存生成 MySQL 语法 SQL；
+- 依据表选择的区分度、槽位解析情况与问题文本覆盖率给出置信度，高置信度时可跳过大模型调用。
+"""
+import copy
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.services.metadata_catalog import CatalogSnapshot, CatalogTable, CatalogColumn
+
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_NUM = r"(\d+|[零一二两三四五六七八九十百]+)"
+
+
+def parse_cn_int(s: str) -> Optional[int]:
+    """解析阿拉伯数字或简单中文数字（支持到百位）。"""
+    s = (s or "").strip()
+    if s.isdigit():
+        return int(s)
+    if not s:
+        return None
+    total, cur = 0, 0
+    for ch in s:
+        if ch in _CN_DIGITS:
+            cur = _CN_DIGITS[ch]
+        elif ch == "十":
+            total += (cur or 1) * 10
+            cur = 0
+        elif ch == "百":
+            total += (cur or 1) * 100
+            cur = 0
+        else:
+            return None
+    return total + cur
+
+
+# 中文实体词 -> 英文表/列名词干
+ENTITY_STEMS: Dict[str, str] = {
+    "订单": "order",
+    "交易": "order",
+    "客户": "customer",
+    "用户": "customer",
+    "顾客": "customer",
+    "商品": "product",
+    "产品": "product",
+    "品类": "category",
+    "分类": "category",
+    "城市": "city",
+    "状态": "status",
+    "明细": "item",
+}
+
+# 度量提示词 -> (中文触发词, 列名关键词)
+MEASURE_HINTS: Dict[str, Tuple[List[str], List[str]]] = {
+    "amount": (["金额", "交易额", "销售额", "收入", "消费", "gmv"], ["amount", "revenue", "spent", "gmv", "pay", "total_price"]),
+    "quantity": (["销量", "销售数量", "购买数量", "件数", "销售总量"], ["quantity", "qty"]),
+    "price": (["单价", "价格"], ["unit_price", "price"]),
+}
+
+# 时间粒度 -> MySQL 分桶表达式
+BUCKET_EXPR: Dict[str, str] = {
+    "day": "DATE({col})",
+    "week": "DATE_FORMAT({col}, '%x-%v')",
+    "month": "DATE_FORMAT({col}, '%Y-%m')",
+    "year": "YEAR({col})",
+}
+
+_UNIT_GRANULARITY = {"天": "day", "日": "day", "周": "week", "星期": "week", "月": "month", "年": "year"}
+_INTERVAL_UNIT = {"天": "DAY", "日": "DAY", "周": "WEEK", "星期": "WEEK", "月": "MONTH", "个月": "MONTH", "年": "YEAR"}
+_DATE_TYPES = ("date", "time", "timestamp", "datetime")
+
+
+@dataclass
+class TimeRange:
+    kind: str  # last | year | month | this_year | this_month | today | yesterday
+    n: int = 0
+    unit: str = "DAY"
+    year: int = 0
+    month: int = 0
+
+    def to_sql(self, col: str) -> str:
+        if self.kind == "last":
+            return f"{col} >= DATE_SUB(CURDATE(), INTERVAL {int(self.n)} {self.unit})"
+        if self.kind == "year":
+            return f"{col} >= '{self.year:04d}-01-01' AND {col} < '{self.year + 1:04d}-01-01'"
+        if self.kind == "month":
+            ny, nm = (self.year + 1, 1) if self.month == 12 else (self.year, self.month + 1)
+            return f"{col} >= '{self.year:04d}-{self.month:02d}-01' AND {col} < '{ny:04d}-{nm:02d}-01'"
+        if self.kind == "this_year":
+            return f"{col} >= MAKEDATE(YEAR(CURDATE()), 1)"
+        if self.kind == "this_month":
+            return f"{col} >= DATE_FORMAT(CURDATE(), '%Y-%m-01')"
+        if self.kind == "yesterday":
+            return f"{col} >= DATE_SUB(CURDATE(), INTERVAL 1 DAY) AND {col} < CURDATE()"
+        return f"{col} >= CURDATE()"
+
+
+@dataclass
+class ParseState:
+    """规则解析得到的槽位，以及问题文本中已被规则解释的字符区间。"""
+    text: str
+    covered: List[bool] = field(default_factory=list)
+    time_range: Optional[TimeRange] = None
+    granularity: Optional[str] = None
+    top_n: Optional[int] = None
+    order_dir: Optional[str] = None
+    agg: Optional[str] = None
+    distinct: bool = False
+    group_phrases: List[Tuple[str, int, int]] = field(default_factory=list)
+    measures: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        if not self.covered:
+            self.covered = [False] * len(self.text)
+
+    def cover(self, start: int, end: int):
+        for i in range(max(0, start), min(len(self.text), end)):
+            self.covered[i] = True
+
+    def in_group_span(self, start: int, end: int) -> bool:
+        return any(s <= start and end <= e for _, s, e in self.group_phrases)
+
+    def unexplained(self, min_len: int = 2) -> List[str]:
+        """返回未被任何规则或SQL元素解释的连续片段（长度不小于 min_len，多为筛选值等字面量）。"""
+        runs: List[str] = []
+        for m in re.finditer(r"[A-Za-z0-9_\u4e00-\u9fff]+", self.text):
+            buf = ""
+            for i in range(m.start(), m.end()):
+                if self.covered[i]:
+                    if len(buf) >= min_len:
+                        runs.append(buf)
+                    buf = ""
+                else:
+                    buf += self.text[i]
+            if len(buf) >= min_len:
+                runs.append(buf)
+        return runs
+
+    def coverage(self) -> float:
+        chars = [c for i, c in enumerate(self.text) if not c.isspace() and not self.covered[i]]
+        total = sum(1 for c in self.text if not c.isspace())
+        return 1.0 - (len(chars) / total) if total else 0.0
+
+
+@dataclass
+class IntentRule:
+    """意图语法规则：预编译正则 + 槽位处理函数；处理函数返回 False 表示不覆盖该匹配区间。"""
+    name: str
+    pattern: "re.Pattern[str]"
+    apply: Callable[[ParseState, "re.Match[str]"], Optional[bool]]
+
+
+@dataclass
+class IntentResult:
+    sql: str
+    confidence: float
+    intent: str
+    table: str
+    slots: Dict = field(default_factory=dict)
+
+
+def _set_last(st: ParseState, m: "re.Match[str]"):
+    n = parse_cn_int(m.group(2))
+    unit = m.group(3)
+    if not n:
+        return False
+    st.time_range = TimeRange(kind="last", n=n, unit=_INTERVAL_UNIT.get(unit, "DAY"))
+
+
+def _set_last_one(st: ParseState, m: "re.Match[str]"):
+    st.time_range = TimeRange(kind="last", n=1, unit=_INTERVAL_UNIT.get(m.group(1), "DAY"))
+
+
+def _set_year(st: ParseState, m: "re.Match[str]"):
+    year = int(m.group(1))
+    month = int(m.group(2)) if m.group(2) else 0
+    if month and 1 <= month <= 12:
+        st.time_range = TimeRange(kind="month", year=year, month=month)
+    else:
+        st.time_range = TimeRange(kind="year", year=year)
+
+
+def _set_relative(st: ParseState, m: "re.Match[str]"):
+    word = m.group(0)
+    if word in ("今年", "本年"):
+        st.time_range = TimeRange(kind="this_year")
+    elif word in ("本月", "这个月", "当月"):
+        st.time_range = TimeRange(kind="this_month")
+    elif word == "昨天":
+        st.time_range = TimeRange(kind="yesterday")
+    else:
+        st.time_range = TimeRange(kind="today")
+
+
+def _set_granularity(st: ParseState, m: "re.Match[str]"):
+    st.granularity = _UNIT_GRANULARITY.get(m.group(1), "day")
+
+
+def _set_top(st: ParseState, m: "re.Match[str]"):
+    n = parse_cn_int(m.group(1))
+    if not n:
+        return False
+    st.top_n = n
+    st.order_dir = st.order_dir or "DESC"
+    noun = m.group(2)
+    if noun:
+        if noun in _UNIT_GRANULARITY:
+            st.granularity = st.granularity or _UNIT_GRANULARITY[noun]
+        else:
+            st.group_phrases.append((noun, m.start(2), m.end(2)))
+
+
+def _set_order(st: ParseState, m: "re.Match[str]"):
+    st.order_dir = "ASC" if m.group(0) in ("最低", "最少", "最小") else "DESC"
+
+
+def _add_group(st: ParseState, m: "re.Match[str]"):
+    phrase = m.group(1).strip()
+    if not phrase:
+        return False
+    if phrase in _UNIT_GRANULARITY:
+        st.granularity = st.granularity or _UNIT_GRANULARITY[phrase]
+        return None
+    st.group_phrases.append((phrase, m.start(1), m.end(1)))
+
+
+def _set_agg(name: str):
+    def _apply(st: ParseState, m: "re.Match[str]"):
+        if name == "distinct":
+            st.distinct = True
+        elif name == "count":
+            st.agg = st.agg or "count"
+        else:
+            st.agg = name
+    return _apply
+
+
+def _add_measure(name: str):
+    def _apply(st: ParseState, m: "re.Match[str]"):
+        if name not in st.measures:
+            st.measures.append(name)
+    return _apply
+
+
+_GROUP_TAIL = r"(?=分组|统计|汇总|排序|计算|查看|的|，|,|；|每|去重|（|\(|\s|$)"
+
+DEFAULT_RULES: List[IntentRule] = [
+    # 时间范围
+    IntentRule("last_n", re.compile(r"(最近|近|过去|last|past)\s*" + _NUM + r"\s*(个月|天|日|周|星期|月|年)", re.I), _set_last),
+    IntentRule("last_one", re.compile(r"(?:最近|近|过去)一(天|周|个月|月|年)"), _set_last_one),
+    IntentRule("year", re.compile(r"((?:19|20)\d{2})\s*年(?:\s*(\d{1,2})\s*月)?"), _set_year),
+    IntentRule("relative", re.compile(r"今年|本年|本月|这个月|当月|今天|今日|昨天"), _set_relative),
+    # 时间粒度
+    IntentRule("granularity", re.compile(r"(?:每|按|逐)个?(天|日|周|星期|月|年)"), _set_granularity),
+    # Top-N 与排序
+    IntentRule("top_n", re.compile(r"(?:前|top\s*)" + _NUM + r"\s*(?:个|名|条|位|大)?\s*([A-Za-z_]\w*|[一-龥]{1,6}?)?(?=的|汇总|统计|$|\s|，|,)", re.I), _set_top),
+    IntentRule("order", re.compile(r"最高|最多|最大|最好|排名|排行|最低|最少|最小"), _set_order),
+    # 分组维度
+    IntentRule("group_by", re.compile(r"按照?\s*([A-Za-z_]\w*|[一-龥A-Za-z]{1,8}?)\s*" + _GROUP_TAIL), _add_group),
+    IntentRule("group_each", re.compile(r"(?:每个|每一个|每位)\s*([A-Za-z_]\w*|[一-龥]{1,6}?)\s*的"), _add_group),
+    IntentRule("group_diff", re.compile(r"(?:不同|各个|各)\s*([A-Za-z_]\w*|[一-龥]{1,6}?)\s*的"), _add_group),
+    # 聚合
+    IntentRule("distinct", re.compile(r"去重|distinct|独立|唯一", re.I), _set_agg("distinct")),
+    IntentRule("avg", re.compile(r"平均|均值|avg", re.I), _set_agg("avg")),
+    IntentRule("sum", re.compile(r"总计|总额|合计|总和|总量|汇总|sum", re.I), _set_agg("sum")),
+    IntentRule("max", re.compile(r"最大值|max", re.I), _set_agg("max")),
+    IntentRule("min", re.compile(r"最小值|min", re.I), _set_agg("min")),
+    IntentRule("count", re.compile(r"数量|个数|总数|记录数|条数|多少|count|数(?![据值])", re.I), _set_agg("count")),
+    # 度量提示
+    *[
+        IntentRule(f"measure_{name}", re.compile("|".join(map(re.escape, zh)), re.I), _add_measure(name))
+        for name, (zh, _) in MEASURE_HINTS.items()
+    ],
+    # 无语义的填充词（仅用于覆盖率统计）
+    IntentRule("filler", re.compile(
+        r"统计|查询|查看|计算|返回|显示|列出|给出|获取|请|帮我|一下|所有|全部|情况|分组|表中|表|中|的|个|和|及|并|新增|销售|"
+        r"[，,。；;：:（）()\[\]]"
+    ), lambda st, m: None),
+]
+
+
+class IntentEngine:
+    def __init__(self, rules: Optional[List[IntentRule]] = None):
+        self.rules: List[IntentRule] = list(rules if rules is not None else DEFAULT_RULES)
+
+    def register(self, rule: IntentRule, before: Optional[str] = None):
+        """注册扩展规则；可指定插入到某条规则之前以调整优先级。"""
+        if before:
+            for i, r in enumerate(self.rules):
+                if r.name == before:
+                    self.rules.insert(i, rule)
+                    return
+        self.rules.append(rule)
+
+    def parse(self, text: str) -> ParseState:
+        st = ParseState(text=text or "")
+        for rule in self.rules:
+            for m in rule.pattern.finditer(st.text):
+                if rule.apply(st, m) is False:
+                    continue
+                st.cover(m.start(), m.end())
+        return st
+
+    # ---- 基于元数据目录的解析 ----
+    @staticmethod
+    def _entity_mentions(text: str) -> List[Tuple[str, int, int]]:
+        out = []
+        for zh, stem in ENTITY_STEMS.items():
+            for m in re.finditer(re.escape(zh), text):
+                out.append((stem, m.start(), m.end()))
+        return out
+
+    @staticmethod
+    def _is_date_col(c: CatalogColumn) -> bool:
+        t = (c.type or "").lower()
+        return any(k in t for k in _DATE_TYPES)
+
+    def _mentioned_columns(self, st: ParseState, table: CatalogTable) -> List[Tuple[CatalogColumn, int, int]]:
+        """返回问题中被显式提及的列（英文列名或中文显示名），较长的显示名优先。"""
+        text = st.text
+        low = text.lower()
+        hits: List[Tuple[CatalogColumn, int, int]] = []
+        for c in table.columns:
+            m = re.search(r"(?<![A-Za-z0-9_])" + re.escape(c.name.lower()) + r"(?![A-Za-z0-9_])", low)
+            if m:
+                hits.append((c, m.start(), m.end()))
+                continue
+            dn = (c.display_name or "").strip()
+            if len(dn) >= 2:
+                i = text.find(dn)
+                if i >= 0:
+                    hits.append((c, i, i + len(dn)))
+        return sorted(hits, key=lambda h: h[2] - h[1], reverse=True)
+
+    @staticmethod
+    def _is_identifier(c: CatalogColumn, table: CatalogTable) -> bool:
+        """主键或首列视为表自身的标识列。"""
+        return c.is_pk or (bool(table.columns) and table.columns[0] is c)
+
+    @staticmethod
+    def _is_date_phrase(phrase: str) -> bool:
+        return any(k in phrase.lower() for k in ("时间", "日期", "date", "time"))
+
+    def _measure_column(self, table: CatalogTable, measure: str) -> Optional[CatalogColumn]:
+        _, col_kw = MEASURE_HINTS[measure]
+        for prefer_met in (True, False):
+            for kw in col_kw:
+                for c in table.columns:
+                    name = c.name.lower()
+                    if kw in name and not name.startswith("stock") and (c.is_met or not prefer_met):
+                        return c
+        return None
+
+    def _resolve_phrase(self, phrase: str, table: CatalogTable) -> Optional[CatalogColumn]:
+        """将分组短语解析为表中的列：列名 > 显示名 > 实体词干（优先 *_id 与维度列）。"""
+        p = phrase.strip().lower()
+        for c in table.columns:
+            if c.name.lower() == p:
+                return c
+        for c in table.columns:
+            dn = (c.display_name or "").lower()
+            if dn and (dn == p or (len(p) >= 2 and (p in dn or dn in p))):
+                return c
+        stem = None
+        for zh, s in ENTITY_STEMS.items():
+            if zh in phrase:
+                stem = s
+                break
+        if stem is None:
+            return None
+        cands = [c for c in table.columns if stem in c.name.lower()]
+        if not cands:
+            return None
+        cands.sort(key=lambda c: (not c.name.lower().endswith("_id") and c.name.lower() != stem, not c.is_dim))
+        return cands[0]
+
+    def _score_tables(self, st: ParseState, snap: CatalogSnapshot) -> List[Tuple[float, str]]:
+        text = st.text
+        low = text.lower()
+        entities = self._entity_mentions(text)
+        needs_date = st.time_range is not None or st.granularity is not None
+        scored: List[Tuple[float, str]] = []
+        for tname, table in snap.tables.items():
+            tl = tname.lower()
+            s = 0.0
+            if re.search(r"(?<![A-Za-z0-9_])" + re.escape(tl) + r"(?![A-Za-z0-9_])", low):
+                s += 10
+            dn = (table.display_name or "").strip()
+            if dn and dn in text:
+                s += 8
+            elif dn.endswith("表") and len(dn) > 2 and dn[:-1] in text:
+                s += 4
+            col_names = [c.name.lower() for c in table.columns]
+            for phrase, _, _ in st.group_phrases:
+                # 分组维度：表需包含对应列；按表自身标识列分组通常意味着应选择事实表
+                col = self._resolve_phrase(phrase, table)
+                if col is None:
+                    s -= 0 if self._is_date_phrase(phrase) else 2
+                elif self._is_identifier(col, table):
+                    s -= 3
+                else:
+                    s += 2
+            for stem, a, b in entities:
+                if st.in_group_span(a, b):
+                    continue
+                if stem in tl:
+                    s += 3
+                elif any(stem in n for n in col_names):
+                    s += 1
+            for measure in st.measures:
+                s += 2 if self._measure_column(table, measure) is not None else -1
+            if needs_date and not any(self._is_date_col(c) for c in table.columns):
+                s -= 5
+            for n in col_names:
+                if len(n) >= 3 and re.search(r"(?<![A-Za-z0-9_])" + re.escape(n) + r"(?![A-Za-z0-9_])", low):
+                    s += 2
+            scored.append((s, tname))
+        scored.sort(key=lambda x: x[0], reverse=True)
+        return scored
+
+    def _compose(self, st: ParseState, table: CatalogTable) -> Optional[Tuple[str, str, Dict, float]]:
+        """在选定表上解析列并组装SQL；返回 (sql, intent, slots, 槽位解析质量) 或 None。
+        仅SQL中实际用到的列（分组、指标、日期筛选）计入已理解的文本；问题提及但未用到的列视为无法解析。
+        """
+        mentioned = self._mentioned_columns(st, table)
+        quality = 1.0
+        # 表名/显示名视为已理解（即查询主体）
+        low = st.text.lower()
+        for name in (table.name.lower(), (table.display_name or "").strip(), (table.display_name or "").strip().rstrip("表")):
+            i = low.find(name.lower()) if len(name) >= 2 else -1
+            if i >= 0:
+                st.cover(i, i + len(name))
+
+        # 日期列：显式提及的日期列优先，其次首个日期类型维度列
+        date_col: Optional[CatalogColumn] = None
+        for c, _, _ in mentioned:
+            if self._is_date_col(c):
+                date_col = c
+                break
+
+        # 分组维度
+        dims: List[CatalogColumn] = []
+        for phrase, a, b in st.group_phrases:
+            col = self._resolve_phrase(phrase, table)
+            if col is None and self._is_date_phrase(phrase) and date_col is None:
+                # “按创建时间”等未能精确解析的日期短语，退化为表的默认日期列
+                date_cols = [c for c in table.columns if self._is_date_col(c)]
+                if date_cols:
+                    col = date_cols[0]
+                    quality -= 0.1
+            if col is None:
+                return None
+            st.cover(a, b)
+            if self._is_date_col(col):
+                date_col = date_col or col
+                if st.granularity is None:
+                    st.granularity = "day"
+                continue
+            if col not in dims:
+                dims.append(col)
+
+        needs_date = st.time_range is not None or st.granularity is not None
+        if needs_date and date_col is None:
+            date_cols = [c for c in table.columns if self._is_date_col(c)]
+            date_cols.sort(key=lambda c: (not c.is_dim,))
+            if not date_cols:
+                return None
+            date_col = date_cols[0]
+            if len(date_cols) > 1:
+                quality -= 0.1
+
+        # 指标
+        target: Optional[CatalogColumn] = None
+        for measure in st.measures:
+            target = self._measure_column(table, measure)
+            if target is not None:
+                break
+        if target is None:
+            for c, _, _ in mentioned:
+                if c.is_met and c not in dims:
+                    target = c
+                    break
+        agg = st.agg
+        subject: Optional[CatalogColumn] = None
+        # 实际进入聚合表达式的列
+        metric_col: Optional[CatalogColumn] = None
+        if st.distinct:
+            for stem, a, b in self._entity_mentions(st.text):
+                if not st.in_group_span(a, b):
+                    subject = self._resolve_phrase(next(zh for zh, s in ENTITY_STEMS.items() if s == stem), table)
+                    if subject is not None:
+                        break
+            subject = subject or (dims[0] if dims else None)
+            if subject is None:
+                return None
+            dims = [d for d in dims if d is not subject]
+            metric_expr, alias = f"COUNT(DISTINCT {subject.name})", f"distinct_{subject.name}"
+            metric_col = subject
+            intent = "distinct_count"
+        elif target is not None and agg in (None, "count", "sum", "avg", "max", "min"):
+            func = agg if agg in ("avg", "max", "min") else "sum"
+            metric_expr, alias = f"{func.upper()}({target.name})", f"{func}_{target.name}"
+            metric_col = target
+            intent = "aggregate"
+        elif agg in ("avg", "sum", "max", "min"):
+            return None
+        else:
+            metric_expr, alias = "COUNT(*)", "record_count"
+            intent = "aggregate"
+            if agg is None:
+                quality -= 0.2
+
+        select_items: List[str] = []
+        group_items: List[str] = []
+        bucket = None
+        if st.granularity is not None and date_col is not None:
+            bucket = BUCKET_EXPR[st.granularity].format(col=date_col.name)
+            select_items.append(f"{bucket} AS period")
+            group_items.append(bucket)
+            intent = "trend"
+        for d in dims:
+            select_items.append(d.name)
+            group_items.append(d.name)
+            if intent != "trend":
+                intent = "group_by"
+        select_items.append(f"{metric_expr} AS {alias}")
+
+        sql = f"SELECT {', '.join(select_items)}\nFROM {table.name}"
+        if st.time_range is not None and date_col is not None:
+            sql += f"\nWHERE {st.time_range.to_sql(date_col.name)}"
+        if group_items:
+            sql += f"\nGROUP BY {', '.join(group_items)}"
+        if st.top_n or (st.order_dir and group_items):
+            sql += f"\nORDER BY {alias} {st.order_dir or 'DESC'}"
+            if st.top_n:
+                sql += f"\nLIMIT {int(st.top_n)}"
+                intent = "top_n"
+        elif bucket is not None:
+            sql += "\nORDER BY period"
+        # 仅覆盖SQL实际用到的列；提及但未用到的列（如“最高的客户”“状态为…”）说明存在未能表达的分组或筛选
+        used = set(id(c) for c in dims)
+        if metric_col is not None:
+            used.add(id(metric_col))
+        if date_col is not None and (st.time_range is not None or bucket is not None):
+            used.add(id(date_col))
+        for c, a, b in mentioned:
+            if id(c) in used:
+                st.cover(a, b)
+            elif not st.in_group_span(a, b):
+                return None
+        for stem, a, b in self._entity_mentions(st.text):
+            if st.in_group_span(a, b):
+                continue
+            if stem in table.name.lower():
+                st.cover(a, b)
+                continue
+            col = self._resolve_phrase(next(zh for zh, s in ENTITY_STEMS.items() if s == stem), table)
+            if col is None:
+                continue
+            if id(col) not in used:
+                return None
+            st.cover(a, b)
+        slots = {
+            "granularity": st.granularity,
+            "time_range": st.time_range.kind if st.time_range else None,
+            "top_n": st.top_n,
+            "dimensions": [d.name for d in dims],
+            "metric": metric_expr,
+            "date_column": date_col.name if date_col else None,
+        }
+        return sql, intent, slots, quality
+
+    def match(self, text: str, snap: Optional[CatalogSnapshot]) -> Optional[IntentResult]:
+        """解析问题并在元数据目录上生成SQL；无法可靠解析时返回None。"""
+        if snap is None or not snap.tables or not (text or "").strip():
+            return None
+        st = self.parse(text.strip())
+        scored = self._score_tables(st, snap)
+        if not scored or scored[0][0] <= 0:
+            return None
+        best_score = scored[0][0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        for score, tname in scored[:3]:
+            if score <= 0:
+                break
+            # 每个候选表在独立的槽位副本上解析，避免相互污染
+            st_t = copy.deepcopy(st)
+            composed = self._compose(st_t, snap.tables[tname])
+            if composed is None:
+                continue
+            sql, intent, slots, quality = composed
+            margin = score - (runner_up if score == best_score else best_score)
+            conf = 0.55
+            if score >= 10:
+                conf += 0.3
+            elif margin >= 3:
+                conf += 0.25
+            elif margin >= 1:
+                conf += 0.1
+            conf += 0.1 * quality
+            coverage = st_t.coverage()
+            # 未被解释的词（多为“北京”“已取消”等筛选值）无法落到SQL中，不生成以免静默丢弃条件
+            if coverage < 0.6 or st_t.unexplained():
+                return None
+            conf *= min(1.0, coverage / 0.9)
+            slots["coverage"] = round(coverage, 3)
+            return IntentResult(sql=sql, confidence=round(min(conf, 0.99), 3), intent=intent, table=tname, slots=slots)
+        return None
+
+
+_engine: Optional[IntentEngine] = None
+
+
+def get_intent_engine() -> IntentEngine:
+    """获取全局意图引擎单例（规则已预编译）。"""
+    global _engine
+    if _engine is None:
+        _engine = IntentEngine()
+    return _engine
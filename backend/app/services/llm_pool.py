@@ -0,0 +1,226 @@
+"""
+大模型端点池：
+- 支持配置多个兼容 OpenAI 协议的端点（LLM_ENDPOINTS），未配置时退化为单端点 OPENAI_BASE_URL；
+- 路由采用“最少在途请求”（按权重归一），跳过熔断中的端点，各端点健康状态由独立熔断器维护；
+- 可选对冲请求：首个请求超过该端点观测到的 P90 延迟仍未返回时，向另一端点补发一次，
+  取先返回者并取消落后的请求；对冲比例受上限约束，避免平均成本翻倍。
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.circuit_breaker import CircuitBreaker, BreakerState, get_llm_breaker
+
+try:
+    from openai import AsyncOpenAI
+    ASYNC_OPENAI_AVAILABLE = True
+except Exception:
+    ASYNC_OPENAI_AVAILABLE = False
+
+
+class LLMUnavailableError(RuntimeError):
+    """端点池中没有可用端点（全部熔断或未配置）。"""
+
+
+class LLMEndpoint:
+    def __init__(self, base_url: str, api_key: str, model: Optional[str] = None, weight: float = 1.0, name: Optional[str] = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.weight = max(0.01, float(weight or 1.0))
+        self.name = (name or urlparse(base_url).netloc or base_url)[:100]
+        self.breaker: CircuitBreaker = get_llm_breaker(base_url)
+        self.in_flight = 0
+        self._latencies: Deque[int] = deque(maxlen=200)
+        self._client = None
+        self.calls_total = 0
+        self.failures_total = 0
+
+    @property
+    def client(self):
+        # 延迟创建客户端；重试由调用方统一控制，关闭SDK内置重试
+        if self._client is None:
+            self._client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key, max_retries=0)
+        return self._client
+
+    def observe(self, latency_ms: int):
+        self._latencies.append(int(latency_ms))
+
+    def percentile_ms(self, q: float) -> Optional[int]:
+        """返回近期成功调用延迟的分位数；样本不足时返回None。"""
+        if len(self._latencies) < 10:
+            return None
+        data = sorted(self._latencies)
+        idx = min(len(data) - 1, max(0, int(math.ceil(q * len(data))) - 1))
+        return data[idx]
+
+    def load(self) -> float:
+        return self.in_flight / self.weight
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "calls_total": self.calls_total,
+            "failures_total": self.failures_total,
+            "p50_ms": self.percentile_ms(0.5),
+            "p90_ms": self.percentile_ms(0.9),
+            "breaker": self.breaker.state.value,
+        }
+
+
+class LLMPool:
+    def __init__(self, endpoints: List[LLMEndpoint], hedge_enabled: bool = False, hedge_min_delay_ms: int = 1500, hedge_max_ratio: float = 0.1):
+        self.endpoints = endpoints
+        self.hedge_enabled = bool(hedge_enabled)
+        self.hedge_min_delay_ms = max(0, int(hedge_min_delay_ms))
+        self.hedge_max_ratio = max(0.0, float(hedge_max_ratio))
+        self._requests_total = 0
+        self._hedged_total = 0
+        self._hedge_wins = 0
+
+    def has_available(self) -> bool:
+        """是否存在未熔断的端点（不占用半开探测名额）。"""
+        return any(ep.breaker.state != BreakerState.OPEN for ep in self.endpoints)
+
+    def _pick(self, exclude: Tuple[LLMEndpoint, ...] = ()) -> Optional[LLMEndpoint]:
+        """按在途请求数（权重归一）升序选择端点，并通过熔断器准入。"""
+        cands = [ep for ep in self.endpoints if ep not in exclude]
+        cands.sort(key=lambda ep: (ep.load(), ep.percentile_ms(0.5) or 0))
+        for ep in cands:
+            if ep.breaker.state == BreakerState.OPEN:
+                continue
+            if ep.breaker.allow_request():
+                return ep
+        return None
+
+    async def _call(self, ep: LLMEndpoint, model: str, kwargs: Dict[str, Any]) -> Tuple[Any, LLMEndpoint]:
+        ep.in_flight += 1
+        ep.calls_total += 1
+        t0 = time.perf_counter()
+        try:
+            # 模型由调用方按分级路由决定；端点配置的 model 仅在调用方未指定时作为缺省
+            completion = await ep.client.chat.completions.create(model=model or ep.model, **kwargs)
+        except asyncio.CancelledError:
+            ep.breaker.record_cancelled()
+            raise
+        except Exception as e:
+            ep.failures_total += 1
+            ep.breaker.record_failure(int((time.perf_counter() - t0) * 1000), e)
+            raise
+        finally:
+            ep.in_flight -= 1
+        latency_ms = int((time.perf_counter() - t0) * 1000)
+        ep.observe(latency_ms)
+        ep.breaker.record_success(latency_ms)
+        return completion, ep
+
+    def _hedge_delay_s(self, ep: LLMEndpoint) -> Optional[float]:
+        """对冲触发延迟：取端点P90（样本不足时用下限）；超出对冲比例上限时不对冲。"""
+        if not self.hedge_enabled or len(self.endpoints) < 2:
+            return None
+        if self._requests_total and self._hedged_total / self._requests_total >= self.hedge_max_ratio:
+            return None
+        p90 = ep.percentile_ms(0.9) or 0
+        return max(self.hedge_min_delay_ms, p90) / 1000.0
+
+    async def chat_completion(self, model: str, **kwargs) -> Tuple[Any, LLMEndpoint]:
+        """发起一次 chat.completions 调用，返回 (completion, 实际响应的端点)。"""
+        primary = self._pick()
+        if primary is None:
+            raise LLMUnavailableError("无可用的大模型端点（全部熔断）")
+        self._requests_total += 1
+        delay = self._hedge_delay_s(primary)
+        if delay is None:
+            return await self._call(primary, model, kwargs)
+
+        first = asyncio.create_task(self._call(primary, model, kwargs))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+            secondary = self._pick(exclude=(primary,))
+            if secondary is None:
+                return await first
+            self._hedged_total += 1
+            logger.info("LLM对冲请求: primary={} 超过 {}ms 未返回，补发至 {}", primary.name, int(delay * 1000), secondary.name)
+            second = asyncio.create_task(self._call(secondary, model, kwargs))
+            tasks.append(second)
+            pending = {first, second}
+            last_err: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._hedge_wins += 1
+                        return task.result()
+                    last_err = task.exception()
+            raise last_err  # type: ignore[misc]
+        finally:
+            # 已有结果、全部失败或调用方自身被取消时，取消仍在途的请求，释放连接与在途计数
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedge_enabled": self.hedge_enabled,
+            "requests_total": self._requests_total,
+            "hedged_total": self._hedged_total,
+            "hedge_wins": self._hedge_wins,
+            "endpoints": [ep.snapshot() for ep in self.endpoints],
+        }
+
+
+def _endpoints_from_settings() -> List[LLMEndpoint]:
+    eps: List[LLMEndpoint] = []
+    for item in settings.LLM_ENDPOINTS or []:
+        base_url = str(item.get("base_url") or "").strip()
+        if not base_url:
+            continue
+        eps.append(LLMEndpoint(
+            base_url=base_url,
+            api_key=str(item.get("api_key") or settings.OPENAI_API_KEY),
+            model=item.get("model"),
+            weight=item.get("weight") or 1.0,
+            name=item.get("name"),
+        ))
+    if not eps:
+        eps.append(LLMEndpoint(base_url=settings.OPENAI_BASE_URL, api_key=settings.OPENAI_API_KEY))
+    return eps
+
+
+_pool: Optional[LLMPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_llm_pool() -> LLMPool:
+    """获取全局端点池单例。"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LLMPool(
+                    _endpoints_from_settings(),
+                    hedge_enabled=settings.LLM_HEDGE_ENABLED,
+                    hedge_min_delay_ms=settings.LLM_HEDGE_MIN_DELAY_MS,
+                    hedge_max_ratio=settings.LLM_HEDGE_MAX_RATIO,
+                )
+                logger.info(
+                    "LLM端点池已初始化: endpoints={}, hedge_enabled={}",
+                    [ep.name for ep in _pool.endpoints],
+                    _pool.hedge_enabled,
+                )
+    return _pool
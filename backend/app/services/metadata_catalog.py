@@ -0,0 +1,265 @@
+"""
+元数据目录缓存：
+- 从 MySQL 元数据表（aitt_data_tables + aitt_table_columns）加载一次，构建不可变快照；
+- 快照带版本号，内容变化时版本递增，便于下游缓存判断是否失效；
+- 预计算“关键词集合 -> 表”“(表, 关键词集合) -> 列”索引，规则兜底生成 SQL 时为纯内存操作；
+- 首次加载与过期刷新均在后台线程进行：冷启动期间返回 None，刷新期间继续使用旧快照，不阻塞请求路径。
+"""
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import pymysql
+from pymysql.cursors import DictCursor
+from sqlalchemy.engine.url import make_url
+from loguru import logger
+
+from app.core.config import settings
+
+
+# 规则引擎使用的关键词集合（按名称匹配表/列，英文统一小写）
+ORDER_KW = ["order", "orders", "交易", "订单"]
+DATE_KW = ["date", "dt", "时间", "日期", "created_at", "order_date", "下单"]
+AMOUNT_KW = ["amount", "total_amount", "gmv", "price", "pay", "支付", "金额", "交易额"]
+PRODUCT_KW = ["product", "商品", "产品", "sku", "spu", "brand", "category"]
+DETAIL_KW = ["detail", "详细", "详情", "明细"]
+
+KEYWORD_SETS: Dict[str, List[str]] = {
+    "order": ORDER_KW,
+    "date": DATE_KW,
+    "amount": AMOUNT_KW,
+    "product": PRODUCT_KW,
+    # 详情意图常用列（单关键词集合）
+    "id": ["id"],
+    "name": ["name"],
+    "category": ["category"],
+    "brand": ["brand"],
+    "price": ["price"],
+}
+
+
+@dataclass(frozen=True)
+class CatalogColumn:
+    name: str
+    type: str
+    display_name: Optional[str] = None
+    description: Optional[str] = None
+    is_dim: bool = False
+    is_met: bool = False
+    is_pk: bool = False
+
+
+@dataclass
+class CatalogTable:
+    id: int
+    name: str
+    data_source_id: Optional[int] = None
+    display_name: Optional[str] = None
+    description: Optional[str] = None
+    columns: List[CatalogColumn] = field(default_factory=list)
+
+
+class CatalogSnapshot:
+    """元数据目录的只读快照及其预计算索引。"""
+
+    def __init__(self, tables: Dict[str, CatalogTable], version: int, fingerprint: str):
+        self.tables = tables
+        self.version = version
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+        # 关键词集合 -> 表名包含该集合任一关键词的表（保持表加载顺序）
+        self.tables_by_keyword: Dict[str, List[str]] = {}
+        # (表名, 关键词集合) -> 首个列名包含该集合任一关键词的列
+        self.columns_by_keyword: Dict[Tuple[str, str], str] = {}
+        # 同时具备日期列与金额列的表
+        self.tables_with_date_and_amount: List[str] = []
+        self._build_indexes()
+
+    def _build_indexes(self):
+        for set_name, kws in KEYWORD_SETS.items():
+            self.tables_by_keyword[set_name] = [
+                t for t in self.tables if any(k in t.lower() for k in kws)
+            ]
+        for tname, table in self.tables.items():
+            for set_name, kws in KEYWORD_SETS.items():
+                for c in table.columns:
+                    if any(k in c.name.lower() for k in kws):
+                        self.columns_by_keyword[(tname, set_name)] = c.name
+                        break
+            if (tname, "date") in self.columns_by_keyword and (tname, "amount") in self.columns_by_keyword:
+                self.tables_with_date_and_amount.append(tname)
+
+    def column_for(self, table: str, set_name: str) -> Optional[str]:
+        """返回表中匹配关键词集合的首个列名（O(1) 查表）。"""
+        return self.columns_by_keyword.get((table, set_name))
+
+    def tables_mentioned_in(self, text: str) -> List[str]:
+        """返回在文本中被显式提及（表名或显示名）的表，按名称长度降序以优先匹配更具体的表。"""
+        q = (text or "").lower()
+        if not q:
+            return []
+        hits = []
+        for tname, table in self.tables.items():
+            if tname.lower() in q or (table.display_name and table.display_name.lower() in q):
+                hits.append(tname)
+        return sorted(hits, key=len, reverse=True)
+
+
+def _open_mysql_conn():
+    url = make_url(settings.DATABASE_URL)
+    return pymysql.connect(
+        host=url.host or "localhost",
+        port=int(url.port or 3306),
+        user=url.username,
+        password=url.password or "",
+        database=url.database,
+        charset="utf8mb4",
+        cursorclass=DictCursor,
+    )
+
+
+class MetadataCatalog:
+    def __init__(self, ttl_seconds: int = 300):
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._load_lock = threading.Lock()
+        self._flag_lock = threading.Lock()
+        self._refreshing = False
+        self._version = 0
+
+    def get(self, wait: bool = False) -> Optional[CatalogSnapshot]:
+        """获取当前快照，过期时触发后台刷新并继续返回旧快照。
+
+        尚未加载（冷启动）时默认不阻塞：触发后台加载并返回 None，调用方按“无目录”降级处理；
+        仅在工作线程中调用且确实需要目录时传 wait=True 同步加载（会执行阻塞的 PyMySQL 查询，
+        不可在事件循环中使用）。
+        """
+        snap = self._snapshot
+        if snap is None:
+            if not wait:
+                self._schedule_refresh()
+                return None
+            try:
+                return self.refresh()
+            except Exception as e:
+                logger.warning("元数据目录首次加载失败: {}", e)
+                return None
+        if time.time() - snap.loaded_at >= self.ttl_seconds:
+            self._schedule_refresh()
+        return snap
+
+    def _schedule_refresh(self):
+        with self._flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("元数据目录后台刷新失败，继续使用旧快照: {}", e)
+        finally:
+            self._refreshing = False
+
+    def invalidate(self):
+        """标记快照过期，下次访问时后台刷新。"""
+        snap = self._snapshot
+        if snap is not None:
+            snap.loaded_at = 0.0
+
+    def refresh(self) -> CatalogSnapshot:
+        """从 MySQL 元数据表重新加载；内容未变化时沿用版本号。"""
+        with self._load_lock:
+            tables = self._load_tables()
+            h = hashlib.sha1()
+            for tname, t in tables.items():
+                h.update(f"{t.id}|{tname}|{t.display_name}".encode("utf-8"))
+                for c in t.columns:
+                    h.update(f"|{c.name}:{c.type}:{int(c.is_dim)}{int(c.is_met)}{int(c.is_pk)}".encode("utf-8"))
+            fingerprint = h.hexdigest()
+            prev = self._snapshot
+            if prev is None or prev.fingerprint != fingerprint:
+                self._version += 1
+            snap = CatalogSnapshot(tables, version=self._version, fingerprint=fingerprint)
+            self._snapshot = snap
+            logger.info(
+                "元数据目录已加载: version={}, tables={}, columns={}",
+                snap.version,
+                len(tables),
+                sum(len(t.columns) for t in tables.values()),
+            )
+            return snap
+
+    def _load_tables(self) -> Dict[str, CatalogTable]:
+        tables: Dict[str, CatalogTable] = {}
+        by_id: Dict[int, CatalogTable] = {}
+        conn = _open_mysql_conn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT id, data_source_id, table_name, display_name, description
+                    FROM aitt_data_tables
+                    WHERE COALESCE(is_active, 1) = 1
+                    ORDER BY id
+                    """
+                )
+                for r in cur.fetchall() or []:
+                    name = str(r.get("table_name") or "")
+                    # 多数据源同名表时保留首个，与既有规则兜底行为一致
+                    if not name or name in tables:
+                        continue
+                    t = CatalogTable(
+                        id=int(r["id"]),
+                        name=name,
+                        data_source_id=r.get("data_source_id"),
+                        display_name=r.get("display_name"),
+                        description=r.get("description"),
+                    )
+                    tables[name] = t
+                    by_id[t.id] = t
+                cur.execute(
+                    """
+                    SELECT table_id, column_name, display_name, description, data_type,
+                           is_dimension, is_metric, is_primary_key
+                    FROM aitt_table_columns
+                    ORDER BY table_id, column_order, id
+                    """
+                )
+                for c in cur.fetchall() or []:
+                    t = by_id.get(int(c.get("table_id") or 0))
+                    if t is None or not c.get("column_name"):
+                        continue
+                    t.columns.append(CatalogColumn(
+                        name=str(c.get("column_name")),
+                        type=str(c.get("data_type") or ""),
+                        display_name=c.get("display_name"),
+                        description=c.get("description"),
+                        is_dim=bool(c.get("is_dimension")),
+                        is_met=bool(c.get("is_metric")),
+                        is_pk=bool(c.get("is_primary_key")),
+                    ))
+        finally:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        return tables
+
+
+_catalog: Optional[MetadataCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_metadata_catalog() -> MetadataCatalog:
+    """获取全局元数据目录单例。"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = MetadataCatalog(ttl_seconds=settings.METADATA_CATALOG_TTL_SECONDS)
+    return _catalog
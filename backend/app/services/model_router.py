@@ -0,0 +1,106 @@
+"""
+基于问题复杂度的模型分级路由：
+- 本地轻量特征（检索到的表数量、涉及实体数推断的关联路径长度、聚合与日期逻辑、子查询类意图）打分；
+- 分数低于阈值走快速/低成本模型，否则走强模型；未配置快速模型时始终使用强模型；
+- 快速模型生成的SQL无效（占位SQL、非只读查询、括号不配对、引用未知表等）时由调用方自动升级到强模型。
+"""
+import enum
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.services.intent_engine import ENTITY_STEMS
+from app.services.metadata_catalog import get_metadata_catalog
+from app.services.sql_parser import parse_sql
+
+
+class ModelTier(str, enum.Enum):
+    """模型档位枚举"""
+    FAST = "fast"
+    STRONG = "strong"
+
+
+AGG_KW = ["总", "合计", "平均", "均值", "最大", "最小", "最高", "最低", "数量", "个数", "去重", "求和", "count", "sum", "avg"]
+DATE_LOGIC_KW = ["同比", "环比", "去年同期", "上月", "上周", "季度", "累计", "滚动", "移动平均", "月初", "月末", "周末", "工作日", "间隔", "留存"]
+SUBQUERY_KW = ["占比", "比例", "排名", "高于平均", "低于平均", "超过平均", "分别", "每个.{1,6}前", "复购", "首次", "最近一次", "连续", "未下单", "没有"]
+JOIN_KW = ["关联", "对应的", "以及", "和他们的", "join"]
+# 通常对应独立表的实体（城市、状态、品类等多为表内属性列，不计入关联路径）
+TABLE_ENTITIES = {"order", "customer", "product", "item"}
+
+
+@dataclass
+class RouteDecision:
+    tier: ModelTier
+    model: str
+    score: float
+    features: Dict[str, Any] = field(default_factory=dict)
+
+
+def extract_features(nl_query: str, metadata_ctx: Optional[str] = None) -> Dict[str, Any]:
+    """提取路由特征，纯字符串处理，耗时可忽略。"""
+    q = (nl_query or "").lower()
+    entities = {stem for zh, stem in ENTITY_STEMS.items() if zh in q and stem in TABLE_ENTITIES}
+    mentioned_tables = 0
+    try:
+        snap = get_metadata_catalog().get()
+        if snap is not None:
+            mentioned_tables = len(snap.tables_mentioned_in(q))
+    except Exception:
+        mentioned_tables = 0
+    return {
+        "query_len": len(q),
+        "context_tables": len(re.findall(r"^Table: ", metadata_ctx or "", flags=re.MULTILINE)),
+        "join_path": max(len(entities), mentioned_tables) - 1 if (entities or mentioned_tables) else 0,
+        "join_hint": any(k in q for k in JOIN_KW),
+        "aggregations": sum(1 for k in AGG_KW if k in q),
+        "date_logic": sum(1 for k in DATE_LOGIC_KW if k in q),
+        "subquery": sum(1 for k in SUBQUERY_KW if re.search(k, q)),
+    }
+
+
+def complexity_score(f: Dict[str, Any]) -> float:
+    score = 0.0
+    score += 1.5 * max(0, int(f.get("join_path") or 0))
+    score += 1.0 if f.get("join_hint") else 0.0
+    score += 0.5 * max(0, int(f.get("aggregations") or 0) - 1)
+    score += 1.5 * int(f.get("date_logic") or 0)
+    score += 2.0 * int(f.get("subquery") or 0)
+    # 检索上下文表过多通常意味着问题跨多个主题
+    score += 0.5 * max(0, int(f.get("context_tables") or 0) - 3)
+    score += 1.0 if int(f.get("query_len") or 0) > 60 else 0.0
+    return score
+
+
+def route(nl_query: str, metadata_ctx: Optional[str] = None) -> RouteDecision:
+    """选择模型档位；未配置快速模型时始终返回强模型。"""
+    features = extract_features(nl_query, metadata_ctx)
+    score = complexity_score(features)
+    if settings.AI_MODEL_FAST_NAME and score < settings.AI_MODEL_ROUTER_THRESHOLD:
+        return RouteDecision(ModelTier.FAST, settings.AI_MODEL_FAST_NAME, score, features)
+    return RouteDecision(ModelTier.STRONG, settings.AI_MODEL_NAME, score, features)
+
+
+def invalid_reason(sql: Optional[str]) -> Optional[str]:
+    """快速校验生成的SQL，返回无效原因；有效时返回None。"""
+    text = (sql or "").strip()
+    if not text:
+        return "empty"
+    if "placeholder" in text.lower():
+        return "placeholder"
+    parsed = parse_sql(text)
+    violation = parsed.read_only_violation()
+    if violation:
+        return f"not_read_only:{violation}"
+    if sum(1 for t in parsed.tokens if t.value == "(") != sum(1 for t in parsed.tokens if t.value == ")"):
+        return "unbalanced_parens"
+    try:
+        snap = get_metadata_catalog().get()
+    except Exception:
+        snap = None
+    if snap is not None and snap.tables:
+        known = {t.lower() for t in snap.tables}
+        for name in parsed.tables:
+            if name.lower() not in known:
+                return f"unknown_table:{name.lower()}"
+    return None
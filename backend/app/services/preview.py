@@ -0,0 +1,137 @@
+"""
+生成SQL的推测性预览执行：
+- /ai/query 指定数据源并开启 preview 时，在分析与记录历史的同时并发执行一次受限预览
+  （只读事务、小 LIMIT、短超时），结果附在 AIQueryResponse.query_results；
+- 预览结果按 (数据源ID, SQL指纹) 进程内短期缓存，随后的 /queries/execute 命中时免去再次连接与执行。
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+from app.models.data_source import DataSource
+from app.services.sql_parser import parse_sql
+from app.services.query_executor import get_query_executor
+
+
+@dataclass
+class PreviewResult:
+    rows: List[dict]
+    columns: List[str]
+    # 预览行数达到上限时结果可能被截断
+    truncated: bool
+    limit: int
+    execution_time_ms: int
+    created_at: float
+
+    def covers(self, max_rows: int) -> bool:
+        """判断该预览能否直接作为 max_rows 行执行的结果：未截断或请求行数不超过预览行数。"""
+        return not self.truncated or max_rows <= self.limit
+
+    def to_query_results(self) -> Dict[str, Any]:
+        return {
+            "preview": True,
+            "columns": [{"name": c} for c in self.columns],
+            "data": self.rows,
+            "row_count": len(self.rows),
+            "truncated": self.truncated,
+            "execution_time_ms": self.execution_time_ms,
+        }
+
+
+class PreviewCache:
+    """预览结果的进程内TTL缓存，键为 (数据源ID, SQL指纹)。"""
+
+    def __init__(self, max_entries: int = 200, ttl_seconds: int = 120):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self._items: "OrderedDict[Tuple[int, str], PreviewResult]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(ds_id: int, sql: str) -> Tuple[int, str]:
+        return int(ds_id), parse_sql(sql).fingerprint
+
+    def get(self, ds_id: int, sql: str, max_rows: int) -> Optional[PreviewResult]:
+        key = self._key(ds_id, sql)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if time.time() - item.created_at > self.ttl_seconds:
+                self._items.pop(key, None)
+                return None
+            if not item.covers(max_rows):
+                return None
+            self._items.move_to_end(key)
+            return item
+
+    def put(self, ds_id: int, sql: str, result: PreviewResult):
+        key = self._key(ds_id, sql)
+        with self._lock:
+            self._items[key] = result
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+async def run_preview(ds_service, ds: DataSource, sql: str) -> Optional[PreviewResult]:
+    """在数据源执行线程池中执行受限预览，失败或超时返回None（预览为尽力而为，不影响主流程）。"""
+    limit = max(1, int(settings.AI_PREVIEW_MAX_ROWS))
+    timeout = max(1, int(settings.AI_PREVIEW_TIMEOUT_SECONDS))
+    t0 = time.perf_counter()
+    try:
+        # 多取一行用于判断是否截断
+        rows, columns = await asyncio.wait_for(
+            get_query_executor().run(
+                ds.id,
+                ds_service.execute_sql_blocking,
+                ds,
+                sql,
+                max_rows=limit + 1,
+                timeout_seconds=timeout,
+            ),
+            timeout=timeout + 1,
+        )
+    except asyncio.TimeoutError:
+        logger.info("预览执行超时: data_source_id={}, timeout={}s", ds.id, timeout)
+        return None
+    except Exception as e:
+        logger.info("预览执行失败: data_source_id={}, err={}", ds.id, e)
+        return None
+    result = PreviewResult(
+        rows=rows[:limit],
+        columns=columns,
+        truncated=len(rows) > limit,
+        limit=limit,
+        execution_time_ms=int((time.perf_counter() - t0) * 1000),
+        created_at=time.time(),
+    )
+    get_preview_cache().put(ds.id, sql, result)
+    logger.info(
+        "预览执行完成: data_source_id={}, rows={}, truncated={}, ms={}",
+        ds.id,
+        len(result.rows),
+        result.truncated,
+        result.execution_time_ms,
+    )
+    return result
+
+
+_cache: Optional[PreviewCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_preview_cache() -> PreviewCache:
+    """获取全局预览结果缓存单例。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PreviewCache(ttl_seconds=settings.AI_PREVIEW_CACHE_TTL_SECONDS)
+    return _cache
@@ -1,8 +1,32 @@
-from typing import Optional
+import json
+from typing import Any, Dict, Optional, Union
 
 
-def build_sql_generation_prompt(nl_query: str, schema_context: Optional[str] = None, user_context: Optional[str] = None) -> str:
-    """构建用于将自然语言安全转换为只读 SQL 的 Markdown 提示词。"""
+def format_user_context(context: Union[str, Dict[str, Any], None]) -> Optional[str]:
+    """将请求携带的额外上下文格式化为提示词文本：字典按“- 键: 值”逐行输出，非字符串值序列化为 JSON。"""
+    if not context:
+        return None
+    if isinstance(context, str):
+        return context
+    if isinstance(context, dict):
+        lines = []
+        for k, v in context.items():
+            val = v if isinstance(v, str) else json.dumps(v, ensure_ascii=False, default=str)
+            lines.append(f"- {k}: {val}")
+        return "\n".join(lines) or None
+    return json.dumps(context, ensure_ascii=False, default=str)
+
+
+def build_sql_generation_prompt(
+    nl_query: str,
+    schema_context: Optional[str] = None,
+    user_context: Union[str, Dict[str, Any], None] = None,
+    history_context: Optional[str] = None,
+    followup_context: Optional[str] = None,
+) -> str:
+    """构建用于将自然语言安全转换为只读 SQL 的 Markdown 提示词。
+    user_context 为请求携带的额外上下文（字典或文本）；history_context 为会话历史；followup_context 为追问增量提示。
+    """
     parts = []
 
     parts.append("## 角色定位\n你是资深数据分析助理，负责将自然语言安全地转换为只读 SQL 查询。")
@@ -55,8 +79,13 @@ def build_sql_generation_prompt(nl_query: str, schema_context: Optional[str] = N
         "- 遇到敏感字段：优先不选或进行掩码后再选\n"
     )
 
-    if user_context:
-        parts.append(f"## 用户上下文\n{user_context}")
+    user_text = format_user_context(user_context)
+    if user_text:
+        parts.append(f"## 用户上下文\n{user_text}")
+    if history_context:
+        parts.append(f"## 会话历史\n{history_context}")
+    if followup_context:
+        parts.append(f"## 追问上下文\n{followup_context}")
     if schema_context:
         parts.append(f"## 参考数据上下文\n{schema_context}")
     parts.append(f"## 需求\n{nl_query}")
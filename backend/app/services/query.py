@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.query import QueryHistory, QueryTemplate, QueryStatus
 from app.schemas.query import QueryTemplateCreate, QueryTemplateUpdate
+from app.services.template_matcher import get_template_matcher
 
 
 class QueryService:
@@ -31,6 +32,7 @@ class QueryService:
             await self.db.flush()
             await self.db.refresh(tpl)
             await self.db.commit()
+            get_template_matcher().invalidate()
             return tpl
         except Exception:
             # ORM 路径不可用（缺少 greenlet），降级为 PyMySQL 同步插入
@@ -134,6 +136,7 @@ class QueryService:
                     setattr(tpl, "created_at", getattr(tpl, "created_at", now))
                     setattr(tpl, "updated_at", getattr(tpl, "updated_at", now))
 
+                get_template_matcher().invalidate()
                 return tpl
             finally:
                 conn.close()
@@ -155,12 +158,14 @@ class QueryService:
         )
         res = await self.db.execute(stmt)
         await self.db.commit()
+        get_template_matcher().invalidate()
         return res.scalar_one_or_none()
 
     async def delete_template(self, tpl_id: int) -> None:
         stmt = delete(QueryTemplate).where(QueryTemplate.id == tpl_id)
         await self.db.execute(stmt)
         await self.db.commit()
+        get_template_matcher().invalidate()
 
     async def list_templates(self, limit: int = 20, offset: int = 0) -> List[QueryTemplate]:
         """列出查询模板。
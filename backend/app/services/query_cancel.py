@@ -0,0 +1,89 @@
+"""
+查询取消：
+- ServerSession 记录正在执行查询的服务端会话（MySQL 线程ID / PostgreSQL 后端进程ID）及其所在节点（主库或只读副本），
+  执行线程在借到连接后登记、归还连接前清除；取消时持锁在独立连接上中止该会话的当前语句，
+  保证不会误杀连接归还后被其他查询复用的会话；
+- await_or_cancel_on_disconnect 监听 ASGI 客户端断开（关闭页面、代理超时），断开时回调调用方取消执行。
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Request
+from loguru import logger
+
+from app.models.data_source import DataSource
+
+
+class QueryCancelledError(Exception):
+    """查询已被取消"""
+
+
+class ClientDisconnectedError(Exception):
+    """客户端在查询完成前断开连接"""
+
+
+class ServerSession:
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._session_id: Optional[int] = None
+        self._node: Optional[str] = None
+
+    def on_connection(self, conn) -> None:
+        """作为 on_connection 回调传给数据源执行函数；已取消时拒绝开始执行（如仍在执行队列中排队的查询）。"""
+        if conn is not None and self.cancelled.is_set():
+            raise QueryCancelledError("查询已取消")
+        with self._lock:
+            self._session_id = conn.session_id() if conn is not None else None
+            self._node = conn.node if conn is not None else None
+
+    def _cancel_blocking(self, ds_service, ds: DataSource) -> Optional[int]:
+        # 持锁期间执行线程无法归还连接，保证被中止的会话仍在执行本查询
+        with self._lock:
+            session_id = self._session_id
+            if session_id is not None:
+                ds_service.cancel_query_blocking(ds, session_id, self._node)
+            return session_id
+
+    async def cancel(self, ds_service, ds: DataSource) -> Optional[int]:
+        """标记取消并中止服务端正在执行的语句，返回被中止的会话ID（尚未连接时为None）。"""
+        self.cancelled.set()
+        try:
+            session_id = await asyncio.to_thread(self._cancel_blocking, ds_service, ds)
+        except Exception as e:
+            logger.warning("中止服务端语句失败: data_source_id={}, err={}", ds.id, e)
+            return None
+        if session_id is not None:
+            logger.info("已中止服务端语句: data_source_id={}, session_id={}", ds.id, session_id)
+        return session_id
+
+
+async def _wait_disconnect(request: Request) -> None:
+    # 请求体已读完，之后收到的消息只可能是 http.disconnect
+    while True:
+        message = await request.receive()
+        if message.get("type") == "http.disconnect":
+            return
+
+
+async def await_or_cancel_on_disconnect(
+    request: Request,
+    work: Awaitable[Any],
+    on_disconnect: Callable[[], Awaitable[None]],
+) -> Any:
+    """等待 work 完成；期间客户端断开则调用 on_disconnect（中止服务端语句等）并抛出 ClientDisconnectedError。
+    断开后 work 在后台自然结束，其结果或异常被丢弃。
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if not watcher.done():
+            watcher.cancel()
+    if task.done():
+        return task.result()
+    task.add_done_callback(lambda t: t.exception() if not t.cancelled() else None)
+    await on_disconnect()
+    raise ClientDisconnectedError("客户端已断开连接")
@@ -0,0 +1,188 @@
+"""
+外部数据源查询执行器：
+- PyMySQL/psycopg 为同步驱动，查询放入按数据源隔离的有界线程池执行，不阻塞事件循环；
+- 每个数据源的并发执行数受线程数限制，排队数超过上限时立即拒绝，避免单个慢库拖垮整个服务；
+- 记录提交/完成/失败/拒绝次数、运行与排队数及耗时分位，供健康检查观察。
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+
+
+class ExecutorBusyError(Exception):
+    """数据源执行队列已满"""
+
+
+class DataSourceExecutor:
+    def __init__(self, ds_id: int, max_workers: int = 4, max_queue: int = 32):
+        self.ds_id = ds_id
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"ds{ds_id}-exec")
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        # 指标
+        self.submitted_total = 0
+        self.completed_total = 0
+        self.failed_total = 0
+        self.rejected_total = 0
+        self._latencies: Deque[int] = deque(maxlen=200)
+        self._waits: Deque[int] = deque(maxlen=200)
+
+    async def run(self, fn: Callable[[], Any], on_done: Optional[Callable[[], None]] = None) -> Any:
+        """在线程池中执行 fn。on_done 在任务真正结束（完成、失败、排队中被取消或提交被拒绝）后恰好调用一次，
+        可能在工作线程中调用；等待方被取消不会中断已在执行的任务，此时 on_done 仍待任务结束后才调用。
+        """
+        with self._lock:
+            rejected = self._running + self._queued >= self.max_workers + self.max_queue
+            if rejected:
+                self.rejected_total += 1
+            else:
+                self._queued += 1
+                self.submitted_total += 1
+        if rejected:
+            if on_done is not None:
+                on_done()
+            raise ExecutorBusyError(f"数据源{self.ds_id}执行队列已满，请稍后重试")
+        enqueued_at = time.perf_counter()
+
+        def _task():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._waits.append(int((started - enqueued_at) * 1000))
+            try:
+                return fn()
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._latencies.append(int((time.perf_counter() - started) * 1000))
+
+        def _finished(f):
+            if f.cancelled():
+                # 排队中被取消：任务不会再执行，扣除排队数
+                with self._lock:
+                    self._queued -= 1
+            if on_done is not None:
+                on_done()
+
+        try:
+            cf = self._executor.submit(_task)
+        except RuntimeError:
+            # 线程池已关闭（数据源配置变更或服务停止）
+            with self._lock:
+                self._queued -= 1
+                self.failed_total += 1
+            if on_done is not None:
+                on_done()
+            raise
+        cf.add_done_callback(_finished)
+        try:
+            result = await asyncio.wrap_future(cf)
+        except Exception:
+            with self._lock:
+                self.failed_total += 1
+            raise
+        with self._lock:
+            self.completed_total += 1
+        return result
+
+    def shutdown(self):
+        # 已提交的任务继续执行完毕，不等待
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _percentile(values, q: float) -> Optional[int]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = list(self._latencies)
+            waits = list(self._waits)
+            return {
+                "data_source_id": self.ds_id,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._queued,
+                "submitted_total": self.submitted_total,
+                "completed_total": self.completed_total,
+                "failed_total": self.failed_total,
+                "rejected_total": self.rejected_total,
+                "latency_p50_ms": self._percentile(latencies, 0.5),
+                "latency_p95_ms": self._percentile(latencies, 0.95),
+                "queue_wait_p95_ms": self._percentile(waits, 0.95),
+            }
+
+
+class QueryExecutorManager:
+    def __init__(self):
+        self._executors: Dict[int, DataSourceExecutor] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, ds_id: int) -> DataSourceExecutor:
+        with self._lock:
+            ex = self._executors.get(ds_id)
+            if ex is None:
+                # 线程数不超过连接池上限，避免线程空等连接
+                workers = min(settings.DS_EXECUTOR_MAX_WORKERS, settings.DS_POOL_MAX_SIZE)
+                ex = DataSourceExecutor(ds_id, max_workers=workers, max_queue=settings.DS_EXECUTOR_MAX_QUEUE)
+                self._executors[ds_id] = ex
+            return ex
+
+    async def run(
+        self,
+        ds_id: int,
+        fn: Callable[..., Any],
+        *args,
+        on_done: Optional[Callable[[], None]] = None,
+        **kwargs,
+    ) -> Any:
+        """在数据源专属线程池中执行同步函数；on_done 语义见 DataSourceExecutor.run。"""
+        return await self._get(ds_id).run(partial(fn, *args, **kwargs), on_done=on_done)
+
+    def invalidate(self, ds_id: int):
+        with self._lock:
+            ex = self._executors.pop(ds_id, None)
+        if ex is not None:
+            ex.shutdown()
+            logger.info("数据源执行线程池已关闭: data_source_id={}", ds_id)
+
+    def shutdown(self):
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for ex in executors:
+            ex.shutdown()
+
+    def stats(self):
+        with self._lock:
+            executors = list(self._executors.values())
+        return [ex.stats() for ex in executors]
+
+
+_manager: Optional[QueryExecutorManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_query_executor() -> QueryExecutorManager:
+    """获取全局查询执行器单例。"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = QueryExecutorManager()
+    return _manager
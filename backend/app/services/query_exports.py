@@ -0,0 +1,518 @@
+"""
+查询结果导出（大结果集落盘）：
+- 导出任务在后台以服务端游标逐批读取，写入 UPLOAD_DIR/exports/<导出ID>/ 下的分片文件（Parquet 或 CSV），
+  结果不经过请求路径，也不构造逐行字典；
+- 内存占用有界：Parquet 攒满 QUERY_EXPORT_ROW_GROUP_ROWS 行写出一个行组，CSV 逐批写出；
+  单个分片达到 QUERY_EXPORT_FILE_MAX_ROWS 行后滚动到下一分片；
+- Parquet 列类型由分片的首个行组推断，后续行组类型不兼容（如首批某列全为空值）时滚动到新分片并重新推断；
+- 完成后写入 manifest.json（列、分片、行数、字节数、过期时间），下载接口按 Range 支持断点续传；
+- 过期导出（QUERY_EXPORT_TTL_SECONDS）由后台任务定期删除，失败或取消的导出立即删除。
+状态回写 aitt_query_history（tags 含 export），任务注册表为进程内状态（同 app.services.query_jobs）。
+"""
+import asyncio
+import csv
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.data_source import DataSource
+from app.models.query import QueryHistory, QueryStatus
+from app.services.query_cancel import QueryCancelledError, ServerSession
+from app.services.query_scheduler import get_query_scheduler
+from app.services.result_format import arrow_arrays, arrow_available
+
+EXPORT_FORMAT_PARQUET = "parquet"
+EXPORT_FORMAT_CSV = "csv"
+
+EXPORT_MEDIA_TYPES = {
+    EXPORT_FORMAT_PARQUET: "application/vnd.apache.parquet",
+    EXPORT_FORMAT_CSV: "text/csv; charset=utf-8",
+}
+
+MANIFEST_NAME = "manifest.json"
+
+_FINAL_STATUSES = (QueryStatus.SUCCESS, QueryStatus.ERROR, QueryStatus.TIMEOUT, QueryStatus.CANCELLED)
+
+
+class ExportFormatUnavailableError(Exception):
+    """导出格式依赖的组件未安装"""
+
+
+class RangeNotSatisfiableError(ValueError):
+    """Range 请求超出文件范围"""
+
+
+def export_root() -> str:
+    return os.path.join(settings.UPLOAD_DIR, "exports")
+
+
+def export_dir(export_id: int) -> str:
+    return os.path.join(export_root(), str(int(export_id)))
+
+
+def check_format(fmt: str):
+    if fmt == EXPORT_FORMAT_PARQUET and not arrow_available():
+        raise ExportFormatUnavailableError("服务端未安装 pyarrow，无法导出 Parquet，请改用 CSV")
+
+
+def _unique_names(columns: List[str]) -> List[str]:
+    # Parquet 按列名读取，重复列名（如 SELECT a.id, b.id）追加序号
+    seen: Dict[str, int] = {}
+    names = []
+    for c in columns:
+        n = seen.get(c, 0) + 1
+        seen[c] = n
+        names.append(c if n == 1 else f"{c}_{n}")
+    return names
+
+
+# ---------- 分片写出 ----------
+class _ExportSink:
+    """按格式写出分片文件，负责行组缓冲与分片滚动（在执行线程中使用）。"""
+
+    def __init__(self, directory: str, fmt: str, file_max_rows: int, row_group_rows: int):
+        self.directory = directory
+        self.fmt = fmt
+        self.row_group_rows = max(1, int(row_group_rows))
+        # Parquet 分片至少容纳一个行组
+        self.file_max_rows = max(self.row_group_rows if fmt == EXPORT_FORMAT_PARQUET else 1, int(file_max_rows))
+        self.columns: List[str] = []
+        self.files: List[Dict[str, Any]] = []
+        self.bytes_written = 0
+        self._pending: List[tuple] = []
+        self._fh = None
+        self._writer = None
+        self._schema = None
+        self._part_rows = 0
+
+    def _open_part(self, schema=None):
+        name = f"part-{len(self.files):05d}.{self.fmt}"
+        path = os.path.join(self.directory, name)
+        self.files.append({"name": name, "rows": 0, "bytes": 0})
+        self._part_rows = 0
+        if self.fmt == EXPORT_FORMAT_CSV:
+            self._fh = open(path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._fh)
+            self._writer.writerow(self.columns)
+        else:
+            import pyarrow.parquet as pq
+
+            self._schema = schema
+            self._writer = pq.ParquetWriter(path, schema)
+
+    def _close_part(self):
+        if self._writer is None:
+            return
+        if self.fmt == EXPORT_FORMAT_CSV:
+            self._fh.close()
+            self._fh = None
+        else:
+            self._writer.close()
+        self._writer = None
+        part = self.files[-1]
+        part["rows"] = self._part_rows
+        part["bytes"] = os.path.getsize(os.path.join(self.directory, part["name"]))
+        self.bytes_written += part["bytes"]
+
+    def _write_csv(self, rows: List[tuple]):
+        while rows:
+            if self._writer is None or self._part_rows >= self.file_max_rows:
+                self._close_part()
+                self._open_part()
+            n = min(len(rows), self.file_max_rows - self._part_rows)
+            self._writer.writerows(rows[:n])
+            self._part_rows += n
+            rows = rows[n:]
+
+    def _write_row_group(self, rows: List[tuple]):
+        import pyarrow as pa
+
+        names = _unique_names(self.columns)
+        if self._writer is not None and self._part_rows + len(rows) > self.file_max_rows:
+            self._close_part()
+        table = None
+        if self._writer is not None:
+            try:
+                table = pa.Table.from_arrays(arrow_arrays(names, rows, self._schema.types), schema=self._schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # 与当前分片的列类型不兼容：滚动到新分片并重新推断类型
+                self._close_part()
+        if table is None:
+            table = pa.Table.from_arrays(arrow_arrays(names, rows), names=names)
+            self._open_part(table.schema)
+        self._writer.write_table(table, row_group_size=max(1, len(rows)))
+        self._part_rows += len(rows)
+
+    def write(self, columns: List[str], rows: List[tuple]):
+        if not self.columns:
+            self.columns = list(columns)
+        if self.fmt == EXPORT_FORMAT_CSV:
+            if self._writer is None:
+                self._open_part()
+            self._write_csv(list(rows))
+            return
+        self._pending.extend(rows)
+        while len(self._pending) >= self.row_group_rows:
+            group, self._pending = self._pending[: self.row_group_rows], self._pending[self.row_group_rows:]
+            self._write_row_group(group)
+
+    def close(self):
+        if self._pending or (self.fmt == EXPORT_FORMAT_PARQUET and not self.files and self.columns):
+            # 剩余不足一个行组的行；空结果也写出仅含列定义的分片
+            self._write_row_group(self._pending)
+            self._pending = []
+        self._close_part()
+
+    def abort(self):
+        try:
+            self._close_part()
+        except Exception:
+            pass
+
+
+@dataclass
+class ExportJob:
+    export_id: int
+    ds: DataSource
+    sql: str
+    fmt: str
+    max_rows: Optional[int]
+    timeout_seconds: int
+    status: QueryStatus = QueryStatus.QUEUED
+    progress: int = 0
+    row_count: int = 0
+    columns: List[str] = field(default_factory=list)
+    files: List[Dict[str, Any]] = field(default_factory=list)
+    bytes_written: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expires_at: Optional[float] = None
+    user_key: Optional[str] = None
+    session: ServerSession = field(default_factory=ServerSession)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINAL_STATUSES
+
+    @property
+    def execution_time_ms(self) -> Optional[int]:
+        if self.started_at is None:
+            return None
+        return int(((self.finished_at or time.time()) - self.started_at) * 1000)
+
+    def manifest(self) -> Dict[str, Any]:
+        return {
+            "export_id": self.export_id,
+            "data_source_id": self.ds.id,
+            "format": self.fmt,
+            "columns": self.columns,
+            "row_count": self.row_count,
+            "bytes": self.bytes_written,
+            "files": self.files,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "expires_at": self.expires_at,
+        }
+
+
+def read_manifest(export_id: int) -> Optional[Dict[str, Any]]:
+    """读取导出清单；导出不存在、未完成或已过期时返回None。"""
+    path = os.path.join(export_dir(export_id), MANIFEST_NAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("expires_at") and manifest["expires_at"] < time.time():
+        return None
+    return manifest
+
+
+def export_file_path(manifest: Dict[str, Any], name: str) -> Optional[str]:
+    """按清单校验分片名（防止路径穿越），返回文件路径。"""
+    if not any(f.get("name") == name for f in manifest.get("files") or []):
+        return None
+    return os.path.join(export_dir(manifest["export_id"]), name)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """解析单段 Range: bytes=start-end / start- / -suffix，返回闭区间 (start, end)；
+    未指定或格式无法识别时返回None（返回完整文件），超出范围时抛出 RangeNotSatisfiableError。
+    """
+    if not header or not header.strip().lower().startswith("bytes="):
+        return None
+    spec = header.strip()[6:]
+    if "," in spec or "-" not in spec:
+        # 多段 Range 不支持，按完整文件返回
+        return None
+    first, last = (p.strip() for p in spec.split("-", 1))
+    # RangeNotSatisfiableError 继承自 ValueError，须在数值解析的 try 之外抛出
+    try:
+        suffix = int(last) if not first else None
+        start = int(first) if first else None
+        end = int(last) if first and last else size - 1
+    except ValueError:
+        return None
+    if suffix is not None:
+        if suffix <= 0 or size <= 0:
+            raise RangeNotSatisfiableError("Range 超出文件范围")
+        return max(0, size - suffix), size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiableError("Range 超出文件范围")
+    return start, min(end, size - 1)
+
+
+def iter_file(path: str, start: int, end: int) -> Iterator[bytes]:
+    """按块读取文件的闭区间 [start, end]（同步迭代器，StreamingResponse 在线程池中迭代）。"""
+    chunk = max(4096, int(settings.QUERY_EXPORT_DOWNLOAD_CHUNK_BYTES))
+    remaining = end - start + 1
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            data = f.read(min(chunk, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+class QueryExportManager:
+    def __init__(self, ttl_seconds: int = 86400):
+        self.ttl_seconds = max(60, int(ttl_seconds))
+        self._jobs: Dict[int, ExportJob] = {}
+        self._tasks: set = set()
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self.removed_total = 0
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            eid for eid, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl_seconds
+        ]
+        for eid in expired:
+            self._jobs.pop(eid, None)
+
+    def get(self, export_id: int) -> Optional[ExportJob]:
+        self._prune()
+        return self._jobs.get(export_id)
+
+    def submit(self, ds_service, job: ExportJob) -> ExportJob:
+        """登记导出任务并在后台执行；export_id 为已创建的 QUEUED 状态查询历史ID。"""
+        self._prune()
+        self._jobs[job.export_id] = job
+        task = asyncio.create_task(self._run(ds_service, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _run_blocking(self, ds_service, job: ExportJob) -> None:
+        if job.session.cancelled.is_set():
+            raise QueryCancelledError("导出已取消")
+        job.status = QueryStatus.RUNNING
+        job.started_at = time.time()
+        job.progress = 5
+        directory = export_dir(job.export_id)
+        os.makedirs(directory, exist_ok=True)
+        sink = _ExportSink(
+            directory,
+            job.fmt,
+            file_max_rows=settings.QUERY_EXPORT_FILE_MAX_ROWS,
+            row_group_rows=settings.QUERY_EXPORT_ROW_GROUP_ROWS,
+        )
+
+        def _emit(columns: List[str], batch: List[tuple]) -> bool:
+            if job.session.cancelled.is_set():
+                return False
+            sink.write(columns, batch)
+            job.columns = sink.columns
+            job.row_count += len(batch)
+            job.bytes_written = sink.bytes_written
+            if job.max_rows:
+                job.progress = min(99, 10 + int(89 * job.row_count / job.max_rows))
+            else:
+                job.progress = max(job.progress, 10)
+            return True
+
+        try:
+            ds_service.stream_sql_blocking(
+                job.ds,
+                job.sql,
+                _emit,
+                max_rows=job.max_rows,
+                timeout_seconds=job.timeout_seconds,
+                batch_size=settings.QUERY_EXPORT_BATCH_ROWS,
+                on_connection=job.session.on_connection,
+            )
+            if job.session.cancelled.is_set():
+                raise QueryCancelledError("导出已取消")
+            sink.close()
+        except BaseException:
+            sink.abort()
+            raise
+        job.files = sink.files
+        job.bytes_written = sink.bytes_written
+        job.finished_at = time.time()
+        job.expires_at = job.finished_at + self.ttl_seconds
+        # 先写临时文件再替换，下载方不会读到不完整的清单
+        path = os.path.join(directory, MANIFEST_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(job.manifest(), f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    async def _execute(self, ds_service, job: ExportJob):
+        await get_query_scheduler().run(job.ds.id, job.user_key, self._run_blocking, ds_service, job)
+
+    async def _run(self, ds_service, job: ExportJob):
+        runner = asyncio.ensure_future(self._execute(ds_service, job))
+        last_rows = -1
+        try:
+            # 执行期间定期回写进度与已导出行数
+            while True:
+                done, _ = await asyncio.wait({runner}, timeout=settings.QUERY_JOB_PROGRESS_INTERVAL_SECONDS)
+                if done:
+                    break
+                if job.status == QueryStatus.RUNNING and job.row_count != last_rows:
+                    last_rows = job.row_count
+                    await self._persist(job, status=QueryStatus.RUNNING, progress=job.progress, row_count=job.row_count)
+            runner.result()
+            job.status = QueryStatus.SUCCESS
+            job.progress = 100
+        except QueryCancelledError:
+            job.status = QueryStatus.CANCELLED
+            job.error = "导出已取消"
+        except Exception as e:
+            if job.session.cancelled.is_set():
+                job.status = QueryStatus.CANCELLED
+                job.error = "导出已取消"
+            else:
+                job.status = QueryStatus.ERROR
+                job.error = str(e)
+        finally:
+            if job.finished_at is None:
+                job.finished_at = time.time()
+            if job.status != QueryStatus.SUCCESS:
+                job.files = []
+                await asyncio.to_thread(shutil.rmtree, export_dir(job.export_id), True)
+            await self._persist(
+                job,
+                status=job.status,
+                progress=job.progress,
+                row_count=job.row_count if job.status == QueryStatus.SUCCESS else 0,
+                execution_time_ms=job.execution_time_ms,
+                error_message=job.error,
+                query_result=job.manifest() if job.status == QueryStatus.SUCCESS else None,
+            )
+            logger.info(
+                "导出任务结束: export_id={}, status={}, format={}, rows={}, files={}, bytes={}, ms={}",
+                job.export_id,
+                job.status.value,
+                job.fmt,
+                job.row_count,
+                len(job.files),
+                job.bytes_written,
+                job.execution_time_ms,
+            )
+
+    async def _persist(self, job: ExportJob, **values):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(QueryHistory).where(QueryHistory.id == job.export_id).values(**values))
+                await db.commit()
+        except Exception as e:
+            logger.warning("导出任务状态回写失败: export_id={}, err={}", job.export_id, e)
+
+    async def cancel(self, ds_service, job: ExportJob) -> bool:
+        """请求取消导出；排队中的导出不再执行，执行中的导出在服务端中止当前语句并删除已写出的分片。"""
+        if job.finished:
+            return False
+        await job.session.cancel(ds_service, job.ds)
+        return True
+
+    # ---------- 过期清理 ----------
+    def cleanup_blocking(self) -> int:
+        """删除过期导出目录；没有清单的目录（其他实例执行中或异常中断）按最近写入时间判断。"""
+        root = export_root()
+        if not os.path.isdir(root):
+            return 0
+        now = time.time()
+        removed = 0
+        for name in os.listdir(root):
+            directory = os.path.join(root, name)
+            if not os.path.isdir(directory) or (name.isdigit() and int(name) in self._jobs and not self._jobs[int(name)].finished):
+                continue
+            manifest_path = os.path.join(directory, MANIFEST_NAME)
+            expires_at = None
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    expires_at = json.load(f).get("expires_at")
+            except (OSError, ValueError):
+                pass
+            if expires_at is None:
+                try:
+                    latest = max([os.path.getmtime(directory)] + [e.stat().st_mtime for e in os.scandir(directory)])
+                except OSError:
+                    continue
+                expires_at = latest + self.ttl_seconds
+            if expires_at < now:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        self.removed_total += removed
+        return removed
+
+    async def start(self):
+        """启动过期导出清理任务（幂等）。"""
+        if self._cleanup_task is not None and not self._cleanup_task.done():
+            return
+        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def _cleanup_loop(self):
+        interval = max(10, int(settings.QUERY_EXPORT_CLEANUP_INTERVAL_SECONDS))
+        while True:
+            try:
+                removed = await asyncio.to_thread(self.cleanup_blocking)
+                if removed:
+                    logger.info("已删除过期导出: count={}", removed)
+            except Exception as e:
+                logger.warning("过期导出清理失败: {}", e)
+            await asyncio.sleep(interval)
+
+    async def stop(self):
+        """服务停止时通知未完成导出停止读取，并停止清理任务。"""
+        for job in list(self._jobs.values()):
+            if not job.finished:
+                job.session.cancelled.set()
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._cleanup_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status.value] = counts.get(job.status.value, 0) + 1
+        return {"tracked": len(self._jobs), "by_status": counts, "expired_removed_total": self.removed_total}
+
+
+_manager: Optional[QueryExportManager] = None
+
+
+def get_query_export_manager() -> QueryExportManager:
+    """获取全局导出任务管理器（仅在事件循环内使用）。"""
+    global _manager
+    if _manager is None:
+        _manager = QueryExportManager(ttl_seconds=settings.QUERY_EXPORT_TTL_SECONDS)
+    return _manager
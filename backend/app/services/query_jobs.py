@@ -0,0 +1,210 @@
+"""
+异步查询任务：
+- 提交后立即返回任务ID（即查询历史ID），查询在数据源专属执行线程池中运行，不占用请求与负载均衡连接；
+- 执行中以服务端游标逐批读取并更新进度，状态/进度/结果回写 aitt_query_history，可按ID轮询；
+- 取消时在独立连接上对执行该查询的服务端会话发出 KILL QUERY（MySQL）/ pg_cancel_backend（PostgreSQL），
+  见 app.services.query_cancel.ServerSession。
+任务注册表为进程内状态；其他实例或重启后仍可从查询历史读取状态与结果，但无法取消。
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+from sqlalchemy import update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.data_source import DataSource
+from app.models.query import QueryHistory, QueryStatus
+from app.services.query_cancel import ServerSession
+from app.services.query_scheduler import get_query_scheduler
+
+
+class JobCancelledError(Exception):
+    """任务已被取消"""
+
+
+_FINAL_STATUSES = (QueryStatus.SUCCESS, QueryStatus.ERROR, QueryStatus.TIMEOUT, QueryStatus.CANCELLED)
+
+
+@dataclass
+class QueryJob:
+    job_id: int
+    ds: DataSource
+    sql: str
+    max_rows: int
+    timeout_seconds: int
+    status: QueryStatus = QueryStatus.QUEUED
+    progress: int = 0
+    row_count: int = 0
+    columns: List[str] = field(default_factory=list)
+    rows: List[dict] = field(default_factory=list)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    user_key: Optional[str] = None
+    session: ServerSession = field(default_factory=ServerSession)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in _FINAL_STATUSES
+
+    @property
+    def execution_time_ms(self) -> Optional[int]:
+        if self.started_at is None:
+            return None
+        return int(((self.finished_at or time.time()) - self.started_at) * 1000)
+
+
+class QueryJobManager:
+    def __init__(self, ttl_seconds: int = 3600):
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self._jobs: Dict[int, QueryJob] = {}
+        self._tasks: set = set()
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            jid for jid, job in self._jobs.items()
+            if job.finished_at is not None and now - job.finished_at > self.ttl_seconds
+        ]
+        for jid in expired:
+            self._jobs.pop(jid, None)
+
+    def get(self, job_id: int) -> Optional[QueryJob]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    def submit(self, ds_service, job: QueryJob) -> QueryJob:
+        """登记任务并在后台执行；job_id 为已创建的 QUEUED 状态查询历史ID。"""
+        self._prune()
+        self._jobs[job.job_id] = job
+        task = asyncio.create_task(self._run(ds_service, job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _run_blocking(self, ds_service, job: QueryJob) -> None:
+        if job.session.cancelled.is_set():
+            raise JobCancelledError("任务已取消")
+        job.status = QueryStatus.RUNNING
+        job.started_at = time.time()
+        job.progress = 5
+
+        def _emit(columns: List[str], batch: List[tuple]) -> bool:
+            if job.session.cancelled.is_set():
+                return False
+            job.columns = columns
+            job.rows.extend(dict(zip(columns, r)) for r in batch)
+            job.row_count = len(job.rows)
+            # 首批结果返回即视为服务端执行完成，其余进度按已读取行数估算
+            job.progress = min(99, 10 + int(89 * job.row_count / max(1, job.max_rows)))
+            return True
+
+        ds_service.stream_sql_blocking(
+            job.ds,
+            job.sql,
+            _emit,
+            max_rows=job.max_rows,
+            timeout_seconds=job.timeout_seconds,
+            batch_size=settings.QUERY_STREAM_BATCH_ROWS,
+            on_connection=job.session.on_connection,
+        )
+        if job.session.cancelled.is_set():
+            raise JobCancelledError("任务已取消")
+
+    async def _execute(self, ds_service, job: QueryJob):
+        await get_query_scheduler().run(job.ds.id, job.user_key, self._run_blocking, ds_service, job)
+
+    async def _run(self, ds_service, job: QueryJob):
+        runner = asyncio.ensure_future(self._execute(ds_service, job))
+        last_progress = -1
+        try:
+            # 执行期间定期回写进度
+            while True:
+                done, _ = await asyncio.wait({runner}, timeout=settings.QUERY_JOB_PROGRESS_INTERVAL_SECONDS)
+                if done:
+                    break
+                if job.status == QueryStatus.RUNNING and job.progress != last_progress:
+                    last_progress = job.progress
+                    await self._persist(job, status=QueryStatus.RUNNING, progress=job.progress)
+            runner.result()
+            job.status = QueryStatus.SUCCESS
+            job.progress = 100
+        except JobCancelledError:
+            job.status = QueryStatus.CANCELLED
+            job.error = "任务已取消"
+            job.rows = []
+        except Exception as e:
+            if job.session.cancelled.is_set():
+                # KILL QUERY / pg_cancel_backend 使执行中的语句以错误结束
+                job.status = QueryStatus.CANCELLED
+                job.error = "任务已取消"
+            else:
+                job.status = QueryStatus.ERROR
+                job.error = str(e)
+            job.rows = []
+        finally:
+            job.finished_at = time.time()
+            await self._persist(
+                job,
+                status=job.status,
+                progress=job.progress,
+                row_count=job.row_count if job.status == QueryStatus.SUCCESS else 0,
+                execution_time_ms=job.execution_time_ms,
+                error_message=job.error,
+                query_result=self.result_payload(job) if job.status == QueryStatus.SUCCESS else None,
+            )
+            logger.info(
+                "查询任务结束: job_id={}, status={}, rows={}, ms={}",
+                job.job_id,
+                job.status.value,
+                job.row_count,
+                job.execution_time_ms,
+            )
+
+    @staticmethod
+    def result_payload(job: QueryJob) -> Dict[str, Any]:
+        return {"columns": job.columns, "rows": jsonable_encoder(job.rows)}
+
+    async def _persist(self, job: QueryJob, **values):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(QueryHistory).where(QueryHistory.id == job.job_id).values(**values))
+                await db.commit()
+        except Exception as e:
+            logger.warning("查询任务状态回写失败: job_id={}, err={}", job.job_id, e)
+
+    async def cancel(self, ds_service, job: QueryJob) -> bool:
+        """请求取消任务；排队中的任务不再执行，执行中的任务在服务端中止当前语句。返回是否发出了取消。"""
+        if job.finished:
+            return False
+        await job.session.cancel(ds_service, job.ds)
+        return True
+
+    def shutdown(self):
+        """服务停止时通知未完成任务停止读取结果。"""
+        for job in list(self._jobs.values()):
+            if not job.finished:
+                job.session.cancelled.set()
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status.value] = counts.get(job.status.value, 0) + 1
+        return {"tracked": len(self._jobs), "by_status": counts}
+
+
+_manager: Optional[QueryJobManager] = None
+
+
+def get_query_job_manager() -> QueryJobManager:
+    """获取全局查询任务管理器（仅在事件循环内使用）。"""
+    global _manager
+    if _manager is None:
+        _manager = QueryJobManager(ttl_seconds=settings.QUERY_JOB_TTL_SECONDS)
+    return _manager
@@ -0,0 +1,228 @@
+"""
+抽样近似执行（探索性预览）：
+- 仅改写单表查询（无CTE、连接、集合运算及子查询中的表），其余查询按原SQL精确执行并说明原因；
+- PostgreSQL：在表引用后追加 TABLESAMPLE SYSTEM (p) REPEATABLE (seed)，按数据页抽样；
+- MySQL：取元数据目录中的单列整数主键，按其最小/最大值把主键区间分为若干层，每层随机取一段连续范围，
+  表引用替换为 (SELECT * FROM t WHERE pk BETWEEN a1 AND b1 OR ...) AS t，每段走主键范围扫描，
+  总覆盖比例为 p（主键越稠密越接近实际抽样比例）；
+- 抽样位置由SQL指纹决定，同一查询重复预览得到相同样本，改写后的SQL也可命中结果缓存；
+- 结果标记为近似：非 DISTINCT 的 COUNT/SUM 输出列按 100/p 放大，AVG/MIN/MAX 等保持样本值。
+仅在事件循环内使用。
+"""
+import asyncio
+import decimal
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.models.data_source import DataSource, DataSourceType
+from app.services.metadata_catalog import get_metadata_catalog
+from app.services.sql_parser import ParsedSQL, parse_sql
+
+SAMPLE_METHOD_PK_RANGE = "pk_range"
+SAMPLE_METHOD_TABLESAMPLE = "tablesample_system"
+
+_INTEGER_TYPE_RE = re.compile(r"^\s*(tiny|small|medium|big)?int(eger)?\b|^\s*(big|small)?serial\b", re.IGNORECASE)
+
+
+@dataclass
+class SamplePlan:
+    sql: str
+    applied: bool = False
+    method: Optional[str] = None
+    table: Optional[str] = None
+    percent: Optional[float] = None
+    reason: Optional[str] = None
+    scaled_columns: List[str] = field(default_factory=list)
+
+    @property
+    def scale(self) -> float:
+        return 100.0 / self.percent if self.applied and self.percent else 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "applied": self.applied,
+            "method": self.method,
+            "table": self.table,
+            "percent": round(self.percent, 4) if self.percent else None,
+            "scale": round(self.scale, 4),
+            "scaled_columns": self.scaled_columns,
+            "reason": self.reason,
+        }
+
+
+def _quote(name: str, ds_type: DataSourceType) -> str:
+    if ds_type == DataSourceType.MYSQL:
+        return "`" + name.replace("`", "``") + "`"
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _seed(parsed: ParsedSQL) -> int:
+    return int(parsed.fingerprint[:8], 16) & 0x7FFFFFFF
+
+
+def _scale_value(value: Any, factor: float) -> Any:
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return int(round(value * factor))
+    if isinstance(value, decimal.Decimal):
+        scaled = value * decimal.Decimal(repr(factor))
+        try:
+            # 保持原有小数位数
+            return scaled.quantize(value)
+        except decimal.InvalidOperation:
+            return scaled
+    if isinstance(value, float):
+        return value * factor
+    return value
+
+
+def scale_results(plan: SamplePlan, rows: Sequence[Any], columns: List[str]) -> List[Any]:
+    """按抽样比例放大 COUNT/SUM 输出列，返回新的结果行（原行可能被结果缓存共享，不就地修改）。"""
+    if not plan.applied or not rows:
+        return list(rows)
+    positions = [p for p in parse_sql(plan.sql).additive_aggregates if p < len(columns)]
+    if not positions:
+        return list(rows)
+    plan.scaled_columns = [columns[p] for p in positions]
+    factor = plan.scale
+    out: List[Any] = []
+    for r in rows:
+        if isinstance(r, dict):
+            r = dict(r)
+            for p in positions:
+                r[columns[p]] = _scale_value(r.get(columns[p]), factor)
+        else:
+            r = list(r)
+            for p in positions:
+                r[p] = _scale_value(r[p], factor)
+            r = tuple(r)
+        out.append(r)
+    return out
+
+
+class QuerySampler:
+    def __init__(self, bounds_ttl_seconds: int = 300):
+        self.bounds_ttl_seconds = max(1, int(bounds_ttl_seconds))
+        # (数据源ID, 表名) -> (最小主键, 最大主键, 读取时间)
+        self._bounds: Dict[Tuple[int, str], Tuple[int, int, float]] = {}
+        # 指标
+        self.sampled_total = 0
+        self.exact_total = 0
+
+    @staticmethod
+    def _integer_pk(ds: DataSource, table: str, snapshot) -> Optional[str]:
+        t = snapshot.tables.get(table) if snapshot is not None else None
+        if t is None or (t.data_source_id is not None and int(t.data_source_id) != int(ds.id)):
+            return None
+        pk = [c for c in t.columns if c.is_pk]
+        if len(pk) != 1 or not _INTEGER_TYPE_RE.match(pk[0].type or ""):
+            return None
+        return pk[0].name
+
+    async def _pk_bounds(self, ds_service, ds: DataSource, ref_text: str, table: str, pk: str, user_key: Optional[str]) -> Optional[Tuple[int, int]]:
+        key = (int(ds.id), table)
+        cached = self._bounds.get(key)
+        if cached is not None and time.time() - cached[2] < self.bounds_ttl_seconds:
+            return cached[0], cached[1]
+        col = _quote(pk, ds.type)
+        # 主键最小/最大值由索引两端直接读取
+        rows, _ = await ds_service.execute_sql(
+            ds,
+            f"SELECT MIN({col}) AS lo, MAX({col}) AS hi FROM {ref_text}",
+            max_rows=1,
+            timeout_seconds=10,
+            user_key=user_key,
+        )
+        if not rows or rows[0].get("lo") is None:
+            return None
+        lo, hi = int(rows[0]["lo"]), int(rows[0]["hi"])
+        self._bounds[key] = (lo, hi, time.time())
+        return lo, hi
+
+    @staticmethod
+    def _pk_ranges(lo: int, hi: int, percent: float, seed: int) -> Tuple[List[Tuple[int, int]], float]:
+        """分层取主键范围：返回 ([(起, 止)], 实际覆盖比例%)。"""
+        total = hi - lo + 1
+        want = max(1, int(total * percent / 100))
+        layers = max(1, min(int(settings.QUERY_SAMPLE_PK_RANGES), want))
+        span = max(1, want // layers)
+        stratum = total / layers
+        rng = random.Random(seed)
+        ranges = []
+        for k in range(layers):
+            begin = lo + int(k * stratum)
+            room = max(0, int(stratum) - span)
+            a = begin + rng.randint(0, room)
+            ranges.append((a, min(hi, a + span - 1)))
+        covered = sum(b - a + 1 for a, b in ranges)
+        return ranges, min(100.0, covered * 100.0 / total)
+
+    async def plan(self, ds_service, ds: DataSource, sql: str, percent: float, user_key: Optional[str] = None) -> SamplePlan:
+        """生成抽样执行计划；无法抽样时返回 applied=False 的计划（sql 为原查询）并说明原因。"""
+        parsed = parse_sql(sql, ds.type)
+        plan = SamplePlan(sql=sql)
+        percent = float(percent)
+        ref = parsed.single_table_ref
+        if percent >= 100:
+            plan.reason = "抽样比例不小于100%，按原查询执行"
+        elif ds.type not in (DataSourceType.MYSQL, DataSourceType.POSTGRESQL):
+            plan.reason = f"暂不支持该类型的抽样: {ds.type}"
+        elif ref is None:
+            plan.reason = "仅支持单表查询抽样（不含连接、子查询与CTE）"
+        if plan.reason:
+            self.exact_total += 1
+            return plan
+        text = parsed.sql
+        plan.table = ref.name
+        if ds.type == DataSourceType.POSTGRESQL:
+            plan.sql = (
+                f"{text[:ref.alias_end]} TABLESAMPLE SYSTEM ({percent:g}) REPEATABLE ({_seed(parsed)})"
+                f"{text[ref.alias_end:]}"
+            )
+            plan.method, plan.percent = SAMPLE_METHOD_TABLESAMPLE, percent
+        else:
+            snapshot = await asyncio.to_thread(get_metadata_catalog().get, True)
+            pk = self._integer_pk(ds, ref.name, snapshot)
+            ref_text = text[ref.start:ref.end]
+            bounds = await self._pk_bounds(ds_service, ds, ref_text, ref.name, pk, user_key) if pk else None
+            if bounds is None:
+                plan.table = None
+                plan.reason = "表没有单列整数主键，按原查询执行" if pk is None else "表为空，按原查询执行"
+                self.exact_total += 1
+                return plan
+            ranges, actual = self._pk_ranges(bounds[0], bounds[1], percent, _seed(parsed))
+            col = _quote(pk, ds.type)
+            where = " OR ".join(f"{col} BETWEEN {a} AND {b}" for a, b in ranges)
+            alias = ref.alias or _quote(ref.name, ds.type)
+            plan.sql = f"{text[:ref.start]}(SELECT * FROM {ref_text} WHERE {where}) AS {alias}{text[ref.alias_end:]}"
+            plan.method, plan.percent = SAMPLE_METHOD_PK_RANGE, actual
+        plan.applied = True
+        self.sampled_total += 1
+        return plan
+
+    def invalidate(self, ds_id: int):
+        for key in [k for k in self._bounds if k[0] == int(ds_id)]:
+            self._bounds.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sampled_total": self.sampled_total,
+            "exact_total": self.exact_total,
+            "cached_pk_bounds": len(self._bounds),
+        }
+
+
+_sampler: Optional[QuerySampler] = None
+
+
+def get_query_sampler() -> QuerySampler:
+    """获取全局抽样执行器（仅在事件循环内使用）。"""
+    global _sampler
+    if _sampler is None:
+        _sampler = QuerySampler(bounds_ttl_seconds=settings.QUERY_SAMPLE_BOUNDS_TTL_SECONDS)
+    return _sampler
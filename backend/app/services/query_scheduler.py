@@ -0,0 +1,220 @@
+"""
+数据源查询准入与公平调度：
+- 每个数据源限定同时执行的查询数（默认值 + 按数据源覆盖），超出的请求排队；
+- 排队按用户加权公平（开始时间公平排队 SFQ）：每个请求的虚拟开始标签为
+  max(当前虚拟时间, 该用户上一请求的结束标签)，结束标签 = 开始标签 + 1/权重，总是放行标签最小的请求，
+  单个用户的突发请求只会排在自己的队列后面，不会饿死其他用户；
+- 排队数超过上限或等待超时立即失败（视同执行队列已满，接口返回 503）；
+- 记录放行/拒绝/超时次数、运行与排队数、排队等待耗时分位，供健康检查观察。
+仅在事件循环内使用。
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from fastapi import Request
+
+from app.core.config import settings
+from app.services.query_executor import ExecutorBusyError, get_query_executor
+from app.utils.security import verify_token
+
+
+class SchedulerRejectedError(ExecutorBusyError):
+    """排队已满或排队等待超时"""
+
+
+ANONYMOUS_USER = "anonymous"
+
+
+def user_key_from_request(request: Optional[Request]) -> str:
+    """调度用的用户标识：优先取访问令牌中的 sub，其次客户端IP。"""
+    if request is None:
+        return ANONYMOUS_USER
+    auth = request.headers.get("authorization") or ""
+    if auth.lower().startswith("bearer "):
+        payload = verify_token(auth[7:].strip())
+        sub = (payload or {}).get("sub")
+        if sub and sub != ANONYMOUS_USER:
+            return f"user:{sub}"
+    if request.client and request.client.host:
+        return f"ip:{request.client.host}"
+    return ANONYMOUS_USER
+
+
+class _Waiter:
+    __slots__ = ("user", "future", "enqueued_at")
+
+    def __init__(self, user: str, future: asyncio.Future):
+        self.user = user
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class DataSourceScheduler:
+    def __init__(self, ds_id: int, max_concurrency: int = 4, max_queue: int = 64, queue_timeout_seconds: float = 10):
+        self.ds_id = ds_id
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout_seconds = max(0.1, float(queue_timeout_seconds))
+        self._running = 0
+        self._heap: List[tuple] = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._vtime = 0.0
+        self._user_finish: Dict[str, float] = {}
+        self._user_queued: Dict[str, int] = {}
+        # 指标
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self.timeouts_total = 0
+        self._waits: Deque[int] = deque(maxlen=500)
+
+    @staticmethod
+    def _weight(user: str) -> float:
+        try:
+            return max(0.01, float(settings.QUERY_SCHEDULER_USER_WEIGHTS.get(user, 1.0)))
+        except (TypeError, ValueError):
+            return 1.0
+
+    def _admit(self, waited_ms: int):
+        self._running += 1
+        self.admitted_total += 1
+        self._waits.append(waited_ms)
+
+    def _dequeue(self, waiter: _Waiter):
+        self._queued -= 1
+        self._user_queued[waiter.user] -= 1
+        if not self._user_queued[waiter.user]:
+            self._user_queued.pop(waiter.user, None)
+
+    def _dispatch(self):
+        while self._heap and self._running < self.max_concurrency:
+            start_tag, _, waiter = heapq.heappop(self._heap)
+            if waiter.future.done():
+                # 已超时或已取消的等待者（出队计数已在放弃时扣除）
+                continue
+            self._dequeue(waiter)
+            self._vtime = max(self._vtime, start_tag)
+            self._admit(int((time.perf_counter() - waiter.enqueued_at) * 1000))
+            waiter.future.set_result(None)
+
+    async def acquire(self, user: str):
+        if self._running < self.max_concurrency and not self._queued:
+            self._admit(0)
+            return
+        if self._queued >= self.max_queue:
+            self.rejected_total += 1
+            raise SchedulerRejectedError(f"数据源{self.ds_id}排队查询过多，请稍后重试")
+        start_tag = max(self._vtime, self._user_finish.get(user, 0.0))
+        self._user_finish[user] = start_tag + 1.0 / self._weight(user)
+        waiter = _Waiter(user, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, (start_tag, next(self._seq), waiter))
+        self._queued += 1
+        self._user_queued[user] = self._user_queued.get(user, 0) + 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                # 超时与放行同时发生：已占用名额，照常执行
+                return
+            waiter.future.cancel()
+            self._dequeue(waiter)
+            self.timeouts_total += 1
+            raise SchedulerRejectedError(f"数据源{self.ds_id}查询排队超时（{self.queue_timeout_seconds:g}秒），请稍后重试")
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已放行但调用方被取消：归还名额
+                self.release()
+            else:
+                waiter.future.cancel()
+                self._dequeue(waiter)
+            raise
+
+    def release(self):
+        self._running -= 1
+        self._dispatch()
+        if not self._queued and not self._running:
+            # 空闲时重置虚拟时间，避免标签无限增长
+            self._vtime = 0.0
+            self._user_finish.clear()
+
+    @staticmethod
+    def _percentile(values, q: float) -> Optional[int]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def stats(self) -> Dict[str, Any]:
+        waits = list(self._waits)
+        return {
+            "data_source_id": self.ds_id,
+            "max_concurrency": self.max_concurrency,
+            "running": self._running,
+            "queued": self._queued,
+            "queued_by_user": dict(self._user_queued),
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "timeouts_total": self.timeouts_total,
+            "queue_wait_p50_ms": self._percentile(waits, 0.5),
+            "queue_wait_p95_ms": self._percentile(waits, 0.95),
+        }
+
+
+class QueryScheduler:
+    def __init__(self):
+        self._schedulers: Dict[int, DataSourceScheduler] = {}
+
+    def _get(self, ds_id: int) -> DataSourceScheduler:
+        sched = self._schedulers.get(ds_id)
+        if sched is None:
+            limit = settings.QUERY_SCHEDULER_DS_CONCURRENCY.get(str(ds_id), settings.QUERY_SCHEDULER_MAX_CONCURRENCY)
+            sched = DataSourceScheduler(
+                ds_id,
+                max_concurrency=limit,
+                max_queue=settings.QUERY_SCHEDULER_MAX_QUEUE,
+                queue_timeout_seconds=settings.QUERY_SCHEDULER_QUEUE_TIMEOUT_SECONDS,
+            )
+            self._schedulers[ds_id] = sched
+        return sched
+
+    async def run(self, ds_id: int, user: Optional[str], fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """占用数据源的一个执行名额后，在数据源专属线程池中执行同步函数；未启用调度时直接执行。
+        名额在线程中的任务真正结束时归还，而非等待方被取消时：被放弃等待的查询仍在执行，继续占用名额。
+        """
+        if not settings.QUERY_SCHEDULER_ENABLED:
+            return await get_query_executor().run(ds_id, fn, *args, **kwargs)
+        sched = self._get(ds_id)
+        await sched.acquire(user or ANONYMOUS_USER)
+        loop = asyncio.get_running_loop()
+
+        def _release():
+            # 可能在工作线程中调用；调度器仅在事件循环内使用，转交回事件循环执行
+            try:
+                loop.call_soon_threadsafe(sched.release)
+            except RuntimeError:
+                # 事件循环已关闭（服务停止）
+                pass
+
+        return await get_query_executor().run(ds_id, fn, *args, on_done=_release, **kwargs)
+
+    def invalidate(self, ds_id: int):
+        # 正在排队/执行的请求仍持有旧调度器引用，按旧名额结束；新请求使用新配置
+        self._schedulers.pop(ds_id, None)
+
+    def stats(self):
+        return [s.stats() for s in self._schedulers.values()]
+
+
+_scheduler: Optional[QueryScheduler] = None
+
+
+def get_query_scheduler() -> QueryScheduler:
+    """获取全局查询调度器（仅在事件循环内使用）。"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = QueryScheduler()
+    return _scheduler
@@ -0,0 +1,322 @@
+"""
+只读副本路由：
+- 数据源可配置若干只读副本（replicas），只读查询（执行、流式读取、EXPLAIN）按策略分流到副本，
+  连接池按 (数据源, 节点) 独立维护；元数据同步、连接测试等仍走主库；
+- 策略：round_robin 轮询 / least_connections 选借出连接最少的副本 / primary 仅主库；
+- 后台任务定期检查副本：借连接探活并读取复制延迟（MySQL SHOW REPLICA STATUS，旧版本 SHOW SLAVE STATUS；
+  PostgreSQL 按 WAL 回放时间估算），不可达、复制已停止或延迟超过阈值的副本不参与路由；
+  设置了延迟阈值时，延迟未知（无权限查看复制状态）的副本同样不参与路由，除非开启 REPLICA_ALLOW_UNKNOWN_LAG；
+  未完成首次检查的副本暂不参与路由；
+- 没有可用副本或借副本连接失败时回退主库（借连接失败的副本同时标记为不健康，待下次检查恢复）。
+连接的借出可在执行线程中进行，状态读写持锁。
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pymysql
+from loguru import logger
+
+from app.core.config import settings
+from app.models.data_source import DataSource, DataSourceType
+from app.services.connection_pool import (
+    _BROKEN_CONN_ERRORS,
+    DataSourcePool,
+    PoolTimeoutError,
+    PooledConnection,
+    get_pool_manager,
+    replica_node,
+)
+
+STRATEGY_ROUND_ROBIN = "round_robin"
+STRATEGY_LEAST_CONNECTIONS = "least_connections"
+STRATEGY_PRIMARY = "primary"
+
+# 备库 WAL 已全部回放时延迟为0（主库无写入时回放时间戳不再前进，不能直接按其计算）
+_PG_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class ReplicationStoppedError(Exception):
+    """副本复制线程已停止（延迟未知，数据可能严重过期）"""
+
+
+@dataclass
+class ReplicaState:
+    node: str
+    healthy: bool = False
+    checked: bool = False
+    lag_seconds: Optional[float] = None
+    checked_at: Optional[float] = None
+    last_error: Optional[str] = None
+    routed_total: int = 0
+    failures_total: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "node": self.node,
+            "healthy": self.healthy,
+            "checked": self.checked,
+            "lag_seconds": round(self.lag_seconds, 3) if self.lag_seconds is not None else None,
+            "checked_ago_seconds": round(time.time() - self.checked_at, 1) if self.checked_at else None,
+            "last_error": self.last_error,
+            "routed_total": self.routed_total,
+            "failures_total": self.failures_total,
+        }
+
+
+def _replication_lag(conn: PooledConnection) -> Optional[float]:
+    """读取副本复制延迟（秒）。非复制节点返回0；无权限查看复制状态时返回None（延迟未知）。"""
+    if conn.kind == DataSourceType.MYSQL:
+        with conn.raw.cursor() as cur:
+            for stmt, col in (
+                ("SHOW REPLICA STATUS", "Seconds_Behind_Source"),
+                ("SHOW SLAVE STATUS", "Seconds_Behind_Master"),
+            ):
+                try:
+                    cur.execute(stmt)
+                except pymysql.MySQLError as e:
+                    # 客户端错误（2xxx，连接中断等）向上抛出；语法不支持或无 REPLICATION CLIENT 权限时尝试下一条
+                    if e.args and isinstance(e.args[0], int) and e.args[0] >= 2000:
+                        raise
+                    continue
+                row = cur.fetchone()
+                if not row:
+                    return 0.0
+                if row.get(col) is None:
+                    raise ReplicationStoppedError("复制线程未运行")
+                return float(row[col])
+        return None
+    with conn.raw.cursor() as cur:
+        cur.execute(_PG_LAG_SQL)
+        row = cur.fetchone()
+        return float(row[0]) if row and row[0] is not None else 0.0
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 数据源ID -> 最近一次路由使用的数据源配置（后台检查据此得到副本列表）
+        self._sources: Dict[int, DataSource] = {}
+        # (数据源ID, 节点) -> 副本状态
+        self._states: Dict[Tuple[int, str], ReplicaState] = {}
+        self._rr: Dict[int, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        # 指标
+        self.replica_routed_total = 0
+        self.primary_fallback_total = 0
+        self.failover_total = 0
+
+    @staticmethod
+    def replicas(ds: DataSource) -> List[Dict[str, Any]]:
+        items = getattr(ds, "replicas", None) or []
+        return [r for r in items if isinstance(r, dict) and r.get("host") and r.get("port")]
+
+    @staticmethod
+    def strategy(ds: DataSource) -> str:
+        return getattr(ds, "replica_strategy", None) or settings.REPLICA_STRATEGY
+
+    @staticmethod
+    def max_lag_seconds(ds: DataSource) -> int:
+        value = getattr(ds, "max_replica_lag_seconds", None)
+        return int(settings.REPLICA_MAX_LAG_SECONDS if value is None else value)
+
+    def find(self, ds: DataSource, node: str) -> Optional[Dict[str, Any]]:
+        """按节点标识查找副本配置。"""
+        for r in self.replicas(ds):
+            if replica_node(r) == node:
+                return r
+        return None
+
+    def _eligible(self, ds_id: int, replica: Dict[str, Any], max_lag: int) -> bool:
+        state = self._states.get((ds_id, replica_node(replica)))
+        if state is None or not state.healthy:
+            return False
+        # 阈值为0表示不限制；延迟未知（无权限查看复制状态）时无法保证阈值，默认不参与路由，
+        # 显式开启 REPLICA_ALLOW_UNKNOWN_LAG 后仅按连通性判断
+        if max_lag <= 0:
+            return True
+        if state.lag_seconds is None:
+            return settings.REPLICA_ALLOW_UNKNOWN_LAG
+        return state.lag_seconds <= max_lag
+
+    def choose(self, ds: DataSource) -> Optional[Dict[str, Any]]:
+        """按策略选择一个可用副本；返回None表示使用主库。"""
+        replicas = self.replicas(ds)
+        if not settings.REPLICA_ROUTING_ENABLED or not replicas or self.strategy(ds) == STRATEGY_PRIMARY:
+            return None
+        strategy = self.strategy(ds)
+        max_lag = self.max_lag_seconds(ds)
+        with self._lock:
+            # 配置变化时数据源服务会调用 invalidate，此处保留首次登记的配置，后台检查结果据此归属
+            self._sources.setdefault(ds.id, ds)
+            candidates = [r for r in replicas if self._eligible(ds.id, r, max_lag)]
+            if not candidates:
+                self.primary_fallback_total += 1
+                return None
+            start = self._rr.get(ds.id, 0)
+            self._rr[ds.id] = start + 1
+            ordered = candidates[start % len(candidates):] + candidates[:start % len(candidates)]
+        if strategy == STRATEGY_LEAST_CONNECTIONS:
+            # 尚未建池的副本借出数为0；借出数相同时按轮询顺序
+            manager = get_pool_manager()
+
+            def _in_use(r: Dict[str, Any]) -> int:
+                pool = manager.peek(ds.id, replica_node(r))
+                return pool.in_use() if pool is not None else 0
+
+            picked = min(ordered, key=_in_use)
+        else:
+            picked = ordered[0]
+        with self._lock:
+            state = self._states.get((ds.id, replica_node(picked)))
+            if state is not None:
+                state.routed_total += 1
+            self.replica_routed_total += 1
+        return picked
+
+    def mark_failed(self, ds_id: int, node: str, error: Exception):
+        with self._lock:
+            state = self._states.setdefault((ds_id, node), ReplicaState(node=node))
+            state.healthy = False
+            state.failures_total += 1
+            state.last_error = str(error)
+
+    def acquire(self, ds: DataSource, timeout: Optional[float] = None) -> Tuple[DataSourcePool, PooledConnection]:
+        """为只读查询借出连接：优先按策略选择的副本，不可用时回退主库。返回 (连接池, 连接)，用完需归还到该连接池。"""
+        replica = self.choose(ds)
+        manager = get_pool_manager()
+        if replica is not None:
+            pool = manager.get_pool(ds, replica)
+            try:
+                return pool, pool.acquire(timeout)
+            except PoolTimeoutError:
+                # 副本连接池已满：本次回退主库，不影响副本健康状态
+                pass
+            except Exception as e:
+                self.mark_failed(ds.id, pool.node, e)
+                logger.warning("只读副本连接失败，回退主库: data_source_id={}, node={}, err={}", ds.id, pool.node, e)
+            with self._lock:
+                self.failover_total += 1
+        pool = manager.get_pool(ds)
+        return pool, pool.acquire(timeout)
+
+    @contextmanager
+    def connection(self, ds: DataSource, timeout: Optional[float] = None) -> Iterator[PooledConnection]:
+        pool, conn = self.acquire(ds, timeout)
+        broken = False
+        try:
+            yield conn
+        except Exception as e:
+            broken = type(e).__name__ in _BROKEN_CONN_ERRORS
+            raise
+        finally:
+            pool.release(conn, broken=broken)
+
+    def _check_blocking(self, ds: DataSource, replica: Dict[str, Any]):
+        node = replica_node(replica)
+        timeout = max(1, int(settings.REPLICA_CHECK_TIMEOUT_SECONDS))
+        lag: Optional[float] = None
+        error: Optional[str] = None
+        try:
+            with get_pool_manager().connection(ds, timeout=timeout, replica=replica) as conn:
+                conn.set_timeout(timeout)
+                lag = _replication_lag(conn)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        with self._lock:
+            if self._sources.get(ds.id) is not ds:
+                # 检查期间数据源已失效或配置已更新
+                return
+            state = self._states.setdefault((ds.id, node), ReplicaState(node=node))
+            was_healthy, first = state.healthy, not state.checked
+            state.checked = True
+            state.checked_at = time.time()
+            state.healthy = error is None
+            state.lag_seconds = lag
+            state.last_error = error
+        if error is not None and (was_healthy or first):
+            logger.warning("只读副本检查未通过: data_source_id={}, node={}, err={}", ds.id, node, error)
+        elif error is None and not was_healthy:
+            logger.info("只读副本可用: data_source_id={}, node={}, lag={}", ds.id, node, lag)
+
+    async def check_all(self):
+        with self._lock:
+            sources = list(self._sources.values())
+        jobs = [(ds, r) for ds in sources for r in self.replicas(ds)]
+        if jobs:
+            await asyncio.gather(*(asyncio.to_thread(self._check_blocking, ds, r) for ds, r in jobs))
+
+    def invalidate(self, ds_id: int):
+        """数据源更新/删除后清除其副本状态（下次路由时重新登记并检查）。"""
+        with self._lock:
+            self._sources.pop(ds_id, None)
+            self._rr.pop(ds_id, None)
+            for key in [k for k in self._states if k[0] == ds_id]:
+                self._states.pop(key, None)
+
+    async def start(self):
+        """启动副本检查任务（幂等）。"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        interval = max(1, int(settings.REPLICA_HEALTH_CHECK_INTERVAL_SECONDS))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.check_all()
+            except Exception as e:
+                logger.warning("只读副本检查失败: {}", e)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sources = list(self._sources.values())
+            data_sources = []
+            for ds in sources:
+                data_sources.append({
+                    "data_source_id": ds.id,
+                    "strategy": self.strategy(ds),
+                    "max_lag_seconds": self.max_lag_seconds(ds),
+                    "replicas": [
+                        (self._states.get((ds.id, replica_node(r))) or ReplicaState(node=replica_node(r))).to_dict()
+                        for r in self.replicas(ds)
+                    ],
+                })
+            return {
+                "enabled": settings.REPLICA_ROUTING_ENABLED,
+                "replica_routed_total": self.replica_routed_total,
+                "primary_fallback_total": self.primary_fallback_total,
+                "failover_total": self.failover_total,
+                "data_sources": data_sources,
+            }
+
+
+_router: Optional[ReplicaRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_replica_router() -> ReplicaRouter:
+    """获取全局只读副本路由器单例。"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ReplicaRouter()
+    return _router
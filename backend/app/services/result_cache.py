@@ -0,0 +1,236 @@
+"""
+查询结果缓存（Redis）：
+- 键为 (数据源ID, 归一化SQL指纹, max_rows)，值为 zlib 压缩的 JSON，过期时间取 CACHE_EXPIRE_MINUTES；
+- 受 ENABLE_QUERY_CACHE 总开关控制，请求可通过 use_cache / refresh_cache 绕过或强制刷新；
+- 防击穿：进程内同键请求合并为一次执行（singleflight），跨进程以 SET NX 锁保证仅一个实例回源，
+  其余实例在锁有效期内轮询等待缓存写入，超时后自行执行；
+- Redis 不可用时直接回源执行，并在短时间内不再尝试连接。
+"""
+import asyncio
+import json
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from loguru import logger
+
+from app.core.config import settings
+from app.services.sql_parser import parse_sql
+
+
+_KEY = "aitt:qcache:{}:{}:{}"
+_LOCK_KEY = "aitt:qcache_lock:{}:{}:{}"
+
+
+@dataclass
+class CachedResult:
+    rows: List[dict]
+    columns: List[str]
+    cached_at: float
+    hit: bool = False
+
+    @property
+    def age_seconds(self) -> float:
+        return round(max(0.0, time.time() - self.cached_at), 3)
+
+
+def _encode(rows: List[dict], columns: List[str], cached_at: float) -> bytes:
+    # 与接口响应相同的 JSON 编码（Decimal/日期等），保证命中与未命中时返回一致
+    payload = {"rows": jsonable_encoder(rows), "columns": columns, "cached_at": cached_at}
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _decode(raw: bytes) -> CachedResult:
+    data = json.loads(zlib.decompress(raw).decode("utf-8"))
+    return CachedResult(rows=data["rows"], columns=data["columns"], cached_at=float(data["cached_at"]), hit=True)
+
+
+class QueryResultCache:
+    def __init__(self, ttl_seconds: int = 3600, lock_ttl_seconds: int = 30, max_bytes: int = 2 * 1024 * 1024):
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.lock_ttl_seconds = max(1, int(lock_ttl_seconds))
+        self.max_bytes = max(1024, int(max_bytes))
+        self._inflight: Dict[Tuple[int, str, int], asyncio.Future] = {}
+        self._waiters: Dict[Tuple[int, str, int], int] = {}
+        self._redis_retry_at = 0.0
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    @staticmethod
+    def key_parts(ds_id: int, sql: str, max_rows: int) -> Tuple[int, str, int]:
+        return int(ds_id), parse_sql(sql).fingerprint, int(max_rows)
+
+    async def _redis(self):
+        if time.time() < self._redis_retry_at:
+            return None
+        from app.core.database import get_redis_binary
+        return await get_redis_binary()
+
+    def _redis_failed(self, e: Exception):
+        self.errors += 1
+        self._redis_retry_at = time.time() + 30
+        logger.warning("查询结果缓存Redis不可用，暂时直接回源: {}", e)
+
+    async def get(self, parts: Tuple[int, str, int]) -> Optional[CachedResult]:
+        try:
+            r = await self._redis()
+            if r is None:
+                return None
+            raw = await r.get(_KEY.format(*parts))
+            return _decode(raw) if raw else None
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+
+    async def put(self, parts: Tuple[int, str, int], rows: List[dict], columns: List[str]) -> float:
+        cached_at = time.time()
+        try:
+            r = await self._redis()
+            if r is None:
+                return cached_at
+            blob = _encode(rows, columns, cached_at)
+            if len(blob) > self.max_bytes:
+                logger.info("查询结果过大不缓存: key={}, bytes={}", parts, len(blob))
+                return cached_at
+            await r.set(_KEY.format(*parts), blob, ex=self.ttl_seconds)
+            self.stores += 1
+        except Exception as e:
+            self._redis_failed(e)
+        return cached_at
+
+    async def invalidate_data_source(self, ds_id: int):
+        """删除某数据源的全部缓存结果（数据源更新/删除时调用）。"""
+        try:
+            r = await self._redis()
+            if r is None:
+                return
+            keys = [k async for k in r.scan_iter(match=_KEY.format(int(ds_id), "*", "*"), count=500)]
+            if keys:
+                await r.delete(*keys)
+        except Exception as e:
+            self._redis_failed(e)
+
+    async def _acquire_lock(self, parts) -> Optional[bool]:
+        """跨进程回源锁；Redis不可用时返回None。"""
+        try:
+            r = await self._redis()
+            if r is None:
+                return None
+            return bool(await r.set(_LOCK_KEY.format(*parts), b"1", nx=True, ex=self.lock_ttl_seconds))
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+
+    async def _release_lock(self, parts):
+        try:
+            r = await self._redis()
+            if r is not None:
+                await r.delete(_LOCK_KEY.format(*parts))
+        except Exception:
+            pass
+
+    async def _wait_for_peer(self, parts) -> Optional[CachedResult]:
+        """其他实例持有回源锁时轮询等待其写入缓存。"""
+        deadline = time.monotonic() + self.lock_ttl_seconds
+        delay = 0.05
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            cached = await self.get(parts)
+            if cached is not None:
+                return cached
+            delay = min(delay * 2, 0.5)
+        return None
+
+    async def get_or_execute(
+        self,
+        ds_id: int,
+        sql: str,
+        max_rows: int,
+        execute: Callable[[], Awaitable[Tuple[List[dict], List[str]]]],
+        use_cache: bool = True,
+        refresh: bool = False,
+    ) -> CachedResult:
+        """读取缓存，未命中时合并同键请求并回源执行后写入缓存。"""
+        if not settings.ENABLE_QUERY_CACHE or not use_cache:
+            rows, columns = await execute()
+            return CachedResult(rows=rows, columns=columns, cached_at=time.time())
+        parts = self.key_parts(ds_id, sql, max_rows)
+        if not refresh:
+            cached = await self.get(parts)
+            if cached is not None:
+                self.hits += 1
+                return cached
+        self.misses += 1
+        inflight = self._inflight.get(parts)
+        if inflight is not None:
+            self.coalesced += 1
+            self._waiters[parts] = self._waiters.get(parts, 0) + 1
+            try:
+                return await asyncio.shield(inflight)
+            finally:
+                self._waiters[parts] -= 1
+                if not self._waiters[parts]:
+                    self._waiters.pop(parts, None)
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._inflight[parts] = fut
+        try:
+            result = await self._load(parts, execute, refresh)
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            # 避免无等待者时出现“未获取的异常”告警
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(parts, None)
+
+    def is_shared(self, ds_id: int, sql: str, max_rows: int) -> bool:
+        """是否有其他请求正在等待同键的回源执行结果（此时不应因单个请求断开而中止执行）。"""
+        return self._waiters.get(self.key_parts(ds_id, sql, max_rows), 0) > 0
+
+    async def _load(self, parts, execute, refresh: bool) -> CachedResult:
+        locked = await self._acquire_lock(parts)
+        if locked is False and not refresh:
+            cached = await self._wait_for_peer(parts)
+            if cached is not None:
+                self.hits += 1
+                return cached
+        try:
+            rows, columns = await execute()
+            cached_at = await self.put(parts, rows, columns)
+            return CachedResult(rows=rows, columns=columns, cached_at=cached_at)
+        finally:
+            if locked:
+                await self._release_lock(parts)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": bool(settings.ENABLE_QUERY_CACHE),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+        }
+
+
+_cache: Optional[QueryResultCache] = None
+
+
+def get_result_cache() -> QueryResultCache:
+    """获取全局查询结果缓存（仅在事件循环内使用）。"""
+    global _cache
+    if _cache is None:
+        _cache = QueryResultCache(
+            ttl_seconds=settings.CACHE_EXPIRE_MINUTES * 60,
+            lock_ttl_seconds=settings.QUERY_CACHE_LOCK_SECONDS,
+            max_bytes=settings.QUERY_CACHE_MAX_BYTES,
+        )
+    return _cache
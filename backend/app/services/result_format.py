@@ -0,0 +1,170 @@
+"""
+查询结果的列式输出格式（按 Accept 头协商）：
+- application/vnd.apache.arrow.stream：Apache Arrow IPC 流，Decimal/日期/时间等类型原样保留（需安装 pyarrow）；
+- application/vnd.aitt.columnar+json：紧凑列式 JSON {columns, rows: [[...]]}，列名只出现一次；
+- 其他（含 application/json、*/*、未指定）：沿用 DataResponse[QueryResponse] 的逐行字典格式。
+两种列式格式均直接由游标返回的元组构建，不经过逐行字典与 Pydantic 校验。
+"""
+import datetime
+import decimal
+import json
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+RESULT_FORMAT_JSON = "json"
+RESULT_FORMAT_COLUMNAR = "columnar"
+RESULT_FORMAT_ARROW = "arrow"
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.aitt.columnar+json"
+
+_MEDIA_FORMATS = {
+    ARROW_STREAM_MEDIA_TYPE: RESULT_FORMAT_ARROW,
+    COLUMNAR_JSON_MEDIA_TYPE: RESULT_FORMAT_COLUMNAR,
+    "application/json": RESULT_FORMAT_JSON,
+    "application/*": RESULT_FORMAT_JSON,
+    "*/*": RESULT_FORMAT_JSON,
+}
+
+
+class FormatNotAcceptableError(Exception):
+    """Accept 头要求的格式无法提供"""
+
+
+def arrow_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """按 Accept 头（含 q 权重）选择输出格式；未指定或无法识别时返回逐行 JSON。
+    仅接受 Arrow 而 pyarrow 未安装时抛出 FormatNotAcceptableError。
+    """
+    if not accept:
+        return RESULT_FORMAT_JSON
+    candidates = []
+    for order, part in enumerate(accept.split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        media = fields[0].lower()
+        q = 1.0
+        for f in fields[1:]:
+            if f.lower().startswith("q="):
+                try:
+                    q = float(f[2:])
+                except ValueError:
+                    q = 0.0
+        if media in _MEDIA_FORMATS and q > 0:
+            candidates.append((-q, order, _MEDIA_FORMATS[media]))
+    if not candidates:
+        return RESULT_FORMAT_JSON
+    candidates.sort()
+    for _, _, fmt in candidates:
+        if fmt == RESULT_FORMAT_ARROW and not arrow_available():
+            continue
+        return fmt
+    raise FormatNotAcceptableError("服务端未安装 pyarrow，无法输出 Arrow 格式，请安装 'pyarrow' 或改用 JSON")
+
+
+def _type_name(value: Any) -> str:
+    # bool 需在 int 之前判断
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, decimal.Decimal):
+        return "decimal"
+    if isinstance(value, datetime.datetime):
+        return "datetime"
+    if isinstance(value, datetime.date):
+        return "date"
+    if isinstance(value, datetime.time):
+        return "time"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "binary"
+    return "string"
+
+
+def _json_default(value: Any) -> Any:
+    # Decimal 以字符串输出以免丢失精度，客户端可按列类型还原
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return str(value)
+
+
+def _column_types(columns: List[str], rows: Sequence[Sequence[Any]]) -> List[str]:
+    types: List[Optional[str]] = [None] * len(columns)
+    pending = len(columns)
+    for row in rows:
+        if not pending:
+            break
+        for i, v in enumerate(row):
+            if types[i] is None and v is not None:
+                types[i] = _type_name(v)
+                pending -= 1
+    return [t or "null" for t in types]
+
+
+def to_columnar_json(columns: List[str], rows: Sequence[Sequence[Any]], meta: Dict[str, Any]) -> bytes:
+    """编码为紧凑列式 JSON：{"success", "message", "data": {..meta, columns: [{name, type}], rows: [[...]]}}。"""
+    payload = {
+        "success": True,
+        "message": "执行成功",
+        "code": 200,
+        "data": {
+            **meta,
+            "columns": [{"name": c, "type": t} for c, t in zip(columns, _column_types(columns, rows))],
+            "rows": [list(r) for r in rows],
+        },
+    }
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def arrow_arrays(columns: List[str], rows: Sequence[Sequence[Any]], types: Optional[Sequence[Any]] = None) -> List[Any]:
+    """按列构建 Arrow 数组。types 为空时由值推断，推断失败的列（如混合类型）退化为字符串列；
+    指定 types 时按给定类型转换，不兼容时抛出 pyarrow 的 ArrowInvalid/ArrowTypeError。
+    """
+    import pyarrow as pa
+
+    arrays = []
+    for i in range(len(columns)):
+        values = [r[i] for r in rows]
+        if types is not None:
+            arrays.append(pa.array(values, type=types[i]))
+            continue
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+    return arrays
+
+
+def to_arrow_ipc(columns: List[str], rows: Sequence[Sequence[Any]], meta: Dict[str, Any]) -> bytes:
+    """编码为 Arrow IPC 流；类型由 pyarrow 从值推断（Decimal→decimal128、date→date32 等），
+    推断失败的列（如混合类型）退化为字符串列。meta 写入 schema 元数据。
+    """
+    import pyarrow as pa
+
+    arrays = arrow_arrays(columns, rows)
+    # 列名可能重复（如 SELECT a.id, b.id），按位置构建
+    schema = pa.schema(
+        [pa.field(name, arr.type) for name, arr in zip(columns, arrays)],
+        metadata={k: str(v) for k, v in meta.items()},
+    )
+    batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,177 @@
+"""
+查询结果分页：
+- 键集分页（keyset）：排序键由请求指定，或在单表明细查询中取元数据目录里的主键（需出现在输出列中）；
+  每页执行 SELECT * FROM (原查询) t WHERE (k1, k2, ...) > (上一页末行键值) ORDER BY k1, k2, ... LIMIT n+1，
+  第N页与第1页代价相同，键值以占位参数传入；
+- 无可用排序键（聚合、去重、自定义排序等）时退化为缓存分段：原查询执行一次（至多 QUERY_PAGE_SEGMENT_MAX_ROWS 行）
+  写入查询结果缓存，后续页从缓存切片；
+- 游标为不透明字符串（base64 负载 + HMAC 签名），绑定数据源与SQL指纹，防篡改与跨查询复用。
+"""
+import base64
+import datetime
+import decimal
+import hashlib
+import hmac
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.metadata_catalog import CatalogSnapshot
+from app.services.sql_parser import ParsedSQL
+
+PAGE_MODE_KEYSET = "keyset"
+PAGE_MODE_SEGMENT = "segment"
+
+
+class InvalidCursorError(ValueError):
+    """分页游标无效、被篡改或与当前查询不匹配"""
+
+
+@dataclass
+class PageCursor:
+    mode: str
+    page: int = 1
+    keys: List[str] = field(default_factory=list)
+    # 键集分页：上一页末行的排序键值
+    after: Optional[List[Any]] = None
+    # 缓存分段：下一页在结果中的起始行
+    offset: int = 0
+
+
+# ---------- 游标编解码 ----------
+def _encode_value(v: Any) -> Any:
+    # 保留键值类型，避免比较时的隐式转换导致跳行/重行
+    if isinstance(v, decimal.Decimal):
+        return {"$dec": str(v)}
+    if isinstance(v, datetime.datetime):
+        return {"$dt": v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {"$date": v.isoformat()}
+    if isinstance(v, datetime.time):
+        return {"$time": v.isoformat()}
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return {"$bin": base64.b64encode(bytes(v)).decode("ascii")}
+    return v
+
+
+def _decode_value(v: Any) -> Any:
+    if isinstance(v, dict) and len(v) == 1:
+        (tag, raw), = v.items()
+        if tag == "$dec":
+            return decimal.Decimal(raw)
+        if tag == "$dt":
+            return datetime.datetime.fromisoformat(raw)
+        if tag == "$date":
+            return datetime.date.fromisoformat(raw)
+        if tag == "$time":
+            return datetime.time.fromisoformat(raw)
+        if tag == "$bin":
+            return base64.b64decode(raw)
+    return v
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(body: str) -> str:
+    mac = hmac.new(settings.SECRET_KEY.encode("utf-8"), body.encode("ascii"), hashlib.sha256).digest()
+    return _b64(mac[:16])
+
+
+def encode_cursor(cursor: PageCursor, ds_id: int, fingerprint: str) -> str:
+    payload = {
+        "ds": int(ds_id),
+        "fp": fingerprint[:16],
+        "m": cursor.mode,
+        "p": cursor.page,
+        "k": cursor.keys,
+        "a": [_encode_value(v) for v in cursor.after] if cursor.after is not None else None,
+        "o": cursor.offset,
+    }
+    body = _b64(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    return f"{body}.{_sign(body)}"
+
+
+def decode_cursor(token: str, ds_id: int, fingerprint: str) -> PageCursor:
+    try:
+        body, sig = token.rsplit(".", 1)
+    except ValueError:
+        raise InvalidCursorError("分页游标格式无效")
+    if not hmac.compare_digest(sig, _sign(body)):
+        raise InvalidCursorError("分页游标签名无效")
+    try:
+        payload = json.loads(_unb64(body))
+    except Exception:
+        raise InvalidCursorError("分页游标格式无效")
+    if payload.get("ds") != int(ds_id) or payload.get("fp") != fingerprint[:16]:
+        raise InvalidCursorError("分页游标与当前查询不匹配")
+    after = payload.get("a")
+    return PageCursor(
+        mode=payload.get("m") or PAGE_MODE_SEGMENT,
+        page=int(payload.get("p") or 1),
+        keys=list(payload.get("k") or []),
+        after=[_decode_value(v) for v in after] if after is not None else None,
+        offset=int(payload.get("o") or 0),
+    )
+
+
+# ---------- 排序键识别 ----------
+def detect_sort_keys(parsed: ParsedSQL, ds_id: int, snapshot: Optional[CatalogSnapshot]) -> Optional[List[str]]:
+    """在单表明细查询中以主键作为排序键；原查询自带的排序须与主键一致，否则返回None（退化为缓存分段）。"""
+    if snapshot is None or not parsed.is_plain_select or len(parsed.tables) != 1:
+        return None
+    table = snapshot.tables.get(parsed.tables[0])
+    if table is None or (table.data_source_id is not None and int(table.data_source_id) != int(ds_id)):
+        return None
+    pk = [c.name for c in table.columns if c.is_pk]
+    if not pk:
+        return None
+    outputs = parsed.output_columns
+    has_star = any(name == "*" for name, _ in outputs)
+    output_names = {name for name, _ in outputs}
+    # 主键需以原名出现在输出列中（SELECT * 或未改名的列）
+    if not all(has_star or k in output_names for k in pk):
+        return None
+    sorts = parsed.analysis()["sorts"]
+    if sorts:
+        cols = [s["column"].split(".")[-1].strip("`\"") for s in sorts]
+        if cols != pk[: len(cols)] or any(s["order"] != "asc" for s in sorts):
+            return None
+    return pk
+
+
+def _quote(name: str, ds_type: str) -> str:
+    if ds_type == "mysql":
+        return "`" + name.replace("`", "``") + "`"
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_keyset_sql(parsed: ParsedSQL, keys: Sequence[str], after: Optional[Sequence[Any]], page_size: int, ds_type: str) -> Tuple[str, Optional[List[Any]]]:
+    """构造键集分页SQL与参数；原查询作为派生表，字面 % 转义为 %%。"""
+    inner = parsed.without_order_limit()
+    quoted = [f"_aitt_page.{_quote(k, ds_type)}" for k in keys]
+    params: Optional[List[Any]] = None
+    where = ""
+    if after is not None:
+        # 展开为 (k1 > v1) OR (k1 = v1 AND k2 > v2) ...，兼容不支持行值比较走索引的情况
+        ors = []
+        params = []
+        for i in range(len(keys)):
+            parts = [f"{quoted[j]} = %s" for j in range(i)] + [f"{quoted[i]} > %s"]
+            params.extend(list(after[:i]) + [after[i]])
+            ors.append("(" + " AND ".join(parts) + ")")
+        where = "\nWHERE " + " OR ".join(ors)
+        inner = inner.replace("%", "%%")
+    order = ", ".join(quoted)
+    sql = f"SELECT * FROM (\n{inner}\n) AS _aitt_page{where}\nORDER BY {order}\nLIMIT {int(page_size) + 1}"
+    return sql, params
+
+
+def key_values(row: Dict[str, Any], keys: Sequence[str]) -> List[Any]:
+    return [row.get(k) for k in keys]
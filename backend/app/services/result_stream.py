@@ -0,0 +1,151 @@
+"""
+查询结果流式输出（NDJSON / CSV）：
+- 执行线程通过服务端游标逐批读取，经有界队列交给事件循环编码输出；
+- 队列满时执行线程阻塞等待（背压），内存占用与结果集大小无关；
+- 客户端断开或下游停止消费时通知执行线程停止，连接直接丢弃而不读完剩余结果。
+"""
+import asyncio
+import csv
+import io
+import json
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, List, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.models.data_source import DataSource
+from app.services.query_scheduler import get_query_scheduler
+
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+_DONE = object()
+
+
+class StreamStats:
+    """流式执行统计，供结束后记录查询历史"""
+
+    def __init__(self):
+        self.rows = 0
+        self.error: Optional[str] = None
+        self.aborted = False
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed_ms(self) -> int:
+        return int((time.perf_counter() - self.started) * 1000)
+
+
+def _encode_ndjson(columns: List[str], rows: List[tuple]) -> str:
+    return "".join(
+        json.dumps(dict(zip(columns, r)), ensure_ascii=False, default=str) + "\n"
+        for r in rows
+    )
+
+
+def _encode_csv(rows: List[tuple], header: Optional[List[str]] = None) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buf.getvalue()
+
+
+async def stream_query(
+    ds_service,
+    ds: DataSource,
+    sql: str,
+    fmt: str = "ndjson",
+    max_rows: Optional[int] = None,
+    timeout_seconds: int = 300,
+    stats: Optional[StreamStats] = None,
+    user_key: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """异步生成编码后的结果块。NDJSON 出错时以一行 {"error": ...} 结尾；CSV 出错时直接截断。"""
+    stats = stats or StreamStats()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, settings.QUERY_STREAM_QUEUE_CHUNKS))
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        # 在执行线程中阻塞等待队列空位（背压）；消费端停止后返回 False
+        fut = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            if stop.is_set():
+                fut.cancel()
+                return False
+            try:
+                fut.result(timeout=1)
+                return not stop.is_set()
+            except FutureTimeoutError:
+                continue
+            except Exception:
+                return False
+
+    def _emit(columns: List[str], rows: List[tuple]) -> bool:
+        return _put((columns, rows))
+
+    async def _produce():
+        try:
+            await get_query_scheduler().run(
+                ds.id,
+                user_key,
+                ds_service.stream_sql_blocking,
+                ds,
+                sql,
+                _emit,
+                max_rows=max_rows,
+                timeout_seconds=timeout_seconds,
+                batch_size=settings.QUERY_STREAM_BATCH_ROWS,
+            )
+        except Exception as e:
+            stats.error = str(e)
+        finally:
+            # 消费端已停止时无人读取结束标记，不再入队
+            if not stop.is_set():
+                await queue.put(_DONE)
+
+    producer = asyncio.create_task(_produce())
+    header_sent = False
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            columns, rows = item
+            stats.rows += len(rows)
+            if fmt == "csv":
+                chunk = _encode_csv(rows, header=None if header_sent else columns)
+                header_sent = True
+            else:
+                chunk = _encode_ndjson(columns, rows)
+            if chunk:
+                yield chunk
+        if stats.error:
+            logger.warning("流式查询执行失败: data_source_id={}, err={}", ds.id, stats.error)
+            if fmt != "csv":
+                yield json.dumps({"error": stats.error}, ensure_ascii=False) + "\n"
+    except (asyncio.CancelledError, GeneratorExit):
+        stats.aborted = True
+        raise
+    finally:
+        stop.set()
+        # 清空队列，解除执行线程可能的阻塞
+        while not queue.empty():
+            queue.get_nowait()
+        if not producer.done():
+            producer.add_done_callback(lambda t: t.exception() if not t.cancelled() else None)
+        logger.info(
+            "流式查询结束: data_source_id={}, rows={}, aborted={}, ms={}",
+            ds.id,
+            stats.rows,
+            stats.aborted,
+            stats.elapsed_ms,
+        )
@@ -0,0 +1,651 @@
+"""
+SQL解析服务：
+- 轻量词法分析（字符串/标识符/注释/括号深度），一次解析得到结构化的 ParsedSQL，按 (文本, 方言) LRU 缓存；
+- 字符串与注释按方言识别：MySQL 反斜杠转义、# 注释、/*! */ 可执行注释；PostgreSQL 仅 E'' 中反斜杠转义、$tag$ 字符串；
+- 同一份解析结果供安全校验（单条只读语句）、表/维度/指标/筛选/排序提取、LIMIT 注入与指纹计算复用；
+- 不依赖第三方SQL解析库，覆盖 MySQL/PostgreSQL 常见查询语法，无法识别的结构按保守策略处理。
+"""
+import copy
+import hashlib
+import re
+from functools import cached_property, lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+
+class Token(NamedTuple):
+    kind: str       # kw | ident | qident | str | num | op | punct | param
+    value: str      # 原始文本
+    upper: str      # 关键字/标识符的大写形式，便于比较
+    depth: int      # 所在括号深度
+    start: int
+    end: int
+
+
+DIALECT_MYSQL = "mysql"
+DIALECT_POSTGRESQL = "postgresql"
+
+_TOKEN_PATTERN_TAIL = r"""
+  | (?P<qident>`(?:[^`]|``)*`?)
+  | (?P<num>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<param>%s|%\(\w+\)s|\?|:\w+|\$\d+)
+  | (?P<word>[A-Za-z_\u0080-￿][\w$\u0080-￿]*)
+  | (?P<op><=>|<=|>=|<>|!=|::|\|\||->>|->|[=<>+\-*/%!~^&|#])
+  | (?P<punct>[(),;.\[\]{}])
+  | (?P<other>.)
+"""
+_TOKEN_RES = {
+    # MySQL：字符串内反斜杠转义；# 为行注释；/*! */ 内的文本会被服务端执行，单独识别
+    DIALECT_MYSQL: re.compile(
+        r"""
+    (?P<ws>\s+)
+  | (?P<xcomment>/\*!.*?(?:\*/|$))
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<str>'(?:[^'\\]|\\.|'')*'?|"(?:[^"\\]|\\.|"")*"?)
+"""
+        + _TOKEN_PATTERN_TAIL,
+        re.VERBOSE | re.DOTALL,
+    ),
+    # PostgreSQL（standard_conforming_strings=on）：仅 E'' 中反斜杠转义；$tag$...$tag$ 为字符串；# 为运算符
+    DIALECT_POSTGRESQL: re.compile(
+        r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<str>[eE]'(?:[^'\\]|\\.|'')*'?|'(?:[^']|'')*'?|"(?:[^"]|"")*"?)
+  | (?P<dollar>\$(?P<dtag>[A-Za-z_]\w*)?\$.*?(?:\$(?P=dtag)\$|$))
+"""
+        + _TOKEN_PATTERN_TAIL,
+        re.VERBOSE | re.DOTALL,
+    ),
+}
+
+KEYWORDS = {
+    "SELECT", "WITH", "RECURSIVE", "AS", "FROM", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "OUTER", "CROSS",
+    "NATURAL", "STRAIGHT_JOIN", "ON", "USING", "WHERE", "GROUP", "BY", "HAVING", "ORDER", "LIMIT", "OFFSET",
+    "FETCH", "UNION", "INTERSECT", "EXCEPT", "ALL", "DISTINCT", "AND", "OR", "NOT", "IN", "IS", "NULL", "LIKE",
+    "ILIKE", "BETWEEN", "EXISTS", "CASE", "WHEN", "THEN", "ELSE", "END", "ASC", "DESC", "INTO", "FOR", "LOCK",
+    "SHARE", "MODE", "WINDOW", "OVER", "PARTITION", "LATERAL", "VALUES",
+    "INSERT", "UPDATE", "DELETE", "REPLACE", "MERGE", "UPSERT", "CREATE", "DROP", "ALTER", "TRUNCATE", "RENAME",
+    "GRANT", "REVOKE", "CALL", "EXEC", "EXECUTE", "LOAD", "HANDLER", "UNLOCK", "SET", "COPY", "VACUUM", "DO",
+    "PREPARE", "DEALLOCATE", "SHOW", "DESCRIBE", "EXPLAIN", "USE", "KILL", "BEGIN", "COMMIT", "ROLLBACK",
+}
+# 只读查询中不允许出现的关键字（写入、DDL、权限、会话控制等）
+FORBIDDEN_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "REPLACE", "MERGE", "UPSERT", "CREATE", "DROP", "ALTER", "TRUNCATE", "RENAME",
+    "GRANT", "REVOKE", "CALL", "EXEC", "EXECUTE", "LOAD", "HANDLER", "LOCK", "UNLOCK", "SET", "COPY", "VACUUM",
+    "DO", "PREPARE", "DEALLOCATE", "USE", "KILL", "BEGIN", "COMMIT", "ROLLBACK", "INTO",
+}
+# 同名的普通标量函数（REPLACE(s, a, b)、TRUNCATE(x, d)、MySQL INSERT(s, pos, len, t)），后接 "(" 时按函数调用处理
+_FUNCTION_KEYWORDS = {"REPLACE", "TRUNCATE", "INSERT"}
+# 具有副作用或可用于拖慢数据库的函数
+FORBIDDEN_FUNCTIONS = {"SLEEP", "PG_SLEEP", "BENCHMARK", "GET_LOCK", "LOAD_FILE", "PG_READ_FILE", "DBLINK"}
+AGG_FUNCTIONS = {"SUM", "COUNT", "AVG", "MIN", "MAX"}
+_SET_OPS = {"UNION", "INTERSECT", "EXCEPT"}
+_FROM_FUNCTIONS = {"EXTRACT", "TRIM", "SUBSTRING", "SUBSTR", "POSITION", "OVERLAY"}
+_CLAUSE_STARTS = {"FROM", "WHERE", "GROUP", "HAVING", "ORDER", "LIMIT", "OFFSET", "FETCH", "WINDOW", "FOR", "LOCK", "INTO"}
+
+
+def normalize_dialect(dialect: Any) -> str:
+    """将数据源类型（或方言名）归一为 mysql / postgresql；未知类型按 MySQL 规则处理。"""
+    value = str(getattr(dialect, "value", dialect) or "").lower()
+    return DIALECT_POSTGRESQL if value in (DIALECT_POSTGRESQL, "postgres", "pg") else DIALECT_MYSQL
+
+
+def tokenize(sql: str, dialect: str = DIALECT_MYSQL) -> List[Token]:
+    """词法分析，丢弃空白与注释，记录每个记号的括号深度与原文位置。"""
+    tokens: List[Token] = []
+    depth = 0
+    for m in _TOKEN_RES[normalize_dialect(dialect)].finditer(sql or ""):
+        kind = m.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        if kind == "dollar":
+            kind = "str"
+        val = m.group(0)
+        if kind == "word":
+            up = val.upper()
+            kind = "kw" if up in KEYWORDS else "ident"
+        elif kind == "qident":
+            up = val[1:-1].replace("``", "`").upper()
+        else:
+            up = val.upper()
+        if kind == "other":
+            kind = "op"
+        if val == ")":
+            depth = max(0, depth - 1)
+        tokens.append(Token(kind, val, up, depth, m.start(), m.end()))
+        if val == "(":
+            depth += 1
+    return tokens
+
+
+class TableRef(NamedTuple):
+    name: str
+    start: int              # 表引用（含 schema 前缀）在原文中的起止位置
+    end: int
+    alias: Optional[str]    # 别名原文（含引号），无别名时为None
+    alias_end: int          # 表引用及别名的结束位置
+
+
+def _ident_name(tok: Token) -> str:
+    if tok.kind == "qident":
+        return tok.value[1:-1].replace("``", "`")
+    if tok.kind == "str" and tok.value.startswith('"'):
+        return tok.value[1:-1]
+    return tok.value
+
+
+def _read_table_ref(toks, j: int) -> Tuple[Optional[str], int]:
+    """从位置 j 读取表引用（支持 schema.table），返回 (表名或None, 之后的位置)。"""
+    if j >= len(toks) or toks[j].kind not in ("ident", "qident"):
+        return None, j
+    if j + 2 < len(toks) and toks[j + 1].value == "." and toks[j + 2].kind in ("ident", "qident"):
+        return _ident_name(toks[j + 2]), j + 3
+    return _ident_name(toks[j]), j + 1
+
+
+class ParsedSQL:
+    """一次解析后的SQL结构，实例在LRU中共享，外部请勿修改。"""
+
+    def __init__(self, sql: str, dialect: str = DIALECT_MYSQL):
+        self.sql = sql
+        self.dialect = normalize_dialect(dialect)
+        self.tokens: Tuple[Token, ...] = tuple(tokenize(sql, self.dialect))
+        # 按深度0的分号切分语句（忽略末尾空语句）
+        stmts: List[Tuple[Token, ...]] = []
+        cur: List[Token] = []
+        for t in self.tokens:
+            if t.value == ";" and t.depth == 0:
+                if cur:
+                    stmts.append(tuple(cur))
+                cur = []
+            else:
+                cur.append(t)
+        if cur:
+            stmts.append(tuple(cur))
+        self.statements: Tuple[Tuple[Token, ...], ...] = tuple(stmts)
+        self.main: Tuple[Token, ...] = stmts[0] if stmts else ()
+
+    # ---------- 基本属性 ----------
+    @property
+    def statement_count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def statement_type(self) -> str:
+        for t in self.main:
+            if t.value == "(":
+                continue
+            return t.upper
+        return ""
+
+    @cached_property
+    def normalized(self) -> str:
+        """规范化文本：去除注释与多余空白，关键字大写，末尾分号去除。"""
+        return " ".join(t.upper if t.kind == "kw" else t.value for t in self.main)
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """语句指纹（区分字面量），用于结果缓存与执行计划判定缓存。"""
+        return hashlib.sha1(self.normalized.encode("utf-8")).hexdigest()
+
+    @cached_property
+    def shape_fingerprint(self) -> str:
+        """语句形态指纹（字面量替换为 ?），用于统计同类查询。"""
+        parts = ["?" if t.kind in ("str", "num", "param") else (t.upper if t.kind in ("kw", "ident") else t.value) for t in self.main]
+        return hashlib.sha1(" ".join(parts).encode("utf-8")).hexdigest()
+
+    # ---------- 安全校验 ----------
+    def read_only_violation(self) -> Optional[str]:
+        """返回不满足“单条只读查询”的原因；满足时返回None。"""
+        if self.statement_count == 0:
+            return "SQL为空"
+        if self.statement_count > 1:
+            return "仅允许执行单条SQL语句"
+        if self.statement_type not in ("SELECT", "WITH"):
+            return "仅允许执行SELECT查询"
+        if any(t.kind == "xcomment" for t in self.tokens):
+            return "查询中不允许可执行注释（/*! */）"
+        toks = self.main
+        for i, t in enumerate(toks):
+            is_call = i + 1 < len(toks) and toks[i + 1].value == "("
+            if t.kind == "kw" and t.upper in FORBIDDEN_KEYWORDS and not (t.upper in _FUNCTION_KEYWORDS and is_call):
+                return f"查询中包含不允许的关键字: {t.upper}"
+            if t.kind == "ident" and t.upper in FORBIDDEN_FUNCTIONS and is_call:
+                return f"查询中包含不允许的函数: {t.upper}"
+            # SELECT ... FOR UPDATE / FOR SHARE 会加锁
+            if t.upper == "FOR" and i + 1 < len(toks) and toks[i + 1].upper in ("UPDATE", "SHARE", "NO"):
+                return "查询中不允许加锁子句"
+        return None
+
+    def validate_read_only(self):
+        reason = self.read_only_violation()
+        if reason:
+            raise ValueError(reason)
+
+    # ---------- 结构提取 ----------
+    def _main_select_range(self) -> Tuple[int, int]:
+        """返回最外层主查询 SELECT 的记号区间 [start, end)（跳过 WITH 子句，止于首个集合运算符）。"""
+        toks = self.main
+        i = 0
+        if toks and toks[0].upper == "WITH":
+            i = 1
+            while i < len(toks):
+                if toks[i].depth == 0 and toks[i].upper == "SELECT":
+                    break
+                i += 1
+        while i < len(toks) and toks[i].upper != "SELECT":
+            i += 1
+        if i >= len(toks):
+            return len(toks), len(toks)
+        d = toks[i].depth
+        j = i + 1
+        while j < len(toks):
+            t = toks[j]
+            if t.depth < d or (t.depth == d and t.upper in _SET_OPS):
+                break
+            j += 1
+        return i, j
+
+    def _clauses(self) -> Dict[str, Tuple[Token, ...]]:
+        """将主查询按同层级子句关键字切分为 select/from/where/group/having/order/limit。"""
+        toks = self.main
+        s, e = self._main_select_range()
+        if s >= e:
+            return {}
+        d = toks[s].depth
+        out: Dict[str, List[Token]] = {"select": []}
+        current = "select"
+        i = s + 1
+        while i < e:
+            t = toks[i]
+            if t.depth == d and t.kind == "kw" and t.upper in _CLAUSE_STARTS:
+                current = {"GROUP": "group", "ORDER": "order"}.get(t.upper, t.upper.lower())
+                out.setdefault(current, [])
+                # 跳过 GROUP BY / ORDER BY 中的 BY
+                if t.upper in ("GROUP", "ORDER") and i + 1 < e and toks[i + 1].upper == "BY":
+                    i += 1
+                i += 1
+                continue
+            out[current].append(t)
+            i += 1
+        return {k: tuple(v) for k, v in out.items()}
+
+    @staticmethod
+    def _split(tokens: Tuple[Token, ...], sep: str) -> List[Tuple[Token, ...]]:
+        if not tokens:
+            return []
+        d = tokens[0].depth
+        parts: List[List[Token]] = [[]]
+        for t in tokens:
+            if t.depth == d and (t.value == sep or (t.kind == "kw" and t.upper == sep)):
+                parts.append([])
+            else:
+                parts[-1].append(t)
+        return [tuple(p) for p in parts if p]
+
+    def _text(self, tokens: Tuple[Token, ...]) -> str:
+        if not tokens:
+            return ""
+        return self.sql[tokens[0].start:tokens[-1].end].strip()
+
+    @cached_property
+    def cte_names(self) -> Tuple[str, ...]:
+        """WITH 子句中定义的CTE名称。"""
+        toks = self.main
+        if not toks or toks[0].upper != "WITH":
+            return ()
+        names: List[str] = []
+        for i in range(1, len(toks)):
+            t = toks[i]
+            if t.depth != 0:
+                continue
+            if t.upper == "SELECT":
+                break
+            if t.kind in ("ident", "qident") and toks[i - 1].upper in ("WITH", "RECURSIVE", ","):
+                names.append(_ident_name(t))
+        return tuple(names)
+
+    def _is_function_from(self, idx: int) -> bool:
+        """判断 FROM 是否位于 EXTRACT(YEAR FROM x) 等函数参数内。"""
+        toks = self.main
+        d = toks[idx].depth
+        if d == 0:
+            return False
+        for k in range(idx - 1, -1, -1):
+            if toks[k].value == "(" and toks[k].depth == d - 1:
+                return k > 0 and toks[k - 1].upper in _FROM_FUNCTIONS
+        return False
+
+    @cached_property
+    def tables(self) -> Tuple[str, ...]:
+        """全部被引用的表（含子查询内，排除CTE名称），保持出现顺序。"""
+        toks = self.main
+        ctes = {c.lower() for c in self.cte_names}
+        out: List[str] = []
+        for i, t in enumerate(toks):
+            if not (t.kind == "kw" and t.upper in ("FROM", "JOIN", "STRAIGHT_JOIN")) or self._is_function_from(i):
+                continue
+            j = i + 1
+            while j < len(toks):
+                name, j = _read_table_ref(toks, j)
+                if name is None:
+                    break
+                if name.lower() not in ctes and name not in out:
+                    out.append(name)
+                if t.upper != "FROM":
+                    break
+                # 跳过可选别名；FROM a, b 形式继续读取下一张表
+                if j < len(toks) and toks[j].upper == "AS":
+                    j += 1
+                if j < len(toks) and toks[j].kind in ("ident", "qident"):
+                    j += 1
+                if j < len(toks) and toks[j].value == ",":
+                    j += 1
+                    continue
+                break
+        return tuple(out)
+
+    @cached_property
+    def _analysis(self) -> Dict[str, Any]:
+        clauses = self._clauses()
+        tables = list(self.tables)
+        selected_table, _ = _read_table_ref(clauses.get("from") or (), 0)
+        if selected_table is not None and selected_table.lower() in {c.lower() for c in self.cte_names}:
+            selected_table = None
+        if selected_table is None and tables:
+            selected_table = tables[0]
+
+        dimensions: List[str] = []
+        metrics: List[Dict[str, Any]] = []
+        select_toks = clauses.get("select") or ()
+        if select_toks and select_toks[0].upper in ("DISTINCT", "ALL"):
+            select_toks = select_toks[1:]
+        for item in self._split(select_toks, ","):
+            if not item:
+                continue
+            alias = None
+            body = item
+            if len(item) >= 2 and item[-2].upper == "AS":
+                alias, body = _ident_name(item[-1]), item[:-2]
+            elif len(item) >= 2 and item[-1].kind in ("ident", "qident") and item[-2].value not in (".", "(") and item[-2].kind not in ("op",):
+                alias, body = _ident_name(item[-1]), item[:-1]
+            if (
+                len(body) >= 3
+                and body[0].upper in AGG_FUNCTIONS
+                and body[1].value == "("
+                and body[-1].value == ")"
+                and body[-1].depth == body[0].depth
+            ):
+                inner = body[2:-1]
+                func = body[0].upper.lower()
+                distinct = bool(inner) and inner[0].upper == "DISTINCT"
+                if distinct:
+                    inner = inner[1:]
+                col = self._text(inner) or "*"
+                metrics.append({
+                    "column": col,
+                    "aggregation": func,
+                    "alias": alias or f"{func}_{re.sub(r'[^0-9A-Za-z_]+', '_', col).strip('_') or 'all'}",
+                    **({"distinct": True} if distinct else {}),
+                })
+                continue
+            # 普通列：去掉表前缀与 DISTINCT/COALESCE/IFNULL 包装
+            if len(body) == 3 and body[1].value == "." and body[2].kind in ("ident", "qident"):
+                col = _ident_name(body[2])
+            elif len(body) >= 4 and body[0].upper in ("COALESCE", "IFNULL") and body[1].value == "(":
+                col = self._text(self._split(body[2:-1], ",")[0])
+            else:
+                col = self._text(body)
+            if col:
+                dimensions.append(col)
+
+        filters: List[Dict[str, Any]] = []
+        conds = self._split(clauses.get("where") or (), "AND")
+        ci = 0
+        while ci < len(conds):
+            cond = conds[ci]
+            ci += 1
+            if len(cond) < 3:
+                continue
+            head = cond[0]
+            k = 1
+            col = _ident_name(head)
+            if len(cond) >= 3 and cond[1].value == "." and cond[2].kind in ("ident", "qident"):
+                col = f"{_ident_name(head)}.{_ident_name(cond[2])}"
+                k = 3
+            if head.kind not in ("ident", "qident") or k >= len(cond):
+                continue
+            op_tok = cond[k]
+            op = op_tok.upper
+            if op_tok.kind == "op" and op in ("=", "!=", "<>", ">=", "<=", ">", "<"):
+                pass
+            elif op in ("LIKE", "ILIKE", "IN", "BETWEEN", "IS"):
+                if op == "IS" and k + 1 < len(cond) and cond[k + 1].upper == "NOT":
+                    op, k = "IS NOT", k + 1
+            elif op == "NOT" and k + 1 < len(cond) and cond[k + 1].upper in ("LIKE", "IN", "BETWEEN"):
+                op, k = f"NOT {cond[k + 1].upper}", k + 1
+            else:
+                continue
+            rest = cond[k + 1:]
+            val = rest[0].value[1:-1] if len(rest) == 1 and rest[0].kind == "str" else self._text(rest)
+            if op in ("BETWEEN", "NOT BETWEEN") and ci < len(conds):
+                # BETWEEN a AND b 被 AND 切开，合并上界
+                val = f"{val} AND {self._text(conds[ci])}"
+                ci += 1
+            filters.append({"column": col, "operator": op, "value": val})
+
+        sorts: List[Dict[str, Any]] = []
+        for seg in self._split(clauses.get("order") or (), ","):
+            order = "asc"
+            body = seg
+            if seg[-1].upper in ("ASC", "DESC"):
+                order, body = seg[-1].upper.lower(), seg[:-1]
+            col = self._text(body)
+            if col:
+                sorts.append({"column": col, "order": order})
+
+        return {
+            "tables": tables,
+            "selected_table": selected_table,
+            "dimensions": dimensions,
+            "metrics": metrics,
+            "filters": filters,
+            "sorts": sorts,
+        }
+
+    def analysis(self) -> Dict[str, Any]:
+        """表/维度/指标/筛选/排序提取结果（返回副本）。"""
+        return copy.deepcopy(self._analysis)
+
+    @cached_property
+    def output_columns(self) -> Tuple[Tuple[str, Optional[str]], ...]:
+        """主查询的输出列：(输出列名, 来源列名)；表达式的来源列为None，星号输出为 ("*", None)。"""
+        select_toks = self._clauses().get("select") or ()
+        if select_toks and select_toks[0].upper in ("DISTINCT", "ALL"):
+            select_toks = select_toks[1:]
+        out: List[Tuple[str, Optional[str]]] = []
+        for item in self._split(select_toks, ","):
+            if item[-1].value == "*":
+                out.append(("*", None))
+                continue
+            alias = None
+            body = item
+            if len(item) >= 2 and item[-2].upper == "AS":
+                alias, body = _ident_name(item[-1]), item[:-2]
+            elif len(item) >= 2 and item[-1].kind in ("ident", "qident") and item[-2].value not in (".", "(") and item[-2].kind != "op":
+                alias, body = _ident_name(item[-1]), item[:-1]
+            source = None
+            if len(body) == 1 and body[0].kind in ("ident", "qident"):
+                source = _ident_name(body[0])
+            elif len(body) == 3 and body[1].value == "." and body[2].kind in ("ident", "qident"):
+                source = _ident_name(body[2])
+            out.append((alias or source or self._text(body), source))
+        return tuple(out)
+
+    @cached_property
+    def is_plain_select(self) -> bool:
+        """是否为单表/多表的明细查询：无聚合、分组、去重、集合运算、窗口函数与 LIMIT/OFFSET。"""
+        clauses = self._clauses()
+        if not clauses or any(k in clauses for k in ("group", "having", "limit", "offset", "fetch", "window")):
+            return False
+        toks = self.main
+        s, e = self._main_select_range()
+        if e < len(toks) and toks[e].upper in _SET_OPS:
+            return False
+        select_toks = clauses.get("select") or ()
+        if select_toks and select_toks[0].upper == "DISTINCT":
+            return False
+        d = toks[s].depth
+        for i, t in enumerate(select_toks):
+            if t.upper == "OVER":
+                return False
+            if t.upper in AGG_FUNCTIONS and t.depth == d and i + 1 < len(select_toks) and select_toks[i + 1].value == "(":
+                return False
+        return True
+
+    def without_order_limit(self) -> str:
+        """去掉最外层 ORDER BY / LIMIT / OFFSET 后的语句文本（用于外层包装后重新排序分页）。"""
+        toks = self.main
+        if not toks:
+            return self.sql
+        cut = toks[-1].end
+        for t in toks:
+            if t.depth == 0 and t.kind == "kw" and t.upper in ("ORDER", "LIMIT", "OFFSET", "FETCH"):
+                cut = t.start
+                break
+        return self.sql[:cut].rstrip()
+
+    @cached_property
+    def single_table_ref(self) -> Optional["TableRef"]:
+        """仅引用一张表（无CTE、连接、集合运算及子查询中的表）时，返回主查询 FROM 中该表引用的位置与别名。"""
+        if self.cte_names or len(self.tables) != 1:
+            return None
+        toks = self.main
+        refs = [
+            i for i, t in enumerate(toks)
+            if t.kind == "kw" and t.upper in ("FROM", "JOIN", "STRAIGHT_JOIN") and not self._is_function_from(i)
+        ]
+        s, e = self._main_select_range()
+        if len(refs) != 1 or e < len(toks) or not s < refs[0] < e:
+            return None
+        i = refs[0]
+        if toks[i].upper != "FROM" or toks[i].depth != toks[s].depth:
+            return None
+        name, j = _read_table_ref(toks, i + 1)
+        if name is None:
+            return None
+        ref_end = toks[j - 1].end
+        alias, alias_end = None, ref_end
+        k = j
+        if k < len(toks) and toks[k].upper == "AS":
+            k += 1
+        if k < len(toks) and toks[k].kind in ("ident", "qident"):
+            alias, alias_end = toks[k].value, toks[k].end
+            k += 1
+        if k < len(toks) and toks[k].value in (",", "("):
+            return None
+        return TableRef(name, toks[i + 1].start, ref_end, alias, alias_end)
+
+    @cached_property
+    def additive_aggregates(self) -> Dict[int, str]:
+        """主查询中整列为非 DISTINCT 的 COUNT/SUM 调用的输出列：{输出列位置: 函数名}（供抽样结果按比例放大）。
+        星号之后的输出列位置无法确定，不计入。
+        """
+        select_toks = self._clauses().get("select") or ()
+        if select_toks and select_toks[0].upper in ("DISTINCT", "ALL"):
+            select_toks = select_toks[1:]
+        out: Dict[int, str] = {}
+        for pos, item in enumerate(self._split(select_toks, ",")):
+            if item[-1].value == "*":
+                break
+            body = item
+            if len(item) >= 2 and item[-2].upper == "AS":
+                body = item[:-2]
+            elif len(item) >= 2 and item[-1].kind in ("ident", "qident") and item[-2].value not in (".", "(") and item[-2].kind != "op":
+                body = item[:-1]
+            d = body[0].depth
+            if (
+                len(body) >= 4
+                and body[0].upper in ("COUNT", "SUM")
+                and body[1].value == "("
+                and body[-1].value == ")"
+                and body[2].upper != "DISTINCT"
+                and all(t.depth > d for t in body[2:-1])
+                and body[-1].depth == d
+            ):
+                out[pos] = body[0].upper.lower()
+        return out
+
+    # ---------- 改写 ----------
+    def _top_level_limit(self) -> Optional[Tuple[Optional[Token], bool]]:
+        """定位最外层 LIMIT 的行数记号；返回 (行数记号或None, 是否为 FETCH 语法)，不存在时返回None。"""
+        toks = self.main
+        for i in range(len(toks) - 1, -1, -1):
+            t = toks[i]
+            if t.depth != 0:
+                continue
+            if t.upper in _SET_OPS:
+                return None
+            if t.upper == "FETCH":
+                return None, True
+            if t.upper == "LIMIT":
+                nums = toks[i + 1:i + 4]
+                if len(nums) >= 3 and nums[1].value == ",":
+                    return (nums[2] if nums[2].kind == "num" else None), False
+                return (nums[0] if nums and nums[0].kind == "num" else None), False
+        return None
+
+    def with_limit(self, max_rows: int) -> str:
+        """返回注入/收紧最外层 LIMIT 后的SQL；已有更小的 LIMIT 时原样返回。"""
+        n = max(1, int(max_rows))
+        body = self.sql[: self.main[-1].end] if self.main else self.sql
+        found = self._top_level_limit()
+        if found is not None:
+            tok, is_fetch = found
+            if is_fetch or tok is None:
+                return body
+            try:
+                current = int(float(tok.value))
+            except ValueError:
+                return body
+            if current <= n:
+                return body
+            return body[: tok.start] + str(n) + body[tok.end:]
+        return f"{body}\nLIMIT {n}"
+
+
+_PARSE_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _parse_cached(text: str, dialect: str) -> ParsedSQL:
+    return ParsedSQL(text, dialect)
+
+
+def parse_sql(sql: str, dialect: Any = DIALECT_MYSQL) -> ParsedSQL:
+    """解析SQL（按去除首尾空白与末尾分号后的文本及方言做LRU缓存）。
+    dialect 可直接传数据源类型；在数据源上执行前的校验须按其方言解析。
+    """
+    text = (sql or "").strip()
+    while text.endswith(";"):
+        text = text[:-1].rstrip()
+    return _parse_cached(text, normalize_dialect(dialect))
+
+
+_FENCE_RE = re.compile(r"```(?:sql|mysql|postgresql)?\s*(.*?)(?:```|$)", re.IGNORECASE | re.DOTALL)
+_STMT_START_RE = re.compile(r"\b(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+
+
+def extract_sql_from_text(text: str) -> str:
+    """从模型输出中提取SQL：去掉代码块标记与前置说明，截断至首条语句结束处。"""
+    content = (text or "").strip()
+    m = _FENCE_RE.search(content)
+    if m and "```" in content:
+        content = m.group(1).strip()
+    m = _STMT_START_RE.search(content)
+    if m:
+        content = content[m.start():]
+    parsed = parse_sql(content)
+    if parsed.statement_count > 1 and parsed.main:
+        content = content[: parsed.main[-1].end]
+    return content.strip().rstrip(";").strip()
@@ -0,0 +1,499 @@
+"""
+查询模板快速路径：
+- 加载全部公开模板（aitt_query_templates），将自然语言模板编译为带类型槽位的正则，并建立字符二元组倒排索引；
+- 匹配时先做结构化正则匹配，再以二元组相似度（可选叠加向量相似度）召回候选并从问题中抽取参数；
+- 按参数定义（date/number/integer/enum/string）校验并以完整的安全字面量（字符串/日期含引号）渲染 SQL 模板，高置信度时无需调用模型；
+- 索引冷启动与过期刷新均在后台线程进行，匹配路径不会阻塞事件循环；
+- 命中次数在内存中累计，由 lifespan 启动的后台任务批量回写 usage_count；模板增删改时使索引失效。
+"""
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pymysql
+from pymysql.cursors import DictCursor
+from pymysql.converters import escape_string
+from sqlalchemy.engine.url import make_url
+from loguru import logger
+
+from app.core.config import settings
+from app.services.intent_engine import parse_cn_int
+
+
+_PLACEHOLDER = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
+# SQL模板中的占位符连同其外层引号（'{name}' 或 "{name}"）一并替换，由字面量自带引号
+_SQL_SLOT = re.compile(r"(?P<q>['\"]?)\{(?P<name>[A-Za-z_][A-Za-z0-9_]*)\}(?P=q)")
+_DATE_RE = r"\d{4}\s*[-/.年]\s*\d{1,2}\s*[-/.月]\s*\d{1,2}\s*日?"
+_NUMBER_RE = r"\d+(?:\.\d+)?|[零一二两三四五六七八九十百]+"
+_SAFE_STRING = re.compile(r"^[\w一-鿿 \-./]{1,50}$")
+# 计算相似度时忽略的标点与空白
+_NOISE = re.compile(r"[\s，,。；;：:？?！!（）()\[\]【】“”\"'、]")
+
+
+def _bigrams(text: str) -> Set[str]:
+    t = _NOISE.sub("", (text or "").lower())
+    if len(t) < 2:
+        return {t} if t else set()
+    return {t[i:i + 2] for i in range(len(t) - 1)}
+
+
+def _normalize_date(raw: str) -> Optional[str]:
+    nums = re.findall(r"\d+", raw or "")
+    if len(nums) != 3:
+        return None
+    y, m, d = (int(n) for n in nums)
+    if not (1900 <= y <= 2999 and 1 <= m <= 12 and 1 <= d <= 31):
+        return None
+    return f"{y:04d}-{m:02d}-{d:02d}"
+
+
+def _param_type(spec: Any) -> str:
+    t = str((spec or {}).get("type") or "string").lower() if isinstance(spec, dict) else "string"
+    if isinstance(spec, dict) and (spec.get("enum") or spec.get("values")):
+        return "enum"
+    if t in ("int", "integer"):
+        return "integer"
+    if t in ("number", "float", "decimal"):
+        return "number"
+    if t in ("date", "datetime"):
+        return "date"
+    return "string"
+
+
+@dataclass
+class TemplateEntry:
+    id: int
+    name: str
+    nl_template: str
+    sql_template: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    pattern: Optional["re.Pattern[str]"] = None
+    bigrams: Set[str] = field(default_factory=set)
+    embedding: Optional[List[float]] = None
+
+
+@dataclass
+class TemplateMatch:
+    template_id: int
+    name: str
+    sql: str
+    confidence: float
+    params: Dict[str, Any]
+    method: str
+
+
+def _slot_regex(name: str, spec: Any) -> str:
+    ptype = _param_type(spec)
+    if ptype == "date":
+        body = _DATE_RE
+    elif ptype in ("integer", "number"):
+        body = _NUMBER_RE
+    elif ptype == "enum":
+        values = [str(v) for v in (spec.get("enum") or spec.get("values") or [])]
+        body = "|".join(re.escape(v) for v in sorted(values, key=len, reverse=True))
+    else:
+        body = r"[^\s，,。；;：:？?！!]{1,30}?"
+    return f"(?P<{name}>{body})"
+
+
+def _compile_template(nl_template: str, params: Dict[str, Any]) -> Optional["re.Pattern[str]"]:
+    """将“查询{start_date}到{end_date}的销售趋势”编译为带类型槽位的正则（字面量间允许空白差异）。"""
+    parts: List[str] = []
+    pos = 0
+    seen: Set[str] = set()
+    for m in _PLACEHOLDER.finditer(nl_template):
+        literal = _NOISE.sub("", nl_template[pos:m.start()])
+        parts.append(r"\s*".join(re.escape(ch) for ch in literal))
+        name = m.group(1)
+        # 同名占位符重复出现时使用反向引用
+        parts.append(f"(?P={name})" if name in seen else _slot_regex(name, params.get(name)))
+        seen.add(name)
+        pos = m.end()
+    literal = _NOISE.sub("", nl_template[pos:])
+    parts.append(r"\s*".join(re.escape(ch) for ch in literal))
+    try:
+        return re.compile(r"\s*".join(p for p in parts if p), re.IGNORECASE)
+    except re.error:
+        return None
+
+
+def _quote(raw: str) -> str:
+    return "'" + escape_string(raw) + "'"
+
+
+def render_literal(value: Any, spec: Any) -> Optional[str]:
+    """按参数类型校验并生成可直接嵌入SQL的完整字面量：数字不带引号，日期/枚举/字符串带单引号；校验失败返回None。"""
+    ptype = _param_type(spec)
+    raw = str(value).strip()
+    if ptype == "date":
+        d = _normalize_date(raw)
+        return f"'{d}'" if d is not None else None
+    if ptype == "integer":
+        n = parse_cn_int(raw)
+        return str(n) if n is not None else None
+    if ptype == "number":
+        if re.fullmatch(r"\d+(?:\.\d+)?", raw):
+            return raw
+        n = parse_cn_int(raw)
+        return str(n) if n is not None else None
+    if ptype == "enum":
+        values = [str(v) for v in (spec.get("enum") or spec.get("values") or [])]
+        return _quote(raw) if raw in values else None
+    if not _SAFE_STRING.match(raw):
+        return None
+    return _quote(raw)
+
+
+class TemplateMatcher:
+    def __init__(self, ttl_seconds: int = 300, use_embedding: bool = False):
+        self.ttl_seconds = max(1, int(ttl_seconds))
+        self.use_embedding = bool(use_embedding)
+        self._entries: List[TemplateEntry] = []
+        self._index: Dict[str, Set[int]] = {}
+        self._loaded_at = 0.0
+        self._loaded = False
+        self._refreshing = False
+        self._load_lock = threading.Lock()
+        self._flag_lock = threading.Lock()
+        self._ef = None
+
+    # ---------- 索引 ----------
+    def invalidate(self):
+        """模板增删改后调用：下次访问时后台重建索引。"""
+        self._loaded_at = 0.0
+
+    def _ensure_loaded(self) -> bool:
+        """索引是否可用。冷启动或过期时仅触发后台加载，不阻塞调用方（match 在事件循环中调用）。"""
+        if not self._loaded:
+            self._schedule_refresh()
+            return False
+        if time.time() - self._loaded_at >= self.ttl_seconds:
+            self._schedule_refresh()
+        return True
+
+    def _schedule_refresh(self):
+        with self._flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning("查询模板索引后台刷新失败，继续使用旧索引: {}", e)
+        finally:
+            self._refreshing = False
+
+    def refresh(self):
+        with self._load_lock:
+            entries: List[TemplateEntry] = []
+            for r in self._load_rows():
+                params = r.get("parameters") or {}
+                if isinstance(params, (str, bytes)):
+                    try:
+                        params = json.loads(params)
+                    except Exception:
+                        params = {}
+                if not isinstance(params, dict):
+                    params = {}
+                nl = str(r.get("natural_language_template") or "")
+                sql = str(r.get("sql_template") or "")
+                if not nl or not sql:
+                    continue
+                entries.append(TemplateEntry(
+                    id=int(r["id"]),
+                    name=str(r.get("name") or ""),
+                    nl_template=nl,
+                    sql_template=sql,
+                    params=params,
+                    pattern=_compile_template(nl, params),
+                    bigrams=_bigrams(_PLACEHOLDER.sub("", nl)),
+                ))
+            index: Dict[str, Set[int]] = defaultdict(set)
+            for i, e in enumerate(entries):
+                for g in e.bigrams:
+                    index[g].add(i)
+            if self.use_embedding:
+                self._embed_entries(entries)
+            self._entries = entries
+            self._index = dict(index)
+            self._loaded = True
+            self._loaded_at = time.time()
+            logger.info("查询模板索引已加载: templates={}", len(entries))
+
+    def _load_rows(self) -> List[Dict[str, Any]]:
+        url = make_url(settings.DATABASE_URL)
+        conn = pymysql.connect(
+            host=url.host or "localhost",
+            port=int(url.port or 3306),
+            user=url.username,
+            password=url.password or "",
+            database=url.database,
+            charset="utf8mb4",
+            cursorclass=DictCursor,
+        )
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT id, name, natural_language_template, sql_template, parameters
+                    FROM aitt_query_templates
+                    WHERE is_public = 1
+                    ORDER BY id
+                    """
+                )
+                return list(cur.fetchall() or [])
+        finally:
+            conn.close()
+
+    def _embedding_function(self):
+        """惰性加载与元数据检索一致的 SentenceTransformer 嵌入函数；不可用时返回None。"""
+        if self._ef is None:
+            try:
+                from chromadb.utils import embedding_functions as _ef
+                try:
+                    self._ef = _ef.SentenceTransformerEmbeddingFunction(model_name="paraphrase-multilingual-MiniLM-L12-v2")
+                except Exception:
+                    self._ef = _ef.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+            except Exception as e:
+                logger.warning("模板向量匹配不可用，仅使用词法匹配: {}", e)
+                self.use_embedding = False
+                return None
+        return self._ef
+
+    def _embed_entries(self, entries: List[TemplateEntry]):
+        ef = self._embedding_function()
+        if ef is None or not entries:
+            return
+        try:
+            vectors = ef([_PLACEHOLDER.sub("", e.nl_template) for e in entries])
+            for e, v in zip(entries, vectors):
+                e.embedding = list(v)
+        except Exception as ex:
+            logger.warning("模板向量化失败，仅使用词法匹配: {}", ex)
+
+    # ---------- 匹配 ----------
+    def _fill_by_pattern(self, entry: TemplateEntry, text: str) -> Optional[Tuple[Dict[str, str], float]]:
+        if entry.pattern is None:
+            return None
+        compact = text.strip()
+        m = entry.pattern.search(_NOISE.sub("", compact))
+        if not m:
+            return None
+        span_ratio = (m.end() - m.start()) / max(1, len(_NOISE.sub("", compact)))
+        values = {k: v for k, v in m.groupdict().items() if v is not None}
+        for k, v in values.items():
+            # 去除标点后才匹配上的字符串参数（如含引号）视为不可信
+            if _param_type(entry.params.get(k)) == "string" and v not in compact:
+                return None
+        return values, span_ratio
+
+    def _fill_by_extraction(self, entry: TemplateEntry, text: str) -> Optional[Dict[str, str]]:
+        """从问题中按类型顺序抽取参数值（日期、数字、枚举值），缺少且无默认值时返回None。"""
+        dates = [m.group(0) for m in re.finditer(_DATE_RE, text)]
+        numbers = [m.group(0) for m in re.finditer(_NUMBER_RE, re.sub(_DATE_RE, " ", text))]
+        values: Dict[str, str] = {}
+        for name in dict.fromkeys(_PLACEHOLDER.findall(entry.nl_template + " " + entry.sql_template)):
+            spec = entry.params.get(name)
+            ptype = _param_type(spec)
+            v: Optional[str] = None
+            if ptype == "date" and dates:
+                v = dates.pop(0)
+            elif ptype in ("integer", "number") and numbers:
+                v = numbers.pop(0)
+            elif ptype == "enum":
+                for cand in sorted((str(x) for x in (spec.get("enum") or spec.get("values") or [])), key=len, reverse=True):
+                    if cand and cand in text:
+                        v = cand
+                        break
+            if v is None and isinstance(spec, dict) and spec.get("default") is not None:
+                v = str(spec.get("default"))
+            if v is None:
+                return None
+            values[name] = v
+        return values
+
+    def _render(self, entry: TemplateEntry, values: Dict[str, str]) -> Optional[str]:
+        rendered: Dict[str, str] = {}
+        for name in {m.group("name") for m in _SQL_SLOT.finditer(entry.sql_template)}:
+            raw = values.get(name)
+            if raw is None:
+                spec = entry.params.get(name)
+                if isinstance(spec, dict) and spec.get("default") is not None:
+                    raw = str(spec["default"])
+                else:
+                    return None
+            lit = render_literal(raw, entry.params.get(name))
+            if lit is None:
+                return None
+            rendered[name] = lit
+        return _SQL_SLOT.sub(lambda m: rendered.get(m.group("name"), m.group(0)), entry.sql_template)
+
+    def match(self, text: str) -> Optional[TemplateMatch]:
+        """返回置信度最高的模板匹配；索引尚未加载、无候选或参数无法填充时返回None。"""
+        text = (text or "").strip()
+        if not text:
+            return None
+        if not self._ensure_loaded():
+            return None
+        entries = self._entries
+        if not entries:
+            return None
+        q_grams = _bigrams(text)
+        cand_ids: Set[int] = set()
+        for g in q_grams:
+            cand_ids |= self._index.get(g, set())
+        q_vec = None
+        if self.use_embedding and any(e.embedding for e in entries):
+            ef = self._embedding_function()
+            try:
+                q_vec = list(ef([text])[0]) if ef is not None else None
+                cand_ids = set(range(len(entries)))
+            except Exception:
+                q_vec = None
+
+        best: Optional[TemplateMatch] = None
+        for i in cand_ids:
+            e = entries[i]
+            lexical = (2 * len(q_grams & e.bigrams) / (len(q_grams) + len(e.bigrams))) if e.bigrams else 0.0
+            sim = lexical
+            if q_vec is not None and e.embedding:
+                sim = max(sim, _cosine(q_vec, e.embedding))
+            filled = self._fill_by_pattern(e, text)
+            if filled is not None:
+                values, span_ratio = filled
+                conf = 0.7 + 0.25 * span_ratio + 0.05 * sim
+                method = "pattern"
+            else:
+                values = self._fill_by_extraction(e, text)
+                if values is None:
+                    continue
+                conf = 0.9 * sim
+                method = "similarity"
+            sql = self._render(e, values)
+            if sql is None:
+                continue
+            conf = round(min(conf, 0.99), 3)
+            if best is None or conf > best.confidence:
+                best = TemplateMatch(template_id=e.id, name=e.name, sql=sql, confidence=conf, params=values, method=method)
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "templates": len(self._entries),
+            "loaded_at": self._loaded_at or None,
+            "use_embedding": self.use_embedding,
+        }
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    num = sum(x * y for x, y in zip(a, b))
+    da = sum(x * x for x in a) ** 0.5
+    db = sum(y * y for y in b) ** 0.5
+    return num / (da * db) if da and db else 0.0
+
+
+class TemplateUsageCounter:
+    """模板命中计数：请求路径仅累加内存计数，后台按固定间隔合并回写 usage_count。"""
+
+    def __init__(self, flush_interval_ms: int = 5000):
+        self.flush_interval_ms = max(100, int(flush_interval_ms))
+        self._pending: Dict[int, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._flushed_total = 0
+
+    def bump(self, template_id: int):
+        with self._lock:
+            self._pending[int(template_id)] += 1
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping:
+            await asyncio.sleep(self.flush_interval_ms / 1000.0)
+            await self.flush()
+
+    async def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            batch = list(self._pending.items())
+            self._pending.clear()
+        try:
+            await asyncio.to_thread(self._update_pymysql, batch)
+            self._flushed_total += sum(n for _, n in batch)
+        except Exception as e:
+            # 回写失败时合并回待写计数，下个周期重试
+            with self._lock:
+                for tid, n in batch:
+                    self._pending[tid] += n
+            logger.warning("模板使用次数回写失败，稍后重试: {}", e)
+
+    def _update_pymysql(self, batch: List[Tuple[int, int]]):
+        url = make_url(settings.DATABASE_URL)
+        conn = pymysql.connect(
+            host=url.host or "localhost",
+            port=int(url.port or 3306),
+            user=url.username,
+            password=url.password or "",
+            database=url.database,
+            charset="utf8mb4",
+        )
+        try:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    "UPDATE aitt_query_templates SET usage_count = COALESCE(usage_count, 0) + %s WHERE id = %s",
+                    [(n, tid) for tid, n in batch],
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(self._pending.values())
+        return {"pending": pending, "flushed_total": self._flushed_total}
+
+
+_matcher: Optional[TemplateMatcher] = None
+_matcher_lock = threading.Lock()
+
+# 全局单例：由 lifespan 负责启动与排空
+template_usage_counter = TemplateUsageCounter(flush_interval_ms=settings.TEMPLATE_USAGE_FLUSH_INTERVAL_MS)
+
+
+def get_template_matcher() -> TemplateMatcher:
+    """获取全局模板匹配器单例。"""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = TemplateMatcher(
+                    ttl_seconds=settings.TEMPLATE_INDEX_TTL_SECONDS,
+                    use_embedding=settings.TEMPLATE_MATCH_USE_EMBEDDING,
+                )
+    return _matcher
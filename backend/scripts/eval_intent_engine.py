@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+# 允许从 backend 目录直接运行：python scripts/eval_intent_engine.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.intent_engine import get_intent_engine  # noqa: E402
+from app.services.metadata_catalog import get_metadata_catalog  # noqa: E402
+
+
+def load_cases(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("评测数据格式错误：应为数组")
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="意图语法引擎离线评测（覆盖率/选表准确率/解析耗时），无需启动服务与模型")
+    parser.add_argument("--cases", default="backend/scripts/eval_cases.json", help="评测数据集路径（JSON数组）")
+    parser.add_argument("--threshold", type=float, default=None, help="直接返回SQL的置信度阈值，默认取配置 INTENT_ENGINE_MIN_CONFIDENCE")
+    parser.add_argument("--output", default="", help="评测报告输出路径（可选）")
+    args = parser.parse_args()
+
+    from app.core.config import settings
+    threshold = args.threshold if args.threshold is not None else settings.INTENT_ENGINE_MIN_CONFIDENCE
+
+    cases = load_cases(args.cases)
+    snap = get_metadata_catalog().refresh()
+    engine = get_intent_engine()
+
+    latencies_us: List[float] = []
+    details: List[Dict[str, Any]] = []
+    covered = correct = 0
+    for c in cases:
+        q = c.get("query") or ""
+        expected_table = (c.get("expected_selected_table") or "").strip()
+        t0 = time.perf_counter()
+        r = engine.match(q, snap)
+        latencies_us.append((time.perf_counter() - t0) * 1e6)
+        hit = r is not None and r.confidence >= threshold
+        is_correct = hit and bool(expected_table) and r.table.lower() == expected_table.lower()
+        covered += int(hit)
+        correct += int(is_correct)
+        details.append({
+            "query": q,
+            "expected_table": expected_table,
+            "selected_table": r.table if r else None,
+            "intent": r.intent if r else None,
+            "confidence": r.confidence if r else None,
+            "sql": r.sql if r else None,
+            "hit": hit,
+            "correct": is_correct,
+            "latency_us": round(latencies_us[-1], 1),
+        })
+
+    result = {
+        "threshold": threshold,
+        "catalog_version": snap.version,
+        "cases": len(cases),
+        "coverage": round(covered / len(cases), 4) if cases else 0.0,
+        "precision": round(correct / covered, 4) if covered else 0.0,
+        "avg_latency_us": round(statistics.mean(latencies_us), 1) if latencies_us else 0.0,
+        "max_latency_us": round(max(latencies_us), 1) if latencies_us else 0.0,
+        "details": details,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps({k: v for k, v in result.items() if k != "details"}, ensure_ascii=False))
+    for d in details:
+        flag = "OK " if d["correct"] else ("ERR" if d["hit"] else "-- ")
+        print(f"{flag} {d['confidence']!s:<6} {d['selected_table']!s:<16} {d['query']}")
+
+
+if __name__ == "__main__":
+    main()
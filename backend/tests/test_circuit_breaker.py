@@ -0,0 +1,127 @@
+"""
+大模型熔断器测试：滑动窗口熔断、冷却后半开、探测名额限制与取消调用的处理。
+"""
+import pytest
+
+from app.services import circuit_breaker as cb_module
+from app.services.circuit_breaker import BreakerState, CircuitBreaker
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(cb_module.time, "monotonic", c)
+    return c
+
+
+def _breaker(**kw):
+    opts = dict(window_size=4, min_calls=4, error_rate_threshold=0.5, slow_call_ms=1000, slow_call_rate_threshold=0.75, open_seconds=30, half_open_max_probes=1)
+    opts.update(kw)
+    return CircuitBreaker("test", **opts)
+
+
+def _open(b):
+    for _ in range(b.window_size):
+        b.record_failure(10, "boom")
+    assert b.state == BreakerState.OPEN
+
+
+# ---------- 滑动窗口 ----------
+def test_stays_closed_below_min_calls(clock):
+    b = _breaker()
+    for _ in range(3):
+        b.record_failure(10, "boom")
+    assert b.state == BreakerState.CLOSED
+
+
+def test_trips_on_error_rate(clock):
+    b = _breaker()
+    b.record_success(10)
+    b.record_success(10)
+    b.record_failure(10, "boom")
+    assert b.state == BreakerState.CLOSED
+    b.record_failure(10, "boom")
+    assert b.state == BreakerState.OPEN
+    assert not b.allow_request()
+    assert b.snapshot()["rejected_total"] == 1
+
+
+def test_old_failures_slide_out_of_window(clock):
+    b = _breaker(window_size=4, min_calls=4, error_rate_threshold=0.75)
+    b.record_failure(10, "boom")
+    b.record_failure(10, "boom")
+    for _ in range(4):
+        b.record_success(10)
+    b.record_failure(10, "boom")
+    assert b.state == BreakerState.CLOSED
+    assert b.snapshot()["error_rate"] == 0.25
+
+
+def test_trips_on_slow_call_rate(clock):
+    b = _breaker()
+    for _ in range(3):
+        b.record_success(1500)
+    b.record_success(10)
+    assert b.state == BreakerState.OPEN
+
+
+# ---------- 冷却与半开 ----------
+def test_open_moves_to_half_open_after_cooldown(clock):
+    b = _breaker()
+    _open(b)
+    clock.now += 29
+    assert b.state == BreakerState.OPEN
+    assert b.snapshot()["retry_in_seconds"] == 1.0
+    clock.now += 1
+    assert b.state == BreakerState.HALF_OPEN
+
+
+def test_half_open_limits_probes_and_closes_on_success(clock):
+    b = _breaker(half_open_max_probes=2)
+    _open(b)
+    clock.now += 30
+    assert b.allow_request() and b.allow_request()
+    assert not b.allow_request()
+    b.record_success(10)
+    assert b.state == BreakerState.HALF_OPEN
+    b.record_success(10)
+    assert b.state == BreakerState.CLOSED
+    assert b.snapshot()["window_calls"] == 0
+
+
+@pytest.mark.parametrize("record", [lambda b: b.record_failure(10, "boom"), lambda b: b.record_success(5000)])
+def test_half_open_probe_failure_or_slow_call_reopens(clock, record):
+    b = _breaker()
+    _open(b)
+    clock.now += 30
+    assert b.allow_request()
+    record(b)
+    assert b.state == BreakerState.OPEN
+    assert not b.allow_request()
+
+
+def test_record_cancelled_releases_probe_slot(clock):
+    b = _breaker()
+    _open(b)
+    clock.now += 30
+    assert b.allow_request()
+    assert not b.allow_request()
+    b.record_cancelled()
+    assert b.state == BreakerState.HALF_OPEN
+    assert b.allow_request()
+
+
+def test_record_cancelled_does_not_touch_window(clock):
+    b = _breaker()
+    b.record_success(10)
+    b.record_cancelled()
+    assert b.state == BreakerState.CLOSED
+    assert b.snapshot()["window_calls"] == 1
@@ -0,0 +1,51 @@
+"""
+会话摘要测试：Token 估算与截断、关闭时排空后台任务。
+"""
+import asyncio
+
+from app.services.conversation_summary import ConversationSummarizer, _truncate_to_tokens, estimate_tokens
+
+
+def test_truncate_keeps_latest_content():
+    text = "旧内容" * 50 + "最新结论"
+    out = _truncate_to_tokens(text, 10)
+    assert out.endswith("最新结论")
+    assert estimate_tokens(out) <= 11
+
+
+def test_drain_waits_for_running_updates_and_rejects_new_ones():
+    summarizer = ConversationSummarizer()
+    finished = []
+
+    async def _fake_update(conversation_id):
+        await asyncio.sleep(0.05)
+        finished.append(conversation_id)
+        summarizer._running.discard(conversation_id)
+
+    summarizer._update = _fake_update
+
+    async def _main():
+        summarizer.schedule_update(1)
+        await summarizer.drain(timeout=2)
+        summarizer.schedule_update(2)
+        return len(summarizer._tasks)
+
+    assert asyncio.run(_main()) == 0
+    assert finished == [1]
+
+
+def test_drain_cancels_updates_past_timeout():
+    summarizer = ConversationSummarizer()
+
+    async def _slow_update(conversation_id):
+        await asyncio.sleep(10)
+
+    summarizer._update = _slow_update
+
+    async def _main():
+        summarizer.schedule_update(1)
+        task = next(iter(summarizer._tasks))
+        await summarizer.drain(timeout=0.05)
+        return task.cancelled()
+
+    assert asyncio.run(_main())
@@ -0,0 +1,165 @@
+"""
+代价守卫测试：MySQL/PostgreSQL 执行计划解析与按阈值给出的放行/收紧/拒绝判定。
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.data_source import DataSourceType
+from app.services import cost_guard as cg
+from app.services.cost_guard import (
+    VERDICT_LIMITED,
+    VERDICT_PASS,
+    VERDICT_REJECTED,
+    VERDICT_SKIPPED,
+    CostGuard,
+    CostGuardRejectedError,
+    parse_mysql_plan,
+    parse_postgres_plan,
+)
+from app.services.query_executor import QueryExecutorManager
+
+MYSQL_JOIN_PLAN = {
+    "query_block": {
+        "cost_info": {"query_cost": "1250.50"},
+        "nested_loop": [
+            {"table": {"table_name": "o", "access_type": "ALL", "rows_examined_per_scan": 1000, "rows_produced_per_join": "1000"}},
+            {"table": {"table_name": "i", "access_type": "ref", "rows_examined_per_scan": 5, "rows_produced_per_join": "5000"}},
+        ],
+    }
+}
+
+PG_NESTED_LOOP_PLAN = [{
+    "Plan": {
+        "Node Type": "Nested Loop",
+        "Plan Rows": 4000,
+        "Total Cost": 880.0,
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "orders", "Plan Rows": 200},
+            {"Node Type": "Index Scan", "Relation Name": "items", "Plan Rows": 20},
+        ],
+    }
+}]
+
+
+# ---------- 计划解析 ----------
+def test_parse_mysql_nested_loop():
+    est = parse_mysql_plan(MYSQL_JOIN_PLAN)
+    # 内表按外表产出行数重复扫描：1000 + 5 * 1000
+    assert est.rows_scanned == 6000
+    assert est.join_fanout == 5000
+    assert est.full_scans == ["o"]
+    assert est.cost == 1250.5
+
+
+def test_parse_mysql_single_table_has_no_fanout():
+    est = parse_mysql_plan({"query_block": {"table": {"table_name": "t", "access_type": "range", "rows_examined_per_scan": "42"}}})
+    assert (est.rows_scanned, est.join_fanout, est.full_scans, est.cost) == (42, 0, [], None)
+
+
+def test_parse_postgres_nested_loop():
+    est = parse_postgres_plan(PG_NESTED_LOOP_PLAN)
+    assert est.rows_scanned == 200 + 20 * 200
+    assert est.join_fanout == 4000
+    assert est.full_scans == ["orders"]
+    assert est.cost == 880.0
+
+
+@pytest.mark.parametrize("plan", [None, [], {}, "garbage"])
+def test_parse_tolerates_empty_plans(plan):
+    assert parse_postgres_plan(plan).rows_scanned == 0
+    assert parse_mysql_plan(plan).rows_scanned == 0
+
+
+# ---------- 判定 ----------
+def _ds(action="reject", max_scan_rows=1000, max_join_fanout=None, type_=DataSourceType.MYSQL):
+    return SimpleNamespace(id=1, type=type_, cost_guard_action=action, max_scan_rows=max_scan_rows, max_join_fanout=max_join_fanout)
+
+
+class _Service:
+    def __init__(self, plan=None, error=None):
+        self.plan = plan
+        self.error = error
+        self.calls = 0
+
+    def explain_blocking(self, ds, sql, timeout):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.plan
+
+
+@pytest.fixture
+def guard(monkeypatch):
+    manager = QueryExecutorManager()
+    monkeypatch.setattr(cg, "get_query_executor", lambda: manager)
+    monkeypatch.setattr(settings, "COST_GUARD_ENABLED", True)
+    monkeypatch.setattr(settings, "COST_GUARD_MAX_JOIN_FANOUT", 0)
+    monkeypatch.setattr(settings, "COST_GUARD_LIMIT_ROWS", 100)
+    yield CostGuard()
+    manager.shutdown()
+
+
+def _evaluate(guard, service, ds, sql="SELECT * FROM o JOIN i ON i.oid = o.id", max_rows=1000):
+    return asyncio.run(guard.evaluate(service, ds, sql, max_rows))
+
+
+def test_pass_under_threshold(guard):
+    v = _evaluate(guard, _Service(MYSQL_JOIN_PLAN), _ds(max_scan_rows=10000))
+    assert v.verdict == VERDICT_PASS and v.max_rows == 1000 and v.reason is None
+
+
+def test_reject_over_scan_threshold(guard):
+    v = _evaluate(guard, _Service(MYSQL_JOIN_PLAN), _ds(max_scan_rows=1000))
+    assert v.verdict == VERDICT_REJECTED
+    assert "6,000" in v.reason and "全表扫描: o" in v.reason
+
+
+def test_reject_over_fanout_threshold(guard):
+    v = _evaluate(guard, _Service(MYSQL_JOIN_PLAN), _ds(max_scan_rows=0, max_join_fanout=100))
+    assert v.verdict == VERDICT_REJECTED and "连接结果" in v.reason
+
+
+def test_zero_thresholds_disable_limits(guard):
+    assert _evaluate(guard, _Service(MYSQL_JOIN_PLAN), _ds(max_scan_rows=0)).verdict == VERDICT_PASS
+
+
+def test_limit_action_tightens_detail_query(guard):
+    v = _evaluate(guard, _Service(MYSQL_JOIN_PLAN), _ds(action="limit"))
+    assert v.verdict == VERDICT_LIMITED and v.max_rows == 100
+
+
+@pytest.mark.parametrize("sql", ["SELECT city, COUNT(*) FROM o GROUP BY city", "SELECT * FROM o ORDER BY amount"])
+def test_limit_action_still_rejects_queries_that_read_all_input(guard, sql):
+    v = _evaluate(guard, _Service(MYSQL_JOIN_PLAN), _ds(action="limit"), sql=sql)
+    assert v.verdict == VERDICT_REJECTED
+
+
+def test_off_action_skips_explain(guard):
+    service = _Service(MYSQL_JOIN_PLAN)
+    assert _evaluate(guard, service, _ds(action="off")).verdict == VERDICT_SKIPPED
+    assert service.calls == 0
+
+
+def test_explain_failure_lets_query_through(guard):
+    v = _evaluate(guard, _Service(error=RuntimeError("denied")), _ds())
+    assert v.verdict == VERDICT_SKIPPED and "denied" in v.reason
+    assert guard.explain_errors == 1
+
+
+def test_postgres_plan_and_estimate_cache(guard):
+    service = _Service(PG_NESTED_LOOP_PLAN)
+    ds = _ds(max_scan_rows=100, type_=DataSourceType.POSTGRESQL)
+    first = _evaluate(guard, service, ds, sql="SELECT * FROM orders")
+    second = _evaluate(guard, service, ds, sql="select *  from orders")
+    assert first.verdict == second.verdict == VERDICT_REJECTED
+    assert (first.cached, second.cached, service.calls) == (False, True, 1)
+
+
+def test_check_raises_on_reject(guard):
+    with pytest.raises(CostGuardRejectedError) as exc:
+        asyncio.run(guard.check(_Service(MYSQL_JOIN_PLAN), _ds(), "SELECT * FROM o", 1000))
+    assert exc.value.verdict.verdict == VERDICT_REJECTED
+    assert guard.rejected_total == 1
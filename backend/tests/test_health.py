@@ -0,0 +1,17 @@
+"""
+健康检查测试：/health 与 /api/v1/health 返回同一份汇总数据。
+"""
+import asyncio
+
+from app.api.v1.health import build_health_payload, health_v1
+
+
+def test_health_payload_shape():
+    payload = build_health_payload()
+    assert payload["status"] in ("healthy", "degraded")
+    for key in ("llm_breakers", "query_executors", "query_schedulers", "query_exports", "data_source_replicas"):
+        assert key in payload
+
+
+def test_v1_endpoint_uses_shared_payload():
+    assert asyncio.run(health_v1()).keys() == build_health_payload().keys()
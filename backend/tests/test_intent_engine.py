@@ -0,0 +1,160 @@
+"""
+意图引擎测试：槽位解析规则、基于元数据目录的表选择与SQL组装、置信度阈值。
+"""
+import re
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai as ai_module
+from app.services.ai import AIService
+from app.services.intent_engine import IntentEngine, IntentRule, TimeRange, parse_cn_int
+from app.services.metadata_catalog import CatalogColumn, CatalogSnapshot, CatalogTable
+
+
+def _col(name, type_="varchar", **kw):
+    return CatalogColumn(name=name, type=type_, **kw)
+
+
+@pytest.fixture
+def snap():
+    orders = CatalogTable(id=1, name="orders", data_source_id=1, display_name="订单表")
+    orders.columns = [
+        _col("order_id", "bigint", is_pk=True),
+        _col("customer_id", "bigint", is_dim=True, display_name="客户"),
+        _col("city", is_dim=True, display_name="城市"),
+        _col("status", is_dim=True, display_name="状态"),
+        _col("order_date", "datetime", is_dim=True, display_name="下单时间"),
+        _col("total_amount", "decimal", is_met=True, display_name="订单金额"),
+    ]
+    customers = CatalogTable(id=2, name="customers", data_source_id=1, display_name="客户表")
+    customers.columns = [
+        _col("customer_id", "bigint", is_pk=True),
+        _col("name", display_name="姓名"),
+        _col("city", is_dim=True, display_name="城市"),
+        _col("created_at", "datetime", is_dim=True, display_name="注册时间"),
+    ]
+    return CatalogSnapshot({"orders": orders, "customers": customers}, version=1, fingerprint="t")
+
+
+# ---------- 槽位解析 ----------
+@pytest.mark.parametrize("text,expected", [("7", 7), ("十五", 15), ("二十", 20), ("一百零五", 105), ("两", 2), ("abc", None), ("", None)])
+def test_parse_cn_int(text, expected):
+    assert parse_cn_int(text) == expected
+
+
+def test_parse_slots():
+    st = IntentEngine().parse("最近三个月按城市统计订单金额最高的前10个")
+    assert st.time_range == TimeRange(kind="last", n=3, unit="MONTH")
+    assert st.top_n == 10 and st.order_dir == "DESC"
+    assert [p for p, _, _ in st.group_phrases][0] == "城市"
+    assert "amount" in st.measures
+
+
+@pytest.mark.parametrize(
+    "text,kind,extra",
+    [
+        ("2024年的订单", "year", {"year": 2024}),
+        ("2024年3月的订单", "month", {"year": 2024, "month": 3}),
+        ("今年的订单", "this_year", {}),
+        ("昨天的订单", "yesterday", {}),
+        ("近一周的订单", "last", {"n": 1, "unit": "WEEK"}),
+    ],
+)
+def test_parse_time_range(text, kind, extra):
+    tr = IntentEngine().parse(text).time_range
+    assert tr is not None and tr.kind == kind
+    for k, v in extra.items():
+        assert getattr(tr, k) == v
+
+
+def test_time_range_sql_month_rolls_over_year():
+    assert TimeRange(kind="month", year=2023, month=12).to_sql("d") == "d >= '2023-12-01' AND d < '2024-01-01'"
+
+
+def test_register_rule_before_existing():
+    engine = IntentEngine()
+    seen = []
+    engine.register(IntentRule("probe", re.compile("订单"), lambda st, m: seen.append(m.group(0))), before="last_n")
+    assert [r.name for r in engine.rules[:1]] == ["probe"]
+    engine.parse("最近7天订单")
+    assert seen == ["订单"]
+
+
+# ---------- 表选择与SQL组装 ----------
+def test_trend_query(snap):
+    r = IntentEngine().match("统计最近7天每天的订单金额", snap)
+    assert r.table == "orders" and r.intent == "trend"
+    assert r.sql == (
+        "SELECT DATE(order_date) AS period, SUM(total_amount) AS sum_total_amount\n"
+        "FROM orders\n"
+        "WHERE order_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)\n"
+        "GROUP BY DATE(order_date)\n"
+        "ORDER BY period"
+    )
+
+
+def test_top_n_query(snap):
+    r = IntentEngine().match("订单金额最高的前5个城市", snap)
+    assert r.intent == "top_n" and r.table == "orders"
+    assert r.sql.endswith("GROUP BY city\nORDER BY sum_total_amount DESC\nLIMIT 5")
+    assert r.slots["top_n"] == 5 and r.slots["dimensions"] == ["city"]
+
+
+def test_group_by_picks_table_by_entity(snap):
+    r = IntentEngine().match("各城市的客户数量", snap)
+    assert r.table == "customers"
+    assert r.sql == "SELECT city, COUNT(*) AS record_count\nFROM customers\nGROUP BY city"
+
+
+@pytest.mark.parametrize("text", ["帮我写一首诗", "今天天气怎么样订单", "   "])
+def test_unrelated_or_low_coverage_text_returns_none(snap, text):
+    assert IntentEngine().match(text, snap) is None
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "订单金额最高的客户",  # 提到了维度却没有按它分组
+        "订单数最少的城市",
+        "北京的订单数",  # 过滤值无法落到 WHERE 中
+        "状态为已取消的订单数",
+        "去重统计最近30天下单的客户数",
+    ],
+)
+def test_unused_dimension_or_filter_value_returns_none(snap, text):
+    assert IntentEngine().match(text, snap) is None
+
+
+def test_no_catalog_returns_none():
+    assert IntentEngine().match("按城市统计订单数量", None) is None
+
+
+def test_confidence_bounds(snap):
+    r = IntentEngine().match("按城市统计订单数量", snap)
+    assert 0.0 < r.confidence <= 0.99
+    assert r.slots["coverage"] >= 0.6
+
+
+# ---------- 置信度阈值 ----------
+class _Catalog:
+    def __init__(self, snap):
+        self._snap = snap
+
+    def get(self):
+        return self._snap
+
+
+def test_intent_sql_respects_threshold(monkeypatch, snap):
+    monkeypatch.setattr(ai_module, "get_metadata_catalog", lambda: _Catalog(snap))
+    monkeypatch.setattr(settings, "INTENT_ENGINE_ENABLED", True)
+    service = AIService(db=None)
+    conf = IntentEngine().match("按城市统计订单数量", snap).confidence
+    assert service._intent_sql("按城市统计订单数量", conf) is not None
+    assert service._intent_sql("按城市统计订单数量", conf + 0.01) is None
+
+
+def test_intent_sql_disabled(monkeypatch, snap):
+    monkeypatch.setattr(ai_module, "get_metadata_catalog", lambda: _Catalog(snap))
+    monkeypatch.setattr(settings, "INTENT_ENGINE_ENABLED", False)
+    assert AIService(db=None)._intent_sql("按城市统计订单数量", 0.0) is None
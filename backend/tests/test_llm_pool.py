@@ -0,0 +1,138 @@
+"""
+大模型端点池测试：最少在途选择、熔断跳过、对冲请求与落后请求取消、对冲比例上限及全部端点失败。
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.circuit_breaker import BreakerState, CircuitBreaker
+from app.services.llm_pool import LLMEndpoint, LLMPool, LLMUnavailableError
+
+
+class _Completions:
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def create(self, model, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(endpoint=self.name, model=model)
+
+
+def _endpoint(name, delay=0.0, error=None, weight=1.0):
+    ep = LLMEndpoint(base_url=f"http://{name}.test/v1", api_key="k", weight=weight, name=name)
+    # 每个用例使用独立熔断器，避免全局注册表在用例之间共享状态
+    ep.breaker = CircuitBreaker(name, window_size=4, min_calls=2, open_seconds=60)
+    ep.fake = _Completions(name, delay, error)
+    ep._client = SimpleNamespace(chat=SimpleNamespace(completions=ep.fake))
+    return ep
+
+
+def _hedged_pool(*eps, max_ratio=1.0):
+    return LLMPool(list(eps), hedge_enabled=True, hedge_min_delay_ms=20, hedge_max_ratio=max_ratio)
+
+
+# ---------- 端点选择 ----------
+def test_pick_least_outstanding_by_weight():
+    a, b = _endpoint("a", weight=4), _endpoint("b")
+    pool = LLMPool([a, b])
+    a.in_flight, b.in_flight = 2, 1
+    assert pool._pick() is a
+    a.in_flight = 5
+    assert pool._pick() is b
+
+
+def test_pick_skips_open_breaker():
+    a, b = _endpoint("a"), _endpoint("b")
+    pool = LLMPool([a, b])
+    a.breaker._trip("test")
+    assert pool._pick() is b
+    assert pool.has_available()
+    b.breaker._trip("test")
+    assert pool._pick() is None
+    assert not pool.has_available()
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(pool.chat_completion("m", messages=[]))
+
+
+# ---------- 对冲 ----------
+def test_no_hedge_when_primary_is_fast():
+    a, b = _endpoint("a", delay=0.0), _endpoint("b")
+    pool = _hedged_pool(a, b)
+    completion, ep = asyncio.run(pool.chat_completion("m", messages=[]))
+    assert ep is a and completion.endpoint == "a"
+    assert b.fake.calls == 0
+    assert pool.stats()["hedged_total"] == 0
+
+
+def test_hedge_wins_and_cancels_loser():
+    a, b = _endpoint("a", delay=5.0), _endpoint("b", delay=0.0)
+    pool = _hedged_pool(a, b)
+
+    async def run():
+        result = await pool.chat_completion("m", messages=[])
+        await asyncio.sleep(0)
+        assert a.fake.cancelled == 1
+        return result
+
+    completion, ep = asyncio.run(run())
+    assert ep is b and completion.model == "m"
+    assert a.fake.cancelled == 1 and a.in_flight == 0 and b.in_flight == 0
+    stats = pool.stats()
+    assert stats["hedged_total"] == 1 and stats["hedge_wins"] == 1
+    # 被取消的一方不计入失败
+    assert a.failures_total == 0 and a.breaker.state == BreakerState.CLOSED
+
+
+def test_hedge_ratio_cap():
+    a, b = _endpoint("a"), _endpoint("b")
+    pool = _hedged_pool(a, b, max_ratio=0.1)
+    assert pool._hedge_delay_s(a) == 0.02
+    pool._requests_total, pool._hedged_total = 10, 1
+    assert pool._hedge_delay_s(a) is None
+    pool.hedge_max_ratio = 0.2
+    assert pool._hedge_delay_s(a) == 0.02
+    assert LLMPool([a, b])._hedge_delay_s(a) is None
+    assert _hedged_pool(a)._hedge_delay_s(a) is None
+
+
+def test_caller_cancel_cancels_in_flight_request():
+    a, b = _endpoint("a", delay=5.0), _endpoint("b")
+    pool = LLMPool([a, b], hedge_enabled=True, hedge_min_delay_ms=1000, hedge_max_ratio=1.0)
+
+    async def run():
+        task = asyncio.create_task(pool.chat_completion("m", messages=[]))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        # 须在事件循环结束前检查：asyncio.run 收尾时会取消所有遗留任务
+        assert a.fake.cancelled == 1 and a.in_flight == 0
+
+    asyncio.run(run())
+    assert b.fake.calls == 0
+
+
+def test_fully_broken_pool_raises_last_error_and_trips_breakers():
+    err = RuntimeError("upstream down")
+    a, b = _endpoint("a", delay=0.05, error=err), _endpoint("b", delay=0.0, error=err)
+    pool = _hedged_pool(a, b)
+    for _ in range(2):
+        with pytest.raises(RuntimeError, match="upstream down"):
+            asyncio.run(pool.chat_completion("m", messages=[]))
+    assert a.failures_total == 2 and b.failures_total == 2
+    assert not pool.has_available()
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(pool.chat_completion("m", messages=[]))
@@ -0,0 +1,28 @@
+"""
+提示词构建测试：请求上下文序列化与各上下文分节。
+"""
+from app.services.prompt import build_sql_generation_prompt, format_user_context
+
+
+def test_format_user_context_dict_lines():
+    text = format_user_context({"部门": "华东", "filters": {"year": 2024}, "top": 5})
+    assert text.splitlines() == ["- 部门: 华东", '- filters: {"year": 2024}', "- top: 5"]
+
+
+def test_format_user_context_empty_and_str():
+    assert format_user_context(None) is None
+    assert format_user_context({}) is None
+    assert format_user_context("已有说明") == "已有说明"
+
+
+def test_prompt_keeps_context_sections_separate():
+    prompt = build_sql_generation_prompt(
+        "按月统计",
+        user_context={"region": "east"},
+        history_context="上一轮：统计订单",
+        followup_context="上一轮SQL：SELECT 1",
+    )
+    assert "## 用户上下文\n- region: east" in prompt
+    assert "## 会话历史\n上一轮：统计订单" in prompt
+    assert "## 追问上下文\n上一轮SQL：SELECT 1" in prompt
+    assert "{'region'" not in prompt
@@ -0,0 +1,59 @@
+"""
+结果导出测试：下载 Range 头解析、按区间读取文件、导出格式依赖检查。
+"""
+import pytest
+
+from app.services import query_exports as qe
+from app.services.query_exports import (
+    EXPORT_FORMAT_CSV,
+    EXPORT_FORMAT_PARQUET,
+    ExportFormatUnavailableError,
+    RangeNotSatisfiableError,
+    check_format,
+    iter_file,
+    parse_range,
+)
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-200", (800, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("  Bytes=0-0 ", (0, 0)),
+        ("bytes = 0-9", None),
+        (None, None),
+        ("", None),
+        ("items=0-10", None),
+        ("bytes=0-10,20-30", None),
+        ("bytes=abc", None),
+        ("bytes=a-b", None),
+        ("bytes=-", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header,size", [("bytes=1000-", 1000), ("bytes=50-10", 1000), ("bytes=-0", 1000), ("bytes=-10", 0), ("bytes=0-", 0)])
+def test_parse_range_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiableError):
+        parse_range(header, size)
+
+
+def test_iter_file_reads_closed_interval(tmp_path):
+    path = tmp_path / "part-0001.csv"
+    path.write_bytes(bytes(range(256)) * 100)
+    data = b"".join(iter_file(str(path), 10, 9009))
+    assert data == (bytes(range(256)) * 100)[10:9010]
+
+
+def test_check_format(monkeypatch):
+    check_format(EXPORT_FORMAT_CSV)
+    monkeypatch.setattr(qe, "arrow_available", lambda: False)
+    check_format(EXPORT_FORMAT_CSV)
+    with pytest.raises(ExportFormatUnavailableError, match="pyarrow"):
+        check_format(EXPORT_FORMAT_PARQUET)
@@ -0,0 +1,154 @@
+"""
+抽样近似执行测试：PostgreSQL TABLESAMPLE 与 MySQL 主键范围改写、不可抽样时的原因、COUNT/SUM 结果放大。
+"""
+import asyncio
+import decimal
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.data_source import DataSourceType
+from app.services import query_sampler as qs
+from app.services.metadata_catalog import CatalogColumn, CatalogSnapshot, CatalogTable
+from app.services.query_sampler import (
+    SAMPLE_METHOD_PK_RANGE,
+    SAMPLE_METHOD_TABLESAMPLE,
+    QuerySampler,
+    SamplePlan,
+    scale_results,
+)
+
+AGG_SQL = "SELECT status, COUNT(*) AS c, SUM(amount) AS s, AVG(amount) AS a, COUNT(DISTINCT uid) AS d FROM orders o WHERE x > 1 GROUP BY status"
+
+
+class _Catalog:
+    def __init__(self, pk_type="bigint(20)"):
+        t = CatalogTable(id=1, name="orders", data_source_id=1)
+        t.columns = [CatalogColumn(name="id", type=pk_type, is_pk=True), CatalogColumn(name="amount", type="decimal")]
+        self.snap = CatalogSnapshot({"orders": t}, version=1, fingerprint="t")
+
+    def get(self, wait=False):
+        return self.snap
+
+
+class _Service:
+    def __init__(self, lo=1, hi=100000):
+        self.lo, self.hi = lo, hi
+        self.bound_queries = []
+
+    async def execute_sql(self, ds, sql, **kwargs):
+        self.bound_queries.append(sql)
+        return [{"lo": self.lo, "hi": self.hi}], ["lo", "hi"]
+
+
+def _ds(type_):
+    return SimpleNamespace(id=1, type=type_)
+
+
+def _plan(sampler, service, type_, sql=AGG_SQL, percent=1.0):
+    return asyncio.run(sampler.plan(service, _ds(type_), sql, percent))
+
+
+@pytest.fixture(autouse=True)
+def catalog(monkeypatch):
+    cat = _Catalog()
+    monkeypatch.setattr(qs, "get_metadata_catalog", lambda: cat)
+    monkeypatch.setattr(settings, "QUERY_SAMPLE_PK_RANGES", 16)
+    return cat
+
+
+# ---------- 改写 ----------
+def test_postgres_tablesample_after_alias():
+    p = _plan(QuerySampler(), _Service(), DataSourceType.POSTGRESQL)
+    assert p.applied and p.method == SAMPLE_METHOD_TABLESAMPLE and p.percent == 1.0
+    assert re.search(r"FROM orders o TABLESAMPLE SYSTEM \(1\) REPEATABLE \(\d+\) WHERE x > 1", p.sql)
+    assert p.scale == 100.0
+
+
+def test_postgres_sample_is_repeatable_per_query():
+    sampler = QuerySampler()
+    assert _plan(sampler, _Service(), DataSourceType.POSTGRESQL).sql == _plan(sampler, _Service(), DataSourceType.POSTGRESQL).sql
+
+
+def test_mysql_pk_range_rewrite():
+    service = _Service()
+    p = _plan(QuerySampler(), service, DataSourceType.MYSQL)
+    assert p.applied and p.method == SAMPLE_METHOD_PK_RANGE and p.table == "orders"
+    assert service.bound_queries == ["SELECT MIN(`id`) AS lo, MAX(`id`) AS hi FROM orders"]
+    m = re.fullmatch(r"SELECT .* FROM \(SELECT \* FROM orders WHERE (.*)\) AS o WHERE x > 1 GROUP BY status", p.sql)
+    assert m is not None
+    ranges = re.findall(r"`id` BETWEEN (\d+) AND (\d+)", m.group(1))
+    assert len(ranges) == 16
+    assert 0.9 <= p.percent <= 1.0
+
+
+def test_mysql_pk_bounds_cached():
+    sampler, service = QuerySampler(), _Service()
+    _plan(sampler, service, DataSourceType.MYSQL)
+    _plan(sampler, service, DataSourceType.MYSQL, sql="SELECT COUNT(*) FROM orders")
+    assert len(service.bound_queries) == 1
+    sampler.invalidate(1)
+    _plan(sampler, service, DataSourceType.MYSQL)
+    assert len(service.bound_queries) == 2
+
+
+@pytest.mark.parametrize(
+    "sql,percent,reason",
+    [
+        ("SELECT * FROM orders JOIN items ON items.oid = orders.id", 1, "仅支持单表查询"),
+        ("WITH c AS (SELECT 1) SELECT * FROM c", 1, "仅支持单表查询"),
+        ("SELECT * FROM orders WHERE id IN (SELECT oid FROM items)", 1, "仅支持单表查询"),
+        (AGG_SQL, 100, "不小于100%"),
+    ],
+)
+def test_exact_execution_reasons(sql, percent, reason):
+    sampler = QuerySampler()
+    p = _plan(sampler, _Service(), DataSourceType.POSTGRESQL, sql=sql, percent=percent)
+    assert not p.applied and p.sql == sql and reason in p.reason
+    assert sampler.exact_total == 1
+
+
+def test_mysql_requires_single_integer_pk(monkeypatch):
+    cat = _Catalog(pk_type="varchar(32)")
+    monkeypatch.setattr(qs, "get_metadata_catalog", lambda: cat)
+    p = _plan(QuerySampler(), _Service(), DataSourceType.MYSQL)
+    assert not p.applied and "单列整数主键" in p.reason
+
+
+def test_mysql_empty_table_runs_exact():
+    p = _plan(QuerySampler(), _Service(lo=None, hi=None), DataSourceType.MYSQL)
+    assert not p.applied and "表为空" in p.reason
+
+
+def test_pk_ranges_stratified_and_deterministic():
+    ranges, covered = QuerySampler._pk_ranges(1, 1000, 10, seed=42)
+    assert ranges == QuerySampler._pk_ranges(1, 1000, 10, seed=42)[0]
+    assert len(ranges) == 16 and covered == pytest.approx(9.6)
+    # 每段落在各自的层内且互不重叠
+    for (a1, b1), (a2, _) in zip(ranges, ranges[1:]):
+        assert a1 <= b1 < a2
+    assert ranges[0][0] >= 1 and ranges[-1][1] <= 1000
+
+
+# ---------- 结果放大 ----------
+def test_scale_results_scales_only_additive_aggregates():
+    plan = SamplePlan(sql=AGG_SQL, applied=True, percent=2.0)
+    rows = [("paid", 3, decimal.Decimal("1.50"), 2.0, 7)]
+    out = scale_results(plan, rows, ["status", "c", "s", "a", "d"])
+    assert out == [("paid", 150, decimal.Decimal("75.00"), 2.0, 7)]
+    assert plan.scaled_columns == ["c", "s"]
+    assert rows == [("paid", 3, decimal.Decimal("1.50"), 2.0, 7)]
+
+
+def test_scale_results_dict_rows_and_nulls():
+    plan = SamplePlan(sql="SELECT COUNT(*) AS c, SUM(v) AS s FROM t", applied=True, percent=10.0)
+    out = scale_results(plan, [{"c": 4, "s": None}, {"c": 0, "s": 1.5}], ["c", "s"])
+    assert out == [{"c": 40, "s": None}, {"c": 0, "s": 15.0}]
+
+
+def test_scale_results_noop_when_not_applied():
+    plan = SamplePlan(sql="SELECT COUNT(*) AS c FROM t")
+    assert scale_results(plan, [(5,)], ["c"]) == [(5,)]
+    assert plan.scale == 1.0
@@ -0,0 +1,64 @@
+"""
+查询调度测试：执行名额在线程任务真正结束后才归还，等待方被取消不提前释放。
+"""
+import asyncio
+import threading
+
+from app.core.config import settings
+from app.services.query_executor import QueryExecutorManager
+from app.services import query_scheduler as qs
+
+
+def test_slot_held_until_thread_finishes_after_cancel(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_SCHEDULER_ENABLED", True)
+    monkeypatch.setattr(settings, "QUERY_SCHEDULER_MAX_CONCURRENCY", 1)
+    manager = QueryExecutorManager()
+    monkeypatch.setattr(qs, "get_query_executor", lambda: manager)
+    scheduler = qs.QueryScheduler()
+    started = threading.Event()
+    finish = threading.Event()
+
+    def _blocking():
+        started.set()
+        finish.wait(5)
+        return "done"
+
+    async def _main():
+        task = asyncio.ensure_future(scheduler.run(1, "u1", _blocking))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # 等待方已取消，但线程仍在执行：名额不归还
+        assert scheduler._get(1).stats()["running"] == 1
+        finish.set()
+        for _ in range(100):
+            if scheduler._get(1).stats()["running"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert scheduler._get(1).stats()["running"] == 0
+        assert await scheduler.run(1, "u1", lambda: 42) == 42
+
+    try:
+        asyncio.run(_main())
+    finally:
+        finish.set()
+        manager.shutdown()
+
+
+def test_slot_released_when_executor_rejects(monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_SCHEDULER_ENABLED", True)
+    manager = QueryExecutorManager()
+    monkeypatch.setattr(qs, "get_query_executor", lambda: manager)
+    scheduler = qs.QueryScheduler()
+    # 线程池已关闭时提交失败，名额应立即归还
+    manager._get(1)._executor.shutdown(wait=False)
+
+    async def _main():
+        try:
+            await scheduler.run(1, "u1", lambda: 1)
+        except RuntimeError:
+            pass
+        await asyncio.sleep(0)
+        return scheduler._get(1).stats()["running"]
+
+    assert asyncio.run(_main()) == 0
@@ -0,0 +1,41 @@
+"""
+只读副本路由测试：健康与复制延迟阈值判定、延迟未知时的处理。
+"""
+import pytest
+
+from app.core.config import settings
+from app.services.connection_pool import replica_node
+from app.services.replica_router import ReplicaRouter, ReplicaState
+
+REPLICA = {"host": "10.0.0.2", "port": 3306}
+
+
+def _router(healthy=True, lag=None):
+    router = ReplicaRouter()
+    node = replica_node(REPLICA)
+    router._states[(1, node)] = ReplicaState(node=node, healthy=healthy, checked=True, lag_seconds=lag)
+    return router
+
+
+@pytest.mark.parametrize(
+    "healthy,lag,max_lag,expected",
+    [
+        (True, 5.0, 30, True),
+        (True, 31.0, 30, False),
+        (False, 0.0, 30, False),
+        (True, None, 30, False),
+        (True, None, 0, True),
+        (True, 120.0, 0, True),
+    ],
+)
+def test_eligible(healthy, lag, max_lag, expected):
+    assert _router(healthy, lag)._eligible(1, REPLICA, max_lag) is expected
+
+
+def test_unknown_lag_opt_in(monkeypatch):
+    monkeypatch.setattr(settings, "REPLICA_ALLOW_UNKNOWN_LAG", True)
+    assert _router(True, None)._eligible(1, REPLICA, 30) is True
+
+
+def test_unchecked_replica_not_eligible():
+    assert ReplicaRouter()._eligible(1, REPLICA, 30) is False
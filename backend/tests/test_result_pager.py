@@ -0,0 +1,134 @@
+"""
+结果分页测试：键集分页SQL构造、排序键识别、游标签名校验与防篡改。
+"""
+import datetime
+import decimal
+import json
+
+import pytest
+
+from app.services.metadata_catalog import CatalogColumn, CatalogSnapshot, CatalogTable
+from app.services.result_pager import (
+    PAGE_MODE_KEYSET,
+    PAGE_MODE_SEGMENT,
+    InvalidCursorError,
+    PageCursor,
+    _b64,
+    _sign,
+    _unb64,
+    build_keyset_sql,
+    decode_cursor,
+    detect_sort_keys,
+    encode_cursor,
+    key_values,
+)
+from app.services.sql_parser import parse_sql
+
+FP = "0123456789abcdef0123456789abcdef"
+
+
+# ---------- 键集分页SQL ----------
+def test_first_page_wraps_query_without_params():
+    parsed = parse_sql("SELECT * FROM orders WHERE note LIKE 'a%' ORDER BY id LIMIT 10")
+    sql, params = build_keyset_sql(parsed, ["id"], None, 50, "mysql")
+    assert params is None
+    assert sql == (
+        "SELECT * FROM (\nSELECT * FROM orders WHERE note LIKE 'a%'\n) AS _aitt_page\n"
+        "ORDER BY _aitt_page.`id`\nLIMIT 51"
+    )
+
+
+def test_next_page_expands_composite_key_and_escapes_percent():
+    parsed = parse_sql("SELECT * FROM orders WHERE note LIKE 'a%'", "postgresql")
+    sql, params = build_keyset_sql(parsed, ["a", "b"], [1, 2], 20, "postgresql")
+    assert "LIKE 'a%%'" in sql
+    assert 'WHERE (_aitt_page."a" > %s) OR (_aitt_page."a" = %s AND _aitt_page."b" > %s)' in sql
+    assert sql.endswith('ORDER BY _aitt_page."a", _aitt_page."b"\nLIMIT 21')
+    assert params == [1, 1, 2]
+
+
+def test_quote_escapes_identifier():
+    sql, _ = build_keyset_sql(parse_sql("SELECT * FROM t"), ["we`ird"], None, 1, "mysql")
+    assert "_aitt_page.`we``ird`" in sql
+
+
+def test_key_values():
+    assert key_values({"id": 3, "b": "x"}, ["b", "id", "missing"]) == ["x", 3, None]
+
+
+# ---------- 排序键识别 ----------
+@pytest.fixture
+def snap():
+    t = CatalogTable(id=1, name="orders", data_source_id=7)
+    t.columns = [
+        CatalogColumn(name="id", type="bigint", is_pk=True),
+        CatalogColumn(name="amount", type="decimal", is_met=True),
+    ]
+    return CatalogSnapshot({"orders": t}, version=1, fingerprint="t")
+
+
+@pytest.mark.parametrize(
+    "sql,ds_id,expected",
+    [
+        ("SELECT * FROM orders", 7, ["id"]),
+        ("SELECT id, amount FROM orders ORDER BY id", 7, ["id"]),
+        ("SELECT amount FROM orders", 7, None),
+        ("SELECT id AS oid FROM orders", 7, None),
+        ("SELECT * FROM orders ORDER BY amount", 7, None),
+        ("SELECT * FROM orders ORDER BY id DESC", 7, None),
+        ("SELECT * FROM orders", 8, None),
+        ("SELECT COUNT(*) FROM orders", 7, None),
+        ("SELECT * FROM unknown", 7, None),
+    ],
+)
+def test_detect_sort_keys(snap, sql, ds_id, expected):
+    assert detect_sort_keys(parse_sql(sql), ds_id, snap) == expected
+
+
+def test_detect_sort_keys_without_catalog():
+    assert detect_sort_keys(parse_sql("SELECT * FROM orders"), 7, None) is None
+
+
+# ---------- 游标 ----------
+def test_cursor_round_trip_preserves_types():
+    after = [decimal.Decimal("1.10"), datetime.datetime(2024, 1, 2, 3, 4, 5), datetime.date(2024, 1, 2), b"\x00\xff", "x", 5]
+    token = encode_cursor(PageCursor(mode=PAGE_MODE_KEYSET, page=3, keys=["a"], after=after), 7, FP)
+    cur = decode_cursor(token, 7, FP)
+    assert cur.mode == PAGE_MODE_KEYSET and cur.page == 3 and cur.keys == ["a"]
+    assert cur.after == after
+    assert isinstance(cur.after[0], decimal.Decimal)
+
+
+def test_segment_cursor_round_trip():
+    token = encode_cursor(PageCursor(mode=PAGE_MODE_SEGMENT, page=2, offset=100), 7, FP)
+    cur = decode_cursor(token, 7, FP)
+    assert (cur.mode, cur.offset, cur.after) == (PAGE_MODE_SEGMENT, 100, None)
+
+
+def test_cursor_rejects_tampered_payload():
+    token = encode_cursor(PageCursor(mode=PAGE_MODE_SEGMENT, offset=100), 7, FP)
+    body, sig = token.rsplit(".", 1)
+    payload = json.loads(_unb64(body))
+    payload["o"] = 0
+    forged = _b64(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    with pytest.raises(InvalidCursorError, match="签名"):
+        decode_cursor(f"{forged}.{sig}", 7, FP)
+
+
+@pytest.mark.parametrize("token", ["", "no-dot", "abc.def", "!!!.xyz"])
+def test_cursor_rejects_garbage(token):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(token, 7, FP)
+
+
+def test_cursor_signed_but_not_json_rejected():
+    body = _b64(b"not json")
+    with pytest.raises(InvalidCursorError, match="格式"):
+        decode_cursor(f"{body}.{_sign(body)}", 7, FP)
+
+
+@pytest.mark.parametrize("ds_id,fp", [(8, FP), (7, "f" * 32)])
+def test_cursor_bound_to_data_source_and_query(ds_id, fp):
+    token = encode_cursor(PageCursor(mode=PAGE_MODE_SEGMENT), 7, FP)
+    with pytest.raises(InvalidCursorError, match="不匹配"):
+        decode_cursor(token, ds_id, fp)
@@ -0,0 +1,175 @@
+"""
+SQL解析服务测试：只读校验（按方言）、LIMIT 注入、表提取与指纹。
+"""
+import pytest
+
+from app.services.sql_parser import extract_sql_from_text, parse_sql, tokenize
+
+
+# ---------- 只读校验 ----------
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT * FROM orders",
+        "select id, name from users where status = 'active';",
+        "WITH c AS (SELECT * FROM orders) SELECT * FROM c",
+        "SELECT REPLACE(name, 'a', 'b') FROM t",
+        "SELECT TRUNCATE(amount, 2) FROM t",
+        "SELECT INSERT(name, 1, 2, 'x') FROM t",
+        "SELECT * FROM t WHERE note = 'please DROP TABLE t; DELETE'",
+        "SELECT 1 -- DROP TABLE t",
+        "SELECT /*+ MAX_EXECUTION_TIME(1000) */ * FROM t",
+        "(SELECT a FROM t) UNION (SELECT a FROM u)",
+    ],
+)
+def test_read_only_accepts_select(sql):
+    assert parse_sql(sql).read_only_violation() is None
+
+
+@pytest.mark.parametrize(
+    "sql, reason",
+    [
+        ("", "SQL为空"),
+        ("SELECT 1; SELECT 2", "仅允许执行单条SQL语句"),
+        ("SELECT 1 FROM t; TRUNCATE t", "仅允许执行单条SQL语句"),
+        ("DELETE FROM t", "仅允许执行SELECT查询"),
+        ("REPLACE INTO t VALUES (1)", "仅允许执行SELECT查询"),
+        ("TRUNCATE t", "仅允许执行SELECT查询"),
+        ("SELECT * INTO OUTFILE '/tmp/x' FROM t", "INTO"),
+        ("WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d", "DELETE"),
+        ("SELECT SLEEP(10)", "SLEEP"),
+        ("SELECT pg_sleep(10)", "PG_SLEEP"),
+        ("SELECT * FROM t FOR UPDATE", "加锁"),
+        ("SELECT 1 /*! FOR UPDATE */", "可执行注释"),
+    ],
+)
+def test_read_only_rejects(sql, reason):
+    violation = parse_sql(sql).read_only_violation()
+    assert violation is not None and reason in violation
+    with pytest.raises(ValueError):
+        parse_sql(sql).validate_read_only()
+
+
+def test_function_keyword_without_call_is_rejected():
+    assert "REPLACE" in parse_sql("SELECT * FROM t WHERE REPLACE").read_only_violation()
+
+
+# ---------- 方言相关的字符串/注释 ----------
+BACKSLASH_INJECTION = "SELECT 'a\\' ; DROP TABLE t; --'"
+
+
+def test_backslash_escapes_string_in_mysql():
+    # MySQL 中 \' 是转义引号，整段为一个字符串
+    parsed = parse_sql(BACKSLASH_INJECTION, "mysql")
+    assert parsed.statement_count == 1
+    assert parsed.read_only_violation() is None
+
+
+def test_backslash_does_not_escape_in_postgresql():
+    # PostgreSQL 中 'a\' 是完整字符串，其后的 DROP 是第二条语句
+    parsed = parse_sql(BACKSLASH_INJECTION, "postgresql")
+    assert parsed.statement_count == 2
+    assert parsed.read_only_violation() == "仅允许执行单条SQL语句"
+
+
+def test_postgresql_escape_string_honours_backslash():
+    parsed = parse_sql("SELECT E'a\\' ; DROP TABLE t; --'", "postgresql")
+    assert parsed.statement_count == 1
+
+
+def test_postgresql_dollar_quoted_strings():
+    assert parse_sql("SELECT $$a; DROP TABLE t$$", "postgresql").read_only_violation() is None
+    assert parse_sql("SELECT $q$ it's $q$ AS s", "postgresql").read_only_violation() is None
+    # 美元引号字符串在 PostgreSQL 中先于单引号闭合
+    assert parse_sql("SELECT $a$ ' $a$; DROP TABLE t; --'", "postgresql").statement_count == 2
+
+
+def test_positional_parameter_is_not_dollar_string():
+    toks = tokenize("SELECT * FROM t WHERE a = $1 AND b = $2", "postgresql")
+    assert [t.value for t in toks if t.kind == "param"] == ["$1", "$2"]
+
+
+def test_hash_is_comment_only_in_mysql():
+    sql = "SELECT 1 # 2; DROP TABLE t"
+    assert parse_sql(sql, "mysql").statement_count == 1
+    assert parse_sql(sql, "postgresql").statement_count == 2
+
+
+def test_dialect_accepts_data_source_type():
+    from app.models.data_source import DataSourceType
+
+    assert parse_sql(BACKSLASH_INJECTION, DataSourceType.POSTGRESQL).dialect == "postgresql"
+    assert parse_sql(BACKSLASH_INJECTION, DataSourceType.MYSQL).dialect == "mysql"
+
+
+def test_doubled_quotes_and_comments():
+    assert parse_sql("SELECT 'it''s; fine' FROM t").statement_count == 1
+    assert parse_sql("SELECT 1 /* ; DROP TABLE t; */ FROM t").statement_count == 1
+    assert parse_sql("SELECT `we;ird` FROM t").statement_count == 1
+
+
+# ---------- LIMIT 注入 ----------
+@pytest.mark.parametrize(
+    "sql, expected",
+    [
+        ("SELECT a FROM t", "SELECT a FROM t\nLIMIT 100"),
+        ("SELECT a FROM t;", "SELECT a FROM t\nLIMIT 100"),
+        ("SELECT a FROM t LIMIT 5000", "SELECT a FROM t LIMIT 100"),
+        ("SELECT a FROM t LIMIT 10", "SELECT a FROM t LIMIT 10"),
+        ("SELECT a FROM t LIMIT 10, 5000", "SELECT a FROM t LIMIT 10, 100"),
+        ("SELECT a FROM t UNION SELECT a FROM u LIMIT 500", "SELECT a FROM t UNION SELECT a FROM u LIMIT 100"),
+        ("SELECT a FROM t FETCH FIRST 5 ROWS ONLY", "SELECT a FROM t FETCH FIRST 5 ROWS ONLY"),
+        ("SELECT a FROM (SELECT * FROM t LIMIT 9999) x", "SELECT a FROM (SELECT * FROM t LIMIT 9999) x\nLIMIT 100"),
+    ],
+)
+def test_with_limit(sql, expected):
+    assert parse_sql(sql).with_limit(100) == expected
+
+
+# ---------- 表提取 ----------
+def test_tables_exclude_cte_names():
+    sql = "WITH c AS (SELECT * FROM orders) SELECT * FROM c JOIN users u ON u.id = c.uid"
+    parsed = parse_sql(sql)
+    assert parsed.cte_names == ("c",)
+    assert parsed.tables == ("orders", "users")
+
+
+def test_tables_comma_join_schema_and_subquery():
+    parsed = parse_sql("SELECT * FROM a, b AS bb, s.c WHERE x IN (SELECT y FROM d)")
+    assert parsed.tables == ("a", "b", "c", "d")
+
+
+def test_tables_ignore_function_from():
+    assert parse_sql("SELECT EXTRACT(YEAR FROM created_at) FROM orders").tables == ("orders",)
+
+
+def test_analysis_extracts_metrics_and_filters():
+    analysis = parse_sql(
+        "SELECT region, SUM(amount) AS total FROM orders WHERE status = 'paid' GROUP BY region ORDER BY total DESC"
+    ).analysis()
+    assert analysis["selected_table"] == "orders"
+    assert analysis["dimensions"] == ["region"]
+    assert analysis["metrics"][0]["aggregation"] == "sum" and analysis["metrics"][0]["alias"] == "total"
+    assert analysis["filters"] == [{"column": "status", "operator": "=", "value": "paid"}]
+    assert analysis["sorts"] == [{"column": "total", "order": "desc"}]
+
+
+# ---------- 指纹 ----------
+def test_fingerprint_ignores_whitespace_case_and_comments():
+    a = parse_sql("select  *  from t where id = 1")
+    b = parse_sql("SELECT * FROM t WHERE id=1 -- trailing comment")
+    assert a.fingerprint == b.fingerprint
+
+
+def test_fingerprint_distinguishes_literals_shape_does_not():
+    a = parse_sql("SELECT * FROM t WHERE id = 1 AND name = 'x'")
+    b = parse_sql("SELECT * FROM t WHERE id = 2 AND name = 'y'")
+    c = parse_sql("SELECT * FROM u WHERE id = 2 AND name = 'y'")
+    assert a.fingerprint != b.fingerprint
+    assert a.shape_fingerprint == b.shape_fingerprint
+    assert b.shape_fingerprint != c.shape_fingerprint
+
+
+def test_extract_sql_from_text():
+    text = "下面是查询：\n```sql\nSELECT * FROM t;\nSELECT 2;\n```"
+    assert extract_sql_from_text(text) == "SELECT * FROM t"
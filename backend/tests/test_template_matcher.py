@@ -0,0 +1,134 @@
+"""
+查询模板快速路径测试：字面量渲染与注入防护、模板正则编译、匹配与非阻塞冷启动。
+"""
+import pytest
+
+from app.services import template_matcher as tm_module
+from app.services.template_matcher import TemplateMatcher, _compile_template, render_literal
+
+ROWS = [
+    {
+        "id": 1,
+        "name": "销售趋势查询",
+        "natural_language_template": "查询{start_date}到{end_date}的销售趋势",
+        "sql_template": "SELECT order_date FROM sales_orders WHERE order_date BETWEEN '{start_date}' AND '{end_date}'",
+        "parameters": '{"start_date": {"type": "date"}, "end_date": {"type": "date"}}',
+    },
+    {
+        "id": 2,
+        "name": "客户消费排行",
+        "natural_language_template": "查询消费金额前{limit}名的客户",
+        "sql_template": "SELECT customer_name FROM customers LIMIT {limit}",
+        "parameters": {"limit": {"type": "integer", "default": 10}},
+    },
+    {
+        "id": 3,
+        "name": "产品销量统计",
+        "natural_language_template": "统计{category}分类产品的销量情况",
+        "sql_template": "SELECT product_name FROM products WHERE category = {category}",
+        "parameters": {"category": {"type": "string"}},
+    },
+]
+
+
+@pytest.fixture
+def matcher(monkeypatch):
+    m = TemplateMatcher()
+    monkeypatch.setattr(m, "_load_rows", lambda: ROWS)
+    m.refresh()
+    return m
+
+
+# ---------- 字面量渲染 ----------
+@pytest.mark.parametrize(
+    "value,spec,expected",
+    [
+        ("2024年1月5日", {"type": "date"}, "'2024-01-05'"),
+        ("2024-13-01", {"type": "date"}, None),
+        ("二十", {"type": "integer"}, "20"),
+        ("12.5", {"type": "number"}, "12.5"),
+        ("1 OR 1", {"type": "integer"}, None),
+        ("华东", {"enum": ["华东", "华北"]}, "'华东'"),
+        ("西南", {"enum": ["华东", "华北"]}, None),
+        ("电子产品", {"type": "string"}, "'电子产品'"),
+        ("1 OR 1", {"type": "string"}, "'1 OR 1'"),
+        ("a--", None, "'a--'"),
+        ("x' OR '1'='1", {"type": "string"}, None),
+        ("", {"type": "string"}, None),
+    ],
+)
+def test_render_literal(value, spec, expected):
+    assert render_literal(value, spec) == expected
+
+
+def test_string_literal_is_always_quoted():
+    # 字符串字面量必须自带引号，不能依赖模板作者在SQL里写引号
+    lit = render_literal("a b-c", {"type": "string"})
+    assert lit.startswith("'") and lit.endswith("'")
+
+
+# ---------- 模板编译 ----------
+def test_compile_template_typed_slots():
+    p = _compile_template("查询{start_date}到{end_date}的销售趋势", {"start_date": {"type": "date"}, "end_date": {"type": "date"}})
+    m = p.search("查询2024-01-01到2024-02-01的销售趋势")
+    assert m.group("start_date") == "2024-01-01" and m.group("end_date") == "2024-02-01"
+    assert p.search("查询上周到本周的销售趋势") is None
+
+
+def test_compile_template_repeated_placeholder_uses_backreference():
+    p = _compile_template("{city}对比{city}", {"city": {"enum": ["北京", "上海"]}})
+    assert p.search("北京对比北京")
+    assert p.search("北京对比上海") is None
+
+
+# ---------- 匹配 ----------
+def test_match_by_pattern_renders_quoted_dates(matcher):
+    r = matcher.match("查询2024年1月1日到2024年1月31日的销售趋势")
+    assert r.template_id == 1 and r.method == "pattern"
+    assert r.sql.endswith("BETWEEN '2024-01-01' AND '2024-01-31'")
+    assert "''" not in r.sql
+
+
+def test_match_integer_slot(matcher):
+    r = matcher.match("查询消费金额前5名的客户")
+    assert r.template_id == 2
+    assert r.sql.endswith("LIMIT 5")
+
+
+def test_match_unquoted_string_slot_gets_quoted(matcher):
+    # 即使模板未给占位符加引号，注释符也只能出现在字符串字面量内部
+    r = matcher.match("统计a--分类产品的销量情况")
+    assert r.sql.endswith("category = 'a--'")
+    r = matcher.match("统计电子产品分类产品的销量情况")
+    assert r.sql.endswith("category = '电子产品'")
+
+
+def test_match_unrelated_returns_none(matcher):
+    assert matcher.match("今天天气怎么样") is None
+    assert matcher.match("   ") is None
+
+
+def test_cold_match_does_not_block(monkeypatch):
+    m = TemplateMatcher()
+    scheduled = []
+    monkeypatch.setattr(m, "_load_rows", lambda: pytest.fail("冷启动不应在调用线程中加载"))
+    monkeypatch.setattr(m, "_schedule_refresh", lambda: scheduled.append(1))
+    assert m.match("查询消费金额前5名的客户") is None
+    assert scheduled == [1]
+
+
+def test_schedule_refresh_runs_once_concurrently(monkeypatch):
+    m = TemplateMatcher()
+    started = []
+
+    class _Thread:
+        def __init__(self, target, daemon):
+            started.append(target)
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(tm_module.threading, "Thread", _Thread)
+    m._schedule_refresh()
+    m._schedule_refresh()
+    assert len(started) == 1
@@ -31,6 +31,12 @@ CREATE TABLE aitt_data_sources (
     password_encrypted TEXT COMMENT '加密密码',
     description TEXT COMMENT '描述',
     is_active BOOLEAN DEFAULT TRUE COMMENT '是否激活',
+    max_scan_rows BIGINT COMMENT '执行前代价守卫：预估扫描行数上限（为空时取全局默认）',
+    max_join_fanout BIGINT COMMENT '执行前代价守卫：预估连接扇出行数上限（为空时取全局默认）',
+    cost_guard_action VARCHAR(10) COMMENT '超出代价阈值时的动作：reject/limit/off（为空时取全局默认）',
+    replicas JSON COMMENT '只读副本列表 [{host, port, username, password_encrypted}]',
+    replica_strategy VARCHAR(20) COMMENT '副本选择策略：round_robin/least_connections/primary（为空时取全局默认）',
+    max_replica_lag_seconds INT COMMENT '允许的最大复制延迟秒数（为空时取全局默认）',
     created_by BIGINT NOT NULL COMMENT '创建人',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -95,7 +101,8 @@ CREATE TABLE aitt_query_history (
     query_result JSON COMMENT '查询结果',
     execution_time_ms INT COMMENT '执行时间毫秒',
     row_count INT COMMENT '结果行数',
-    status ENUM('success', 'error', 'timeout') NOT NULL COMMENT '执行状态',
+    status ENUM('success', 'error', 'timeout', 'queued', 'running', 'cancelled') NOT NULL COMMENT '执行状态',
+    progress INT DEFAULT 0 COMMENT '执行进度(0-100)',
     error_message TEXT COMMENT '错误信息',
     is_saved BOOLEAN DEFAULT FALSE COMMENT '是否保存',
     is_shared BOOLEAN DEFAULT FALSE COMMENT '是否分享',
@@ -160,6 +167,9 @@ CREATE TABLE aitt_ai_call_logs (
     rag_chunks JSON COMMENT '检索片段',
     status ENUM('success','error','timeout') NOT NULL DEFAULT 'success' COMMENT '调用状态',
     error_message TEXT COMMENT '错误信息',
+    model_tier VARCHAR(20) NULL COMMENT '模型档位(fast/strong)',
+    sql_valid BOOLEAN NULL COMMENT '生成SQL是否通过校验',
+    escalated BOOLEAN DEFAULT FALSE COMMENT '是否由快速模型升级而来',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     FOREIGN KEY (conversation_id) REFERENCES aitt_ai_conversations(id),
     INDEX idx_model_name (model_name),